@@ -8,7 +8,34 @@ import json
 from datetime import datetime
 import base64
 import io
+import os
+import sys
 import time
+from document_extraction import DocumentExtractor, ExtractionError, MAX_UPLOAD_BYTES
+
+# Option lists are shared with the Lambda handlers, which reject anything else
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lambda_layer', 'python'))
+from content_transformer.options import (
+    LANGUAGES, MAX_SUMMARY_LENGTH, MIN_SUMMARY_LENGTH, SOURCE_LANGUAGES, SUMMARY_TYPES, TRANSLATION_STYLES
+)
+from content_transformer import tracing
+from results_analytics import ResultsAnalytics, archived_window, open_archive
+from result_history import ResultHistory, is_final
+from notification_channel import NotificationChannel
+
+# Streamlit reruns this script on every interaction; API calls are traced from here
+RERUN_STARTED = time.time()
+
+# Base URL of the deployed API, or of `python local_api.py` (http://127.0.0.1:3000);
+# when unset the summarizer and translator show sample output
+API_URL = os.environ.get('CONTENT_TRANSFORMER_API_URL', '').rstrip('/')
+# Jobs are submitted with Prefer: respond-async and their progress and result pushed over a WebSocket
+JOB_TIMEOUT_SECONDS = 300
+
+# Archived results (s3://<bucket>/archive/results or a local copy) feed the dashboard charts;
+# when unset the charts show sample data
+RESULTS_ARCHIVE = os.environ.get('RESULTS_ARCHIVE', '')
+ANALYTICS_DAYS = 30
 
 # Page config with professional styling
 st.set_page_config(
@@ -508,6 +535,159 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+@st.cache_resource
+def get_document_extractor():
+    """Shared background extractor, reused across reruns and sessions"""
+    return DocumentExtractor()
+
+
+@st.cache_resource
+def get_results_analytics():
+    """Archive analytics shared across reruns and sessions, so its per-partition cache persists"""
+    return ResultsAnalytics(open_archive(RESULTS_ARCHIVE))
+
+
+def archive_summary(tools=None):
+    """Aggregates over the newest ANALYTICS_DAYS of archived results, or None to show sample data"""
+    if not RESULTS_ARCHIVE:
+        return None
+    # Results reach the archive only once they expire, so its newest dates are well in the past
+    start, end = archived_window(ANALYTICS_DAYS)
+    try:
+        summary = get_results_analytics().summary(tools, start, end)
+    except Exception as e:
+        st.caption(f"⚠️ Archive analytics unavailable: {e}")
+        return None
+    return summary if summary.rows else None
+
+
+def extract_uploaded_document(uploaded_file):
+    """Extract an upload off the UI thread, showing page/paragraph progress"""
+    if uploaded_file.size > MAX_UPLOAD_BYTES:
+        st.error(f"❌ File too large: the limit is {MAX_UPLOAD_BYTES // 1024 // 1024} MB")
+        return ""
+
+    extractor = get_document_extractor()
+    try:
+        digest, job, future = extractor.submit(uploaded_file, uploaded_file.name)
+    except ExtractionError as e:
+        st.error(f"❌ {e}")
+        return ""
+
+    status = st.empty()
+    while not future.done():
+        status.caption(f"📑 Extracting {job.filename}: {job.sections} sections, {job.characters:,} characters...")
+        time.sleep(0.1)
+    status.empty()
+
+    try:
+        text = future.result()
+    except ExtractionError as e:
+        st.error(f"❌ {e}")
+        return ""
+
+    if job.truncated:
+        st.warning(f"⚠️ Document truncated to the first {job.characters:,} characters")
+    st.caption(f"✅ Extracted {len(text.split()):,} words from {uploaded_file.name}")
+    return text
+
+
+def call_api(path, payload):
+    """
+    POST to the API; returns the response JSON, or None after showing the error
+
+    The request carries a traceparent header, so with TRACE_EXPORT set the
+    rerun, the call and everything the handler does share one trace. When
+    the API accepts the job for background processing (202), the result is
+    waited for on the notifications WebSocket instead of a held request.
+    """
+    request_span = tracing.start_span('app request', attributes={'component': 'app'}, start=RERUN_STARTED)
+    tracing.start_span('streamlit rerun', request_span, attributes={'component': 'app'}, start=RERUN_STARTED).end()
+    try:
+        with tracing.span(f"POST {path}", request_span, 'client', component='app') as call_span:
+            response = requests.post(f"{API_URL}{path}", json=payload, timeout=130, headers={
+                'traceparent': call_span.traceparent(), 'Prefer': 'respond-async'
+            })
+            result = response.json()
+            call_span.set(status_code=response.status_code, transformId=result.get('transformId'))
+        if response.status_code == 202:
+            with tracing.span('wait for result', request_span, component='app', transformId=result['transformId']):
+                return wait_for_result(result)
+    except (requests.RequestException, ValueError) as e:
+        st.error(f"❌ API request failed: {e}")
+        return None
+    finally:
+        request_span.end()
+    if response.status_code != 200:
+        st.error(f"❌ {result.get('message', response.reason)}")
+        return None
+    return result
+
+
+def wait_for_result(accepted):
+    """The result of an accepted job, pushed over the notifications WebSocket; None after showing the error"""
+    status = st.empty()
+
+    def show_progress(message):
+        if message.get('total'):
+            status.caption(f"⏳ Processed {message['completed']} of {message['total']} sections…")
+
+    try:
+        with NotificationChannel(accepted['notifications']) as channel:
+            channel.subscribe(accepted['transformId'])
+            message = channel.wait(accepted['transformId'], JOB_TIMEOUT_SECONDS, show_progress)
+    except (OSError, ValueError) as e:
+        # TimeoutError and ConnectionError are OSErrors; the result may still arrive at resultPath
+        st.error(f"❌ Lost track of job {accepted['transformId']}: {e}")
+        return None
+    finally:
+        status.empty()
+    if message['type'] == 'failed':
+        st.error(f"❌ {message['message']}")
+        return None
+    if 'result' in message:
+        return message['result']
+    # Too large to push: read it back, past any cache, now that it is finished
+    try:
+        response = requests.get(f"{API_URL}{message['resultPath']}", timeout=30, headers={'Cache-Control': 'no-cache'})
+        result = response.json() if response.status_code == 200 else None
+    except (requests.RequestException, ValueError) as e:
+        st.error(f"❌ Could not read result {accepted['transformId']}: {e}")
+        return None
+    if result is None:
+        st.error(f"❌ Could not read result {accepted['transformId']}: {response.reason}")
+        return None
+    if result.get('status') != message['status']:
+        st.error(f"❌ Result {accepted['transformId']} was read back as {result.get('status')}; try again")
+        return None
+    return result
+
+
+def session_history():
+    """This session's result history, created on first use"""
+    if 'result_history' not in st.session_state:
+        st.session_state.result_history = ResultHistory()
+    return st.session_state.result_history
+
+
+def show_session_history(tool, filename):
+    """Browse and download earlier results of a tool without calling the API again"""
+    history = session_history()
+    entries = history.entries(tool)
+    if not entries:
+        return
+    with st.expander(f"🕘 Session History ({len(entries)})"):
+        entry = st.selectbox(
+            "Earlier results:", entries, key=f"{tool}_history",
+            format_func=lambda entry: f"{datetime.fromtimestamp(entry.created):%H:%M:%S} · {entry.preview} · "
+                                      + ", ".join(str(value) for value in entry.options.values())
+        )
+        st.markdown(entry.output)
+        st.download_button("📥 Download", entry.output, filename, "text/plain", key=f"{tool}_history_download")
+        st.caption(f"{len(history)} results kept, {history.size / 1024:,.0f} KB of "
+                   f"{history.max_bytes // 1024 // 1024} MB")
+
+
 # Initialize session state
 if 'current_tool' not in st.session_state:
     st.session_state.current_tool = None
@@ -526,12 +706,14 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Stats Section
+overall_summary = archive_summary()
+documents_processed = f"{overall_summary.rows:,}" if overall_summary else "50K+"
 col1, col2, col3, col4 = st.columns(4)
 with col1:
-    st.markdown("""
+    st.markdown(f"""
     <div class="stats-container">
         <div class="stat-item">
-            <span class="stat-number">50K+</span>
+            <span class="stat-number">{documents_processed}</span>
             <div class="stat-label">Documents Processed</div>
         </div>
     </div>
@@ -567,6 +749,12 @@ with col4:
     </div>
     """, unsafe_allow_html=True)
 
+if overall_summary:
+    daily_volume = overall_summary.volume.pivot_table(index='date', columns='tool', values='results', fill_value=0)
+    fig = px.bar(daily_volume, title=f'Archived Results per Day (newest {ANALYTICS_DAYS} archived days)')
+    fig.update_layout(height=300, margin=dict(l=20, r=20, t=40, b=20), legend_title_text='')
+    st.plotly_chart(fig, use_container_width=True)
+
 # Feature Selection
 st.markdown("## 🚀 Choose Your AI Transformation Tool")
 
@@ -616,24 +804,38 @@ if st.session_state.current_tool:
                                            placeholder="Enter your long-form content here...")
             else:
                 uploaded_file = st.file_uploader("Upload document", type=['txt', 'pdf', 'docx'])
-                document_text = "Sample uploaded document content..." if uploaded_file else ""
+                document_text = extract_uploaded_document(uploaded_file) if uploaded_file else ""
             
-            summary_type = st.selectbox("Summary Type:", 
-                                      ["Bullet Points", "Executive Summary", "Key Highlights", "Action Items"])
+            summary_type = st.selectbox("Summary Type:", SUMMARY_TYPES)
             
-            length = st.slider("Summary Length:", 1, 10, 5, help="1=Very Brief, 10=Detailed")
+            length = st.slider("Summary Length:", MIN_SUMMARY_LENGTH, MAX_SUMMARY_LENGTH, 5, help="1=Very Brief, 10=Detailed")
             
             st.markdown('</div>', unsafe_allow_html=True)
             
             if st.button("🚀 Generate Summary", type="primary", key="summarize_btn"):
                 if document_text:
-                    with st.spinner("🤖 AI is analyzing your document..."):
-                        time.sleep(2)  # Simulate processing
+                    # An unchanged resubmission is answered from this session's history
+                    options = {'summary_type': summary_type, 'length': length}
+                    earlier = session_history().get('summarizer', document_text, options)
+                    result = None
+                    if earlier is None:
+                        with st.spinner("🤖 AI is analyzing your document..."):
+                            if API_URL:
+                                result = call_api('/summarize', {'document_text': document_text, **options})
+                            else:
+                                time.sleep(2)  # Simulate processing
                         
+                    if API_URL and earlier is None and result is None:
+                        st.stop()
                     st.markdown('<div class="output-section">', unsafe_allow_html=True)
                     st.subheader("✨ Generated Summary")
                     
-                    if summary_type == "Bullet Points":
+                    if earlier is not None:
+                        summary = earlier.output
+                        st.caption("♻️ Same document and options as before: shown from this session's history")
+                    elif result is not None:
+                        summary = result['summary']
+                    elif summary_type == "Bullet Points":
                         summary = """
                         • **Key Finding 1**: AI technology is revolutionizing content creation across industries
                         • **Key Finding 2**: Serverless architecture provides scalable and cost-effective solutions
@@ -653,11 +855,15 @@ if st.session_state.current_tool:
                         - Focus on user experience optimization
                         """
                     
+                    if earlier is None and is_final(result):
+                        session_history().add('summarizer', document_text, options, summary, result)
                     st.markdown(summary)
                     st.markdown('</div>', unsafe_allow_html=True)
                     
                     # Download button
                     st.download_button("📥 Download Summary", summary, "summary.txt", "text/plain")
+            
+            show_session_history('summarizer', "summary.txt")
         
         with col2:
             st.markdown("""
@@ -681,12 +887,14 @@ if st.session_state.current_tool:
                 for metric, value in metrics_data.items():
                     st.metric(metric, value)
                 
-                # Progress visualization
+                # Word-weighted compression of archived summaries, or a sample score
+                summaries = archive_summary(['summarization'])
+                archived = summaries is not None and 'summarization' in summaries.compression.index
                 fig = go.Figure(go.Indicator(
                     mode = "gauge+number",
-                    value = 85,
+                    value = summaries.compression.loc['summarization', 'overall_ratio'] if archived else 85,
                     domain = {'x': [0, 1], 'y': [0, 1]},
-                    title = {'text': "Summary Quality Score"},
+                    title = {'text': "Avg. Compression Ratio (%)" if archived else "Summary Quality Score"},
                     gauge = {
                         'axis': {'range': [None, 100]},
                         'bar': {'color': "#667eea"},
@@ -723,32 +931,47 @@ if st.session_state.current_tool:
             # Language selection
             col_from, col_to = st.columns(2)
             with col_from:
-                source_lang = st.selectbox("From Language:", 
-                    ["Auto-Detect", "English", "Spanish", "French", "German", "Chinese", "Japanese", "Arabic"],
-                    index=5)  # Default to Chinese
+                source_lang = st.selectbox("From Language:", SOURCE_LANGUAGES,
+                    index=SOURCE_LANGUAGES.index("Chinese"))  # Default to Chinese
             with col_to:
-                target_lang = st.selectbox("To Language:", 
-                    ["English", "Spanish", "French", "German", "Chinese", "Japanese", "Arabic", "Portuguese"],
-                    index=0)  # Default to English
+                target_lang = st.selectbox("To Language:", LANGUAGES,
+                    index=LANGUAGES.index("English"))  # Default to English
             
             text_to_translate = st.text_area("Enter text to translate:", height=200,
                                            placeholder="Type or paste your content here...")
             
-            translation_style = st.selectbox("Translation Style:", 
-                                           ["Standard", "Formal", "Casual", "Technical", "Creative"])
+            translation_style = st.selectbox("Translation Style:", TRANSLATION_STYLES)
             
             st.markdown('</div>', unsafe_allow_html=True)
             
             if st.button("🌐 Translate Content", type="primary", key="translate_btn"):
                 if text_to_translate:
-                    with st.spinner("🤖 Translating your content..."):
-                        time.sleep(2)
+                    # An unchanged resubmission is answered from this session's history
+                    options = {'source_language': source_lang, 'target_language': target_lang,
+                               'translation_style': translation_style}
+                    earlier = session_history().get('translator', text_to_translate, options)
+                    result = None
+                    if earlier is None:
+                        with st.spinner("🤖 Translating your content..."):
+                            if API_URL:
+                                result = call_api('/translate', {
+                                    'text_to_translate': text_to_translate, **options, 'include_original_text': False
+                                })
+                            else:
+                                time.sleep(2)
                         
+                    if API_URL and earlier is None and result is None:
+                        st.stop()
                     st.markdown('<div class="output-section">', unsafe_allow_html=True)
                     st.subheader("✨ Translation Result")
                     
                     # Proper translation based on target language
-                    if target_lang == "English":
+                    if earlier is not None:
+                        actual_translation = earlier.output
+                        st.caption("♻️ Same text and options as before: shown from this session's history")
+                    elif result is not None:
+                        actual_translation = result['translated_text']
+                    elif target_lang == "English":
                         if "我的流水线挂了" in text_to_translate:
                             actual_translation = '"My pipeline is down, can you help fix it?" - This is a high-frequency phrase in DevOps daily work. But many times, the logs have already clearly explained the problem. I once spent a whole morning troubleshooting with a developer, and the final error was "Service Account lacks storage bucket permissions." When I pointed it out, they said: "I thought that was background noise."'
                         elif "舞台上的 DevOps" in text_to_translate:
@@ -765,6 +988,8 @@ if st.session_state.current_tool:
                     else:
                         actual_translation = f"Translation from {source_lang} to {target_lang}: {text_to_translate}"
                     
+                    if earlier is None and is_final(result):
+                        session_history().add('translator', text_to_translate, options, actual_translation, result)
                     translated_text = f"""
                     **Original (Chinese):**
                     {text_to_translate}
@@ -794,15 +1019,22 @@ if st.session_state.current_tool:
                         st.write("• **软件学** → Software Engineering")
                     
                     st.download_button("📥 Download Translation", translated_text, "translation.txt", "text/plain")
+            
+            show_session_history('translator', "translation.txt")
         
         with col2:
             st.markdown("### 🎯 Translation Analytics")
             
-            # Language pair popularity
-            lang_data = pd.DataFrame({
-                'Language Pair': ['EN→ES', 'EN→FR', 'EN→DE', 'ES→EN', 'FR→EN'],
-                'Usage': [45, 23, 18, 8, 6]
-            })
+            # Language pair popularity from the archive, or sample data
+            translations = archive_summary(['translation'])
+            if translations is not None and len(translations.language_pairs):
+                top_pairs = translations.language_pairs.head(8)
+                lang_data = pd.DataFrame({'Language Pair': top_pairs.index, 'Usage': top_pairs.to_numpy()})
+            else:
+                lang_data = pd.DataFrame({
+                    'Language Pair': ['EN→ES', 'EN→FR', 'EN→DE', 'ES→EN', 'FR→EN'],
+                    'Usage': [45, 23, 18, 8, 6]
+                })
             
             fig = px.pie(lang_data, values='Usage', names='Language Pair', 
                         title='Popular Translation Pairs')
@@ -810,6 +1042,10 @@ if st.session_state.current_tool:
             st.plotly_chart(fig, use_container_width=True)
             
             # Real-time metrics
+            if translations is not None:
+                latency = translations.latency.loc['translation']
+                st.metric("Median Translation Time", f"{latency['p50_ms'] / 1000:.1f}s",
+                          f"p99 {latency['p99_ms'] / 1000:.1f}s", delta_color="off")
             st.metric("Characters Processed", "1.2M+")
             st.metric("Languages Supported", "25+")
             st.metric("Avg. Accuracy", "96.8%")
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Benchmark dashboard queries over a synthetic result archive
+
+Writes a local archive in the result archiver's layout (one file per tool
+and day, Parquet when pyarrow is installed), then times the dashboard
+summary cold, fully cached, after one new file lands in one partition,
+and for a one-week window of an uncached instance.
+
+Usage:
+    python benchmarks/bench_analytics.py [--rows 2000000] [--days 90]
+"""
+import argparse
+import datetime
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+sys.path.append(os.path.join(PROJECT_DIR, 'lambda_layer', 'python'))
+
+from content_transformer.archive import ARCHIVE_PREFIX, encode_columns, partition_key, pyarrow_module
+from results_analytics import ResultsAnalytics, open_archive
+
+LANGUAGES = ['English', 'Spanish', 'French', 'German', 'Chinese', 'Japanese', 'Portuguese']
+SUMMARIES = [f"Summary {i}: " + 'key finding ' * 20 for i in range(50)]
+
+
+def partition_columns(rng, tool, day, rows):
+    """Columns for one day of one tool, with a long text column the dashboard never reads"""
+    timestamps = day + np.sort(rng.integers(0, 86_400, rows))
+    columns = {
+        'transformId': [f"{tool[:1]}{day}-{i}" for i in range(rows)],
+        'timestamp': timestamps.tolist(),
+        'transformationType': [tool] * rows,
+        'status': ['completed'] * rows,
+        'processing_ms': np.round(rng.lognormal(7.5, 0.8, rows)).tolist(),
+    }
+    if tool == 'translation':
+        columns['source_language'] = rng.choice(LANGUAGES, rows, p=[.4, .2, .1, .1, .1, .05, .05]).tolist()
+        columns['target_language'] = rng.choice(LANGUAGES, rows).tolist()
+        columns['translated_text'] = [SUMMARIES[i % len(SUMMARIES)] for i in range(rows)]
+    else:
+        original = rng.integers(200, 20_000, rows)
+        summary = np.maximum(20, (original * rng.uniform(0.05, 0.3, rows)).astype(int))
+        columns['original_words'] = original.tolist()
+        columns['summary_words'] = summary.tolist()
+        columns['compression_ratio'] = np.round((1 - summary / original) * 100, 1).tolist()
+        columns['summary'] = [SUMMARIES[i % len(SUMMARIES)] for i in range(rows)]
+    return columns
+
+
+def write_partition(root, rng, tool, day, rows):
+    data, extension, _ = encode_columns(partition_columns(rng, tool, day, rows))
+    date = datetime.datetime.fromtimestamp(day, datetime.timezone.utc).strftime('%Y-%m-%d')
+    key = partition_key(ARCHIVE_PREFIX, tool, date, day, extension)
+    path = os.path.join(root, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return len(data)
+
+
+def timed(label, query):
+    started = time.perf_counter()
+    summary = query()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<34} {elapsed * 1000:>9.1f} ms {summary.rows:>11,} rows "
+          f"{summary.partitions_read:>5} read {summary.partitions_cached:>5} cached")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=2_000_000, help='archived results across all partitions')
+    parser.add_argument('--days', type=int, default=90, help='days of history')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    random.seed(args.seed)
+    workdir = tempfile.mkdtemp(prefix='bench-analytics-')
+    try:
+        first_day = (int(time.time()) // 86_400 - args.days) * 86_400
+        per_partition = max(1, args.rows // (args.days * 2))
+        started = time.perf_counter()
+        written = sum(
+            write_partition(workdir, rng, tool, first_day + day * 86_400, per_partition)
+            for day in range(args.days) for tool in ('summarization', 'translation')
+        )
+        print(f"Wrote {per_partition * args.days * 2:,} rows in {args.days * 2} partitions, "
+              f"{written / 1e6:.1f} MB {'Parquet' if pyarrow_module() else 'gzipped JSON'} "
+              f"({time.perf_counter() - started:.1f}s)\n")
+
+        root = os.path.join(workdir, ARCHIVE_PREFIX)
+        analytics = ResultsAnalytics(open_archive(root))
+        timed('cold: all partitions', analytics.summary)
+        summary = timed('warm: all partitions cached', analytics.summary)
+        write_partition(workdir, rng, 'translation', first_day + (args.days - 1) * 86_400, per_partition // 10)
+        timed('one partition changed', analytics.summary)
+
+        last = datetime.datetime.fromtimestamp(first_day, datetime.timezone.utc).date() \
+            + datetime.timedelta(days=args.days - 1)
+        fresh = ResultsAnalytics(open_archive(root))
+        timed('cold: last 7 days, translations', lambda: fresh.summary(
+            ['translation'], last - datetime.timedelta(days=6), last))
+
+        print("\nProcessing time (ms)")
+        print(summary.latency.round(0).to_string())
+        print("\nTop language pairs")
+        print(summary.language_pairs.head(5).to_string())
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
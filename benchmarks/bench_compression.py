@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark bytes on the wire and latency of compressed handler responses
+
+Compares identity, gzip and (if installed) brotli responses for translator
+payloads of increasing size, with and without the echoed original text.
+Estimated end-to-end latency adds transfer time over a simulated link to
+the measured compression and decompression time.
+
+Usage:
+    python benchmarks/bench_compression.py [--mbps 10] [--rtt-ms 60]
+"""
+import argparse
+import base64
+import gzip
+import os
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(PROJECT_DIR, 'lambda_layer', 'python'))
+
+from content_transformer import responses
+
+SAMPLE_SOURCE = "舞台上的 DevOps 常被描绘成技术乌托邦：自动化流水线顺畅运行，开发与运维无缝协作。"
+SAMPLE_TRANSLATION = ("DevOps on stage is often portrayed as a technological utopia: automated "
+                      "pipelines running smoothly, seamless collaboration between development and operations. ")
+
+
+def translator_payload(repeats, include_original_text):
+    payload = {
+        'transformId': '00000000-0000-0000-0000-000000000000',
+        'status': 'success',
+        'message': 'Translation completed successfully',
+        'translated_text': SAMPLE_TRANSLATION * repeats,
+        'source_language': 'Chinese',
+        'target_language': 'English',
+        'confidence_score': 94.5
+    }
+    if include_original_text:
+        payload['original_text'] = SAMPLE_SOURCE * repeats
+    return payload
+
+
+def decode(response):
+    body = response['body']
+    encoding = response['headers'].get('Content-Encoding')
+    if not encoding:
+        return body.encode('utf-8')
+    raw = base64.b64decode(body)
+    if encoding == 'gzip':
+        return gzip.decompress(raw)
+    return responses.brotli_module().decompress(raw)
+
+
+def measure(payload, accept_encoding, iterations=20):
+    event = {'headers': {'Accept-Encoding': accept_encoding}}
+    start = time.perf_counter()
+    for _ in range(iterations):
+        response = responses.json_response(200, payload, event)
+        decode(response)
+    cpu_ms = (time.perf_counter() - start) * 1000 / iterations
+
+    body = response['body']
+    # Base64 is only the Lambda-to-gateway framing; the client receives raw bytes
+    wire_bytes = len(base64.b64decode(body)) if response.get('isBase64Encoded') else len(body.encode('utf-8'))
+    return wire_bytes, cpu_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--mbps', type=float, default=10.0, help='simulated client bandwidth')
+    parser.add_argument('--rtt-ms', type=float, default=60.0, help='simulated round-trip time')
+    args = parser.parse_args()
+
+    encodings = ['identity', 'gzip'] + (['br'] if responses.brotli_module() else [])
+    bytes_per_ms = args.mbps * 1_000_000 / 8 / 1000
+
+    print(f"{'repeats':>8} {'echo':>5} {'encoding':>9} {'bytes':>10} {'cpu ms':>8} {'est. e2e ms':>12}")
+    for repeats in (5, 50, 500, 2000):
+        for include_original_text in (True, False):
+            payload = translator_payload(repeats, include_original_text)
+            for encoding in encodings:
+                wire_bytes, cpu_ms = measure(payload, encoding)
+                e2e_ms = args.rtt_ms + cpu_ms + wire_bytes / bytes_per_ms
+                print(f"{repeats:>8} {str(include_original_text):>5} {encoding:>9} "
+                      f"{wire_bytes:>10,} {cpu_ms:>8.2f} {e2e_ms:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
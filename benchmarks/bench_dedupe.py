@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark near-duplicate signatures, index size and lookup latency
+
+Measures MinHash signature time against document length, then fills an
+LSH index with synthetic documents and reports index size and lookup
+latency as it grows, along with how often a near-duplicate is found and
+how often unrelated documents become candidates. The DynamoDB layout is
+sized from the items the dedupe store would write.
+
+Usage:
+    python benchmarks/bench_dedupe.py [--documents 20000] [--words 1500]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(PROJECT_DIR, 'lambda_layer', 'python'))
+
+from content_transformer.dedupe import band_keys
+from content_transformer.minhash import BANDS, LSHIndex, MinHasher, minhash, pack_signature
+
+VOCABULARY = [f"w{i}" for i in range(5000)]
+
+
+def document(rng, words):
+    return ' '.join(rng.choice(VOCABULARY) for _ in range(words))
+
+
+def near_duplicate(rng, text, edits):
+    """Replace a few runs of words, as a reworded sentence or new header would"""
+    words = text.split()
+    for _ in range(edits):
+        start = rng.randrange(len(words))
+        words[start:start + 8] = [rng.choice(VOCABULARY) for _ in range(8)]
+    return ' '.join(words)
+
+
+def signature_times(rng):
+    print(f"{'words':>8} {'signature ms':>13}")
+    for words in (500, 5000, 50000, 200000):
+        text = document(rng, words)
+        started = time.perf_counter()
+        MinHasher().update(text).signature()
+        print(f"{words:>8,} {(time.perf_counter() - started) * 1000:>13.1f}")
+    print()
+
+
+def dynamodb_bytes_per_document(signature):
+    """Approximate DynamoDB storage one indexed document adds"""
+    keys = band_keys(signature, 'key#0123456789abcdef', 'Bullet Points#5')
+    document_item = len('doc#') + 36 + len(pack_signature(signature)) + 36 + 1500  # id, signature, summary
+    band_entries = sum(len(key) for key in keys) // BANDS + 36 + 8  # id and index time per band item, keys amortized
+    return document_item + BANDS * band_entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--documents', type=int, default=20000, help='documents in the largest index')
+    parser.add_argument('--words', type=int, default=1500, help='words per synthetic document')
+    parser.add_argument('--queries', type=int, default=200, help='lookups per index size')
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    signature_times(rng)
+
+    index = LSHIndex()
+    originals = []
+    sizes = sorted({size for size in (1000, 5000, args.documents) if size <= args.documents})
+    print(f"{'indexed':>8} {'lookup ms p50':>14} {'p99':>7} {'found':>7} {'false cand.':>12} "
+          f"{'memory MB':>10} {'DynamoDB MB':>12}")
+    for size in sizes:
+        while len(originals) < size:
+            text = document(rng, args.words)
+            originals.append(text)
+            index.add(len(originals) - 1, minhash(text))
+
+        latencies, found, false_candidates = [], 0, 0
+        for _ in range(args.queries):
+            target = rng.randrange(len(originals))
+            query = minhash(near_duplicate(rng, originals[target], edits=3))
+            started = time.perf_counter()
+            match, _ = index.query(query, 0.8)
+            latencies.append((time.perf_counter() - started) * 1000)
+            found += match == target
+            false_candidates += len(index.candidates(query) - {target})
+
+        latencies.sort()
+        memory_mb = (len(index.signatures) * 128 * 8 + len(index.bands) * 64) / 1e6
+        dynamodb_mb = len(originals) * dynamodb_bytes_per_document(query) / 1e6
+        print(f"{size:>8,} {statistics.median(latencies):>14.3f} {latencies[int(len(latencies) * 0.99) - 1]:>7.3f} "
+              f"{found / args.queries:>7.1%} {false_candidates / args.queries:>12.2f} "
+              f"{memory_mb:>10.1f} {dynamodb_mb:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Load-test the API end-to-end against the local emulator
+
+Starts local_api.py in-process (or targets --url), then fires summarize
+requests at a fixed client concurrency for several container pool sizes
+and reports throughput, latency percentiles, status codes and cold
+starts. The simulated model latency makes pool size, not Python, the
+bottleneck, as it is for the deployed functions; beyond
+bedrockConcurrency.maxInFlight containers the shared Bedrock semaphore is
+the limit. Rate limits are switched off for in-process runs, since every
+request comes from one source IP; against --url they apply as deployed.
+
+Usage:
+    python benchmarks/bench_local_api.py [--requests 200] [--concurrency 32] [--containers 1 4 16]
+"""
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import http.client
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import urllib.parse
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_DIR)
+
+import local_api
+
+WORDS = [f"w{i}" for i in range(5000)]
+
+
+def document(number, words=300):
+    """A distinct document per request, so near-duplicate reuse never skips the model"""
+    rng = random.Random(number)
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+class Client:
+    """One keep-alive connection per worker thread"""
+
+    def __init__(self, url):
+        self.parts = urllib.parse.urlsplit(url)
+        self.local = threading.local()
+
+    def post(self, path, payload):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = http.client.HTTPConnection(
+                self.parts.hostname, self.parts.port, timeout=60
+            )
+        started = time.perf_counter()
+        try:
+            connection.request('POST', self.parts.path.rstrip('/') + path, json.dumps(payload),
+                               {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            self.local.connection = None
+            status = 0
+        return status, time.perf_counter() - started
+
+
+def run_load(url, requests, concurrency):
+    client = Client(url)
+    documents = [document(i) for i in range(requests)]
+    started = time.perf_counter()
+    # Handler log lines would interleave with the report
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as pool, contextlib.redirect_stdout(io.StringIO()):
+        results = list(pool.map(
+            lambda i: client.post('/summarize', {'document_text': documents[i], 'length': 3}),
+            range(requests)
+        ))
+    return results, time.perf_counter() - started
+
+
+def report(label, results, elapsed, stats=None):
+    latencies = sorted(latency * 1000 for status, latency in results if status == 200)
+    statuses = collections.Counter(status for status, _ in results)
+    pick = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))] if latencies else 0
+    cold = stats.get('cold_starts', '-') if stats else '-'
+    print(f"{label:>10} {len(results) / elapsed:>8.1f} {statistics.median(latencies) if latencies else 0:>8.0f} "
+          f"{pick(0.95):>8.0f} {pick(0.99):>8.0f} {cold:>6} "
+          f"{' '.join(f'{code}:{count}' for code, count in sorted(statuses.items()))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--url', help='API to test instead of an in-process emulator')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=32, help='client threads')
+    parser.add_argument('--containers', type=int, nargs='+', default=[1, 4, 16], help='pool sizes to compare')
+    parser.add_argument('--cold-start-ms', type=float, default=800)
+    parser.add_argument('--model-first-token-ms', type=float, default=300)
+    parser.add_argument('--model-ms-per-token', type=float, default=5)
+    args = parser.parse_args()
+
+    print(f"{'containers':>10} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'cold':>6} statuses")
+    if args.url:
+        results, elapsed = run_load(args.url, args.requests, args.concurrency)
+        report('remote', results, elapsed)
+        return
+
+    bedrock = local_api.LocalBedrock(args.model_first_token_ms, args.model_ms_per_token)
+    for containers in args.containers:
+        gateway = local_api.create_gateway(
+            containers=containers, cold_start_ms=args.cold_start_ms, bedrock=bedrock, log=False
+        )
+        # One source IP would share a single bucket; without the table the limiter is skipped
+        os.environ.pop('RATE_LIMIT_TABLE_NAME', None)
+        port = local_api.serve_in_background(gateway)
+        results, elapsed = run_load(f"http://127.0.0.1:{port}", args.requests, args.concurrency)
+        report(str(containers), results, elapsed, gateway.pools['DocumentSummarizerFunction'].report())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Benchmark prompt preprocessing token savings and latency
+
+Builds a corpus of the documents users actually paste: paginated reports
+with running headers and footers, email threads with quoted disclaimers,
+HTML pages and Markdown notes, plus clean prose as a control. For each,
+compares the summarizer's previous prompt (indented f-string, raw text)
+against the dedented template with preprocessed text, and converts the
+input tokens saved into model latency with a simple prefill cost model.
+Preprocessing time is measured and subtracted from the gain.
+
+Usage:
+    python benchmarks/bench_preprocess.py [--pages 40] [--ms-per-input-token 0.4]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(PROJECT_DIR, 'lambda', 'document-summarizer'))
+sys.path.append(os.path.join(PROJECT_DIR, 'lambda_layer', 'python'))
+
+from document_summarizer import SUMMARY_PROMPT
+from content_transformer.preprocess import preprocess
+from content_transformer.tokens import estimate_tokens
+
+WORDS = ('revenue', 'pipeline', 'customer', 'latency', 'deployment', 'quarter', 'region', 'growth',
+         'margin', 'incident', 'roadmap', 'migration', 'budget', 'forecast', 'team', 'release')
+
+
+def old_prompt(text, summary_type='Bullet Points', length=5):
+    """The summarizer prompt before templates were dedented"""
+    return f"""
+        Please summarize the following document in {summary_type} format with a length level of {length}/10:
+
+        Document: {text}
+
+        Requirements:
+        - Format: {summary_type}
+        - Conciseness level: {length}/10 (1=very brief, 10=detailed)
+        - Focus on key insights and actionable information
+        - Maintain professional tone
+        """
+
+
+def sentence(rng):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 20))]
+    return ' '.join(words).capitalize() + '.'
+
+
+def paragraph(rng):
+    return ' '.join(sentence(rng) for _ in range(rng.randint(3, 6)))
+
+
+def report(rng, pages):
+    """Text extracted from a PDF: header, footer, page number and notice on every page"""
+    out = []
+    for page in range(1, pages + 1):
+        body = '\n\n'.join(paragraph(rng) for _ in range(4))
+        out.append(f"ACME Corporation    |    FY2024 Operating Review    |    Internal\n\n{body}\n\n"
+                   f"CONFIDENTIAL\nCopyright 2024 ACME Corporation. All rights reserved.\n"
+                   f"            Page {page} of {pages}\n\f")
+    return '\n'.join(out)
+
+
+def email_thread(rng, messages):
+    """A reply chain where every message repeats the signature and legal footer"""
+    out = []
+    for i in range(messages):
+        out.append(f"From: person{i % 3}@example.com\nSubject: RE: Q3 migration plan\n\n"
+                   f"{paragraph(rng)}\n\nThanks,\nJordan Lee\nSenior Program Manager | ACME Corporation\n"
+                   f"Sent from my phone\n\nThis email and any attachments are confidential and intended "
+                   f"solely for the addressee. If you received it in error, notify the sender.\n"
+                   f"To unsubscribe from this list, reply STOP.\n{'_' * 40}\n")
+    return '\n'.join(out)
+
+
+def html_page(rng, sections):
+    """A saved web page with styling, scripts, navigation and entities"""
+    parts = ['<html><head><style>body { font-family: sans-serif; } .nav { color: #333; }</style>'
+             '<script>window.analytics = { track: function () {} };</script></head><body>',
+             '<div class="nav"><a href="/">Home</a> &middot; <a href="/docs">Docs</a></div>']
+    for i in range(sections):
+        parts.append(f'<h2 class="section-title" id="s{i}">Section {i}</h2>\n'
+                     f'<p class="body-text">{paragraph(rng)} <b>Key&nbsp;point:</b> '
+                     f'<a href="https://example.com/ref/{i}">{sentence(rng)}</a></p>\n'
+                     f'<!-- tracking pixel {i} --><img src="/px/{i}.gif" alt="">')
+    parts.append('<footer>&copy; 2024 ACME Corporation</footer></body></html>')
+    return '\n'.join(parts)
+
+
+def markdown_notes(rng, sections):
+    out = []
+    for i in range(sections):
+        out.append(f"## Section {i}\n\n> **Note:** {sentence(rng)}\n\n"
+                   + '\n'.join(f"  - **{rng.choice(WORDS)}**: {sentence(rng)} "
+                               f"([details](https://example.com/d/{i}))" for _ in range(4)))
+    return '\n\n'.join(out)
+
+
+def prose(rng, paragraphs):
+    return '\n\n'.join(paragraph(rng) for _ in range(paragraphs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--pages', type=int, default=40, help='pages in the paginated report')
+    parser.add_argument('--ms-per-input-token', type=float, default=0.4,
+                        help='simulated prefill time per input token')
+    parser.add_argument('--first-token-ms', type=float, default=400, help='simulated fixed latency per call')
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    corpus = [
+        ('PDF report', report(rng, args.pages), False),
+        ('email thread', email_thread(rng, args.pages // 2), False),
+        ('HTML page', html_page(rng, args.pages), True),
+        ('Markdown notes', markdown_notes(rng, args.pages), True),
+        ('clean prose', prose(rng, args.pages * 2), False),
+    ]
+
+    print(f"{'document':<15} {'tokens before':>14} {'after':>8} {'saved':>7} "
+          f"{'prep ms':>8} {'latency before ms':>18} {'after ms':>9} {'gain':>7}")
+    total_before = total_after = 0
+    for name, text, markup in corpus:
+        started = time.perf_counter()
+        clean, _ = preprocess(text, markup=markup)
+        prep_ms = (time.perf_counter() - started) * 1000
+        before = estimate_tokens(old_prompt(text))
+        after = estimate_tokens(SUMMARY_PROMPT.format(text=clean, summary_type='Bullet Points', length=5))
+        latency_before = args.first_token_ms + before * args.ms_per_input_token
+        latency_after = args.first_token_ms + after * args.ms_per_input_token + prep_ms
+        total_before += before
+        total_after += after
+        print(f"{name:<15} {before:>14,} {after:>8,} {1 - after / before:>7.1%} {prep_ms:>8.2f} "
+              f"{latency_before:>18,.0f} {latency_after:>9,.0f} {1 - latency_after / latency_before:>7.1%}")
+    print(f"\nCorpus input tokens: {total_before:,} -> {total_after:,} ({1 - total_after / total_before:.1%} saved)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark interactive latency while a bulk backfill saturates Bedrock
+
+Bulk workers call a simulated model in a loop, holding every slot of the
+fleet-wide semaphore, while interactive requests arrive at random. Each
+model call takes a semaphore lease, as in the handlers. Compares one
+shared class (what every caller got before priority classes) with
+interactive and bulk classes sharing slots by weight, bulk deferred
+behind queued interactive callers. Reports queue wait per class and bulk
+throughput.
+
+Usage:
+    python benchmarks/bench_priority.py [--slots 8] [--bulk-workers 24] [--seconds 10]
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import threading
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_DIR)
+sys.path.append(os.path.join(PROJECT_DIR, 'lambda_layer', 'python'))
+
+from local_dynamodb import LocalTable
+from content_transformer.priority import BULK, INTERACTIVE, PriorityPolicy
+from content_transformer.semaphore import DistributedSemaphore, SemaphoreTimeout
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000 if ordered else float('nan')
+
+
+def run(policy, tiered, args):
+    """Queue waits per class and completed bulk calls for one policy"""
+    semaphore = DistributedSemaphore(LocalTable('semaphoreKey'), limit=args.slots, lease_seconds=60, policy=policy)
+    waits = {INTERACTIVE: [], BULK: []}
+    timeouts = {INTERACTIVE: 0, BULK: 0}
+    stop = time.monotonic() + args.seconds
+    lock = threading.Lock()
+
+    def call(name, queue_seconds):
+        try:
+            lease_id, waited = semaphore.acquire(time.time() + queue_seconds, name if tiered else INTERACTIVE)
+        except SemaphoreTimeout:
+            with lock:
+                timeouts[name] += 1
+            return
+        try:
+            time.sleep(random.uniform(0.5, 1.5) * args.model_ms / 1000)
+        finally:
+            semaphore.release(lease_id)
+        with lock:
+            waits[name].append(waited)
+
+    def bulk_worker():
+        while time.monotonic() < stop:
+            call(BULK, 60)
+
+    def interactive_arrivals():
+        requests = []
+        while time.monotonic() < stop:
+            time.sleep(random.expovariate(args.interactive_per_second))
+            thread = threading.Thread(target=call, args=(INTERACTIVE, 10))
+            thread.start()
+            requests.append(thread)
+        for thread in requests:
+            thread.join()
+
+    threads = [threading.Thread(target=bulk_worker) for _ in range(args.bulk_workers)]
+    threads.append(threading.Thread(target=interactive_arrivals))
+    # Semaphore metrics are printed per call; keep them out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return waits, timeouts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--slots', type=int, default=8, help='fleet-wide model concurrency')
+    parser.add_argument('--bulk-workers', type=int, default=24)
+    parser.add_argument('--interactive-per-second', type=float, default=4)
+    parser.add_argument('--model-ms', type=float, default=400, help='mean simulated model call')
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    random.seed(7)
+    print(f"{'policy':<10} {'class':<12} {'calls':>6} {'timeouts':>9} {'p50 wait ms':>12} {'p95 wait ms':>12}")
+    tiered_policy = PriorityPolicy({INTERACTIVE: 3, BULK: 1}, bulk_defer_depth=2, bulk_queue_seconds=60)
+    for label, tiered in (('shared', False), ('tiered', True)):
+        waits, timeouts = run(tiered_policy, tiered, args)
+        for name in (INTERACTIVE, BULK):
+            print(f"{label:<10} {name:<12} {len(waits[name]):>6} {timeouts[name]:>9} "
+                  f"{percentile(waits[name], 0.5):>12.1f} {percentile(waits[name], 0.95):>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
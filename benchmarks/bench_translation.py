@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark translation latency against input length
+
+Runs the translator's batching against a simulated model whose latency
+grows with the number of output tokens. Compares the previous single
+capped call (fast on long inputs only because it truncates), one uncapped
+serial generation of the whole text, and parallel sentence-segmented
+batches. Speedup is batched against uncapped serial.
+
+Usage:
+    python benchmarks/bench_translation.py [--ms-per-token 15] [--first-token-ms 400]
+"""
+import argparse
+import io
+import json
+import os
+import re
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(PROJECT_DIR, 'lambda', 'language-translator'))
+sys.path.append(os.path.join(PROJECT_DIR, 'lambda_layer', 'python'))
+
+import language_translator
+from content_transformer.tokens import estimate_tokens
+from content_transformer.usage import TokenUsage
+
+SAMPLE_PARAGRAPH = ("舞台上的 DevOps 常被描绘成技术乌托邦：自动化流水线顺畅运行，开发与运维无缝协作。"
+                    "然而现实中，团队往往要面对遗留系统、组织壁垒和不断变化的需求。")
+TEXT_PATTERN = re.compile(r'Text to translate: "(.*)"\s*\n\s*Provide only', re.S)
+# English output tokens per Chinese input token, roughly
+EXPANSION = 1.3
+
+
+class SimulatedBedrock:
+    """Sleeps for first-token latency plus per-token generation time"""
+
+    def __init__(self, first_token_ms, ms_per_token):
+        self.first_token_ms = first_token_ms
+        self.ms_per_token = ms_per_token
+
+    def invoke_model(self, modelId, body):
+        request = json.loads(body)
+        text = TEXT_PATTERN.search(request['prompt']).group(1)
+        wanted = int(estimate_tokens(text) * EXPANSION)
+        produced = min(wanted, request['max_tokens_to_sample'])
+        time.sleep((self.first_token_ms + produced * self.ms_per_token) / 1000)
+        payload = {
+            'completion': 'x' * (produced * 4),
+            'stop_reason': 'max_tokens' if produced < wanted else 'stop_sequence'
+        }
+        return {'body': io.BytesIO(json.dumps(payload).encode('utf-8'))}
+
+
+def single_call(bedrock, text):
+    """The previous behavior: one prompt, one capped generation"""
+    started = time.perf_counter()
+    _, truncated = language_translator.translate_segment(
+        bedrock, 'model', text, ('Chinese', 'English', 'Standard'), '', TokenUsage(),
+        depth=language_translator.MAX_SPLIT_DEPTH
+    )
+    return time.perf_counter() - started, truncated
+
+
+def serial_uncapped(bedrock, text):
+    """One prompt with no output cap: the full translation as one long generation"""
+    started = time.perf_counter()
+    bedrock.invoke_model(modelId='model', body=json.dumps({
+        'prompt': language_translator.translation_prompt(text, 'Chinese', 'English', 'Standard'),
+        'max_tokens_to_sample': 10 ** 9
+    }))
+    return time.perf_counter() - started
+
+
+def batched(bedrock, text):
+    started = time.perf_counter()
+    _, truncated, segments = language_translator.translate_text(
+        bedrock, 'model', text, 'Chinese', 'English', 'Standard', TokenUsage()
+    )
+    return time.perf_counter() - started, truncated, segments
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--first-token-ms', type=float, default=400.0, help='simulated time to first token')
+    parser.add_argument('--ms-per-token', type=float, default=15.0, help='simulated generation time per token')
+    args = parser.parse_args()
+
+    bedrock = SimulatedBedrock(args.first_token_ms, args.ms_per_token)
+    print(f"{'paragraphs':>10} {'tokens':>8} {'capped s':>9} {'truncated':>10} {'serial s':>9} "
+          f"{'batched s':>10} {'batches':>8} {'truncated':>10} {'speedup':>8}")
+    for paragraphs in (1, 4, 16, 32):
+        text = '\n\n'.join([SAMPLE_PARAGRAPH * 3] * paragraphs)
+        capped_seconds, capped_truncated = single_call(bedrock, text)
+        serial_seconds = serial_uncapped(bedrock, text)
+        batched_seconds, batched_truncated, segments = batched(bedrock, text)
+        print(f"{paragraphs:>10} {estimate_tokens(text):>8,} {capped_seconds:>9.2f} {str(capped_truncated):>10} "
+              f"{serial_seconds:>9.2f} {batched_seconds:>10.2f} {segments:>8} {str(batched_truncated):>10} "
+              f"{serial_seconds / batched_seconds:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
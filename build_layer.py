@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Build the Content Transformer Lambda layer
+
+Resolves the third-party packages the handlers actually import, installs
+them for the Lambda platform, strips tests/docs/metadata the runtime never
+reads, precompiles bytecode with the runtime's Python version, and reports
+per-module import times for every handler.
+
+Usage:
+    python build_layer.py [--python python3.9] [--bundle-sdk] [--runs 5]
+"""
+import argparse
+import ast
+import hashlib
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(PROJECT_DIR, 'lambda')
+LAYER_SOURCE_DIR = os.path.join(PROJECT_DIR, 'lambda_layer')
+LAYER_BUILD_DIR = os.path.join(PROJECT_DIR, 'build', 'lambda_layer')
+# Digest of the shared sources the build was made from, kept outside the layer asset;
+# cdk_stack.py refuses to deploy a build whose sources have changed since
+SOURCE_DIGEST_PATH = os.path.join(PROJECT_DIR, 'build', 'lambda_layer.sources')
+
+# Import names that differ from the distribution name in requirements.txt
+IMPORT_NAMES = {
+    'Brotli': 'brotli',
+}
+
+# Packages already provided by the Lambda Python runtime
+RUNTIME_PROVIDED = {'boto3', 'botocore', 's3transfer', 'jmespath', 'urllib3', 'dateutil', 'six'}
+
+PRUNE_DIRS = {'tests', 'test', 'testing', 'docs', 'doc', 'examples', '__pycache__'}
+PRUNE_SUFFIXES = ('.pyi', '.pyx', '.pxd', '.c', '.h', '.md', '.rst')
+PRUNE_DIST_INFO_FILES = {'RECORD', 'INSTALLER', 'REQUESTED', 'direct_url.json', 'WHEEL'}
+
+IMPORT_TIME_PATTERN = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+
+def handler_sources():
+    """Yield (function_dir, module_name) for every Lambda handler"""
+    for name in sorted(os.listdir(LAMBDA_DIR)):
+        function_dir = os.path.join(LAMBDA_DIR, name)
+        for filename in sorted(os.listdir(function_dir)) if os.path.isdir(function_dir) else []:
+            if filename.endswith('.py'):
+                yield function_dir, filename[:-3]
+
+
+def python_files(root):
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith('.py'):
+                yield os.path.join(dirpath, filename)
+
+
+def source_digest(layer_source_dir=LAYER_SOURCE_DIR):
+    """SHA-256 over the layer's shared code and requirements, by relative path and content"""
+    paths = [os.path.join(layer_source_dir, 'requirements.txt')]
+    for dirpath, dirnames, filenames in os.walk(os.path.join(layer_source_dir, 'python')):
+        dirnames[:] = sorted(d for d in dirnames if d != '__pycache__')
+        paths.extend(os.path.join(dirpath, f) for f in sorted(filenames) if not f.endswith('.pyc'))
+    digest = hashlib.sha256()
+    for path in paths:
+        if os.path.isfile(path):
+            digest.update(os.path.relpath(path, layer_source_dir).replace(os.sep, '/').encode('utf-8') + b'\0')
+            with open(path, 'rb') as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def imported_modules():
+    """Collect top-level module names imported anywhere in handler or shared code"""
+    paths = list(python_files(LAMBDA_DIR)) + list(python_files(os.path.join(LAYER_SOURCE_DIR, 'python')))
+    modules = set()
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            tree = ast.parse(f.read(), filename=path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                modules.update(alias.name.split('.')[0] for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                modules.add(node.module.split('.')[0])
+    return modules
+
+
+def resolve_requirements(bundle_sdk):
+    """Return the requirement lines whose packages the handlers import"""
+    used = imported_modules()
+    selected = []
+    with open(os.path.join(LAYER_SOURCE_DIR, 'requirements.txt')) as f:
+        for line in f:
+            requirement = line.split('#', 1)[0].strip()
+            if not requirement:
+                continue
+            distribution = re.split(r'[<>=!~\[; ]', requirement, 1)[0]
+            import_name = IMPORT_NAMES.get(distribution, distribution.lower().replace('-', '_'))
+            if import_name not in used:
+                print(f"  skip {requirement} (not imported by any handler)")
+            elif import_name in RUNTIME_PROVIDED and not bundle_sdk:
+                print(f"  skip {requirement} (provided by the Lambda runtime)")
+            else:
+                selected.append(requirement)
+    return selected
+
+
+def install(requirements, target, python_version):
+    """Install manylinux wheels for the Lambda runtime into target"""
+    if not requirements:
+        return
+    subprocess.run([
+        sys.executable, '-m', 'pip', 'install', '--quiet',
+        '--target', target,
+        '--platform', 'manylinux2014_x86_64',
+        '--implementation', 'cp',
+        '--python-version', python_version,
+        '--only-binary=:all:',
+        '--no-compile',
+        *requirements
+    ], check=True)
+
+
+def prune(target):
+    """Delete files the runtime never reads; returns bytes removed"""
+    removed = 0
+    for dirpath, dirnames, filenames in os.walk(target, topdown=True):
+        for dirname in [d for d in dirnames if d in PRUNE_DIRS]:
+            path = os.path.join(dirpath, dirname)
+            removed += directory_size(path)
+            shutil.rmtree(path)
+            dirnames.remove(dirname)
+        in_dist_info = dirpath.endswith('.dist-info')
+        for filename in filenames:
+            if filename.endswith(PRUNE_SUFFIXES) or (in_dist_info and filename in PRUNE_DIST_INFO_FILES):
+                path = os.path.join(dirpath, filename)
+                removed += os.path.getsize(path)
+                os.remove(path)
+    return removed
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(dirpath, f)) for dirpath, _, files in os.walk(path) for f in files)
+
+
+def precompile(python, target):
+    """
+    Compile bytecode with the runtime's interpreter
+
+    Unchecked-hash pycs stay valid after the asset zip resets file mtimes.
+    """
+    subprocess.run([
+        python, '-m', 'compileall', '-q', '-j', '0',
+        '--invalidation-mode', 'unchecked-hash',
+        target
+    ], check=True)
+
+
+def interpreter_version(python):
+    output = subprocess.run(
+        [python, '-c', 'import sys; print("%d.%d" % sys.version_info[:2])'],
+        capture_output=True, text=True, check=True
+    )
+    return output.stdout.strip()
+
+
+def measure_imports(python, function_dir, module, layer_python_dir, runs):
+    """
+    Import a handler module in fresh interpreters and collect import times
+
+    Returns (median total microseconds, {module: median cumulative microseconds}).
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([function_dir, layer_python_dir]))
+    totals = []
+    per_module = {}
+    for _ in range(runs):
+        result = subprocess.run(
+            [python, '-X', 'importtime', '-c', f'import {module}'],
+            capture_output=True, text=True, env=env
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"importing {module} failed:\n{result.stderr[-2000:]}")
+        for match in IMPORT_TIME_PATTERN.finditer(result.stderr):
+            _, cumulative, indent, name = match.groups()
+            per_module.setdefault(name, []).append(int(cumulative))
+            # The handler's own line covers everything it pulls in
+            if name == module and len(indent) == 1:
+                totals.append(int(cumulative))
+    medians = {name: statistics.median(values) for name, values in per_module.items()}
+    return statistics.median(totals), medians
+
+
+def report_import_times(python, layer_python_dir, runs, top):
+    print(f"\nImport times ({python}, median of {runs} fresh interpreters):")
+    for function_dir, module in handler_sources():
+        total, per_module = measure_imports(python, function_dir, module, layer_python_dir, runs)
+        print(f"\n  {module}: {total / 1000:.1f} ms total")
+        slowest = sorted(per_module.items(), key=lambda item: item[1], reverse=True)[:top]
+        for name, cumulative in slowest:
+            print(f"    {cumulative / 1000:8.2f} ms  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--python', default='python3.9', help='interpreter matching the Lambda runtime')
+    parser.add_argument('--bundle-sdk', action='store_true', help='bundle boto3 instead of using the runtime copy')
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per import measurement')
+    parser.add_argument('--top', type=int, default=8, help='slowest modules to list per handler')
+    parser.add_argument('--skip-install', action='store_true', help='only package shared code (offline builds)')
+    args = parser.parse_args()
+
+    try:
+        python_version = interpreter_version(args.python)
+    except (OSError, subprocess.CalledProcessError):
+        parser.error(f"cannot run {args.python}; pass --python with an interpreter matching the Lambda runtime")
+    layer_python_dir = os.path.join(LAYER_BUILD_DIR, 'python')
+
+    print(f"Building layer in {os.path.relpath(LAYER_BUILD_DIR, PROJECT_DIR)} for Python {python_version}")
+    shutil.rmtree(LAYER_BUILD_DIR, ignore_errors=True)
+    if os.path.exists(SOURCE_DIGEST_PATH):
+        os.remove(SOURCE_DIGEST_PATH)
+    digest = source_digest()
+    shutil.copytree(
+        os.path.join(LAYER_SOURCE_DIR, 'python'), layer_python_dir,
+        ignore=shutil.ignore_patterns('__pycache__', '*.pyc')
+    )
+
+    requirements = resolve_requirements(args.bundle_sdk)
+    print(f"  install {', '.join(requirements) or 'nothing'}{' (skipped)' if args.skip_install else ''}")
+    if not args.skip_install:
+        install(requirements, layer_python_dir, python_version)
+
+    removed = prune(layer_python_dir)
+    precompile(args.python, layer_python_dir)
+    print(f"  pruned {removed / 1024:.0f} KiB; layer is {directory_size(LAYER_BUILD_DIR) / 1024:.0f} KiB")
+    with open(SOURCE_DIGEST_PATH, 'w') as f:
+        f.write(digest + '\n')
+
+    report_import_times(args.python, layer_python_dir, args.runs, args.top)
+
+
+if __name__ == '__main__':
+    main()
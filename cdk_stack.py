@@ -2,19 +2,59 @@ from aws_cdk import (
     Stack,
     aws_lambda as _lambda,
     aws_apigateway as apigw,
+    aws_apigatewayv2 as apigwv2,
+    aws_apigatewayv2_integrations as apigwv2_integrations,
     aws_iam as iam,
     aws_s3 as s3,
     aws_dynamodb as dynamodb,
+    aws_events as events,
+    aws_events_targets as targets,
+    aws_applicationautoscaling as appscaling,
+    aws_lambda_event_sources as lambda_event_sources,
     Duration,
     CfnOutput,
-    RemovalPolicy
+    RemovalPolicy,
+    Size
 )
 from constructs import Construct
+import os
+
+from build_layer import source_digest
+
+LAYER_SOURCE_DIR = "lambda_layer"
+# build_layer.py writes a pruned, precompiled layer here, with the digest of the sources it used
+LAYER_BUILD_DIR = "build/lambda_layer"
+LAYER_DIGEST_PATH = "build/lambda_layer.sources"
+
+def layer_asset_dir():
+    """
+    The built layer, or the unbuilt shared sources when there is no build
+
+    A build made from other sources than lambda_layer/ holds now fails
+    synth instead of deploying stale shared code.
+    """
+    if not os.path.isdir(LAYER_BUILD_DIR):
+        return LAYER_SOURCE_DIR
+    recorded = None
+    if os.path.exists(LAYER_DIGEST_PATH):
+        with open(LAYER_DIGEST_PATH) as f:
+            recorded = f.read().strip()
+    if recorded != source_digest(LAYER_SOURCE_DIR):
+        raise RuntimeError(
+            f"{LAYER_BUILD_DIR} is out of date with {LAYER_SOURCE_DIR}/; "
+            f"rerun python build_layer.py, or delete {LAYER_BUILD_DIR} to deploy the unbuilt sources"
+        )
+    return LAYER_BUILD_DIR
 
 class ContentTransformerStack(Stack):
     def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        # Settings under "contentTransformer" in cdk.json context
+        settings = self.node.try_get_context("contentTransformer") or {}
+        # Expired results are archived to the bucket, then moved to cheaper storage classes
+        archive = settings.get("archive", {})
+
         # S3 Bucket for content storage
         content_bucket = s3.Bucket(
             self, "ContentBucket",
@@ -25,10 +65,25 @@ class ContentTransformerStack(Stack):
                 allowed_methods=[s3.HttpMethods.GET, s3.HttpMethods.POST, s3.HttpMethods.PUT],
                 allowed_origins=["*"],
                 allowed_headers=["*"]
+            )],
+            lifecycle_rules=[s3.LifecycleRule(
+                id="TierArchivedResults",
+                prefix="archive/",
+                transitions=[
+                    s3.Transition(
+                        storage_class=s3.StorageClass.INFREQUENT_ACCESS,
+                        transition_after=Duration.days(archive.get("infrequentAccessAfterDays", 30))
+                    ),
+                    s3.Transition(
+                        storage_class=s3.StorageClass.GLACIER_INSTANT_RETRIEVAL,
+                        transition_after=Duration.days(archive.get("glacierAfterDays", 180))
+                    )
+                ]
             )]
         )
 
-        # DynamoDB table for transformation results
+        # DynamoDB table for transformation results; its stream feeds the
+        # notifier with new and updated results and the archiver with expired ones
         transform_table = dynamodb.Table(
             self, "TransformTable",
             table_name="content-transformation-results",
@@ -40,6 +95,119 @@ class ContentTransformerStack(Stack):
                 name="timestamp",
                 type=dynamodb.AttributeType.NUMBER
             ),
+            time_to_live_attribute="expiresAt",
+            stream=dynamodb.StreamViewType.NEW_AND_OLD_IMAGES,
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY
+        )
+
+        # DynamoDB table recording Idempotency-Key executions; records expire via TTL
+        idempotency_table = dynamodb.Table(
+            self, "IdempotencyTable",
+            table_name="content-transformation-idempotency",
+            partition_key=dynamodb.Attribute(
+                name="idempotencyKey",
+                type=dynamodb.AttributeType.STRING
+            ),
+            time_to_live_attribute="expiresAt",
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY
+        )
+
+        # DynamoDB table holding per-API-key token buckets
+        rate_limit_table = dynamodb.Table(
+            self, "RateLimitTable",
+            table_name="content-transformation-rate-limits",
+            partition_key=dynamodb.Attribute(
+                name="bucketKey",
+                type=dynamodb.AttributeType.STRING
+            ),
+            time_to_live_attribute="expiresAt",
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY
+        )
+
+        # DynamoDB table holding the fleet-wide Bedrock concurrency semaphore
+        semaphore_table = dynamodb.Table(
+            self, "SemaphoreTable",
+            table_name="content-transformation-semaphores",
+            partition_key=dynamodb.Attribute(
+                name="semaphoreKey",
+                type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY
+        )
+
+        # DynamoDB table of daily token usage counters per tool, model and API key
+        usage_table = dynamodb.Table(
+            self, "UsageTable",
+            table_name="content-transformation-usage",
+            partition_key=dynamodb.Attribute(
+                name="usageKey",
+                type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name="period",
+                type=dynamodb.AttributeType.STRING
+            ),
+            time_to_live_attribute="expiresAt",
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY
+        )
+
+        # DynamoDB table indexing summarized documents for near-duplicate lookups
+        dedupe_table = dynamodb.Table(
+            self, "DedupeTable",
+            table_name="content-transformation-dedupe",
+            partition_key=dynamodb.Attribute(
+                name="dedupeKey",
+                type=dynamodb.AttributeType.STRING
+            ),
+            time_to_live_attribute="expiresAt",
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY
+        )
+
+        # DynamoDB table caching chunk hash trees of revised documents
+        revision_table = dynamodb.Table(
+            self, "RevisionTable",
+            table_name="content-transformation-revisions",
+            partition_key=dynamodb.Attribute(
+                name="treeKey",
+                type=dynamodb.AttributeType.STRING
+            ),
+            time_to_live_attribute="expiresAt",
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY
+        )
+
+        # DynamoDB table of WebSocket connections waiting on a transformId
+        subscriptions_table = dynamodb.Table(
+            self, "SubscriptionsTable",
+            table_name="content-transformation-subscriptions",
+            partition_key=dynamodb.Attribute(
+                name="transformId",
+                type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name="connectionId",
+                type=dynamodb.AttributeType.STRING
+            ),
+            time_to_live_attribute="expiresAt",
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY
+        )
+
+        # DynamoDB table of bulk jobs and their checkpoints
+        bulk_jobs_table = dynamodb.Table(
+            self, "BulkJobsTable",
+            table_name="content-transformation-bulk-jobs",
+            partition_key=dynamodb.Attribute(
+                name="jobId",
+                type=dynamodb.AttributeType.STRING
+            ),
+            time_to_live_attribute="expiresAt",
             billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
             removal_policy=RemovalPolicy.DESTROY
         )
@@ -83,15 +251,104 @@ class ContentTransformerStack(Stack):
 
         # Grant DynamoDB permissions
         transform_table.grant_read_write_data(lambda_role)
+        idempotency_table.grant_read_write_data(lambda_role)
+        rate_limit_table.grant_read_write_data(lambda_role)
+        semaphore_table.grant_read_write_data(lambda_role)
+        usage_table.grant_read_write_data(lambda_role)
+        dedupe_table.grant_read_write_data(lambda_role)
+        revision_table.grant_read_write_data(lambda_role)
+        subscriptions_table.grant_read_write_data(lambda_role)
+        bulk_jobs_table.grant_read_write_data(lambda_role)
+
+        # Accepted background jobs continue in an asynchronous invocation of
+        # the same function; a wildcard avoids a role-function dependency cycle
+        lambda_role.add_to_policy(iam.PolicyStatement(
+            effect=iam.Effect.ALLOW,
+            actions=["lambda:InvokeFunction"],
+            resources=[f"arn:aws:lambda:{self.region}:{self.account}:function:{self.stack_name}-*"]
+        ))
+
+        # Admission control, usage accounting and hedging settings shared by every model-backed function
+        rate_limit = settings.get("rateLimit", {})
+        bedrock_concurrency = settings.get("bedrockConcurrency", {})
+        hedging = settings.get("hedging", {})
+        near_duplicates = settings.get("nearDuplicates", {})
+        # Spans go to the function log, one JSON line each (see trace_viewer.py)
+        trace_environment = {"TRACE_EXPORT": "stdout"} if settings.get("tracing", {}).get("enabled") else {}
+        model_environment = {
+            "RATE_LIMIT_TABLE_NAME": rate_limit_table.table_name,
+            "RATE_LIMIT_REQUESTS_PER_MINUTE": str(rate_limit.get("requestsPerMinute", 60)),
+            "RATE_LIMIT_REQUEST_BURST": str(rate_limit.get("requestBurst", 20)),
+            "RATE_LIMIT_TOKENS_PER_MINUTE": str(rate_limit.get("tokensPerMinute", 200000)),
+            "RATE_LIMIT_TOKEN_BURST": str(rate_limit.get("tokenBurst", 100000)),
+            "SEMAPHORE_TABLE_NAME": semaphore_table.table_name,
+            "BEDROCK_MAX_CONCURRENCY": str(bedrock_concurrency.get("maxInFlight", 10)),
+            "BEDROCK_QUEUE_SECONDS": str(bedrock_concurrency.get("queueSeconds", 10)),
+            "BEDROCK_LEASE_SECONDS": str(bedrock_concurrency.get("leaseSeconds", 180)),
+            "BEDROCK_INTERACTIVE_WEIGHT": str(bedrock_concurrency.get("interactiveWeight", 3)),
+            "BEDROCK_BULK_WEIGHT": str(bedrock_concurrency.get("bulkWeight", 1)),
+            "BEDROCK_BULK_DEFER_DEPTH": str(bedrock_concurrency.get("bulkDeferQueueDepth", 2)),
+            "BEDROCK_BULK_QUEUE_SECONDS": str(bedrock_concurrency.get("bulkQueueSeconds", 60)),
+            "USAGE_TABLE_NAME": usage_table.table_name,
+            "HEDGE_ENABLED": "true" if hedging.get("enabled") else "false",
+            "HEDGE_MODEL_ID": hedging.get("secondaryModelId", ""),
+            "HEDGE_REGION": hedging.get("secondaryRegion", ""),
+            "HEDGE_PERCENTILE": str(hedging.get("percentile", 95)),
+            "HEDGE_INITIAL_DELAY_SECONDS": str(hedging.get("initialDelaySeconds", 8)),
+            "HEDGE_MIN_DELAY_SECONDS": str(hedging.get("minDelaySeconds", 1)),
+            "HEDGE_MAX_DELAY_SECONDS": str(hedging.get("maxDelaySeconds", 30)),
+            "RESULT_RETENTION_DAYS": str(archive.get("retentionDays", 30)),
+            **trace_environment
+        }
 
         # Lambda Layer for dependencies
         dependencies_layer = _lambda.LayerVersion(
             self, "ContentTransformerDependenciesLayer",
-            code=_lambda.Code.from_asset("lambda_layer"),
+            code=_lambda.Code.from_asset(layer_asset_dir()),
             compatible_runtimes=[_lambda.Runtime.PYTHON_3_9],
             description="Content Transformer dependencies"
         )
 
+        # WebSocket API pushing job progress and results to subscribed clients
+        notification_socket_lambda = _lambda.Function(
+            self, "NotificationSocketFunction",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="notification_socket.handler",
+            code=_lambda.Code.from_asset("lambda/notification-socket"),
+            role=lambda_role,
+            timeout=Duration.seconds(10),
+            memory_size=256,
+            environment={
+                "TABLE_NAME": transform_table.table_name,
+                "SUBSCRIPTIONS_TABLE_NAME": subscriptions_table.table_name
+            },
+            layers=[dependencies_layer]
+        )
+        notifications_api = apigwv2.WebSocketApi(
+            self, "NotificationsAPI",
+            api_name="Content Transformer Notifications",
+            description="Progress and completion of background transformations",
+            connect_route_options=apigwv2.WebSocketRouteOptions(
+                integration=apigwv2_integrations.WebSocketLambdaIntegration(
+                    "ConnectIntegration", notification_socket_lambda
+                )
+            )
+        )
+        notifications_api.add_route(
+            "subscribe",
+            integration=apigwv2_integrations.WebSocketLambdaIntegration(
+                "SubscribeIntegration", notification_socket_lambda
+            )
+        )
+        notifications_stage = apigwv2.WebSocketStage(
+            self, "NotificationsStage",
+            web_socket_api=notifications_api,
+            stage_name="live",
+            auto_deploy=True
+        )
+        notifications_api.grant_manage_connections(lambda_role)
+        notification_socket_lambda.add_environment("WEBSOCKET_CALLBACK_URL", notifications_stage.callback_url)
+
         # Lambda Functions
         summarizer_lambda = _lambda.Function(
             self, "DocumentSummarizerFunction",
@@ -104,7 +361,14 @@ class ContentTransformerStack(Stack):
             environment={
                 "BUCKET_NAME": content_bucket.bucket_name,
                 "TABLE_NAME": transform_table.table_name,
-                "BEDROCK_MODEL_ID": "anthropic.claude-v2"
+                "IDEMPOTENCY_TABLE_NAME": idempotency_table.table_name,
+                "BEDROCK_MODEL_ID": "anthropic.claude-v2",
+                "DEDUPE_TABLE_NAME": dedupe_table.table_name if near_duplicates.get("enabled", True) else "",
+                "DEDUPE_REUSE_THRESHOLD": str(near_duplicates.get("reuseThreshold", 0.9)),
+                "DEDUPE_SECTION_THRESHOLD": str(near_duplicates.get("sectionThreshold", 0.5)),
+                "REVISION_TABLE_NAME": revision_table.table_name,
+                "NOTIFICATIONS_URL": notifications_stage.url,
+                **model_environment
             },
             layers=[dependencies_layer]
         )
@@ -119,7 +383,10 @@ class ContentTransformerStack(Stack):
             memory_size=1024,
             environment={
                 "TABLE_NAME": transform_table.table_name,
-                "BEDROCK_MODEL_ID": "anthropic.claude-v2"
+                "IDEMPOTENCY_TABLE_NAME": idempotency_table.table_name,
+                "BEDROCK_MODEL_ID": "anthropic.claude-v2",
+                "NOTIFICATIONS_URL": notifications_stage.url,
+                **model_environment
             },
             layers=[dependencies_layer]
         )
@@ -135,7 +402,8 @@ class ContentTransformerStack(Stack):
             environment={
                 "BUCKET_NAME": content_bucket.bucket_name,
                 "TABLE_NAME": transform_table.table_name,
-                "BEDROCK_MODEL_ID": "anthropic.claude-v2"
+                "BEDROCK_MODEL_ID": "anthropic.claude-v2",
+                **model_environment
             },
             layers=[dependencies_layer]
         )
@@ -150,7 +418,8 @@ class ContentTransformerStack(Stack):
             memory_size=1024,
             environment={
                 "TABLE_NAME": transform_table.table_name,
-                "BEDROCK_MODEL_ID": "anthropic.claude-v2"
+                "BEDROCK_MODEL_ID": "anthropic.claude-v2",
+                **model_environment
             },
             layers=[dependencies_layer]
         )
@@ -165,20 +434,145 @@ class ContentTransformerStack(Stack):
             memory_size=1536,
             environment={
                 "TABLE_NAME": transform_table.table_name,
-                "BEDROCK_MODEL_ID": "anthropic.claude-v2"
+                "BEDROCK_MODEL_ID": "anthropic.claude-v2",
+                **model_environment
             },
             layers=[dependencies_layer]
         )
 
+        upload_url_lambda = _lambda.Function(
+            self, "UploadUrlFunction",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="upload_url.handler",
+            code=_lambda.Code.from_asset("lambda/upload-url"),
+            role=lambda_role,
+            timeout=Duration.seconds(10),
+            memory_size=256,
+            environment={
+                "BUCKET_NAME": content_bucket.bucket_name,
+                **trace_environment
+            },
+            layers=[dependencies_layer]
+        )
+
+        result_reader_lambda = _lambda.Function(
+            self, "ResultReaderFunction",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="result_reader.handler",
+            code=_lambda.Code.from_asset("lambda/result-reader"),
+            role=lambda_role,
+            timeout=Duration.seconds(10),
+            memory_size=256,
+            environment={
+                "TABLE_NAME": transform_table.table_name,
+                **trace_environment
+            },
+            layers=[dependencies_layer]
+        )
+
+        # Archives results removed by TTL, in batches of up to batchSize or batchWindowSeconds
+        result_archiver_lambda = _lambda.Function(
+            self, "ResultArchiverFunction",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="result_archiver.handler",
+            code=_lambda.Code.from_asset("lambda/result-archiver"),
+            role=lambda_role,
+            timeout=Duration.seconds(300),
+            memory_size=1024,
+            environment={
+                "BUCKET_NAME": content_bucket.bucket_name,
+                "ARCHIVE_PREFIX": "archive/results"
+            },
+            layers=[dependencies_layer]
+        )
+        result_archiver_lambda.add_event_source(lambda_event_sources.DynamoEventSource(
+            transform_table,
+            starting_position=_lambda.StartingPosition.TRIM_HORIZON,
+            batch_size=archive.get("batchSize", 1000),
+            max_batching_window=Duration.seconds(archive.get("batchWindowSeconds", 300)),
+            report_batch_item_failures=True,
+            retry_attempts=archive.get("retryAttempts", 10),
+            filters=[_lambda.FilterCriteria.filter({
+                "eventName": _lambda.FilterRule.is_equal("REMOVE"),
+                "userIdentity": {
+                    "type": _lambda.FilterRule.is_equal("Service"),
+                    "principalId": _lambda.FilterRule.is_equal("dynamodb.amazonaws.com")
+                }
+            })]
+        ))
+
+        # Pushes each new or updated result to the connections subscribed to it
+        result_notifier_lambda = _lambda.Function(
+            self, "ResultNotifierFunction",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="result_notifier.handler",
+            code=_lambda.Code.from_asset("lambda/result-notifier"),
+            role=lambda_role,
+            timeout=Duration.seconds(30),
+            memory_size=256,
+            environment={
+                "SUBSCRIPTIONS_TABLE_NAME": subscriptions_table.table_name,
+                "WEBSOCKET_CALLBACK_URL": notifications_stage.callback_url
+            },
+            layers=[dependencies_layer]
+        )
+        result_notifier_lambda.add_event_source(lambda_event_sources.DynamoEventSource(
+            transform_table,
+            starting_position=_lambda.StartingPosition.LATEST,
+            batch_size=100,
+            retry_attempts=2,
+            filters=[_lambda.FilterCriteria.filter({
+                "eventName": _lambda.FilterRule.or_("INSERT", "MODIFY")
+            })]
+        ))
+
+        # Runs bulk JSONL/CSV jobs shard by shard, continuing in a new
+        # invocation from its checkpoint before the timeout. Records go to
+        # the unqualified tool functions, so they never use the live
+        # aliases' provisioned concurrency.
+        bulk_jobs = settings.get("bulkJobs", {})
+        bulk_jobs_lambda = _lambda.Function(
+            self, "BulkJobsFunction",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="bulk_jobs.handler",
+            code=_lambda.Code.from_asset("lambda/bulk-jobs"),
+            role=lambda_role,
+            timeout=Duration.seconds(900),
+            memory_size=512,
+            environment={
+                "BUCKET_NAME": content_bucket.bucket_name,
+                "BULK_JOBS_TABLE_NAME": bulk_jobs_table.table_name,
+                "SUMMARIZER_FUNCTION_NAME": summarizer_lambda.function_name,
+                "TRANSLATOR_FUNCTION_NAME": translator_lambda.function_name,
+                "BULK_CONCURRENCY": str(bulk_jobs.get("concurrency", 8)),
+                "BULK_SHARD_RECORDS": str(bulk_jobs.get("shardRecords", 200)),
+                **trace_environment
+            },
+            layers=[dependencies_layer]
+        )
+
+        # Provisioned concurrency, scheduled scaling and warm-up pings
+        # (configured under "contentTransformer" in cdk.json context)
+        summarizer_alias = self.add_live_alias(summarizer_lambda, "summarize", settings)
+        translator_alias = self.add_live_alias(translator_lambda, "translate", settings)
+        converter_alias = self.add_live_alias(converter_lambda, "convert", settings)
+        rewriter_alias = self.add_live_alias(rewriter_lambda, "rewrite", settings)
+        repurposer_alias = self.add_live_alias(repurposer_lambda, "repurpose", settings)
+
         # API Gateway
         api = apigw.RestApi(
             self, "ContentTransformerAPI",
             rest_api_name="Content Transformer AI API",
             description="AI-powered content transformation services",
+            # Handlers return gzip/brotli bodies base64-encoded; API Gateway
+            # decodes them to binary and compresses any other large response
+            binary_media_types=["*/*"],
+            min_compression_size=Size.kibibytes(1),
             default_cors_preflight_options=apigw.CorsOptions(
                 allow_origins=apigw.Cors.ALL_ORIGINS,
                 allow_methods=apigw.Cors.ALL_METHODS,
-                allow_headers=["Content-Type", "X-Amz-Date", "Authorization", "X-Api-Key"]
+                allow_headers=["Content-Type", "X-Amz-Date", "Authorization", "X-Api-Key", "If-None-Match",
+                               "Idempotency-Key", "Prefer", "X-Priority"]
             )
         )
 
@@ -187,7 +581,23 @@ class ContentTransformerStack(Stack):
         summarize_resource = api.root.add_resource("summarize")
         summarize_resource.add_method(
             "POST",
-            apigw.LambdaIntegration(summarizer_lambda),
+            apigw.LambdaIntegration(summarizer_alias),
+            method_responses=[
+                apigw.MethodResponse(
+                    status_code="200",
+                    response_parameters={
+                        "method.response.header.Access-Control-Allow-Origin": True,
+                        "method.response.header.Access-Control-Allow-Headers": True
+                    }
+                )
+            ]
+        )
+
+        # Presigned upload endpoint for large documents
+        upload_url_resource = api.root.add_resource("upload-url")
+        upload_url_resource.add_method(
+            "POST",
+            apigw.LambdaIntegration(upload_url_lambda),
             method_responses=[
                 apigw.MethodResponse(
                     status_code="200",
@@ -203,7 +613,7 @@ class ContentTransformerStack(Stack):
         translate_resource = api.root.add_resource("translate")
         translate_resource.add_method(
             "POST",
-            apigw.LambdaIntegration(translator_lambda),
+            apigw.LambdaIntegration(translator_alias),
             method_responses=[
                 apigw.MethodResponse(
                     status_code="200",
@@ -219,7 +629,7 @@ class ContentTransformerStack(Stack):
         convert_resource = api.root.add_resource("convert")
         convert_resource.add_method(
             "POST",
-            apigw.LambdaIntegration(converter_lambda),
+            apigw.LambdaIntegration(converter_alias),
             method_responses=[
                 apigw.MethodResponse(
                     status_code="200",
@@ -235,7 +645,7 @@ class ContentTransformerStack(Stack):
         rewrite_resource = api.root.add_resource("rewrite")
         rewrite_resource.add_method(
             "POST",
-            apigw.LambdaIntegration(rewriter_lambda),
+            apigw.LambdaIntegration(rewriter_alias),
             method_responses=[
                 apigw.MethodResponse(
                     status_code="200",
@@ -251,7 +661,7 @@ class ContentTransformerStack(Stack):
         repurpose_resource = api.root.add_resource("repurpose")
         repurpose_resource.add_method(
             "POST",
-            apigw.LambdaIntegration(repurposer_lambda),
+            apigw.LambdaIntegration(repurposer_alias),
             method_responses=[
                 apigw.MethodResponse(
                     status_code="200",
@@ -263,14 +673,49 @@ class ContentTransformerStack(Stack):
             ]
         )
 
+        # Stored result endpoint. It is not stage-cached: the stage cache ignores
+        # Cache-Control, so it would also keep 404, processing and failed responses.
+        # Completed results are left to clients through their ETag and Cache-Control.
+        transform_resource = api.root.add_resource("transform").add_resource("{transformId}")
+        transform_resource.add_method(
+            "GET",
+            apigw.LambdaIntegration(result_reader_lambda),
+            request_parameters={
+                "method.request.path.transformId": True,
+                "method.request.querystring.include_original_text": False,
+                "method.request.header.Accept-Encoding": False
+            },
+            method_responses=[
+                apigw.MethodResponse(
+                    status_code="200",
+                    response_parameters={
+                        "method.response.header.Access-Control-Allow-Origin": True,
+                        "method.response.header.ETag": True,
+                        "method.response.header.Cache-Control": True
+                    }
+                )
+            ]
+        )
+
+        # Bulk job endpoints: start a job, read its progress, resume it
+        bulk_jobs_resource = api.root.add_resource("bulk-jobs")
+        bulk_jobs_integration = apigw.LambdaIntegration(bulk_jobs_lambda)
+        bulk_jobs_resource.add_method("POST", bulk_jobs_integration)
+        bulk_job_resource = bulk_jobs_resource.add_resource("{jobId}")
+        bulk_job_resource.add_method("GET", bulk_jobs_integration)
+        bulk_job_resource.add_resource("resume").add_method("POST", bulk_jobs_integration)
+
         # Health check endpoint
         health_resource = api.root.add_resource("health")
         health_resource.add_method(
             "GET",
+            # binary_media_types matches every type, so mapping templates only run on text
             apigw.MockIntegration(
+                content_handling=apigw.ContentHandling.CONVERT_TO_TEXT,
                 integration_responses=[
                     apigw.IntegrationResponse(
                         status_code="200",
+                        content_handling=apigw.ContentHandling.CONVERT_TO_TEXT,
                         response_templates={
                             "application/json": '{"status": "healthy", "service": "Content Transformer AI API"}'
                         }
@@ -285,6 +730,14 @@ class ContentTransformerStack(Stack):
             ]
         )
 
+        # The CORS preflight methods are MOCK integrations too; keep their templates on text
+        for method in api.methods:
+            if method.http_method == "OPTIONS":
+                method.node.default_child.add_property_override("Integration.ContentHandling", "CONVERT_TO_TEXT")
+                method.node.default_child.add_property_override(
+                    "Integration.IntegrationResponses.0.ContentHandling", "CONVERT_TO_TEXT"
+                )
+
         # Outputs
         CfnOutput(
             self, "APIEndpoint",
@@ -292,6 +745,12 @@ class ContentTransformerStack(Stack):
             description="Content Transformer AI API Gateway endpoint"
         )
 
+        CfnOutput(
+            self, "NotificationsEndpoint",
+            value=notifications_stage.url,
+            description="WebSocket endpoint pushing background job progress and results"
+        )
+
         CfnOutput(
             self, "BucketName",
             value=content_bucket.bucket_name,
@@ -302,4 +761,56 @@ class ContentTransformerStack(Stack):
             self, "TableName",
             value=transform_table.table_name,
             description="DynamoDB table for transformation results"
-        )
\ No newline at end of file
+        )
+
+        CfnOutput(
+            self, "BulkJobsTableName",
+            value=bulk_jobs_table.table_name,
+            description="DynamoDB table of bulk jobs and their checkpoints"
+        )
+
+        CfnOutput(
+            self, "UsageTableName",
+            value=usage_table.table_name,
+            description="DynamoDB table of daily token usage counters"
+        )
+
+    def add_live_alias(self, function, tool, settings):
+        """
+        Publish a "live" alias for a function with optional provisioned
+        concurrency, scheduled scale-up/down and a warm-up ping schedule
+        """
+        provisioned = settings.get("provisionedConcurrency", {}).get(tool, 0)
+        alias = _lambda.Alias(
+            self, f"{function.node.id}LiveAlias",
+            alias_name="live",
+            version=function.current_version,
+            provisioned_concurrent_executions=provisioned or None
+        )
+
+        schedules = settings.get("scheduledScaling", [])
+        if provisioned and schedules:
+            scaling = alias.add_auto_scaling(
+                min_capacity=provisioned,
+                max_capacity=max(schedule["maxCapacity"] for schedule in schedules)
+            )
+            for schedule in schedules:
+                scaling.scale_on_schedule(
+                    schedule["name"],
+                    schedule=appscaling.Schedule.expression(schedule["schedule"]),
+                    min_capacity=schedule["minCapacity"],
+                    max_capacity=schedule["maxCapacity"]
+                )
+
+        warmer = settings.get("warmer", {})
+        if warmer.get("enabled"):
+            events.Rule(
+                self, f"{function.node.id}WarmerRule",
+                schedule=events.Schedule.rate(Duration.minutes(warmer.get("rateMinutes", 5))),
+                targets=[targets.LambdaFunction(
+                    alias,
+                    event=events.RuleTargetInput.from_object({"warmup": True})
+                )]
+            )
+
+        return alias
@@ -0,0 +1,237 @@
+"""
+Streaming text extraction for uploaded documents (txt, pdf, docx)
+"""
+import codecs
+import hashlib
+import os
+import sys
+import threading
+import zipfile
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(PROJECT_DIR, 'lambda_layer', 'python'))
+
+from content_transformer.options import MAX_DOCUMENT_CHARS
+
+# Upload limits, enforced before any parsing happens
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+# Extracted text is posted inline, so it stops where the summarizer's limit does
+MAX_EXTRACTED_CHARS = MAX_DOCUMENT_CHARS
+READ_BLOCK_SIZE = 64 * 1024
+MAX_PARAGRAPH_CHARS = 256 * 1024
+
+SUPPORTED_TYPES = ('txt', 'pdf', 'docx')
+
+WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+
+class ExtractionError(Exception):
+    """Raised when an uploaded document cannot be extracted"""
+
+
+def file_extension(filename):
+    """Return the lower-cased extension of a file name"""
+    return filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+
+
+def check_upload(filename, size):
+    """Reject unsupported or oversized uploads before reading them"""
+    extension = file_extension(filename)
+    if extension not in SUPPORTED_TYPES:
+        raise ExtractionError(f"Unsupported file type: .{extension}")
+    if size > MAX_UPLOAD_BYTES:
+        raise ExtractionError(
+            f"File is {size / 1024 / 1024:.1f} MB; the limit is {MAX_UPLOAD_BYTES // 1024 // 1024} MB"
+        )
+    return extension
+
+
+def file_hash(fileobj):
+    """Compute the SHA-256 of a seekable file object in fixed-size blocks"""
+    digest = hashlib.sha256()
+    fileobj.seek(0)
+    for block in iter(lambda: fileobj.read(READ_BLOCK_SIZE), b''):
+        digest.update(block)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+def iter_txt(fileobj):
+    """Yield paragraphs of a text file, decoding it block by block"""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    pending = ''
+    for block in iter(lambda: fileobj.read(READ_BLOCK_SIZE), b''):
+        pending += decoder.decode(block)
+        *paragraphs, pending = pending.split('\n\n')
+        for paragraph in paragraphs:
+            if paragraph.strip():
+                yield paragraph.strip()
+        # Files without blank lines must not accumulate in one buffer
+        while len(pending) > MAX_PARAGRAPH_CHARS:
+            cut = pending.rfind('\n', 0, MAX_PARAGRAPH_CHARS)
+            cut = cut if cut > 0 else MAX_PARAGRAPH_CHARS
+            if pending[:cut].strip():
+                yield pending[:cut].strip()
+            pending = pending[cut:]
+    pending += decoder.decode(b'', final=True)
+    if pending.strip():
+        yield pending.strip()
+
+
+def iter_docx(fileobj):
+    """Yield paragraphs of a .docx file without building the whole XML tree"""
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile as e:
+        raise ExtractionError(f"Not a valid .docx file: {e}")
+
+    with archive, archive.open('word/document.xml') as document:
+        parts = []
+        for event, element in ElementTree.iterparse(document, events=('end',)):
+            if element.tag == WORD_NS + 't' and element.text:
+                parts.append(element.text)
+            elif element.tag == WORD_NS + 'tab':
+                parts.append('\t')
+            elif element.tag == WORD_NS + 'p':
+                paragraph = ''.join(parts).strip()
+                parts = []
+                # Drop finished paragraphs so memory stays flat
+                element.clear()
+                if paragraph:
+                    yield paragraph
+
+
+def iter_pdf(fileobj):
+    """Yield the text of a PDF one page at a time"""
+    try:
+        from pypdf import PdfReader
+        from pypdf.errors import PdfReadError
+    except ImportError:
+        raise ExtractionError("PDF support requires the 'pypdf' package")
+
+    try:
+        reader = PdfReader(fileobj)
+        for page in reader.pages:
+            text = (page.extract_text() or '').strip()
+            if text:
+                yield text
+    except PdfReadError as e:
+        raise ExtractionError(f"Could not read PDF: {e}")
+
+
+EXTRACTORS = {
+    'txt': iter_txt,
+    'docx': iter_docx,
+    'pdf': iter_pdf,
+}
+
+
+class ExtractionJob:
+    """Tracks the progress and outcome of one background extraction"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.sections = 0
+        self.characters = 0
+        self.truncated = False
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+
+def extract_text(fileobj, filename, job=None, max_chars=MAX_EXTRACTED_CHARS):
+    """
+    Extract text from a document, stopping once max_chars have been collected
+    """
+    extension = check_upload(filename, _stream_size(fileobj))
+    job = job or ExtractionJob(filename)
+
+    sections = []
+    for section in EXTRACTORS[extension](fileobj):
+        if job.cancelled.is_set():
+            break
+        # Separators are counted too, so the budget can be spent before a section starts
+        remaining = max(0, max_chars - job.characters)
+        if len(section) >= remaining:
+            if remaining:
+                sections.append(section[:remaining])
+                job.characters += remaining
+                job.sections += 1
+            job.truncated = True
+            break
+        sections.append(section)
+        job.characters += len(section) + 2
+        job.sections += 1
+
+    return '\n\n'.join(sections)
+
+
+def _stream_size(fileobj):
+    position = fileobj.tell()
+    fileobj.seek(0, 2)
+    size = fileobj.tell()
+    fileobj.seek(position)
+    return size
+
+
+# Extracted text with the counts the job reported, so cache hits report them too
+CachedExtraction = namedtuple('CachedExtraction', ['text', 'sections', 'characters', 'truncated'])
+
+
+class DocumentExtractor:
+    """
+    Runs extractions on a worker pool and caches results by file hash
+    """
+
+    def __init__(self, max_workers=2, cache_chars=4 * MAX_EXTRACTED_CHARS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='extract')
+        self._cache = OrderedDict()
+        self._cache_chars = cache_chars
+        self._cached_chars = 0
+        self._lock = threading.Lock()
+
+    def cached(self, digest):
+        """Return cached extracted text, or None"""
+        entry = self._cached_entry(digest)
+        return entry.text if entry is not None else None
+
+    def _cached_entry(self, digest):
+        with self._lock:
+            if digest in self._cache:
+                self._cache.move_to_end(digest)
+                return self._cache[digest]
+        return None
+
+    def submit(self, fileobj, filename):
+        """
+        Start extracting a document in the background
+
+        Returns (digest, job, future); the future resolves to the extracted text.
+        """
+        check_upload(filename, _stream_size(fileobj))
+        digest = file_hash(fileobj)
+        job = ExtractionJob(filename)
+        future = self._executor.submit(self._extract, fileobj, filename, digest, job)
+        return digest, job, future
+
+    def _extract(self, fileobj, filename, digest, job):
+        cached = self._cached_entry(digest)
+        if cached is not None:
+            job.sections, job.characters, job.truncated = cached.sections, cached.characters, cached.truncated
+            return cached.text
+
+        text = extract_text(fileobj, filename, job)
+        if not job.cancelled.is_set():
+            with self._lock:
+                if digest not in self._cache:
+                    self._cache[digest] = CachedExtraction(text, job.sections, job.characters, job.truncated)
+                    self._cached_chars += len(text)
+                # Evict least recently used results until under the size budget
+                while self._cached_chars > self._cache_chars and len(self._cache) > 1:
+                    _, evicted = self._cache.popitem(last=False)
+                    self._cached_chars -= len(evicted.text)
+        return text
@@ -0,0 +1,144 @@
+import json
+import os
+
+from content_transformer import bulk, runtime
+from content_transformer.deadline import current_deadline, deadline_aware
+from content_transformer.options import LANGUAGES, SOURCE_LANGUAGES, SUMMARY_TYPES, TRANSLATION_STYLES
+from content_transformer.options import MAX_SUMMARY_LENGTH, MIN_SUMMARY_LENGTH
+from content_transformer.responses import error_response, json_response
+from content_transformer.tracing import annotate, traced
+from content_transformer.validation import Field, Schema, ValidationError
+from content_transformer.warmup import is_warmup, warmup_response
+
+REQUEST_SCHEMA = Schema([
+    # Only objects issued through the upload endpoint may be processed
+    Field('input_key', required=True, prefix='uploads/', maximum=1024),
+    Field('tool', required=True, choices=tuple(bulk.TOOLS)),
+    Field('format', choices=bulk.FORMATS),
+    # JSONL key or CSV column holding each record's text, and optionally its ID
+    Field('text_field', default='text', allow_blank=False, maximum=255),
+    Field('id_field', maximum=255),
+    # Options passed to the tool for every record; its own defaults apply when unset
+    Field('summary_type', choices=SUMMARY_TYPES),
+    Field('length', kind=int, minimum=MIN_SUMMARY_LENGTH, maximum=MAX_SUMMARY_LENGTH),
+    Field('source_language', choices=SOURCE_LANGUAGES),
+    Field('target_language', choices=LANGUAGES),
+    Field('translation_style', choices=TRANSLATION_STYLES),
+    Field('strip_markup', kind=bool),
+])
+
+def start_run(job_id, context):
+    """Continue a job in a new asynchronous invocation of this function"""
+    runtime.client('lambda').invoke(
+        FunctionName=context.invoked_function_arn,
+        InvocationType='Event',
+        Payload=json.dumps({bulk.CONTINUATION_KEY: {'jobId': job_id}}).encode('utf-8')
+    )
+
+def create_job(event, context, store):
+    """POST /bulk-jobs: check the input object, record the job and start its first run"""
+    try:
+        body = REQUEST_SCHEMA.validate_event(event)
+    except ValidationError as e:
+        return error_response(e.status_code, e.message, event)
+
+    s3 = runtime.client('s3')
+    try:
+        input_bytes = s3.head_object(Bucket=os.environ['BUCKET_NAME'], Key=body['input_key'])['ContentLength']
+    except Exception as e:
+        if getattr(e, 'response', {}).get('Error', {}).get('Code') not in ('404', 'NoSuchKey', 'NotFound'):
+            raise
+        return error_response(400, 'input_key was not found; upload the file first', event)
+
+    tool = bulk.TOOLS[body['tool']]
+    job = store.create(bulk.new_job(
+        runtime.new_transform_id(), body['tool'], body['input_key'],
+        bulk.input_format(body['input_key'], body['format']), input_bytes, body['text_field'], body['id_field'],
+        {name: body[name] for name in tool.options}
+    ))
+    annotate(jobId=job['jobId'])
+    try:
+        start_run(job['jobId'], context)
+    except Exception as e:
+        store.fail(job, f"Could not start the job: {e}")
+        return error_response(500, 'Could not start the job', event)
+
+    status_path = f"/bulk-jobs/{job['jobId']}"
+    return json_response(202, dict(bulk.job_status(job), statusPath=status_path), event, {'Location': status_path})
+
+def get_job(event, store):
+    """GET /bulk-jobs/{jobId}: progress, counts and throughput"""
+    job = store.get((event.get('pathParameters') or {}).get('jobId', ''))
+    if job is None:
+        return error_response(404, 'Bulk job not found', event)
+    return json_response(200, bulk.job_status(job), event)
+
+def resume_job(event, context, store):
+    """POST /bulk-jobs/{jobId}/resume: run a failed or stalled job again from its checkpoint"""
+    job = store.get((event.get('pathParameters') or {}).get('jobId', ''))
+    if job is None:
+        return error_response(404, 'Bulk job not found', event)
+    if job['status'] == bulk.COMPLETED:
+        return error_response(409, 'Bulk job already completed', event)
+    if job['status'] == bulk.FAILED:
+        job = store.resume(job)
+        if job is None:
+            return error_response(409, 'Bulk job changed while resuming; try again', event)
+    start_run(job['jobId'], context)
+    return json_response(202, bulk.job_status(job), event)
+
+def run(event, context, store):
+    """
+    One run of a job: process shards until the input ends or time runs short
+
+    A run that stops early starts the next one. An error leaves the job
+    running at its last checkpoint, so Lambda's retries of this
+    asynchronous invocation (or POST .../resume) pick it up from there.
+    """
+    job = store.get(event[bulk.CONTINUATION_KEY]['jobId'])
+    if job is None or job['status'] != bulk.RUNNING:
+        return {'status': job['status'] if job else 'missing'}
+    annotate(jobId=job['jobId'])
+    try:
+        job = bulk.run_job(
+            job, store, runtime.client('s3'), runtime.client('lambda'), current_deadline(),
+            int(os.environ.get('BULK_CONCURRENCY', bulk.DEFAULT_CONCURRENCY)),
+            int(os.environ.get('BULK_SHARD_RECORDS', bulk.DEFAULT_SHARD_RECORDS))
+        )
+    except Exception as e:
+        latest = store.get(job['jobId'])
+        if latest is not None:
+            store.record_error(latest, str(e))
+        raise
+    if job is None:
+        # Another run checkpointed first and carries on
+        return {'status': 'superseded'}
+    if job['status'] == bulk.RUNNING:
+        start_run(job['jobId'], context)
+    return bulk.job_status(job)
+
+@traced('bulk-jobs')
+@deadline_aware
+def handler(event, context):
+    """
+    Lambda function starting, running and reporting bulk jobs
+    """
+    # Scheduled warm-up pings return before any AWS calls
+    if is_warmup(event):
+        return warmup_response(clients=('s3', 'lambda'), resources=('dynamodb',))
+
+    store = bulk.default_store()
+    if bulk.CONTINUATION_KEY in event:
+        return run(event, context, store)
+
+    try:
+        method, resource = event.get('httpMethod'), event.get('resource')
+        if method == 'POST' and resource == '/bulk-jobs':
+            return create_job(event, context, store)
+        if method == 'GET' and resource == '/bulk-jobs/{jobId}':
+            return get_job(event, store)
+        if method == 'POST' and resource == '/bulk-jobs/{jobId}/resume':
+            return resume_job(event, context, store)
+        return error_response(404, 'Not found', event)
+    except Exception as e:
+        return error_response(500, str(e), event)
@@ -1,115 +1,328 @@
-import json
-import boto3
-import uuid
 import time
 import os
-from datetime import datetime
 
+from content_transformer import runtime
+from content_transformer.archive import result_expiry
+from content_transformer.bedrock import invoke_model
+from content_transformer.chunking import map_chunks
+from content_transformer.deadline import DeadlineExceeded, deadline_aware
+from content_transformer import dedupe, hash_tree
+from content_transformer.idempotency import idempotent
+from content_transformer.minhash import MinHasher
+from content_transformer.notifications import background, job_identity
+from content_transformer.options import MAX_DOCUMENT_CHARS, MAX_SUMMARY_LENGTH, MIN_SUMMARY_LENGTH
+from content_transformer.options import SUMMARY_TYPES
+from content_transformer.preprocess import preprocess, template
+from content_transformer.priority import prioritized
+from content_transformer.rate_limit import client_key, rate_limited
+from content_transformer.responses import error_response, json_response
+from content_transformer.s3_stream import iter_object_text
+from content_transformer.semaphore import SemaphoreTimeout
+from content_transformer.tracing import annotate, traced
+from content_transformer.usage import TokenUsage, record_usage
+from content_transformer.validation import Field, Schema, validated, validated_body
+from content_transformer.warmup import is_warmup, warmup_response
+
+REQUEST_SCHEMA = Schema([
+    Field('document_text', max_chars=MAX_DOCUMENT_CHARS, allow_blank=False),
+    # Only objects issued through the upload endpoint may be summarized
+    Field('s3_key', prefix='uploads/', maximum=1024),
+    Field('summary_type', default='Bullet Points', choices=SUMMARY_TYPES),
+    Field('length', kind=int, default=5, minimum=MIN_SUMMARY_LENGTH, maximum=MAX_SUMMARY_LENGTH),
+    # Living documents pass a stable ID so revisions only re-summarize what changed
+    Field('document_id', minimum=1, maximum=255),
+    # HTML or Markdown sources can have their markup stripped before summarizing
+    Field('strip_markup', kind=bool, default=False),
+], one_of=('document_text', 's3_key'))
+
+SUMMARY_PROMPT = template("""
+    Please summarize the following document in {summary_type} format with a length level of {length}/10:
+
+    Document: {text}
+
+    Requirements:
+    - Format: {summary_type}
+    - Conciseness level: {length}/10 (1=very brief, 10=detailed)
+    - Focus on key insights and actionable information
+    - Maintain professional tone
+    """)
+
+def summarize_text(bedrock, model_id, text, summary_type, length, usage=None, markup=False):
+    """
+    Summarize a single piece of text
+
+    Running headers, footers and boilerplate are dropped first, and HTML or
+    Markdown markup too when markup is set.
+    """
+    text, tokens_saved = preprocess(text, markup=markup)
+    if usage is not None:
+        usage.add_saved(tokens_saved)
+    prompt = SUMMARY_PROMPT.format(text=text, summary_type=summary_type, length=length)
+    return invoke_model(bedrock, model_id, prompt, usage=usage)
+
+def summarize_chunks(bedrock, model_id, chunks, summary_type, length, usage=None,
+                     known_sections=None, sections=None, markup=False):
+    """
+    Summarize a stream of chunks, then merge the partial summaries
+
+    Chunks whose digest is in known_sections reuse that summary instead of
+    calling the model. Each chunk's summary is recorded in sections, keyed
+    by digest, when a dict is passed. If the deadline passes, the
+    DeadlineExceeded raised carries the leading section summaries joined
+    together as its partial summary.
+    """
+    def summarize_chunk(chunk):
+        digest = dedupe.section_digest(chunk)
+        summary = (known_sections or {}).get(digest)
+        if summary is None:
+            summary = summarize_text(bedrock, model_id, chunk, summary_type, length, usage, markup)
+        if sections is not None:
+            sections[digest] = summary
+        return summary
+
+    try:
+        partial_summaries = map_chunks(chunks, summarize_chunk, report_progress=True)
+    except DeadlineExceeded as e:
+        raise DeadlineExceeded(str(e), join_sections(e.partial or []) or None, e.completed) from e
+    if len(partial_summaries) <= 1:
+        return partial_summaries[0] if partial_summaries else ''
+    try:
+        return merge_summaries(bedrock, model_id, partial_summaries, summary_type, length, usage)
+    except DeadlineExceeded as e:
+        raise DeadlineExceeded(str(e), join_sections(partial_summaries), len(partial_summaries)) from e
+
+def join_sections(partial_summaries):
+    """Section summaries one after another, for when there is no time to merge them"""
+    return '\n\n'.join(summary.strip() for summary in partial_summaries)
+
+def merge_summaries(bedrock, model_id, partial_summaries, summary_type, length, usage=None):
+    """Combine section summaries into one"""
+    combined = '\n\n'.join(
+        f"Section {i}:\n{summary.strip()}" for i, summary in enumerate(partial_summaries, 1)
+    )
+    return summarize_text(bedrock, model_id, combined, summary_type, length, usage)
+
+def summarize_revision(store, tree_id, bedrock, model_id, blocks, summary_type, length, usage,
+                       markup=False):
+    """
+    Summarize a revision of a living document through its chunk hash tree
+
+    Chunks and merged sections unchanged since the previous revision reuse
+    their cached summaries. Returns (summary, revision_details). If the
+    deadline passes, the summaries computed so far are saved for the next
+    attempt and the DeadlineExceeded raised carries the last finished level
+    of the tree joined together as its partial summary.
+    """
+    manifest = store.load_manifest(tree_id)
+    cached = store.load_summaries(tree_id, hash_tree.previous_hashes(manifest))
+    try:
+        tree = hash_tree.build_summary_tree(
+            hash_tree.iter_content_chunks(blocks),
+            lambda chunk: summarize_text(bedrock, model_id, chunk, summary_type, length, usage, markup),
+            lambda summaries: merge_summaries(bedrock, model_id, summaries, summary_type, length, usage),
+            cached,
+            salt=f"{summary_type}#{length}" + ('#markup' if markup else '')
+        )
+    except DeadlineExceeded as e:
+        tree = e.partial
+        store.save_partial(tree_id, tree, manifest)
+        finished = [tree.summaries[digest] for digest in tree.levels[-1]]
+        raise DeadlineExceeded(str(e), join_sections(finished) or None, e.completed) from e
+    revision = int(manifest['revision']) + 1 if manifest else 1
+    store.save(tree_id, tree, revision)
+    return tree.summary, {
+        'revision': revision,
+        'chunks': len(tree.levels[0]) if tree.levels else 0,
+        'chunks_resummarized': sum(1 for digest in tree.levels[0] if digest in tree.computed) if tree.levels else 0,
+        'sections_merged': sum(1 for digest in tree.children if digest in tree.computed)
+    }
+
+class WordCounter:
+    """Counts words in text blocks as they stream past"""
+
+    def __init__(self):
+        self.words = 0
+
+    def count(self, blocks):
+        for block in blocks:
+            self.words += len(block.split())
+            yield block
+
+@traced('summarize')
+@prioritized('summarize')
+@validated(REQUEST_SCHEMA)
+@rate_limited('summarize', max_output_tokens=1500)
+@idempotent('summarize')
+@background('summarization')
+@deadline_aware
 def handler(event, context):
     """
     Lambda function for AI document summarization
     """
+    # Scheduled warm-up pings return before any AWS calls
+    if is_warmup(event):
+        return warmup_response(clients=('bedrock-runtime', 's3'), resources=('dynamodb',))
+
+    started = time.monotonic()
     try:
-        # Parse request body
-        body = json.loads(event['body']) if event.get('body') else {}
-        
-        document_text = body.get('document_text', '')
-        summary_type = body.get('summary_type', 'Bullet Points')
-        length = body.get('length', 5)
-        
+        # Request body, already checked against REQUEST_SCHEMA
+        body = validated_body(event)
+
+        document_text = body['document_text'] or ''
+        s3_key = body['s3_key']
+        summary_type = body['summary_type']
+        length = body['length']
+        markup = body['strip_markup']
+        document_id = body['document_id']
+
         # Initialize AWS clients
-        bedrock = boto3.client('bedrock-runtime')
-        dynamodb = boto3.resource('dynamodb')
-        
+        bedrock = runtime.client('bedrock-runtime')
+        dynamodb = runtime.resource('dynamodb')
+
         # Get environment variables
         table_name = os.environ['TABLE_NAME']
         model_id = os.environ['BEDROCK_MODEL_ID']
-        
-        # Generate transform ID
-        transform_id = str(uuid.uuid4())
-        timestamp = int(time.time())
-        
-        # Create AI prompt for summarization
-        prompt = f"""
-        Please summarize the following document in {summary_type} format with a length level of {length}/10:
-        
-        Document: {document_text}
-        
-        Requirements:
-        - Format: {summary_type}
-        - Conciseness level: {length}/10 (1=very brief, 10=detailed)
-        - Focus on key insights and actionable information
-        - Maintain professional tone
-        """
-        
-        # Call Bedrock AI model
-        response = bedrock.invoke_model(
-            modelId=model_id,
-            body=json.dumps({
-                'prompt': prompt,
-                'max_tokens_to_sample': 1500,
-                'temperature': 0.3
-            })
-        )
-        
-        # Parse AI response
-        ai_response = json.loads(response['body'].read())
-        summary = ai_response.get('completion', '')
-        
+
+        # Generate transform ID; a background job keeps the one it was accepted with
+        transform_id, timestamp = job_identity(event)
+        annotate(transformId=transform_id)
+
+        # Stream the document from S3 or chunk the inline text
+        def document_blocks():
+            if s3_key:
+                return iter_object_text(runtime.client('s3'), os.environ['BUCKET_NAME'], s3_key)
+            return [document_text]
+
+        scope = client_key(event) or 'anonymous'
+        options = f"{summary_type}#{length}" + ('#markup' if markup else '')
+        revision_store = hash_tree.default_store() if document_id else None
+        dedupe_store = dedupe.default_store() if revision_store is None else None
+        dedupe_settings = dedupe.DedupeSettings.from_environment()
+        signature, near_duplicate, similarity = None, None, 0.0
+        counter = WordCounter()
+        if dedupe_store is not None:
+            # Fingerprint the document first so a near-duplicate can skip the model
+            hasher = MinHasher()
+            for block in counter.count(document_blocks()):
+                hasher.update(block)
+            signature = hasher.signature()
+            try:
+                near_duplicate, similarity = dedupe.find_near_duplicate(
+                    dedupe_store, signature, scope, options, dedupe_settings.section_threshold
+                )
+            except Exception as e:
+                print(f"Near-duplicate lookup failed, summarizing normally: {e}")
+
+        usage = TokenUsage()
+        revision, reused, partial = None, None, None
+        if revision_store is not None:
+            try:
+                summary, revision = summarize_revision(
+                    revision_store, hash_tree.tree_id(scope, document_id), bedrock, model_id,
+                    counter.count(document_blocks()), summary_type, length, usage, markup
+                )
+            except DeadlineExceeded as e:
+                if e.partial is None:
+                    raise
+                # Out of time: the finished chunks are saved for a retry and summarized here
+                summary, partial = e.partial, {'sections_completed': e.completed}
+        elif near_duplicate is not None and similarity >= dedupe_settings.reuse_threshold:
+            # Close enough to reuse the stored summary outright
+            summary = near_duplicate['summary']
+            reused = {'reused': 'summary'}
+        else:
+            # Call Bedrock AI model, reusing summaries of unchanged sections
+            known_sections = near_duplicate.get('sections') if near_duplicate else None
+            sections = {}
+            if signature is not None:
+                counter = WordCounter()
+            # Content-defined boundaries only move near an edit, so unchanged sections keep their digests
+            chunks = hash_tree.iter_content_chunks(counter.count(document_blocks()))
+            try:
+                summary = summarize_chunks(bedrock, model_id, chunks, summary_type, length, usage,
+                                           known_sections, sections, markup)
+            except DeadlineExceeded as e:
+                if e.partial is None:
+                    raise
+                # Out of time: keep the sections that finished instead of losing them
+                summary, partial = e.partial, {'sections_completed': e.completed}
+            sections_reused = sum(1 for digest in sections if digest in (known_sections or {}))
+            reused = {'reused': 'sections', 'sections_reused': sections_reused} if sections_reused else None
+            if signature is not None and partial is None:
+                dedupe.index_document(dedupe_store, transform_id, signature, scope, options, summary, sections)
+
         # Calculate metrics
-        original_words = len(document_text.split())
+        original_words = counter.words
         summary_words = len(summary.split())
         compression_ratio = round((1 - summary_words / original_words) * 100, 1) if original_words > 0 else 0
-        
-        # Store result in DynamoDB
+
+        processing_ms = round((time.monotonic() - started) * 1000)
+
+        # Store result in DynamoDB; S3 documents are referenced, not copied
+        item = {
+            'transformId': transform_id,
+            'timestamp': timestamp,
+            'transformationType': 'summarization',
+            'summary_type': summary_type,
+            'length_level': length,
+            'summary': summary,
+            'original_words': original_words,
+            'summary_words': summary_words,
+            'compression_ratio': compression_ratio,
+            'status': 'partial' if partial else 'completed',
+            'processing_ms': processing_ms,
+            'usage': usage.as_dict(),
+            'createdAt': runtime.utc_isoformat(timestamp)
+        }
+        if partial:
+            item.update(partial, partial=True)
+        # Expired results leave the table for the archive in S3
+        expires_at = result_expiry(timestamp)
+        if expires_at:
+            item['expiresAt'] = expires_at
+        if reused:
+            item['near_duplicate_of'] = near_duplicate['transformId']
+        if revision:
+            item['document_id'] = document_id
+            item['revision'] = revision['revision']
+        if s3_key:
+            item['source_key'] = s3_key
+        else:
+            item['original_text'] = document_text
         table = dynamodb.Table(table_name)
-        table.put_item(
-            Item={
-                'transformId': transform_id,
-                'timestamp': timestamp,
-                'transformationType': 'summarization',
-                'summary_type': summary_type,
-                'length_level': length,
-                'original_text': document_text,
-                'summary': summary,
+        table.put_item(Item=item)
+        record_usage('summarize', model_id, client_key(event), usage, timestamp)
+
+        response_body = {
+            'transformId': transform_id,
+            'status': 'partial' if partial else 'success',
+            'message': f"Time ran out; the summary covers the first {partial['sections_completed']} sections"
+            if partial else 'Document summarized successfully',
+            'summary': summary,
+            'metrics': {
                 'original_words': original_words,
                 'summary_words': summary_words,
-                'compression_ratio': compression_ratio,
-                'status': 'completed',
-                'createdAt': datetime.utcnow().isoformat()
-            }
-        )
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Content-Type': 'application/json'
+                'compression_ratio': f"{compression_ratio}%",
+                'processing_time': f"{processing_ms / 1000:.1f}s"
             },
-            'body': json.dumps({
-                'transformId': transform_id,
-                'status': 'success',
-                'message': 'Document summarized successfully',
-                'summary': summary,
-                'metrics': {
-                    'original_words': original_words,
-                    'summary_words': summary_words,
-                    'compression_ratio': f"{compression_ratio}%",
-                    'processing_time': '2.3s'
-                }
-            })
+            'usage': usage.as_dict()
         }
-        
+        if partial:
+            response_body.update(partial, partial=True)
+        if revision:
+            response_body['revision'] = dict(revision, document_id=document_id)
+        if reused:
+            response_body['near_duplicate'] = dict(
+                reused, transformId=near_duplicate['transformId'], similarity=round(similarity, 3)
+            )
+
+        return json_response(200, response_body, event)
+
+    except DeadlineExceeded as e:
+        return error_response(504, str(e), event)
+
+    except SemaphoreTimeout as e:
+        return error_response(503, str(e), event, {'Retry-After': '5'})
+
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
-            'body': json.dumps({
-                'status': 'error',
-                'message': str(e)
-            })
-        }
\ No newline at end of file
+        return error_response(500, str(e), event)
\ No newline at end of file
@@ -1,113 +1,249 @@
-import json
-import boto3
-import uuid
 import time
 import os
-from datetime import datetime
 
+from content_transformer import runtime
+from content_transformer.archive import result_expiry
+from content_transformer.bedrock import invoke_completion
+from content_transformer.chunking import map_chunks
+from content_transformer.deadline import DeadlineExceeded, deadline_aware
+from content_transformer.idempotency import idempotent
+from content_transformer.notifications import background, job_identity
+from content_transformer.options import LANGUAGES, SOURCE_LANGUAGES, TRANSLATION_STYLES
+from content_transformer.preprocess import preprocess, template
+from content_transformer.priority import prioritized
+from content_transformer.rate_limit import client_key, rate_limited
+from content_transformer.responses import error_response, json_response
+from content_transformer.segmentation import context_tail, segment_batches, split_edges, stitch
+from content_transformer.semaphore import SemaphoreTimeout
+from content_transformer.tokens import estimate_tokens
+from content_transformer.tracing import annotate, traced
+from content_transformer.usage import TokenUsage, record_usage
+from content_transformer.validation import Field, Schema, validated, validated_body
+from content_transformer.warmup import is_warmup, warmup_response
+
+# Texts above this many estimated tokens are split into batches
+SINGLE_PASS_TOKENS = 600
+BATCH_TOKENS = 400
+MAX_OUTPUT_TOKENS = 1000
+MAX_TEXT_CHARS = 100_000
+# Source text from the previous batch shown to the model for continuity
+CONTEXT_TOKENS = 80
+# A batch cut off by the output cap is halved and retried at most this deep
+MAX_SPLIT_DEPTH = 2
+
+TRANSLATION_PROMPT = template("""
+    Translate the following text from {source_language} to {target_language}.
+
+    Translation requirements:
+    - Style: {translation_style}
+    - Maintain original meaning and context
+    - Use natural, fluent language in the target language
+    - Preserve any technical terms appropriately
+    {context_note}
+    Text to translate: "{text}"
+
+    Provide only the translated text without any additional commentary.
+    """)
+CONTEXT_NOTE = 'Preceding text, for context only (do not translate it): "{context}"\n'
+
+def translation_prompt(text, source_language, target_language, translation_style, context=''):
+    """Prompt for translating one piece of text"""
+    return TRANSLATION_PROMPT.format(
+        text=text,
+        source_language=source_language,
+        target_language=target_language,
+        translation_style=translation_style,
+        context_note=CONTEXT_NOTE.format(context=context) if context else ''
+    )
+
+def translate_segment(bedrock, model_id, text, languages, context, usage, depth=0):
+    """
+    Translate one batch; returns (translated_text, truncated)
+
+    If the model stops at the output cap, the batch is split in half on
+    sentence boundaries and each half translated again.
+    """
+    source_language, target_language, translation_style = languages
+    prompt = translation_prompt(text, source_language, target_language, translation_style, context)
+    completion = invoke_completion(bedrock, model_id, prompt, max_tokens=MAX_OUTPUT_TOKENS, usage=usage)
+    if completion.stop_reason != 'max_tokens':
+        return completion.text.strip(), False
+
+    halves = segment_batches(text, max(1, estimate_tokens(text) // 2))
+    if depth >= MAX_SPLIT_DEPTH or len(halves) < 2:
+        return completion.text.strip(), True
+    pieces, truncated = [], False
+    for half in halves:
+        leading, content, trailing = split_edges(half)
+        translated, half_truncated = translate_segment(bedrock, model_id, content, languages, context, usage, depth + 1)
+        pieces.append(leading + translated + trailing)
+        truncated = truncated or half_truncated
+        context = context_tail(content, CONTEXT_TOKENS)
+    return stitch(pieces).strip(), truncated
+
+def translate_text(bedrock, model_id, text, source_language, target_language, translation_style, usage,
+                   markup=False):
+    """
+    Translate text, batching long inputs on sentence and paragraph boundaries
+
+    Returns (translated_text, truncated, segments). Batches run in parallel,
+    each with the end of the previous batch as context, and are stitched
+    back in order with the original paragraph spacing. Whitespace (and
+    markup, when markup is set) is normalized first; every line is kept.
+    If the deadline passes, the DeadlineExceeded raised carries the same
+    tuple for the leading batches that finished as its partial value.
+    """
+    text, tokens_saved = preprocess(text, remove_repeats=False, markup=markup)
+    usage.add_saved(tokens_saved)
+    languages = (source_language, target_language, translation_style)
+    if estimate_tokens(text) <= SINGLE_PASS_TOKENS:
+        translated, truncated = translate_segment(bedrock, model_id, text, languages, '', usage)
+        return translated, truncated, 1
+
+    batches = segment_batches(text, BATCH_TOKENS)
+    jobs = [
+        (batch, context_tail(batches[i - 1], CONTEXT_TOKENS) if i else '')
+        for i, batch in enumerate(batches)
+    ]
+
+    def translate_job(job):
+        batch, context = job
+        leading, content, trailing = split_edges(batch)
+        if not content:
+            return batch, False
+        translated, truncated = translate_segment(bedrock, model_id, content, languages, context, usage)
+        return leading + translated + trailing, truncated
+
+    try:
+        results = map_chunks(jobs, translate_job, report_progress=True)
+    except DeadlineExceeded as e:
+        done = e.partial or []
+        partial = (stitch(piece for piece, _ in done).strip(), any(truncated for _, truncated in done), len(batches))
+        raise DeadlineExceeded(str(e), partial if done else None, len(done)) from e
+    return stitch(piece for piece, _ in results).strip(), any(truncated for _, truncated in results), len(batches)
+
+REQUEST_SCHEMA = Schema([
+    Field('text_to_translate', required=True, max_chars=MAX_TEXT_CHARS, allow_blank=False),
+    Field('source_language', default='Auto-Detect', choices=SOURCE_LANGUAGES),
+    Field('target_language', default='English', choices=LANGUAGES),
+    Field('translation_style', default='Standard', choices=TRANSLATION_STYLES),
+    # Clients that already hold the input can skip having it echoed back
+    Field('include_original_text', kind=bool, default=True),
+    # HTML or Markdown sources can have their markup stripped before translating
+    Field('strip_markup', kind=bool, default=False),
+])
+
+@traced('translate')
+@prioritized('translate')
+@validated(REQUEST_SCHEMA)
+@rate_limited('translate', max_output_tokens=MAX_OUTPUT_TOKENS)
+@idempotent('translate')
+@background('translation')
+@deadline_aware
 def handler(event, context):
     """
     Lambda function for AI language translation
     """
+    # Scheduled warm-up pings return before any AWS calls
+    if is_warmup(event):
+        return warmup_response(clients=('bedrock-runtime',), resources=('dynamodb',))
+
+    started = time.monotonic()
     try:
-        # Parse request body
-        body = json.loads(event['body']) if event.get('body') else {}
+        # Request body, already checked against REQUEST_SCHEMA
+        body = validated_body(event)
         
-        text_to_translate = body.get('text_to_translate', '')
-        source_language = body.get('source_language', 'Auto-Detect')
-        target_language = body.get('target_language', 'English')
-        translation_style = body.get('translation_style', 'Standard')
+        text_to_translate = body['text_to_translate']
+        source_language = body['source_language']
+        target_language = body['target_language']
+        translation_style = body['translation_style']
+        include_original_text = body['include_original_text']
+        markup = body['strip_markup']
         
         # Initialize AWS clients
-        bedrock = boto3.client('bedrock-runtime')
-        dynamodb = boto3.resource('dynamodb')
+        bedrock = runtime.client('bedrock-runtime')
+        dynamodb = runtime.resource('dynamodb')
         
         # Get environment variables
         table_name = os.environ['TABLE_NAME']
         model_id = os.environ['BEDROCK_MODEL_ID']
         
-        # Generate transform ID
-        transform_id = str(uuid.uuid4())
-        timestamp = int(time.time())
-        
-        # Create AI prompt for translation
-        prompt = f"""
-        Translate the following text from {source_language} to {target_language}.
-        
-        Translation requirements:
-        - Style: {translation_style}
-        - Maintain original meaning and context
-        - Use natural, fluent language in the target language
-        - Preserve any technical terms appropriately
-        
-        Text to translate: "{text_to_translate}"
-        
-        Provide only the translated text without any additional commentary.
-        """
-        
-        # Call Bedrock AI model
-        response = bedrock.invoke_model(
-            modelId=model_id,
-            body=json.dumps({
-                'prompt': prompt,
-                'max_tokens_to_sample': 1000,
-                'temperature': 0.3
-            })
-        )
+        # Generate transform ID; a background job keeps the one it was accepted with
+        transform_id, timestamp = job_identity(event)
+        annotate(transformId=transform_id)
         
-        # Parse AI response
-        ai_response = json.loads(response['body'].read())
-        translated_text = ai_response.get('completion', '').strip()
+        # Call Bedrock AI model; long texts are translated in parallel batches
+        usage = TokenUsage()
+        partial = None
+        try:
+            translated_text, truncated, segments = translate_text(
+                bedrock, model_id, text_to_translate, source_language, target_language, translation_style, usage, markup
+            )
+        except DeadlineExceeded as e:
+            if e.partial is None:
+                raise
+            # Out of time: keep the batches that finished instead of losing them
+            (translated_text, truncated, segments), partial = e.partial, {'segments_completed': e.completed}
         
         # Calculate confidence score (mock for demo)
         confidence_score = 94.5
         
+        processing_ms = round((time.monotonic() - started) * 1000)
+
         # Store result in DynamoDB
+        item = {
+            'transformId': transform_id,
+            'timestamp': timestamp,
+            'transformationType': 'translation',
+            'source_language': source_language,
+            'target_language': target_language,
+            'translation_style': translation_style,
+            'original_text': text_to_translate,
+            'translated_text': translated_text,
+            'confidence_score': confidence_score,
+            'segments': segments,
+            'truncated': truncated,
+            'status': 'partial' if partial else 'completed',
+            'processing_ms': processing_ms,
+            'usage': usage.as_dict(),
+            'createdAt': runtime.utc_isoformat(timestamp)
+        }
+        if partial:
+            item.update(partial, partial=True)
+        # Expired results leave the table for the archive in S3
+        expires_at = result_expiry(timestamp)
+        if expires_at:
+            item['expiresAt'] = expires_at
         table = dynamodb.Table(table_name)
-        table.put_item(
-            Item={
-                'transformId': transform_id,
-                'timestamp': timestamp,
-                'transformationType': 'translation',
-                'source_language': source_language,
-                'target_language': target_language,
-                'translation_style': translation_style,
-                'original_text': text_to_translate,
-                'translated_text': translated_text,
-                'confidence_score': confidence_score,
-                'status': 'completed',
-                'createdAt': datetime.utcnow().isoformat()
-            }
-        )
+        table.put_item(Item=item)
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Content-Type': 'application/json'
-            },
-            'body': json.dumps({
-                'transformId': transform_id,
-                'status': 'success',
-                'message': 'Translation completed successfully',
-                'original_text': text_to_translate,
-                'translated_text': translated_text,
-                'source_language': source_language,
-                'target_language': target_language,
-                'confidence_score': confidence_score
-            })
+        record_usage('translate', model_id, client_key(event), usage, timestamp)
+
+        response_body = {
+            'transformId': transform_id,
+            'status': 'partial' if partial else 'success',
+            'message': f"Time ran out; the translation covers the first {partial['segments_completed']} of {segments} segments"
+            if partial else 'Translation completed successfully',
+            'translated_text': translated_text,
+            'source_language': source_language,
+            'target_language': target_language,
+            'confidence_score': confidence_score,
+            'segments': segments,
+            'truncated': truncated,
+            'usage': usage.as_dict()
         }
-        
+        if partial:
+            response_body.update(partial, partial=True)
+        if include_original_text:
+            response_body['original_text'] = text_to_translate
+
+        return json_response(200, response_body, event)
+
+    except DeadlineExceeded as e:
+        return error_response(504, str(e), event)
+
+    except SemaphoreTimeout as e:
+        return error_response(503, str(e), event, {'Retry-After': '5'})
+
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
-            'body': json.dumps({
-                'status': 'error',
-                'message': str(e)
-            })
-        }
\ No newline at end of file
+        return error_response(500, str(e), event)
\ No newline at end of file
@@ -0,0 +1,53 @@
+import json
+import re
+
+from content_transformer import notifications
+from content_transformer.notifications import notification_for, post_message, results_table
+
+TRANSFORM_ID_PATTERN = re.compile(r'^[0-9a-f-]{36}$')
+
+def latest_item(transform_id):
+    """The newest result item stored for a transformId, or None"""
+    response = results_table().query(
+        KeyConditionExpression='transformId = :id',
+        ExpressionAttributeValues={':id': transform_id},
+        ScanIndexForward=False,
+        Limit=1
+    )
+    items = response.get('Items', [])
+    return items[0] if items else None
+
+def subscribe(connection_id, body):
+    """Subscribe a connection to a transformId and send the job's current state"""
+    transform_id = str(body.get('transformId', ''))
+    if not TRANSFORM_ID_PATTERN.match(transform_id):
+        return {'statusCode': 400, 'body': 'transformId must be a transform ID'}
+
+    notifications.default_store().subscribe(transform_id, connection_id)
+    # A job that already finished, or made progress, before the subscription is reported now
+    item = latest_item(transform_id)
+    message = notification_for(item) if item else None
+    if message is not None:
+        post_message(notifications.connection_client(), connection_id, message)
+    return {'statusCode': 200, 'body': 'subscribed'}
+
+def handler(event, context):
+    """
+    Lambda function behind the notifications WebSocket API
+
+    Clients connect, then send {"action": "subscribe", "transformId": ...}
+    for each job they want pushed to them.
+    """
+    request_context = event.get('requestContext') or {}
+    route_key = request_context.get('routeKey')
+    if route_key in ('$connect', '$disconnect'):
+        # Subscriptions expire with the connection, or are dropped when a push finds it gone
+        return {'statusCode': 200}
+
+    try:
+        body = json.loads(event.get('body') or '{}')
+    except ValueError:
+        body = None
+    if route_key != 'subscribe' or not isinstance(body, dict):
+        return {'statusCode': 400, 'body': 'Send {"action": "subscribe", "transformId": "..."}'}
+    return subscribe(request_context['connectionId'], body)
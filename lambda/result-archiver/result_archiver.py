@@ -0,0 +1,21 @@
+import os
+
+from content_transformer import runtime
+from content_transformer.archive import ARCHIVE_PREFIX, archive_records, emit_metrics
+
+def handler(event, context):
+    """
+    Lambda function archiving expired results from the results table stream
+
+    Invoked with batches of TTL deletions; reports the first record of a
+    partition that could not be written so only the rest of the batch is
+    retried.
+    """
+    archived, written, retry_from = archive_records(
+        event.get('Records', []),
+        runtime.client('s3'),
+        os.environ['BUCKET_NAME'],
+        os.environ.get('ARCHIVE_PREFIX', ARCHIVE_PREFIX)
+    )
+    emit_metrics(archived, written, retry_from is not None)
+    return {'batchItemFailures': [{'itemIdentifier': retry_from}] if retry_from is not None else []}
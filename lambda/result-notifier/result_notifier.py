@@ -0,0 +1,17 @@
+from content_transformer import notifications
+
+def handler(event, context):
+    """
+    Lambda function pushing result progress and completion to WebSocket subscribers
+
+    Invoked with inserted and modified items from the results table stream.
+    Delivery is best effort, so nothing in a batch is retried; a client that
+    misses a message still finds the result at its resultPath.
+    """
+    sent, stale = notifications.notify(
+        notifications.default_store(),
+        notifications.connection_client(),
+        notifications.stream_notifications(event.get('Records', []))
+    )
+    notifications.emit_metrics(sent, stale)
+    return {'sent': sent, 'stale': stale}
@@ -0,0 +1,68 @@
+import os
+
+from content_transformer import runtime
+from content_transformer.responses import error_response, etag_matches, json_response, not_modified_response
+from content_transformer.tracing import annotate, traced
+from content_transformer.warmup import is_warmup, warmup_response
+
+# Bump when the shape of the returned item changes, so old ETags stop matching
+REPRESENTATION_VERSION = 'v1'
+
+# Completed results never change, so clients and caches may keep them
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+def result_etag(transform_id, include_original_text=True):
+    """Strong ETag of a completed result"""
+    variant = '' if include_original_text else '.brief'
+    return f"{transform_id}.{REPRESENTATION_VERSION}{variant}"
+
+def fetch_result(table, transform_id):
+    """Return the newest item stored for a transformId, or None"""
+    response = table.query(
+        KeyConditionExpression='transformId = :id',
+        ExpressionAttributeValues={':id': transform_id},
+        ScanIndexForward=False,
+        Limit=1
+    )
+    items = response.get('Items', [])
+    return items[0] if items else None
+
+@traced('read-result')
+def handler(event, context):
+    """
+    Lambda function returning a stored transformation result
+    """
+    # Scheduled warm-up pings return before any AWS calls
+    if is_warmup(event):
+        return warmup_response(resources=('dynamodb',))
+
+    try:
+        transform_id = (event.get('pathParameters') or {}).get('transformId', '')
+        query = event.get('queryStringParameters') or {}
+        include_original_text = query.get('include_original_text', 'true').lower() != 'false'
+
+        annotate(transformId=transform_id)
+
+        if not transform_id:
+            return error_response(400, 'transformId is required', event)
+
+        table = runtime.resource('dynamodb').Table(os.environ['TABLE_NAME'])
+        item = fetch_result(table, transform_id)
+        if item is None:
+            return error_response(404, f"No result for transformId {transform_id}", event,
+                                  {'Cache-Control': 'no-store'})
+
+        if not include_original_text:
+            item.pop('original_text', None)
+
+        # Only completed results have ETags; one still processing, partial or failed may change
+        if item.get('status') != 'completed':
+            return json_response(200, item, event, {'Cache-Control': 'no-store'})
+
+        etag = result_etag(transform_id, include_original_text)
+        if etag_matches(event, etag):
+            return not_modified_response(etag, {'Cache-Control': IMMUTABLE_CACHE_CONTROL})
+        return json_response(200, item, event, {'Cache-Control': IMMUTABLE_CACHE_CONTROL}, etag=etag)
+
+    except Exception as e:
+        return error_response(500, str(e), event)
@@ -0,0 +1,74 @@
+import os
+
+from content_transformer import runtime
+from content_transformer.responses import error_response, json_response
+from content_transformer.tracing import traced
+from content_transformer.validation import Field, Schema, validated, validated_body
+from content_transformer.warmup import is_warmup, warmup_response
+
+# Largest document accepted through a presigned upload
+MAX_UPLOAD_BYTES = 100 * 1024 * 1024
+URL_EXPIRY_SECONDS = 900
+# Uploads are read back as UTF-8 text (summaries and bulk jobs), so only text types are signed;
+# extract PDF and Word documents first, as the web app does
+TEXT_MEDIA_TYPES = ('application/json', 'application/x-ndjson', 'application/jsonl')
+
+def is_text_type(content_type):
+    media_type = content_type.split(';', 1)[0].strip().lower()
+    return media_type.startswith('text/') or media_type in TEXT_MEDIA_TYPES
+
+REQUEST_SCHEMA = Schema([
+    Field('filename', default='document.txt', maximum=255),
+    Field('content_type', default='text/plain', maximum=255),
+    Field('content_length', kind=int, required=True, minimum=1, maximum=MAX_UPLOAD_BYTES, too_large_status=413),
+])
+
+@traced('upload-url')
+@validated(REQUEST_SCHEMA)
+def handler(event, context):
+    """
+    Lambda function issuing presigned S3 upload URLs for large documents
+    """
+    # Scheduled warm-up pings return before any AWS calls
+    if is_warmup(event):
+        return warmup_response(clients=('s3',))
+
+    try:
+        # Request body, already checked against REQUEST_SCHEMA
+        body = validated_body(event)
+
+        filename = os.path.basename(body['filename']) or 'document.txt'
+        content_type = body['content_type']
+        content_length = body['content_length']
+        if not is_text_type(content_type):
+            return error_response(400, 'content_type must be a text type; extract PDF and Word documents first', event)
+
+        s3 = runtime.client('s3')
+        bucket_name = os.environ['BUCKET_NAME']
+        s3_key = f"uploads/{runtime.new_transform_id()}/{filename}"
+
+        # Length and type are signed, so S3 rejects any other upload
+        upload_url = s3.generate_presigned_url(
+            'put_object',
+            Params={
+                'Bucket': bucket_name,
+                'Key': s3_key,
+                'ContentType': content_type,
+                'ContentLength': content_length
+            },
+            ExpiresIn=URL_EXPIRY_SECONDS
+        )
+
+        return json_response(200, {
+            'status': 'success',
+            'upload_url': upload_url,
+            's3_key': s3_key,
+            'method': 'PUT',
+            'headers': {
+                'Content-Type': content_type
+            },
+            'expires_in': URL_EXPIRY_SECONDS
+        }, event)
+
+    except Exception as e:
+        return error_response(500, str(e), event)
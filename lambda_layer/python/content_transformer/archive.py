@@ -0,0 +1,228 @@
+"""
+Expiry and archival of transformation results
+
+Result items carry an expiresAt TTL, RESULT_RETENTION_DAYS after they
+were created, so the results table only holds recent results. DynamoDB
+deletes expired items and publishes each deletion on the table stream;
+the result archiver collects those old images in large batches and
+writes them to the content bucket as compressed columnar files, one per
+tool and creation date in each batch:
+
+    archive/results/tool=summarization/date=2024-05-01/part-<first timestamp>-<id>.parquet
+
+The tool= and date= directories are Hive-style partitions, so the files
+can be read as one dataset by pandas, pyarrow or Athena. Nested values
+are flattened one level (usage becomes usage_input_tokens and so on);
+anything deeper is stored as JSON text. Files are Parquet with zstd
+compression when pyarrow is installed, and gzipped column-oriented JSON
+otherwise. A batch that fails part way is retried from its first
+unwritten partition, so rows can be archived more than once; readers
+drop duplicates on (transformId, timestamp).
+"""
+import base64
+import datetime
+import gzip
+import io
+import json
+import os
+import time
+import uuid
+
+DEFAULT_RETENTION_DAYS = 30
+ARCHIVE_PREFIX = 'archive/results'
+# Written first in every file, in this order; other attributes follow sorted by name
+LEADING_COLUMNS = ('transformId', 'timestamp', 'createdAt', 'transformationType', 'status')
+TTL_PRINCIPAL = 'dynamodb.amazonaws.com'
+
+_pyarrow = []
+
+
+def pyarrow_module():
+    """Import pyarrow (with its Parquet writer) on first use; None when it is not installed"""
+    if not _pyarrow:
+        try:
+            import pyarrow
+            import pyarrow.parquet  # noqa: F401 - makes pyarrow.parquet available
+        except ImportError:
+            pyarrow = None
+        _pyarrow.append(pyarrow)
+    return _pyarrow[0]
+
+
+def retention_days():
+    return float(os.environ.get('RESULT_RETENTION_DAYS', DEFAULT_RETENTION_DAYS))
+
+
+def result_expiry(timestamp):
+    """expiresAt for a result created at timestamp, or None when results are kept forever"""
+    days = retention_days()
+    if days <= 0:
+        return None
+    return int(timestamp + days * 24 * 60 * 60)
+
+
+def from_attribute(value):
+    """Plain Python value of a DynamoDB-JSON attribute value, as found in stream images"""
+    (kind, data), = value.items()
+    if kind == 'S':
+        return data
+    if kind == 'N':
+        return int(data) if data.lstrip('-').isdigit() else float(data)
+    if kind == 'B':
+        return base64.b64decode(data)
+    if kind == 'BOOL':
+        return bool(data)
+    if kind == 'NULL':
+        return None
+    if kind == 'M':
+        return {key: from_attribute(item) for key, item in data.items()}
+    if kind == 'L':
+        return [from_attribute(item) for item in data]
+    if kind == 'SS':
+        return sorted(data)
+    if kind == 'NS':
+        return sorted(from_attribute({'N': item}) for item in data)
+    if kind == 'BS':
+        return [base64.b64decode(item) for item in data]
+    raise ValueError(f"Unknown attribute type {kind}")
+
+
+def is_expiry(record):
+    """True for a stream record of an item deleted by TTL (not by a user or handler)"""
+    identity = record.get('userIdentity') or {}
+    return record.get('eventName') == 'REMOVE' and identity.get('type') == 'Service' \
+        and identity.get('principalId') == TTL_PRINCIPAL
+
+
+def scalar(value):
+    """A value one column cell can hold: numbers, strings, booleans and bytes as is, the rest as JSON"""
+    if value is None or isinstance(value, (str, int, float, bool, bytes)):
+        return value
+    if hasattr(value, 'to_integral_value'):
+        # Decimal from a boto3 read
+        return int(value) if value == value.to_integral_value() else float(value)
+    return json.dumps(value, default=str, sort_keys=True)
+
+
+def archive_row(item):
+    """Flatten an item for a columnar file; maps become prefixed columns, one level deep"""
+    row = {}
+    for key, value in item.items():
+        if isinstance(value, dict):
+            for inner_key, inner_value in value.items():
+                row[f"{key}_{inner_key}"] = scalar(inner_value)
+        else:
+            row[key] = scalar(value)
+    return row
+
+
+def partition_of(item):
+    """(tool, UTC creation date) an item is archived under"""
+    tool = str(item.get('transformationType') or 'unknown').replace('/', '_')
+    created = datetime.datetime.fromtimestamp(int(item.get('timestamp') or 0), datetime.timezone.utc)
+    return tool, created.strftime('%Y-%m-%d')
+
+
+def to_columns(rows):
+    """
+    {column: values} for rows, in archive column order
+
+    A column holding both text and other values (an attribute whose type
+    changed over time) is stored as text throughout.
+    """
+    names = {name for row in rows for name in row}
+    ordered = [name for name in LEADING_COLUMNS if name in names] + sorted(names - set(LEADING_COLUMNS))
+    columns = {}
+    for name in ordered:
+        values = [row.get(name) for row in rows]
+        kinds = {type(value) for value in values if value is not None}
+        if len(kinds) > 1 and not kinds <= {int, float}:
+            values = [value if value is None or isinstance(value, str) else json.dumps(value, default=str)
+                      for value in values]
+        columns[name] = values
+    return columns
+
+
+def encode_columns(columns):
+    """(file bytes, file extension, content type) for one archive file"""
+    pyarrow = pyarrow_module()
+    if pyarrow is not None:
+        buffer = pyarrow.BufferOutputStream()
+        pyarrow.parquet.write_table(pyarrow.table(columns), buffer, compression='zstd')
+        return buffer.getvalue().to_pybytes(), 'parquet', 'application/vnd.apache.parquet'
+    document = json.dumps({'columns': columns}, default=lambda value: base64.b64encode(value).decode('ascii'))
+    return gzip.compress(document.encode('utf-8')), 'columns.json.gz', 'application/gzip'
+
+
+def decode_columns(data, key):
+    """{column: values} of an archive file written by encode_columns"""
+    if key.endswith('.parquet'):
+        pyarrow = pyarrow_module()
+        if pyarrow is None:
+            raise RuntimeError('Reading Parquet archives requires pyarrow')
+        return pyarrow.parquet.read_table(io.BytesIO(data)).to_pydict()
+    return json.loads(gzip.decompress(data))['columns']
+
+
+def partition_key(prefix, tool, date, first_timestamp, extension):
+    return f"{prefix}/tool={tool}/date={date}/part-{first_timestamp}-{uuid.uuid4().hex[:12]}.{extension}"
+
+
+def archive_records(records, s3, bucket, prefix=ARCHIVE_PREFIX):
+    """
+    Write the expired items in a batch of stream records to the bucket
+
+    Returns (archived item count, bytes written, sequence number to retry
+    from or None). Records other than TTL deletions are skipped. When a
+    partition's file cannot be written, the batch is retried from that
+    partition's earliest record.
+    """
+    partitions = {}
+    for record in records:
+        if not is_expiry(record):
+            continue
+        image = (record.get('dynamodb') or {}).get('OldImage')
+        if not image:
+            continue
+        item = {key: from_attribute(value) for key, value in image.items()}
+        sequence = (record.get('dynamodb') or {}).get('SequenceNumber')
+        partitions.setdefault(partition_of(item), []).append((sequence, item))
+
+    archived, written, retry_from = 0, 0, None
+    for (tool, date), entries in sorted(partitions.items()):
+        items = sorted((item for _, item in entries), key=lambda item: (item.get('timestamp') or 0))
+        data, extension, content_type = encode_columns(to_columns([archive_row(item) for item in items]))
+        key = partition_key(prefix, tool, date, items[0].get('timestamp') or 0, extension)
+        try:
+            s3.put_object(Bucket=bucket, Key=key, Body=data, ContentType=content_type)
+        except Exception as e:
+            print(f"Archiving {len(items)} results to {key} failed: {e}")
+            sequences = [int(sequence) for sequence, _ in entries if sequence is not None]
+            if sequences and (retry_from is None or min(sequences) < int(retry_from)):
+                retry_from = str(min(sequences))
+            continue
+        archived += len(items)
+        written += len(data)
+    return archived, written, retry_from
+
+
+def emit_metrics(archived, written, failed):
+    """Publish an archiver batch as a CloudWatch embedded-metric-format log line"""
+    print(json.dumps({
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': 'ContentTransformer',
+                'Dimensions': [['Archive']],
+                'Metrics': [
+                    {'Name': 'ArchivedResults', 'Unit': 'Count'},
+                    {'Name': 'ArchiveBytes', 'Unit': 'Bytes'},
+                    {'Name': 'ArchiveFailures', 'Unit': 'Count'}
+                ]
+            }]
+        },
+        'Archive': 'results',
+        'ArchivedResults': archived,
+        'ArchiveBytes': written,
+        'ArchiveFailures': 1 if failed else 0
+    }))
@@ -0,0 +1,92 @@
+"""
+Bedrock model invocation shared by the handlers
+"""
+import collections
+import json
+import time
+
+from content_transformer import hedging, tracing
+from content_transformer.deadline import MIN_MODEL_CALL_SECONDS, current_deadline
+from content_transformer.semaphore import bedrock_slot
+from content_transformer.usage import response_token_counts
+
+# stop_reason is "max_tokens" when the output cap cut the completion short
+Completion = collections.namedtuple('Completion', ['text', 'stop_reason'])
+
+
+def _invoke(bedrock, model_id, prompt, max_tokens, temperature):
+    """
+    One InvokeModel call; returns (response, decoded body)
+
+    Raises DeadlineExceeded instead of starting a call with less than
+    MIN_MODEL_CALL_SECONDS left, or when the deadline passes mid-call. The
+    caller holds the Bedrock slot.
+    """
+    deadline = current_deadline()
+    deadline.check(MIN_MODEL_CALL_SECONDS)
+
+    def call():
+        response = bedrock.invoke_model(
+            modelId=model_id,
+            body=json.dumps({
+                'prompt': prompt,
+                'max_tokens_to_sample': max_tokens,
+                'temperature': temperature
+            })
+        )
+        return response, json.loads(response['body'].read())
+
+    with tracing.span('model call', modelId=model_id, max_tokens=max_tokens):
+        return deadline.call(call)
+
+
+def invoke_completion(bedrock, model_id, prompt, max_tokens=1500, temperature=0.3, usage=None, policy=None):
+    """
+    Call the Bedrock model and return a Completion
+
+    When a TokenUsage is passed, the call's token counts are added to it.
+    Every call holds a fleet-wide slot, taken on this thread, so bursts stay
+    under the account quota; a call abandoned at the deadline gives its slot
+    up with it. With hedging enabled, a slow call is duplicated to the
+    secondary model or region and the first answer wins. Both attempts
+    share one slot, kept until the loser finishes too, and the loser's
+    tokens are added to usage.
+    """
+    current_deadline().check(MIN_MODEL_CALL_SECONDS)
+    policy = policy or hedging.HedgePolicy.from_environment()
+    if not policy.enabled:
+        with bedrock_slot():
+            response, ai_response = _invoke(bedrock, model_id, prompt, max_tokens, temperature)
+    else:
+        from content_transformer import runtime
+
+        secondary_model_id = policy.secondary_model_id or model_id
+        secondary_bedrock = runtime.client('bedrock-runtime', policy.secondary_region) \
+            if policy.secondary_region else bedrock
+        def count_abandoned(result):
+            abandoned_response, abandoned_body = result
+            if usage is not None:
+                usage.add(*response_token_counts(abandoned_response, prompt, abandoned_body.get('completion', '')))
+
+        started = time.time()
+        with bedrock_slot() as slot:
+            (response, ai_response), hedged, secondary_won = hedging.hedged_call(
+                hedging.timed(model_id, lambda: _invoke(
+                    bedrock, model_id, prompt, max_tokens, temperature)),
+                hedging.timed(secondary_model_id, lambda: _invoke(
+                    secondary_bedrock, secondary_model_id, prompt, max_tokens, temperature)),
+                policy.delay(hedging.tracker_for(model_id)),
+                on_abandoned=count_abandoned,
+                on_settled=slot.keep()
+            )
+        hedging.emit_metrics(model_id, hedged, secondary_won, time.time() - started)
+
+    completion = Completion(ai_response.get('completion', ''), ai_response.get('stop_reason'))
+    if usage is not None:
+        usage.add(*response_token_counts(response, prompt, completion.text))
+    return completion
+
+
+def invoke_model(bedrock, model_id, prompt, max_tokens=1500, temperature=0.3, usage=None, policy=None):
+    """Call the Bedrock model and return the completion text"""
+    return invoke_completion(bedrock, model_id, prompt, max_tokens, temperature, usage, policy).text
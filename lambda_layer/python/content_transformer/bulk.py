@@ -0,0 +1,438 @@
+"""
+Resumable bulk jobs over JSONL and CSV objects
+
+A job streams the records of an object in the content bucket through the
+summarizer or translator function, a bounded number at a time, and
+writes the responses as sharded JSONL. Records are read from a byte
+offset with ranged GETs and processed one shard at a time: once every
+record of a shard is answered, the shard is written and the job's
+checkpoint (input offset, next shard and counts) is advanced with a
+version-conditioned write. A run that fails, times out or hands over to
+a new invocation resumes at the last checkpoint, rewriting at most the
+shard it was in the middle of. Records it had already sent are replayed
+from their Idempotency-Key rather than paid for again.
+
+Every record is sent as bulk priority work, so a running job gives way
+to interactive requests for model slots.
+"""
+import base64
+import collections
+import concurrent.futures
+import csv
+import itertools
+import json
+import os
+import random
+import time
+
+from content_transformer import runtime
+from content_transformer.priority import BULK, PRIORITY_HEADER
+from content_transformer.responses import _json_default
+from content_transformer.s3_stream import iter_object_bytes
+from content_transformer.tracing import propagating
+
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+FORMATS = ('jsonl', 'csv')
+CONTINUATION_KEY = 'bulkJob'
+DEFAULT_CONCURRENCY = 8
+DEFAULT_SHARD_RECORDS = 200
+# A new shard is not started with less time than this left, or than the last shard took
+MIN_SHARD_SECONDS = 30
+# Nor is a record, part way through a shard
+MIN_RECORD_SECONDS = 5
+MAX_RECORD_ATTEMPTS = 4
+MAX_RETRY_SECONDS = 20
+JOB_TTL_SECONDS = 30 * 24 * 60 * 60
+# Responses worth another attempt: rate limited, no model slot free, Lambda throttled
+RETRYABLE_STATUS = (429, 503)
+
+# Function environment variable, API path, text field and accepted options of each tool
+Tool = collections.namedtuple('Tool', ['function_env', 'path', 'text_field', 'options'])
+TOOLS = {
+    'summarize': Tool('SUMMARIZER_FUNCTION_NAME', '/summarize', 'document_text',
+                      ('summary_type', 'length', 'strip_markup')),
+    'translate': Tool('TRANSLATOR_FUNCTION_NAME', '/translate', 'text_to_translate',
+                      ('source_language', 'target_language', 'translation_style', 'strip_markup')),
+}
+
+# A record and the input offset just past it; error is set when it could not be parsed
+Record = collections.namedtuple('Record', ['offset', 'data', 'error'])
+
+
+def input_format(key, requested=None):
+    """The requested format, or the one the key's extension names (JSONL by default)"""
+    if requested:
+        return requested
+    return 'csv' if key.lower().endswith('.csv') else 'jsonl'
+
+
+class RecordReader:
+    """
+    Records of a JSONL or CSV object from a byte offset
+
+    Each record carries the offset just past it, which is where a resumed
+    read starts. A CSV object's header row is read from the start of the
+    object; resumed reads are given its columns instead.
+    """
+
+    def __init__(self, s3, bucket, key, fmt, offset=0, columns=None, size=None):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.format = fmt
+        self.offset = offset
+        self.columns = columns
+        self.size = size
+
+    def lines(self):
+        """(offset past the line, decoded line) from the reader's offset on"""
+        offset, pending = self.offset, b''
+        for block in iter_object_bytes(self.s3, self.bucket, self.key, size=self.size, start=self.offset):
+            pending += block
+            *complete, pending = pending.split(b'\n')
+            for line in complete:
+                offset += len(line) + 1
+                yield offset, line.decode('utf-8', 'replace')
+        if pending:
+            yield offset + len(pending), pending.decode('utf-8', 'replace')
+
+    def __iter__(self):
+        if self.format == 'csv':
+            return self.csv_records()
+        return self.jsonl_records()
+
+    def jsonl_records(self):
+        for offset, line in self.lines():
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError as e:
+                yield Record(offset, None, f"Invalid JSON: {e}")
+                continue
+            if isinstance(data, dict):
+                yield Record(offset, data, None)
+            else:
+                yield Record(offset, None, 'Each JSONL line must be an object')
+
+    def csv_records(self):
+        position = [self.offset]
+
+        def text_lines():
+            # csv pulls lines only as it needs them, so position ends at the current row;
+            # newlines are kept for quoted fields spanning lines
+            for offset, line in self.lines():
+                position[0] = offset
+                yield line + '\n'
+
+        rows = csv.reader(text_lines())
+        if self.columns is None:
+            self.columns = next(rows, None) or []
+        for row in rows:
+            if row:
+                yield Record(position[0], dict(zip(self.columns, row)), None)
+
+
+def record_event(job, index, data):
+    """The API Gateway style request for one record, as bulk priority work"""
+    tool = TOOLS[job['tool']]
+    text = data.get(job['textField'])
+    if not isinstance(text, str) or not text.strip():
+        raise ValueError(f"Record has no {job['textField']} text")
+    body = dict(job.get('options') or {}, **{tool.text_field: text})
+    if job['tool'] == 'translate':
+        body['include_original_text'] = False
+    return {
+        'resource': tool.path,
+        'path': tool.path,
+        'httpMethod': 'POST',
+        # Direct invocations carry no caller identity, so per-client rate limits do not
+        # apply; the bulk priority class and the job's concurrency bound its model use
+        'headers': {
+            'Content-Type': 'application/json',
+            PRIORITY_HEADER: BULK,
+            'Idempotency-Key': f"bulk-{job['jobId']}-{index}"
+        },
+        'body': json.dumps(body, default=_json_default),
+        'isBase64Encoded': False,
+        'requestContext': {'requestId': runtime.new_transform_id(), 'resourcePath': tool.path, 'httpMethod': 'POST'}
+    }
+
+
+def decode_invocation(response):
+    """(statusCode, body) from a RequestResponse invocation of a proxy handler"""
+    payload = json.loads(response['Payload'].read() or b'null')
+    if response.get('FunctionError') or not isinstance(payload, dict) or 'statusCode' not in payload:
+        message = payload.get('errorMessage') if isinstance(payload, dict) else None
+        return 502, {'message': message or 'The function failed'}
+    body = payload.get('body') or '{}'
+    if payload.get('isBase64Encoded'):
+        body = base64.b64decode(body)
+    try:
+        decoded = json.loads(body)
+    except ValueError:
+        decoded = {'message': 'The function returned a body that is not JSON'}
+    return int(payload['statusCode']), decoded if isinstance(decoded, dict) else {'result': decoded}
+
+
+def invoke_tool(client, function_name, event, deadline):
+    """
+    (statusCode, body) of one record, retrying throttled attempts
+
+    429 and 503 responses and Lambda throttling are retried after a
+    jittered exponential backoff, until MAX_RECORD_ATTEMPTS or the
+    deadline; the last response is returned either way.
+    """
+    for attempt in range(1, MAX_RECORD_ATTEMPTS + 1):
+        try:
+            status, body = decode_invocation(client.invoke(
+                FunctionName=function_name, InvocationType='RequestResponse',
+                Payload=json.dumps(event).encode('utf-8')
+            ))
+        except Exception as e:
+            if getattr(e, 'response', {}).get('Error', {}).get('Code') != 'TooManyRequestsException':
+                raise
+            status, body = 429, {'message': 'Lambda throttled the invocation'}
+        if status not in RETRYABLE_STATUS or attempt == MAX_RECORD_ATTEMPTS:
+            return status, body
+        delay = random.uniform(0.5, 1.0) * min(MAX_RETRY_SECONDS, 2 ** attempt)
+        if deadline.remaining() <= delay:
+            return status, body
+        time.sleep(delay)
+    return status, body
+
+
+def output_line(job, index, record, status, body):
+    """The JSONL output object for a record"""
+    line = {'index': index}
+    if job.get('idField') and record.data is not None:
+        line['id'] = record.data.get(job['idField'])
+    line['statusCode'] = status
+    if status == 200:
+        line['result'] = body
+    else:
+        line['error'] = body.get('message') or 'The record failed'
+    return line
+
+
+def process_record(job, client, function_name, index, record, deadline):
+    if record.error:
+        return output_line(job, index, record, 400, {'message': record.error})
+    try:
+        event = record_event(job, index, record.data)
+    except ValueError as e:
+        return output_line(job, index, record, 400, {'message': str(e)})
+    return output_line(job, index, record, *invoke_tool(client, function_name, event, deadline))
+
+
+def process_shard(job, client, function_name, first_index, records, deadline, concurrency):
+    """
+    Output lines for a shard's records, in input order, at most concurrency at a time
+
+    No record is submitted with MIN_RECORD_SECONDS or less left, so when
+    time runs short the lines cover only the leading records of the shard.
+    """
+    lines, in_flight = [], []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for i, r in enumerate(records, first_index):
+            if deadline.remaining() <= MIN_RECORD_SECONDS:
+                break
+            in_flight.append(executor.submit(
+                propagating(lambda i=i, r=r: process_record(job, client, function_name, i, r, deadline))
+            ))
+            if len(in_flight) >= concurrency:
+                lines.append(in_flight.pop(0).result())
+        lines.extend(future.result() for future in in_flight)
+    return lines
+
+
+def shard_key(job, shard):
+    return f"{job['outputPrefix']}part-{shard:05d}.jsonl"
+
+
+def encode_shard(lines):
+    return ''.join(
+        json.dumps(line, ensure_ascii=False, separators=(',', ':'), default=_json_default) + '\n' for line in lines
+    ).encode('utf-8')
+
+
+def run_job(job, store, s3, client, deadline, concurrency=DEFAULT_CONCURRENCY, shard_records=DEFAULT_SHARD_RECORDS):
+    """
+    Process shards from the job's checkpoint until the input ends or time runs short
+
+    A shard cut short by the deadline is written and checkpointed as far as
+    it got, and the job is returned still running for the next run to
+    resume. Returns the job as last checkpointed, or None when another run
+    has checkpointed it in the meantime (this run's last shard is dropped).
+    """
+    tool = job['tool']
+    function_name = os.environ[TOOLS[tool].function_env]
+    bucket = os.environ['BUCKET_NAME']
+    reader = RecordReader(s3, bucket, job['inputKey'], job['format'], int(job['offset']),
+                          job.get('columns'), int(job['inputBytes']))
+    records = iter(reader)
+    last_shard_seconds = 0.0
+    while deadline.remaining() > max(MIN_SHARD_SECONDS, last_shard_seconds * 1.5):
+        started = time.monotonic()
+        batch = list(itertools.islice(records, shard_records))
+        if not batch:
+            return store.finish(job)
+        lines = process_shard(job, client, function_name, int(job['records']), batch, deadline, concurrency)
+        if not lines:
+            return job
+        stopped, batch = len(lines) < len(batch), batch[:len(lines)]
+        failed = sum(1 for line in lines if line['statusCode'] != 200)
+        shard = int(job['shard'])
+        s3.put_object(Bucket=bucket, Key=shard_key(job, shard), Body=encode_shard(lines),
+                      ContentType='application/x-ndjson')
+        last_shard_seconds = time.monotonic() - started
+        job = store.checkpoint(
+            job, offset=batch[-1].offset, columns=reader.columns, shard=shard + 1,
+            records=int(job['records']) + len(batch), failed=int(job['failed']) + failed,
+            activeMs=int(job['activeMs']) + round(last_shard_seconds * 1000)
+        )
+        emit_metrics(tool, len(batch), failed, last_shard_seconds)
+        if job is None or stopped:
+            return job
+    return job
+
+
+def job_status(job):
+    """The public view of a job, with progress and throughput"""
+    active_seconds = int(job['activeMs']) / 1000
+    input_bytes = int(job['inputBytes'])
+    status = {
+        'jobId': job['jobId'],
+        'status': job['status'],
+        'tool': job['tool'],
+        'inputKey': job['inputKey'],
+        'outputPrefix': job['outputPrefix'],
+        'records': int(job['records']),
+        'failed': int(job['failed']),
+        'shards': int(job['shard']),
+        'progress': round(100.0 * int(job['offset']) / input_bytes, 1) if input_bytes else 100.0,
+        'recordsPerSecond': round(int(job['records']) / active_seconds, 2) if active_seconds else 0.0,
+        'activeSeconds': round(active_seconds, 1),
+        'createdAt': runtime.utc_isoformat(int(job['createdAt'])),
+        'updatedAt': runtime.utc_isoformat(int(job['updatedAt']))
+    }
+    if job.get('lastError'):
+        status['lastError'] = job['lastError']
+    return status
+
+
+def new_job(job_id, tool, input_key, fmt, input_bytes, text_field, id_field=None, options=None, now=None):
+    now = int(time.time() if now is None else now)
+    job = {
+        'jobId': job_id,
+        'status': RUNNING,
+        'tool': tool,
+        'inputKey': input_key,
+        'format': fmt,
+        'inputBytes': input_bytes,
+        'textField': text_field,
+        'options': {name: value for name, value in (options or {}).items() if value is not None},
+        'outputPrefix': f"bulk/{job_id}/",
+        'offset': 0,
+        'shard': 0,
+        'records': 0,
+        'failed': 0,
+        'activeMs': 0,
+        'checkpointVersion': 0,
+        'createdAt': now,
+        'updatedAt': now,
+        'expiresAt': now + JOB_TTL_SECONDS
+    }
+    if id_field:
+        job['idField'] = id_field
+    return job
+
+
+class DynamoDBJobStore:
+    """Bulk jobs and their checkpoints, in a table keyed by jobId"""
+
+    def __init__(self, table):
+        self.table = table
+
+    def create(self, job):
+        self.table.put_item(Item=job, ConditionExpression='attribute_not_exists(jobId)')
+        return job
+
+    def get(self, job_id):
+        return self.table.get_item(Key={'jobId': job_id}, ConsistentRead=True).get('Item')
+
+    def _update(self, job, changes, condition_status=RUNNING):
+        """Apply changes if the job is unchanged since it was read; the updated job, or None"""
+        changes = dict(changes, checkpointVersion=int(job['checkpointVersion']) + 1, updatedAt=int(time.time()))
+        names = {f"#{name}": name for name in changes}
+        values = {f":{name}": value for name, value in changes.items()}
+        values.update({':version': job['checkpointVersion'], ':expected': condition_status})
+        try:
+            self.table.update_item(
+                Key={'jobId': job['jobId']},
+                UpdateExpression='SET ' + ', '.join(f"#{name} = :{name}" for name in changes),
+                ConditionExpression='#checkpointVersion = :version AND #status = :expected',
+                ExpressionAttributeNames=dict(names, **{'#checkpointVersion': 'checkpointVersion', '#status': 'status'}),
+                ExpressionAttributeValues=values
+            )
+        except Exception as e:
+            if getattr(e, 'response', {}).get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                return None
+            raise
+        return dict(job, **changes)
+
+    def checkpoint(self, job, **changes):
+        if changes.get('columns') is None:
+            changes.pop('columns', None)
+        return self._update(job, changes)
+
+    def finish(self, job):
+        return self._update(job, {'status': COMPLETED})
+
+    def fail(self, job, message):
+        return self._update(job, {'status': FAILED, 'lastError': message})
+
+    def record_error(self, job, message):
+        """Note why a run stopped; the job stays running so a retry resumes it"""
+        return self._update(job, {'lastError': message})
+
+    def resume(self, job):
+        """Mark a failed job running again, from its checkpoint"""
+        return self._update(job, {'status': RUNNING}, condition_status=job['status'])
+
+
+def emit_metrics(tool, records, failed, seconds):
+    """Publish a shard's throughput as a CloudWatch embedded-metric-format log line"""
+    print(json.dumps({
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': 'ContentTransformer',
+                'Dimensions': [['Tool']],
+                'Metrics': [
+                    {'Name': 'BulkRecords', 'Unit': 'Count'},
+                    {'Name': 'BulkRecordFailures', 'Unit': 'Count'},
+                    {'Name': 'BulkThroughput', 'Unit': 'Count/Second'}
+                ]
+            }]
+        },
+        'Tool': tool,
+        'BulkRecords': records,
+        'BulkRecordFailures': failed,
+        'BulkThroughput': round(records / seconds, 2) if seconds else 0
+    }))
+
+
+_default_store = []
+
+
+def default_store():
+    """Store backed by BULK_JOBS_TABLE_NAME, or None when it is not set"""
+    if not _default_store:
+        table_name = os.environ.get('BULK_JOBS_TABLE_NAME')
+        if not table_name:
+            return None
+        _default_store.append(DynamoDBJobStore(runtime.resource('dynamodb').Table(table_name)))
+    return _default_store[0]
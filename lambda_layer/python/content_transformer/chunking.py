@@ -0,0 +1,91 @@
+"""
+Split long documents into model-sized chunks and process them concurrently
+"""
+
+CHUNK_CHARS = 40000
+MAX_CONCURRENT_CHUNKS = 4
+
+
+def iter_chunks(text_blocks, chunk_chars=CHUNK_CHARS):
+    """
+    Regroup a stream of text blocks into chunks of at most chunk_chars
+
+    Chunks are cut at paragraph breaks where possible, then at line breaks,
+    then at spaces, so sentences are rarely split across chunks.
+    """
+    pending = ''
+    for block in text_blocks:
+        pending += block
+        while len(pending) >= chunk_chars:
+            cut = _cut_point(pending, chunk_chars)
+            chunk = pending[:cut].strip()
+            pending = pending[cut:]
+            if chunk:
+                yield chunk
+    if pending.strip():
+        yield pending.strip()
+
+
+def _cut_point(text, limit):
+    for separator in ('\n\n', '\n', '. ', ' '):
+        position = text.rfind(separator, limit // 2, limit)
+        if position > 0:
+            return position + len(separator)
+    return limit
+
+
+def map_chunks(chunks, func, max_workers=MAX_CONCURRENT_CHUNKS, report_progress=False):
+    """
+    Apply func to every chunk with bounded concurrency, preserving order
+
+    At most max_workers chunks are held in flight, so a streamed document
+    is never fully materialized in memory. Once the invocation deadline
+    passes no further chunk is started, and DeadlineExceeded is raised with
+    the leading results that did finish, in order, as its partial value.
+    With report_progress, each finished chunk is reported to a background
+    job's progress; only model work should be, not bookkeeping writes.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from content_transformer.deadline import DeadlineExceeded, current_deadline
+    from content_transformer.notifications import NO_PROGRESS, current_progress
+    from content_transformer.tracing import propagating
+
+    deadline = current_deadline()
+    progress = current_progress() if report_progress else NO_PROGRESS
+    total = len(chunks) if hasattr(chunks, '__len__') else None
+    results, in_flight = [], []
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for chunk in chunks:
+                deadline.check()
+                in_flight.append(executor.submit(propagating(func), chunk))
+                if len(in_flight) >= max_workers:
+                    results.append(in_flight[0].result())
+                    in_flight.pop(0)
+                    progress.advance(total)
+            while in_flight:
+                results.append(in_flight[0].result())
+                in_flight.pop(0)
+                progress.advance(total)
+    except DeadlineExceeded as e:
+        # Chunks still in flight stopped at the deadline too; keep those that finished in order
+        for future in in_flight:
+            if future.exception() is not None:
+                break
+            results.append(future.result())
+        raise DeadlineExceeded(str(e), partial=results, completed=len(results)) from e
+    return results
+
+
+def map_writes(items, func, max_workers=8):
+    """
+    Apply func to every item concurrently, for store writes
+
+    Unlike map_chunks this ignores the deadline, so results computed before
+    it passed can still be saved, and never reports a job's progress.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from content_transformer.tracing import propagating
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return [future.result() for future in [executor.submit(propagating(func), item) for item in items]]
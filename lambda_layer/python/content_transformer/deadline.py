@@ -0,0 +1,129 @@
+"""
+Invocation deadlines derived from the remaining Lambda time
+
+A request's deadline is the earlier of the function timeout and API
+Gateway's 29 second integration timeout, less a reserve kept back for
+saving the result and responding. While the handler runs it is the
+current deadline: the chunk scheduler stops starting work once it passes
+and model calls stop waiting, so handlers can persist what finished as a
+partial result instead of being killed with nothing saved.
+"""
+import concurrent.futures
+import contextvars
+import functools
+import math
+import os
+import time
+
+from content_transformer.tracing import propagating
+
+API_GATEWAY_TIMEOUT_SECONDS = 29
+# Kept back for persisting the result and building the response
+RESERVE_SECONDS = float(os.environ.get('DEADLINE_RESERVE_SECONDS', 3))
+# Model calls are not started with less time than this left
+MIN_MODEL_CALL_SECONDS = 1.0
+# Workers that run calls the caller may stop waiting for
+MAX_BOUNDED_CALLS = 32
+
+_current = contextvars.ContextVar('content_transformer_deadline', default=None)
+_executor = []
+
+
+class DeadlineExceeded(Exception):
+    """
+    The deadline passed before the work finished
+
+    partial holds whatever the raising step completed (None when nothing
+    usable was), and completed counts the chunks or sections it covers.
+    """
+
+    def __init__(self, message='Ran out of time before the work completed', partial=None, completed=0):
+        super().__init__(message)
+        self.partial = partial
+        self.completed = completed
+
+
+class Deadline:
+    """A point on the monotonic clock; None means no limit"""
+
+    def __init__(self, expires_at=None):
+        self.expires_at = expires_at
+
+    @classmethod
+    def from_invocation(cls, event, context, reserve=RESERVE_SECONDS):
+        """Deadline for a handler invocation; unlimited when neither limit is known"""
+        limits = []
+        get_remaining = getattr(context, 'get_remaining_time_in_millis', None)
+        remaining = get_remaining() if callable(get_remaining) else None
+        if isinstance(remaining, (int, float)) and not isinstance(remaining, bool):
+            limits.append(remaining / 1000)
+        started = ((event or {}).get('requestContext') or {}).get('requestTimeEpoch')
+        if isinstance(started, (int, float)):
+            # Replayed or hand-written events carry stale times; only a live request is bounded
+            gateway_left = started / 1000 + API_GATEWAY_TIMEOUT_SECONDS - time.time()
+            if 0 < gateway_left <= API_GATEWAY_TIMEOUT_SECONDS:
+                limits.append(gateway_left)
+        if not limits:
+            return cls()
+        return cls(time.monotonic() + min(limits) - reserve)
+
+    def remaining(self):
+        """Seconds left, never negative; infinite without a limit"""
+        if self.expires_at is None:
+            return math.inf
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self, minimum=0.0):
+        """Raise DeadlineExceeded unless more than minimum seconds are left"""
+        if self.remaining() <= minimum:
+            raise DeadlineExceeded()
+
+    def cap(self, seconds):
+        """seconds, shortened to the time left"""
+        return min(seconds, self.remaining())
+
+    def call(self, func):
+        """
+        Return func(), giving up with DeadlineExceeded if the deadline passes first
+
+        Without a limit func runs inline. Otherwise it runs on a worker
+        thread, which is left to finish on its own when abandoned.
+        """
+        if self.expires_at is None:
+            return func()
+        self.check()
+        future = bounded_executor().submit(propagating(func))
+        try:
+            return future.result(timeout=self.remaining())
+        except concurrent.futures.TimeoutError:
+            raise DeadlineExceeded()
+
+
+UNLIMITED = Deadline()
+
+
+def current_deadline():
+    """The running invocation's deadline, or UNLIMITED outside one"""
+    return _current.get() or UNLIMITED
+
+
+def bounded_executor():
+    if not _executor:
+        _executor.append(concurrent.futures.ThreadPoolExecutor(MAX_BOUNDED_CALLS, 'deadline'))
+    return _executor[0]
+
+
+def deadline_aware(handler):
+    """Make the invocation's deadline current while the handler runs"""
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        token = _current.set(Deadline.from_invocation(event, context))
+        try:
+            return handler(event, context)
+        finally:
+            _current.reset(token)
+
+    return wrapper
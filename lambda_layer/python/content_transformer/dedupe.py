@@ -0,0 +1,183 @@
+"""
+Near-duplicate lookup for previously summarized documents
+
+Every summarized document's MinHash signature is indexed in a DynamoDB
+table: one item per LSH band mapping the newest documents in that band to
+when they were indexed, and one item per document holding its signature,
+summary and per-section summaries. A lookup reads all band items in one
+batch, then the signatures of the candidates sharing the most bands in a
+second batch, so it costs two round trips regardless of how many
+documents are indexed.
+
+Index entries are scoped to the caller's API key and the summary options,
+so a near-duplicate is only reused for the same caller asking for the
+same kind of summary.
+"""
+import os
+import time
+
+from content_transformer.minhash import band_hashes, pack_signature, similarity, unpack_signature
+
+# Index entries expire with the results they point to
+INDEX_TTL_SECONDS = 90 * 24 * 60 * 60
+# Candidates verified per lookup, so a crowded band cannot make lookups slow
+MAX_CANDIDATES = 50
+# Documents kept per band item, newest first, so a crowded band stays far below
+# DynamoDB's 400 KB item limit
+MAX_BAND_DOCUMENTS = 200
+# Tries at a band item update that keeps losing write races
+BAND_UPDATE_ATTEMPTS = 5
+# Per-section summaries kept for partial reuse
+MAX_STORED_SECTIONS = 50
+
+
+def section_digest(text):
+    """Whitespace-insensitive hash identifying a section of a document"""
+    import hashlib
+
+    return hashlib.sha256(' '.join(text.split()).encode('utf-8')).hexdigest()[:32]
+
+
+class DynamoDBDedupeStore:
+    """LSH bands and document signatures in a table keyed by dedupeKey"""
+
+    def __init__(self, dynamodb, table_name):
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+        self.table = dynamodb.Table(table_name)
+
+    def _batch_get(self, keys):
+        items, pending = [], [{'dedupeKey': key} for key in keys]
+        for _ in range(3):
+            if not pending:
+                break
+            response = self.dynamodb.batch_get_item(
+                RequestItems={self.table_name: {'Keys': pending[:100]}}
+            )
+            items.extend(response.get('Responses', {}).get(self.table_name, []))
+            unprocessed = response.get('UnprocessedKeys', {}).get(self.table_name, {}).get('Keys', [])
+            pending = unprocessed + pending[100:]
+        return items
+
+    def candidates(self, band_keys):
+        """Documents sharing any of the bands, as {document ID: (bands shared, newest index time)}"""
+        found = {}
+        for item in self._batch_get(band_keys):
+            for document_id, indexed_at in band_documents(item).items():
+                hits, newest = found.get(document_id, (0, 0))
+                found[document_id] = (hits + 1, max(newest, indexed_at))
+        return found
+
+    def documents(self, document_ids):
+        return self._batch_get(f"doc#{document_id}" for document_id in document_ids)
+
+    def _add_to_band(self, band_key, document_id, indexed_at, expires_at):
+        """Record a document in a band, dropping the oldest entries beyond MAX_BAND_DOCUMENTS"""
+        for _ in range(BAND_UPDATE_ATTEMPTS):
+            item = self.table.get_item(Key={'dedupeKey': band_key}, ConsistentRead=True).get('Item')
+            documents = band_documents(item)
+            documents[document_id] = indexed_at
+            newest = sorted(documents.items(), key=lambda entry: entry[1], reverse=True)[:MAX_BAND_DOCUMENTS]
+            version = (item or {}).get('version')
+            condition = {'ConditionExpression': 'attribute_not_exists(version)'} if version is None else {
+                'ConditionExpression': 'version = :version',
+                'ExpressionAttributeValues': {':version': version}
+            }
+            try:
+                self.table.put_item(Item={
+                    'dedupeKey': band_key,
+                    'documents': dict(newest),
+                    'version': (version or 0) + 1,
+                    'expiresAt': expires_at
+                }, **condition)
+                return
+            except Exception as e:
+                if getattr(e, 'response', {}).get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                    raise
+        raise RuntimeError(f"Band {band_key} kept changing while indexing {document_id}")
+
+    def add(self, document_id, band_keys, record, now=None):
+        from content_transformer.chunking import map_writes
+
+        indexed_at = int(time.time() if now is None else now)
+        expires_at = indexed_at + INDEX_TTL_SECONDS
+        self.table.put_item(Item=dict(record, dedupeKey=f"doc#{document_id}", expiresAt=expires_at))
+        map_writes(band_keys, lambda band_key: self._add_to_band(band_key, document_id, indexed_at, expires_at))
+
+
+def band_documents(item):
+    """{document ID: index time} of a band item; IDs from the older string-set layout count as oldest"""
+    if not item:
+        return {}
+    documents = dict.fromkeys(item.get('documentIds', ()), 0)
+    documents.update(item.get('documents', {}))
+    return documents
+
+
+def band_keys(signature, scope, options):
+    return [
+        f"band#{scope}#{options}#{band:02d}#{band_hash}"
+        for band, band_hash in enumerate(band_hashes(signature))
+    ]
+
+
+def find_near_duplicate(store, signature, scope, options, threshold):
+    """
+    Most similar indexed document at or above threshold
+
+    Returns (record, similarity), or (None, 0.0) when nothing qualifies.
+    """
+    found = store.candidates(band_keys(signature, scope, options))
+    # Documents sharing more bands are likelier matches; ties go to the newest
+    candidates = sorted(found, key=lambda document_id: found[document_id], reverse=True)[:MAX_CANDIDATES]
+    best, best_similarity = None, 0.0
+    for record in store.documents(candidates) if candidates else ():
+        stored = record['signature']
+        score = similarity(signature, unpack_signature(getattr(stored, 'value', stored)))
+        if score >= threshold and score > best_similarity:
+            best, best_similarity = record, score
+    return best, best_similarity
+
+
+def index_document(store, transform_id, signature, scope, options, summary, sections):
+    """Make a summarized document findable; indexing errors never fail the request"""
+    if len(sections) > MAX_STORED_SECTIONS:
+        sections = {}
+    try:
+        store.add(transform_id, band_keys(signature, scope, options), {
+            'transformId': transform_id,
+            'signature': pack_signature(signature),
+            'summary': summary,
+            'sections': sections
+        })
+    except Exception as e:
+        print(f"Could not index document {transform_id} for near-duplicate lookup: {e}")
+
+
+class DedupeSettings:
+    """Similarity thresholds for reusing a whole summary or individual sections"""
+
+    def __init__(self, reuse_threshold=0.9, section_threshold=0.5):
+        self.reuse_threshold = reuse_threshold
+        self.section_threshold = section_threshold
+
+    @classmethod
+    def from_environment(cls):
+        return cls(
+            reuse_threshold=float(os.environ.get('DEDUPE_REUSE_THRESHOLD', 0.9)),
+            section_threshold=float(os.environ.get('DEDUPE_SECTION_THRESHOLD', 0.5))
+        )
+
+
+_default_store = []
+
+
+def default_store():
+    """Store backed by DEDUPE_TABLE_NAME, or None when it is not set"""
+    if not _default_store:
+        table_name = os.environ.get('DEDUPE_TABLE_NAME')
+        if not table_name:
+            return None
+        from content_transformer import runtime
+        _default_store.append(DynamoDBDedupeStore(runtime.resource('dynamodb'), table_name))
+    return _default_store[0]
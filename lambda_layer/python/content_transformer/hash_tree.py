@@ -0,0 +1,306 @@
+"""
+Content-defined chunk hash trees for incremental re-summarization
+
+A revised document is cut into chunks at boundaries chosen by the content
+of its lines, not by character offsets, so an edit only moves the
+boundaries next to it. Chunk hashes are the leaves of a tree whose
+internal nodes hash their children; children are grouped with the same
+content-defined rule, so inserting a chunk does not regroup the rest of
+the tree. Each node carries a summary: leaves summarize their chunk and
+internal nodes merge their children's summaries.
+
+When a new revision arrives, nodes whose hashes appear in the previous
+revision's tree keep their cached summaries. Only changed chunks and the
+nodes on the path from them to the root call the model, so the cost of a
+revision grows with the size of the edit rather than of the document.
+"""
+import functools
+import hashlib
+import os
+import time
+
+from content_transformer.segmentation import split_edges
+
+TARGET_CHUNK_CHARS = 8000
+MIN_CHUNK_CHARS = 2000
+MAX_CHUNK_CHARS = 24000
+# Expected children per internal node
+FANOUT = 8
+MAX_FANOUT = 16
+HASH_CHARS = 32
+# Keeps the manifest of hashes well under the DynamoDB item size limit
+MAX_TREE_NODES = 5000
+
+
+def _digest(data):
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()[:HASH_CHARS]
+
+
+def _hash_fraction(data):
+    """Uniform number in [0, 1) derived from data"""
+    return int(hashlib.blake2b(data.encode('utf-8'), digest_size=8).hexdigest(), 16) / 2.0 ** 64
+
+
+def iter_content_chunks(text_blocks, target_chars=TARGET_CHUNK_CHARS,
+                        min_chars=MIN_CHUNK_CHARS, max_chars=MAX_CHUNK_CHARS):
+    """
+    Regroup streamed text into chunks whose boundaries follow the content
+
+    A chunk may end after any line once it holds min_chars, with a chance
+    proportional to the line's length so chunks average about
+    target_chars. Lines are hashed without surrounding whitespace, so
+    reflowed spacing does not move boundaries. Chunks never exceed
+    max_chars; an oversized line is cut at a space.
+    """
+    chunk, pending = '', ''
+    for block in text_blocks:
+        pending += block
+        lines = pending.split('\n')
+        pending = lines.pop()
+        for line in lines:
+            chunk += line + '\n'
+            while len(chunk) > max_chars:
+                cut = chunk.rfind(' ', max_chars // 2, max_chars) + 1 or max_chars
+                yield chunk[:cut]
+                chunk = chunk[cut:]
+            content = line.strip()
+            if len(chunk) >= min_chars and content and \
+                    _hash_fraction(content) < len(content) / float(target_chars):
+                yield chunk
+                chunk = ''
+    chunk += pending
+    while len(chunk) > max_chars:
+        cut = chunk.rfind(' ', max_chars // 2, max_chars) + 1 or max_chars
+        yield chunk[:cut]
+        chunk = chunk[cut:]
+    if chunk.strip():
+        yield chunk
+
+
+def leaf_hash(chunk, salt=''):
+    """Hash of a chunk's words; salt carries the summary options"""
+    return _digest(salt + '\x00' + ' '.join(chunk.split()))
+
+
+def node_hash(child_hashes):
+    return _digest('node\x00' + ','.join(child_hashes))
+
+
+def group_children(hashes, fanout=FANOUT, max_fanout=MAX_FANOUT):
+    """
+    Split a level into groups, ending a group after a child whose hash says so
+
+    Every group has at least two children (a lone trailing child joins the
+    previous group), so each level is at most half the size of the last.
+    """
+    groups, group = [], []
+    for child in hashes:
+        group.append(child)
+        if len(group) >= max_fanout or (len(group) >= 2 and int(child[:8], 16) % fanout == 0):
+            groups.append(group)
+            group = []
+    if len(group) == 1 and groups:
+        groups[-1].extend(group)
+    elif group:
+        groups.append(group)
+    return groups
+
+
+class SummaryTree:
+    """
+    Summaries for every node of a document's hash tree
+
+    levels[0] holds the leaf hashes in document order and the last level
+    holds the root alone. children maps each internal node to its children.
+    """
+
+    def __init__(self):
+        self.levels = []
+        self.children = {}
+        self.summaries = {}
+        self.computed = set()
+
+    @property
+    def root(self):
+        """Hash of the root node; None for a document with no text"""
+        return self.levels[-1][0] if self.levels and self.levels[-1] else None
+
+    @property
+    def summary(self):
+        return self.summaries.get(self.root, '')
+
+
+def build_summary_tree(chunks, summarize_chunk, merge_summaries, cached, salt='', map_func=None):
+    """
+    Summarize a chunk stream into a SummaryTree, reusing cached node summaries
+
+    summarize_chunk(text) and merge_summaries(list_of_summaries) call the
+    model; cached maps node hashes to summaries from earlier revisions.
+    map_func(items, func) runs work concurrently and preserves order.
+    If the deadline passes, the DeadlineExceeded raised carries the
+    unfinished tree as its partial value: every node in computed has its
+    summary, and levels end with the last level that finished (the leading
+    leaves that finished, when the leaves did not).
+    """
+    from content_transformer.deadline import DeadlineExceeded
+
+    if map_func is None:
+        from content_transformer.chunking import map_chunks
+
+        map_func = functools.partial(map_chunks, report_progress=True)
+
+    tree = SummaryTree()
+
+    def leaf(chunk):
+        digest = leaf_hash(chunk, salt)
+        summary = cached.get(digest)
+        if summary is None:
+            summary = summarize_chunk(split_edges(chunk)[1])
+            tree.summaries[digest] = summary
+            tree.computed.add(digest)
+        return digest, summary
+
+    try:
+        leaves = map_func(chunks, leaf)
+    except DeadlineExceeded as e:
+        finished = e.partial or []
+        tree.levels.append([digest for digest, _ in finished])
+        tree.summaries.update(finished)
+        raise DeadlineExceeded(str(e), partial=tree, completed=len(finished)) from e
+    tree.levels.append([digest for digest, _ in leaves])
+    tree.summaries.update(leaves)
+
+    level = tree.levels[0]
+    while len(level) > 1:
+        groups = group_children(level)
+
+        def merge(group):
+            digest = node_hash(group)
+            summary = cached.get(digest)
+            if summary is None:
+                summary = merge_summaries([tree.summaries[child] for child in group])
+                tree.children[digest] = group
+                tree.summaries[digest] = summary
+                tree.computed.add(digest)
+            return digest, group, summary
+
+        try:
+            merged = map_func(groups, merge)
+        except DeadlineExceeded as e:
+            raise DeadlineExceeded(str(e), partial=tree, completed=len(tree.levels[0])) from e
+        for digest, group, summary in merged:
+            tree.children[digest] = group
+            tree.summaries[digest] = summary
+        level = [digest for digest, _, _ in merged]
+        tree.levels.append(level)
+    return tree
+
+
+class DynamoDBRevisionStore:
+    """
+    Revision manifests and node summaries in a table keyed by treeKey
+
+    Only summaries computed for a revision are written. Reused nodes keep
+    their original expiry; one that expires is simply summarized again.
+    """
+
+    # Node summaries live as long as documents keep being revised
+    TTL_SECONDS = 90 * 24 * 60 * 60
+
+    def __init__(self, dynamodb, table_name):
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+        self.table = dynamodb.Table(table_name)
+
+    def load_manifest(self, tree_id):
+        return self.table.get_item(Key={'treeKey': f"doc#{tree_id}"}, ConsistentRead=True).get('Item')
+
+    def load_summaries(self, tree_id, hashes):
+        """Cached summaries for the given node hashes, read 100 at a time"""
+        summaries, hashes = {}, list(hashes)
+        for start in range(0, len(hashes), 100):
+            pending = [{'treeKey': f"node#{tree_id}#{digest}"} for digest in hashes[start:start + 100]]
+            for _ in range(3):
+                if not pending:
+                    break
+                response = self.dynamodb.batch_get_item(RequestItems={self.table_name: {'Keys': pending}})
+                for item in response.get('Responses', {}).get(self.table_name, []):
+                    summaries[item['treeKey'].rsplit('#', 1)[1]] = item['summary']
+                pending = response.get('UnprocessedKeys', {}).get(self.table_name, {}).get('Keys', [])
+        return summaries
+
+    def _save_nodes(self, tree_id, tree, expires_at):
+        from content_transformer.chunking import map_writes
+
+        map_writes(sorted(tree.computed), lambda digest: self.table.put_item(Item={
+            'treeKey': f"node#{tree_id}#{digest}",
+            'summary': tree.summaries[digest],
+            'expiresAt': expires_at
+        }))
+
+    def save(self, tree_id, tree, revision, now=None):
+        """Write summaries computed for this revision, then the manifest pointing at them"""
+        if sum(len(level) for level in tree.levels) > MAX_TREE_NODES:
+            print(f"Document tree {tree_id} is too large to cache; later revisions summarize in full")
+            return
+        now = int(time.time() if now is None else now)
+        expires_at = now + self.TTL_SECONDS
+        self._save_nodes(tree_id, tree, expires_at)
+        self.table.put_item(Item={
+            'treeKey': f"doc#{tree_id}",
+            'levels': tree.levels,
+            'revision': revision,
+            'updatedAt': now,
+            'expiresAt': expires_at
+        })
+
+    def save_partial(self, tree_id, tree, manifest, now=None):
+        """
+        Keep the summaries an unfinished revision computed for the next attempt
+
+        The manifest keeps its levels and revision and lists the new nodes
+        as pending, so a retry reuses both the previous revision's summaries
+        and the ones computed before time ran out.
+        """
+        manifest = manifest or {}
+        levels = manifest.get('levels', [])
+        pending = list(dict.fromkeys(list(manifest.get('pending', [])) + sorted(tree.computed)))
+        if sum(len(level) for level in levels) + len(pending) > MAX_TREE_NODES:
+            print(f"Document tree {tree_id} is too large to cache; later revisions summarize in full")
+            return
+        now = int(time.time() if now is None else now)
+        expires_at = now + self.TTL_SECONDS
+        self._save_nodes(tree_id, tree, expires_at)
+        self.table.put_item(Item={
+            'treeKey': f"doc#{tree_id}",
+            'levels': levels,
+            'pending': pending,
+            'revision': manifest.get('revision', 0),
+            'updatedAt': now,
+            'expiresAt': expires_at
+        })
+
+
+def tree_id(scope, document_id):
+    return f"{scope}#{document_id}"
+
+
+def previous_hashes(manifest):
+    """Hashes of the previous revision's nodes and of any later unfinished attempt"""
+    manifest = manifest or {}
+    hashes = [digest for level in manifest.get('levels', []) for digest in level]
+    return hashes + list(manifest.get('pending', []))
+
+
+_default_store = []
+
+
+def default_store():
+    """Store backed by REVISION_TABLE_NAME, or None when it is not set"""
+    if not _default_store:
+        table_name = os.environ.get('REVISION_TABLE_NAME')
+        if not table_name:
+            return None
+        from content_transformer import runtime
+        _default_store.append(DynamoDBRevisionStore(runtime.resource('dynamodb'), table_name))
+    return _default_store[0]
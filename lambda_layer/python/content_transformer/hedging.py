@@ -0,0 +1,189 @@
+"""
+Hedged model calls for tail latency
+
+When hedging is enabled and the primary model has not answered within a
+percentile of its recent latencies, the same prompt is sent to a
+secondary model or region and whichever answers first is used. The loser
+is cancelled if it has not started; a call already in flight cannot be
+aborted through boto3, so it is abandoned and its result passed to
+on_abandoned when it finishes, so its tokens are still accounted for.
+Latency windows are kept per container, so the threshold adapts to what
+each warm container has observed.
+"""
+import collections
+import json
+import os
+import threading
+import time
+
+# Recent latencies kept per model
+LATENCY_WINDOW = 200
+# Fewer samples than this use the configured initial delay
+MIN_SAMPLES = 20
+
+
+class LatencyTracker:
+    """Rolling window of call latencies"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.samples = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, percent):
+        """Nearest-rank percentile, or None with no samples"""
+        with self._lock:
+            ordered = sorted(self.samples)
+        if not ordered:
+            return None
+        rank = max(1, -(-len(ordered) * percent // 100))
+        return ordered[int(rank) - 1]
+
+    def __len__(self):
+        return len(self.samples)
+
+
+class HedgePolicy:
+    """When and where to send a duplicate request"""
+
+    def __init__(self, enabled=False, secondary_model_id=None, secondary_region=None,
+                 percentile=95, initial_delay=8.0, min_delay=1.0, max_delay=30.0):
+        self.enabled = enabled
+        self.secondary_model_id = secondary_model_id
+        self.secondary_region = secondary_region
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_environment(cls):
+        return cls(
+            enabled=os.environ.get('HEDGE_ENABLED', 'false').lower() == 'true',
+            secondary_model_id=os.environ.get('HEDGE_MODEL_ID') or None,
+            secondary_region=os.environ.get('HEDGE_REGION') or None,
+            percentile=float(os.environ.get('HEDGE_PERCENTILE', 95)),
+            initial_delay=float(os.environ.get('HEDGE_INITIAL_DELAY_SECONDS', 8)),
+            min_delay=float(os.environ.get('HEDGE_MIN_DELAY_SECONDS', 1)),
+            max_delay=float(os.environ.get('HEDGE_MAX_DELAY_SECONDS', 30))
+        )
+
+    def delay(self, tracker):
+        """Seconds to wait on the primary before hedging"""
+        if len(tracker) < MIN_SAMPLES:
+            return self.initial_delay
+        return min(self.max_delay, max(self.min_delay, tracker.percentile(self.percentile)))
+
+
+def hedged_call(primary, secondary, delay, should_failover=None, on_abandoned=None, on_settled=None):
+    """
+    Run primary(), and secondary() too if primary is still running after delay
+
+    Returns (result, hedged, secondary_won). If the first call to finish
+    failed, the other one's outcome is used instead, and a primary that
+    fails before the delay fails over to secondary unless
+    should_failover(error) says otherwise. A losing call that was already
+    running has its result passed to on_abandoned(result) if it succeeds.
+    on_settled() is called once every call started on a worker thread has
+    finished, which for an abandoned loser can be after this returns.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+    from content_transformer.tracing import propagating
+
+    executor = ThreadPoolExecutor(max_workers=2)
+    launched = []
+    try:
+        primary_future = executor.submit(propagating(primary))
+        launched.append(primary_future)
+        done, _ = wait([primary_future], timeout=delay)
+        if done:
+            error = primary_future.exception()
+            if error is None:
+                return primary_future.result(), False, False
+            if should_failover is not None and not should_failover(error):
+                raise error
+            return secondary(), True, True
+
+        secondary_future = executor.submit(propagating(secondary))
+        launched.append(secondary_future)
+        pending = {primary_future, secondary_future}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for loser in pending:
+                        if not loser.cancel() and on_abandoned is not None:
+                            loser.add_done_callback(
+                                lambda f: on_abandoned(f.result()) if f.exception() is None else None
+                            )
+                    return future.result(), True, future is secondary_future
+                error = future.exception()
+        raise error
+    finally:
+        # Never block the response on the losing call
+        executor.shutdown(wait=False)
+        if on_settled is not None:
+            when_all_done(launched, on_settled)
+
+
+def when_all_done(futures, callback):
+    """Call callback() once every future has finished, cancelled ones included"""
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def finished(_):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            callback()
+
+    if not futures:
+        callback()
+    for future in futures:
+        future.add_done_callback(finished)
+
+
+_trackers = collections.defaultdict(LatencyTracker)
+
+
+def tracker_for(model_id):
+    return _trackers[model_id]
+
+
+def timed(model_id, call):
+    """Wrap call so its latency is recorded against model_id"""
+    def run():
+        started = time.time()
+        result = call()
+        tracker_for(model_id).record(time.time() - started)
+        return result
+    return run
+
+
+def emit_metrics(model_id, hedged, secondary_won, seconds):
+    """Publish hedge and win counts as a CloudWatch embedded-metric-format log line"""
+    print(json.dumps({
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': 'ContentTransformer',
+                'Dimensions': [['Model']],
+                'Metrics': [
+                    {'Name': 'HedgeableCalls', 'Unit': 'Count'},
+                    {'Name': 'HedgedCalls', 'Unit': 'Count'},
+                    {'Name': 'HedgeWins', 'Unit': 'Count'},
+                    {'Name': 'ModelLatency', 'Unit': 'Milliseconds'}
+                ]
+            }]
+        },
+        'Model': model_id,
+        'HedgeableCalls': 1,
+        'HedgedCalls': 1 if hedged else 0,
+        'HedgeWins': 1 if secondary_won else 0,
+        'ModelLatency': round(seconds * 1000, 1)
+    }))
@@ -0,0 +1,231 @@
+"""
+Idempotency-Key handling for POST handlers
+
+The first request with a given key records an in-progress marker with a
+conditional write and runs normally; its response is stored against the
+key. Retries with the same key get the stored response back (or wait for
+the in-progress one) instead of calling the model again.
+"""
+import functools
+import json
+import os
+import time
+
+from content_transformer.notifications import is_background
+from content_transformer.responses import error_response, header, json_response
+
+IN_PROGRESS = 'IN_PROGRESS'
+COMPLETED = 'COMPLETED'
+
+# How long a completed response can be replayed
+RECORD_TTL_SECONDS = 24 * 60 * 60
+# How long a retry waits for the original request to finish
+REPLAY_WAIT_SECONDS = 25
+POLL_INTERVAL_SECONDS = 0.5
+# Conditional writes tried while the key keeps being released under us
+ACQUIRE_ATTEMPTS = 3
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyConflict(Exception):
+    """The key is already being processed by another request"""
+
+
+class DynamoDBIdempotencyStore:
+    """Idempotency records in a DynamoDB table keyed by idempotencyKey"""
+
+    def __init__(self, table):
+        self.table = table
+
+    def acquire(self, key, fingerprint, lease_seconds, now=None):
+        """
+        Record an in-progress marker; returns None when acquired, otherwise
+        the existing record
+
+        A record released between a refused write and the read that follows
+        is tried again; IdempotencyConflict is raised if that keeps happening.
+        """
+        now = int(time.time() if now is None else now)
+        for _ in range(ACQUIRE_ATTEMPTS):
+            try:
+                self.table.put_item(
+                    Item={
+                        'idempotencyKey': key,
+                        'status': IN_PROGRESS,
+                        'fingerprint': fingerprint,
+                        'leaseExpiresAt': now + lease_seconds,
+                        'expiresAt': now + RECORD_TTL_SECONDS
+                    },
+                    # Free keys, expired records and abandoned leases can be taken
+                    ConditionExpression=(
+                        'attribute_not_exists(idempotencyKey) OR expiresAt < :now '
+                        'OR (#status = :in_progress AND leaseExpiresAt < :now)'
+                    ),
+                    ExpressionAttributeNames={'#status': 'status'},
+                    ExpressionAttributeValues={':now': now, ':in_progress': IN_PROGRESS}
+                )
+                return None
+            except Exception as e:
+                if _error_code(e) != 'ConditionalCheckFailedException':
+                    raise
+            record = self.get(key)
+            if record is not None:
+                return record
+        raise IdempotencyConflict(key)
+
+    def get(self, key):
+        return self.table.get_item(Key={'idempotencyKey': key}, ConsistentRead=True).get('Item')
+
+    def complete(self, key, status_code, body, now=None):
+        import gzip
+
+        now = int(time.time() if now is None else now)
+        self.table.update_item(
+            Key={'idempotencyKey': key},
+            UpdateExpression='SET #status = :completed, statusCode = :code, responseBody = :body, expiresAt = :expires',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={
+                ':completed': COMPLETED,
+                ':code': status_code,
+                # Stored gzipped to stay far below the item size limit
+                ':body': gzip.compress(body.encode('utf-8')),
+                ':expires': now + RECORD_TTL_SECONDS
+            }
+        )
+
+    def release(self, key):
+        self.table.delete_item(Key={'idempotencyKey': key})
+
+
+def _error_code(error):
+    return getattr(error, 'response', {}).get('Error', {}).get('Code')
+
+
+def request_fingerprint(event):
+    """Hash of the request body, so a key cannot be reused for different input"""
+    import hashlib
+
+    return hashlib.sha256((event.get('body') or '').encode('utf-8')).hexdigest()
+
+
+def stored_body(record):
+    import gzip
+
+    body = record['responseBody']
+    # boto3 wraps binary attributes in a Binary object
+    return gzip.decompress(getattr(body, 'value', body)).decode('utf-8')
+
+
+def replay(record, event):
+    """Re-render a stored response, negotiating encoding for this client"""
+    return json_response(
+        int(record['statusCode']), json.loads(stored_body(record)), event,
+        {'Idempotent-Replayed': 'true'}
+    )
+
+
+def reencode(response, event):
+    """Re-render an uncompressed handler response for the calling client"""
+    extra_headers = {
+        name: value for name, value in response.get('headers', {}).items()
+        if name.lower() not in ('content-type', 'content-encoding', 'vary')
+    }
+    return json_response(response['statusCode'], json.loads(response['body']), event, extra_headers)
+
+
+def wait_for_completion(store, key, deadline):
+    """Poll an in-progress record until it completes, disappears or time runs out"""
+    while time.time() < deadline:
+        time.sleep(POLL_INTERVAL_SECONDS)
+        record = store.get(key)
+        if record is None or record['status'] == COMPLETED:
+            return record
+    raise IdempotencyConflict(key)
+
+
+def idempotent(tool, store_factory=None):
+    """
+    Make a handler honor the Idempotency-Key header
+
+    Keys are scoped per tool. Without the header, or when no idempotency
+    table is configured, the handler runs unchanged.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            key = header(event, 'Idempotency-Key').strip()
+            # A background job continues a request whose 202 is already recorded
+            if not key or is_background(event):
+                return handler(event, context)
+            if len(key) > MAX_KEY_LENGTH:
+                return error_response(400, f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters", event)
+
+            store = store_factory() if store_factory else default_store()
+            if store is None:
+                return handler(event, context)
+
+            scoped_key = f"{tool}#{key}"
+            fingerprint = request_fingerprint(event)
+            lease_seconds = _remaining_seconds(context)
+            try:
+                record = store.acquire(scoped_key, fingerprint, lease_seconds)
+            except IdempotencyConflict:
+                # Never run without holding the key
+                return error_response(409, 'A request with this Idempotency-Key is still in progress',
+                                      event, {'Retry-After': '2'})
+
+            if record is not None:
+                if record.get('fingerprint') != fingerprint:
+                    return error_response(422, 'Idempotency-Key was already used with a different request', event)
+                if record['status'] == IN_PROGRESS:
+                    try:
+                        wait = min(REPLAY_WAIT_SECONDS, max(lease_seconds - 1, 0))
+                        record = wait_for_completion(store, scoped_key, time.time() + wait)
+                    except IdempotencyConflict:
+                        return error_response(409, 'A request with this Idempotency-Key is still in progress',
+                                              event, {'Retry-After': '2'})
+                    if record is None:
+                        # The original attempt failed and released the key
+                        return wrapper(event, context)
+                return replay(record, event)
+
+            # Render an uncompressed response for storage, then re-encode it
+            identity_event = dict(event, headers={
+                name: value for name, value in (event.get('headers') or {}).items()
+                if name.lower() != 'accept-encoding'
+            })
+            try:
+                response = handler(identity_event, context)
+            except Exception:
+                store.release(scoped_key)
+                raise
+
+            if response['statusCode'] >= 500:
+                # Server errors are not cached so the client can retry
+                store.release(scoped_key)
+                return reencode(response, event)
+
+            store.complete(scoped_key, response['statusCode'], response['body'])
+            return reencode(response, event)
+
+        return wrapper
+    return decorator
+
+
+_default_store = []
+
+
+def default_store():
+    """Store backed by IDEMPOTENCY_TABLE_NAME, or None when it is not set"""
+    if not _default_store:
+        table_name = os.environ.get('IDEMPOTENCY_TABLE_NAME')
+        if not table_name:
+            return None
+        from content_transformer import runtime
+        _default_store.append(DynamoDBIdempotencyStore(runtime.resource('dynamodb').Table(table_name)))
+    return _default_store[0]
+
+
+def _remaining_seconds(context, default=120):
+    get_remaining = getattr(context, 'get_remaining_time_in_millis', None)
+    return int(get_remaining() / 1000) + 1 if callable(get_remaining) else default
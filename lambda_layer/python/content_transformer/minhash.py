@@ -0,0 +1,162 @@
+"""
+MinHash signatures and LSH banding for near-duplicate documents
+
+Documents are reduced to overlapping 5-token shingles (words, or single
+characters for CJK text, which has no spaces) after lowercasing, so
+whitespace, case and punctuation changes do not matter. Signatures use
+one-permutation hashing: each shingle is hashed once and the hash picks
+one of NUM_HASHES bins, keeping the minimum per bin. That is O(n) per
+document instead of O(n * NUM_HASHES), which matters in pure Python.
+Empty bins are filled from their neighbours (rotation densification) so
+short documents still compare correctly.
+
+The signature is cut into BANDS bands of ROWS values; documents sharing
+any band hash are candidates, and candidates are verified by comparing
+full signatures. With 32 bands of 4 rows a pair at Jaccard similarity
+0.5 becomes a candidate about 87% of the time, and a pair at 0.9 almost
+always.
+"""
+import hashlib
+import re
+import struct
+
+from content_transformer.tokens import is_wide
+
+NUM_HASHES = 128
+BANDS = 32
+ROWS = NUM_HASHES // BANDS
+SHINGLE_TOKENS = 5
+
+_BIN_BITS = 7  # log2(NUM_HASHES)
+_VALUE_BITS = 64 - _BIN_BITS
+_EMPTY = (1 << _VALUE_BITS) - 1
+_ROTATION = 1 << _VALUE_BITS
+_SIGNATURE_FORMAT = f'>{NUM_HASHES}Q'
+
+_CJK = r'\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+TOKEN_PATTERN = re.compile(f'[{_CJK}]|[^\\W_{_CJK}]+')  # one CJK character, or one word
+
+
+def _hash64(text):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class MinHasher:
+    """
+    Incremental MinHash over a stream of text blocks
+
+    Blocks may split words; the unfinished last token of each block is
+    carried into the next one.
+    """
+
+    def __init__(self):
+        self.bins = [_EMPTY] * NUM_HASHES
+        self.window = []
+        self.carry = ''
+        self.shingles = 0
+
+    def update(self, block):
+        text = (self.carry + block).lower()
+        tokens = TOKEN_PATTERN.findall(text)
+        # A word touching the end of the block may continue in the next one
+        if tokens and text[-1].isalnum() and not is_wide(text[-1]):
+            self.carry = tokens.pop()
+        else:
+            self.carry = ''
+        self._add_tokens(tokens)
+        return self
+
+    def _add_tokens(self, tokens):
+        bins = self.bins
+        window = self.window
+        for token in tokens:
+            window.append(token)
+            if len(window) > SHINGLE_TOKENS:
+                del window[0]
+            if len(window) == SHINGLE_TOKENS:
+                value = _hash64(' '.join(window))
+                index = value & (NUM_HASHES - 1)
+                value >>= _BIN_BITS
+                if value < bins[index]:
+                    bins[index] = value
+                self.shingles += 1
+
+    def signature(self):
+        """Densified signature of everything seen so far, as a tuple of NUM_HASHES ints"""
+        if self.carry:
+            self._add_tokens([self.carry])
+            self.carry = ''
+        if self.shingles == 0 and self.window:
+            # Documents shorter than one shingle are hashed whole
+            value = _hash64(' '.join(self.window))
+            self.bins[value & (NUM_HASHES - 1)] = value >> _BIN_BITS
+        return densify(self.bins)
+
+
+def densify(bins):
+    """Fill empty bins from the next non-empty bin, offset by the distance travelled"""
+    if all(value == _EMPTY for value in bins):
+        return tuple(bins)
+    signature = list(bins)
+    for index, value in enumerate(bins):
+        if value != _EMPTY:
+            continue
+        distance = 1
+        while bins[(index + distance) % NUM_HASHES] == _EMPTY:
+            distance += 1
+        signature[index] = bins[(index + distance) % NUM_HASHES] + distance * _ROTATION
+    return tuple(signature)
+
+
+def minhash(text):
+    return MinHasher().update(text).signature()
+
+
+def similarity(signature_a, signature_b):
+    """Estimated Jaccard similarity of the documents behind two signatures"""
+    return sum(1 for a, b in zip(signature_a, signature_b) if a == b) / NUM_HASHES
+
+
+def band_hashes(signature):
+    """One short hash per band; documents sharing any band are candidates"""
+    return [
+        hashlib.blake2b(struct.pack(f'>{ROWS}Q', *signature[band * ROWS:(band + 1) * ROWS]),
+                        digest_size=8).hexdigest()
+        for band in range(BANDS)
+    ]
+
+
+def pack_signature(signature):
+    return struct.pack(_SIGNATURE_FORMAT, *signature)
+
+
+def unpack_signature(data):
+    return struct.unpack(_SIGNATURE_FORMAT, data)
+
+
+class LSHIndex:
+    """In-memory LSH index; the DynamoDB-backed one lives in content_transformer.dedupe"""
+
+    def __init__(self):
+        self.bands = {}
+        self.signatures = {}
+
+    def add(self, document_id, signature):
+        self.signatures[document_id] = signature
+        for band, band_hash in enumerate(band_hashes(signature)):
+            self.bands.setdefault((band, band_hash), set()).add(document_id)
+
+    def candidates(self, signature):
+        found = set()
+        for band, band_hash in enumerate(band_hashes(signature)):
+            found |= self.bands.get((band, band_hash), set())
+        return found
+
+    def query(self, signature, threshold):
+        """(document_id, similarity) of the most similar document at or above threshold, else (None, 0)"""
+        best, best_similarity = None, 0.0
+        for document_id in self.candidates(signature):
+            score = similarity(signature, self.signatures[document_id])
+            if score >= threshold and score > best_similarity:
+                best, best_similarity = document_id, score
+        return best, best_similarity
@@ -0,0 +1,375 @@
+"""
+Background jobs with pushed progress and completion notifications
+
+A request sent with `Prefer: respond-async` is answered at once with 202
+Accepted and its transformId; the work continues in an asynchronous
+invocation of the same function, free of API Gateway's 29 second limit.
+The result item is written as 'processing' first, its progress is
+updated as chunks finish, and the finished result is written over it.
+Each of those writes reaches the results table stream, where the result
+notifier turns it into a message for the WebSocket connections that
+subscribed to the transformId:
+
+    {"type": "progress", "transformId": "...", "completed": 3, "total": 8}
+    {"type": "completed", "transformId": "...", "status": "completed", "result": {...}}
+    {"type": "failed", "transformId": "...", "message": "..."}
+
+Results too large for one WebSocket message are sent without "result";
+clients read them from resultPath instead. Subscribing also sends the
+job's current state, so a job that finished before the client subscribed
+is not missed; a client can therefore see a completion twice.
+"""
+import contextvars
+import functools
+import json
+import os
+import time
+
+from content_transformer import runtime
+from content_transformer.responses import header, json_response
+from content_transformer.tracing import annotate
+
+BACKGROUND_KEY = 'backgroundJob'
+PROCESSING = 'processing'
+FAILED = 'failed'
+FINISHED = ('completed', 'partial')
+# Asynchronous Lambda invocations carry at most this much event
+MAX_BACKGROUND_EVENT_BYTES = 256 * 1024
+# API Gateway WebSocket messages are limited to 128 KB
+MAX_MESSAGE_BYTES = 96 * 1024
+PROGRESS_INTERVAL_SECONDS = 1.0
+# API Gateway closes WebSocket connections after two hours
+SUBSCRIPTION_TTL_SECONDS = 2 * 60 * 60
+
+_progress = contextvars.ContextVar('content_transformer_progress', default=None)
+
+
+class Progress:
+    """Progress of the running invocation; records nothing outside a background job"""
+
+    def advance(self, total=None):
+        """One more chunk finished, of total when the total is known"""
+
+
+NO_PROGRESS = Progress()
+
+
+class ProgressRecorder(Progress):
+    """Writes a background job's progress to its result item, at most once per interval"""
+
+    def __init__(self, table, transform_id, timestamp, interval=PROGRESS_INTERVAL_SECONDS):
+        self.table = table
+        self.key = {'transformId': transform_id, 'timestamp': timestamp}
+        self.interval = interval
+        self.completed = 0
+        self.written_at = None
+
+    def advance(self, total=None):
+        self.completed += 1
+        now = time.monotonic()
+        if self.written_at is not None and now - self.written_at < self.interval:
+            return
+        self.written_at = now
+        progress = {'completed': self.completed}
+        if total:
+            progress['total'] = total
+        try:
+            # A finished result is never turned back into a processing one
+            self.table.update_item(
+                Key=self.key,
+                UpdateExpression='SET progress = :progress',
+                ConditionExpression='#status = :processing',
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={':progress': progress, ':processing': PROCESSING}
+            )
+        except Exception as e:
+            print(f"Progress update skipped for {self.key['transformId']}: {e}")
+
+
+def current_progress():
+    """The running background job's progress, or NO_PROGRESS outside one"""
+    return _progress.get() or NO_PROGRESS
+
+
+def wants_async(event):
+    """True when the client sent Prefer: respond-async"""
+    return 'respond-async' in header(event, 'Prefer').lower()
+
+
+def background_job(event):
+    """{'transformId', 'timestamp'} of the job a background invocation continues, or None"""
+    job = event.get(BACKGROUND_KEY) if isinstance(event, dict) else None
+    return job if isinstance(job, dict) else None
+
+
+def is_background(event):
+    """True for the asynchronous invocation continuing an accepted request"""
+    return background_job(event) is not None
+
+
+def job_identity(event):
+    """(transformId, timestamp) for a result: the accepted job's, or new ones"""
+    job = background_job(event)
+    if job is not None:
+        return job['transformId'], int(job['timestamp'])
+    return runtime.new_transform_id(), int(time.time())
+
+
+def continuation_event(event, transform_id, timestamp):
+    """
+    The event for the background invocation
+
+    It carries no request time, so the job's deadline is the function
+    timeout rather than API Gateway's, and no Accept-Encoding, so error
+    responses can be read back.
+    """
+    from content_transformer.validation import VALIDATED_BODY_KEY
+
+    continuation = {key: value for key, value in event.items() if key != VALIDATED_BODY_KEY}
+    for field in ('headers', 'multiValueHeaders'):
+        if continuation.get(field):
+            continuation[field] = {
+                name: value for name, value in continuation[field].items() if name.lower() != 'accept-encoding'
+            }
+    request_context = dict(continuation.get('requestContext') or {})
+    request_context.pop('requestTimeEpoch', None)
+    continuation['requestContext'] = request_context
+    continuation[BACKGROUND_KEY] = {'transformId': transform_id, 'timestamp': timestamp}
+    return continuation
+
+
+def background(transformation_type):
+    """
+    Accept requests sent with Prefer: respond-async and finish them in the background
+
+    Apply it inside idempotent, so a retried request gets the same 202
+    and transformId back. Without NOTIFICATIONS_URL, or when the request
+    is too large to hand over, the preference is ignored and the request
+    is answered synchronously.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            job = background_job(event)
+            if job is not None:
+                return run_background(handler, event, context, job)
+            notifications_url = os.environ.get('NOTIFICATIONS_URL')
+            if not notifications_url or not wants_async(event):
+                return handler(event, context)
+
+            transform_id, timestamp = runtime.new_transform_id(), int(time.time())
+            continuation = continuation_event(event, transform_id, timestamp)
+            payload = json.dumps(continuation).encode('utf-8')
+            if len(payload) > MAX_BACKGROUND_EVENT_BYTES:
+                return handler(event, context)
+            annotate(transformId=transform_id, background=True)
+
+            from content_transformer.archive import result_expiry
+
+            item = {
+                'transformId': transform_id,
+                'timestamp': timestamp,
+                'transformationType': transformation_type,
+                'status': PROCESSING,
+                'createdAt': runtime.utc_isoformat(timestamp)
+            }
+            expires_at = result_expiry(timestamp)
+            if expires_at:
+                item['expiresAt'] = expires_at
+            results_table().put_item(Item=item)
+            try:
+                runtime.client('lambda').invoke(
+                    FunctionName=context.invoked_function_arn, InvocationType='Event', Payload=payload
+                )
+            except Exception as e:
+                print(f"Background invocation failed, finishing {transform_id} in this request: {e}")
+                return run_background(handler, continuation, context, continuation[BACKGROUND_KEY])
+
+            result_path = f"/transform/{transform_id}"
+            return json_response(202, {
+                'transformId': transform_id,
+                'status': PROCESSING,
+                'message': 'Accepted; subscribe to notifications for progress and the result',
+                'notifications': notifications_url,
+                'resultPath': result_path
+            }, event, {'Location': result_path})
+
+        return wrapper
+    return decorator
+
+
+def run_background(handler, event, context, job):
+    """Run an accepted job, recording progress and marking the item failed if it does not finish"""
+    table = results_table()
+    transform_id, timestamp = job['transformId'], int(job['timestamp'])
+    token = _progress.set(ProgressRecorder(table, transform_id, timestamp))
+    try:
+        response = handler(event, context)
+    except Exception as e:
+        mark_failed(table, transform_id, timestamp, str(e))
+        raise
+    finally:
+        _progress.reset(token)
+    if response.get('statusCode', 500) >= 400:
+        try:
+            message = json.loads(response.get('body') or '{}').get('message')
+        except ValueError:
+            message = None
+        mark_failed(table, transform_id, timestamp, message or 'The job failed')
+    return response
+
+
+def mark_failed(table, transform_id, timestamp, message):
+    """Mark a job failed unless its result was already stored"""
+    try:
+        table.update_item(
+            Key={'transformId': transform_id, 'timestamp': timestamp},
+            UpdateExpression='SET #status = :failed, #error = :message',
+            ConditionExpression='#status = :processing',
+            ExpressionAttributeNames={'#status': 'status', '#error': 'error'},
+            ExpressionAttributeValues={':failed': FAILED, ':message': message, ':processing': PROCESSING}
+        )
+    except Exception as e:
+        print(f"Could not mark {transform_id} failed: {e}")
+
+
+def results_table():
+    return runtime.resource('dynamodb').Table(os.environ['TABLE_NAME'])
+
+
+def notification_for(item):
+    """The message announcing an item's state, or None when there is nothing to announce"""
+    transform_id, status = item.get('transformId'), item.get('status')
+    if status == PROCESSING:
+        return dict(item.get('progress') or {'completed': 0}, type='progress', transformId=transform_id)
+    if status == FAILED:
+        return {'type': 'failed', 'transformId': transform_id, 'message': item.get('error', 'The job failed')}
+    if status not in FINISHED:
+        return None
+    message = {
+        'type': 'completed', 'transformId': transform_id, 'status': status,
+        'resultPath': f"/transform/{transform_id}"
+    }
+    result = {key: value for key, value in item.items() if key not in ('original_text', 'progress')}
+    if len(encode_message(dict(message, result=result))) <= MAX_MESSAGE_BYTES:
+        message['result'] = result
+    return message
+
+
+def encode_message(message):
+    from content_transformer.responses import _json_default
+
+    return json.dumps(message, separators=(',', ':'), ensure_ascii=False, default=_json_default).encode('utf-8')
+
+
+def stream_notifications(records):
+    """(transformId, message) for each inserted or modified result in a batch of stream records"""
+    from content_transformer.archive import from_attribute
+
+    for record in records:
+        if record.get('eventName') not in ('INSERT', 'MODIFY'):
+            continue
+        image = (record.get('dynamodb') or {}).get('NewImage')
+        if not image:
+            continue
+        message = notification_for({key: from_attribute(value) for key, value in image.items()})
+        if message is not None:
+            yield message['transformId'], message
+
+
+class DynamoDBSubscriptionStore:
+    """WebSocket connections subscribed to a transformId, in a table keyed by transformId and connectionId"""
+
+    def __init__(self, table):
+        self.table = table
+
+    def subscribe(self, transform_id, connection_id, now=None):
+        now = int(time.time() if now is None else now)
+        self.table.put_item(Item={
+            'transformId': transform_id,
+            'connectionId': connection_id,
+            'expiresAt': now + SUBSCRIPTION_TTL_SECONDS
+        })
+
+    def subscribers(self, transform_id):
+        response = self.table.query(
+            KeyConditionExpression='transformId = :id',
+            ExpressionAttributeValues={':id': transform_id}
+        )
+        return [item['connectionId'] for item in response.get('Items', [])]
+
+    def unsubscribe(self, transform_id, connection_id):
+        self.table.delete_item(Key={'transformId': transform_id, 'connectionId': connection_id})
+
+
+def connection_client():
+    """apigatewaymanagementapi client posting to the WebSocket API's connections"""
+    return runtime.client('apigatewaymanagementapi', endpoint_url=os.environ['WEBSOCKET_CALLBACK_URL'])
+
+
+def post_message(client, connection_id, message):
+    """Send a message to one connection; False when the connection is gone"""
+    try:
+        client.post_to_connection(ConnectionId=connection_id, Data=encode_message(message))
+        return True
+    except Exception as e:
+        if getattr(e, 'response', {}).get('Error', {}).get('Code') != 'GoneException':
+            raise
+        return False
+
+
+def notify(store, client, notifications):
+    """
+    Deliver messages to their subscribers; returns (sent, stale)
+
+    Connections that are gone are unsubscribed, as is everyone once a job
+    has completed or failed. Any other delivery error is logged and
+    skipped: a missed push leaves the result readable from resultPath.
+    """
+    sent = stale = 0
+    for transform_id, message in notifications:
+        final = message['type'] != 'progress'
+        for connection_id in store.subscribers(transform_id):
+            try:
+                delivered = post_message(client, connection_id, message)
+            except Exception as e:
+                print(f"Notification to {connection_id} failed: {e}")
+                continue
+            sent += delivered
+            stale += not delivered
+            if final or not delivered:
+                store.unsubscribe(transform_id, connection_id)
+    return sent, stale
+
+
+def emit_metrics(sent, stale):
+    """Publish a notifier batch as a CloudWatch embedded-metric-format log line"""
+    print(json.dumps({
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': 'ContentTransformer',
+                'Dimensions': [['Notifications']],
+                'Metrics': [
+                    {'Name': 'NotificationsSent', 'Unit': 'Count'},
+                    {'Name': 'StaleConnections', 'Unit': 'Count'}
+                ]
+            }]
+        },
+        'Notifications': 'results',
+        'NotificationsSent': sent,
+        'StaleConnections': stale
+    }))
+
+
+_default_store = []
+
+
+def default_store():
+    """Store backed by SUBSCRIPTIONS_TABLE_NAME, or None when it is not set"""
+    if not _default_store:
+        table_name = os.environ.get('SUBSCRIPTIONS_TABLE_NAME')
+        if not table_name:
+            return None
+        _default_store.append(DynamoDBSubscriptionStore(runtime.resource('dynamodb').Table(table_name)))
+    return _default_store[0]
@@ -0,0 +1,13 @@
+"""
+Choices the web app offers and the API accepts
+"""
+SUMMARY_TYPES = ('Bullet Points', 'Executive Summary', 'Key Highlights', 'Action Items')
+# Summary length levels, 1=very brief to 10=detailed
+MIN_SUMMARY_LENGTH = 1
+MAX_SUMMARY_LENGTH = 10
+# Longest document summarized inline, and so the most text the app extracts from an upload
+MAX_DOCUMENT_CHARS = 1_000_000
+
+LANGUAGES = ('English', 'Spanish', 'French', 'German', 'Chinese', 'Japanese', 'Arabic', 'Portuguese')
+SOURCE_LANGUAGES = ('Auto-Detect',) + LANGUAGES
+TRANSLATION_STYLES = ('Standard', 'Formal', 'Casual', 'Technical', 'Creative')
@@ -0,0 +1,103 @@
+"""
+Shrink prompt input before it is sent to the model
+
+Prompt templates are dedented once at import, and user text goes through
+whitespace normalization, removal of lines repeated on every page
+(running headers, footers, page numbers) and boilerplate such as
+copyright notices, and optionally HTML/Markdown markup stripping. Each
+step only removes characters the model does not need to read, and every
+call reports the estimated tokens saved.
+"""
+import collections
+import re
+import textwrap
+
+from content_transformer.tokens import estimate_tokens
+
+# A short line seen this many times is treated as a running header or footer
+REPEATED_LINE_MIN_COUNT = 3
+REPEATED_LINE_MAX_CHARS = 120
+
+INVISIBLE_CHARACTERS = re.compile('[\u200b\u200c\u200d\u2060\ufeff\u00ad]')
+HORIZONTAL_SPACE = re.compile('[ \t\u00a0\u2000-\u200a\u202f\u205f\u3000]+')
+BLANK_LINES = re.compile(r'\n{3,}')
+# "Page 3", "Page 3 of 10", "3 / 10" or "- 3 -"; bare numbers are left alone since they may be data
+PAGE_NUMBER_LINE = re.compile(
+    r'^(?:page\s*\d{1,4}(?:\s*(?:of|/)\s*\d{1,4})?|\d{1,4}\s*(?:of|/)\s*\d{1,4}|[-–—]\s*\d{1,4}\s*[-–—])$', re.I
+)
+BOILERPLATE_LINE = re.compile(
+    r'^(?:copyright\b|©|\(c\)\s*\d{4}|all rights reserved\b|confidential(?:ity)?\s*(?:notice)?\s*$'
+    r'|this (?:e-?mail|message) (?:and any attachments )?(?:is|are|may be) (?:confidential|intended)'
+    r'|to unsubscribe\b|unsubscribe\b|sent from my\b)',
+    re.I
+)
+HTML_COMMENT = re.compile(r'<!--.*?-->', re.S)
+HTML_BLOCK = re.compile(r'<(script|style)\b.*?</\1\s*>', re.S | re.I)
+HTML_BREAK = re.compile(r'<\s*(?:br|/p|/div|/li|/h[1-6]|/tr)\s*/?>', re.I)
+HTML_TAG = re.compile(r'</?[A-Za-z][^<>]*>')
+MARKDOWN_LINK = re.compile(r'!?\[([^\]]*)\]\([^)]*\)')
+MARKDOWN_EMPHASIS = re.compile(r'(\*\*|__|~~|`{1,3})(.+?)\1', re.S)
+MARKDOWN_LINE_PREFIX = re.compile(r'^\s{0,3}(?:#{1,6}\s+|>\s?|[-*+]\s+(?=\S))', re.M)
+
+
+def template(text):
+    """Dedent and trim a triple-quoted prompt template once, at import time"""
+    return textwrap.dedent(text).strip()
+
+
+def normalize_whitespace(text):
+    """Collapse runs of spaces, drop invisible characters and trailing spaces, cap blank lines at one"""
+    text = INVISIBLE_CHARACTERS.sub('', text.replace('\r\n', '\n').replace('\r', '\n'))
+    lines = (HORIZONTAL_SPACE.sub(' ', line).strip() for line in text.split('\n'))
+    return BLANK_LINES.sub('\n\n', '\n'.join(lines)).strip()
+
+
+def remove_repeated_lines(text):
+    """
+    Drop page numbers and boilerplate lines, and keep only the first copy of
+    short lines that repeat on every page
+    """
+    lines = text.split('\n')
+    counts = collections.Counter(
+        line.lower() for line in lines if line and len(line) <= REPEATED_LINE_MAX_CHARS
+    )
+    seen = set()
+    kept = []
+    for line in lines:
+        key = line.lower()
+        if line and (PAGE_NUMBER_LINE.match(line) or BOILERPLATE_LINE.match(line)):
+            continue
+        if counts.get(key, 0) >= REPEATED_LINE_MIN_COUNT:
+            if key in seen:
+                continue
+            seen.add(key)
+        kept.append(line)
+    return BLANK_LINES.sub('\n\n', '\n'.join(kept)).strip()
+
+
+def strip_markup(text):
+    """Reduce HTML and Markdown to their text"""
+    import html
+
+    text = HTML_BLOCK.sub('', HTML_COMMENT.sub('', text))
+    text = HTML_TAG.sub('', HTML_BREAK.sub('\n', text))
+    text = html.unescape(text)
+    text = MARKDOWN_LINK.sub(r'\1', text)
+    text = MARKDOWN_EMPHASIS.sub(r'\2', text)
+    return MARKDOWN_LINE_PREFIX.sub('', text)
+
+
+def preprocess(text, remove_repeats=True, markup=False):
+    """
+    Clean user text for a prompt; returns (clean_text, tokens_saved)
+
+    remove_repeats drops running headers, footers and boilerplate, which
+    suits summaries but not translations that must keep every line.
+    """
+    if not text:
+        return text, 0
+    clean = strip_markup(text) if markup else text
+    clean = normalize_whitespace(clean)
+    if remove_repeats:
+        clean = remove_repeated_lines(clean)
+    return clean, max(0, estimate_tokens(text) - estimate_tokens(clean))
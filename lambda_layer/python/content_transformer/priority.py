@@ -0,0 +1,114 @@
+"""
+Priority classes for model work
+
+Requests are interactive unless they carry "X-Priority: bulk", as nightly
+backfills and bulk jobs do. The class is the current one for the rest of
+the invocation, and the Bedrock semaphore uses it to share model
+concurrency between classes by weight and to hold bulk work back while
+interactive callers are queued (see semaphore.py). Handler latency is
+published per class, next to the semaphore's per-class queue wait.
+"""
+import collections
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import time
+
+from content_transformer.responses import header
+from content_transformer.tracing import annotate
+from content_transformer.warmup import is_warmup
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+CLASSES = (INTERACTIVE, BULK)
+PRIORITY_HEADER = 'X-Priority'
+
+_current = contextvars.ContextVar('content_transformer_priority', default=INTERACTIVE)
+
+PriorityPolicy = collections.namedtuple('PriorityPolicy', ['weights', 'bulk_defer_depth', 'bulk_queue_seconds'])
+
+
+def policy_from_env():
+    """Class weights, the interactive queue depth that defers bulk work, and how long bulk calls queue"""
+    return PriorityPolicy(
+        weights={
+            INTERACTIVE: float(os.environ.get('BEDROCK_INTERACTIVE_WEIGHT', 3)),
+            BULK: float(os.environ.get('BEDROCK_BULK_WEIGHT', 1))
+        },
+        bulk_defer_depth=int(os.environ.get('BEDROCK_BULK_DEFER_DEPTH', 2)),
+        bulk_queue_seconds=float(os.environ.get('BEDROCK_BULK_QUEUE_SECONDS', 60))
+    )
+
+
+def request_priority(event):
+    """The class a request asked for; anything unrecognized is interactive"""
+    requested = header(event, PRIORITY_HEADER).strip().lower()
+    return requested if requested in CLASSES else INTERACTIVE
+
+
+def current_priority():
+    return _current.get()
+
+
+@contextlib.contextmanager
+def priority(name):
+    """Run a block of work in a priority class"""
+    token = _current.set(name)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def prioritized(tool):
+    """
+    Run the handler in the priority class the request asked for
+
+    Apply it just inside traced, so the class is annotated on the handler
+    span and the latency covers validation, admission and the work itself.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            if is_warmup(event):
+                return handler(event, context)
+            name = request_priority(event)
+            annotate(priority=name)
+            started = time.monotonic()
+            status_code = 500
+            with priority(name):
+                try:
+                    response = handler(event, context)
+                    if isinstance(response, dict):
+                        status_code = response.get('statusCode', 200)
+                    return response
+                finally:
+                    emit_metrics(tool, name, time.monotonic() - started, status_code)
+
+        return wrapper
+    return decorator
+
+
+def emit_metrics(tool, name, seconds, status_code):
+    """Publish a request's latency per priority class as a CloudWatch embedded-metric-format log line"""
+    print(json.dumps({
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': 'ContentTransformer',
+                'Dimensions': [['PriorityClass'], ['Tool', 'PriorityClass']],
+                'Metrics': [
+                    {'Name': 'RequestLatency', 'Unit': 'Milliseconds'},
+                    {'Name': 'Requests', 'Unit': 'Count'},
+                    {'Name': 'ServerErrors', 'Unit': 'Count'}
+                ]
+            }]
+        },
+        'Tool': tool,
+        'PriorityClass': name,
+        'RequestLatency': round(seconds * 1000, 1),
+        'Requests': 1,
+        'ServerErrors': 1 if status_code >= 500 else 0
+    }))
@@ -0,0 +1,224 @@
+"""
+Per-API-key token-bucket admission control
+
+Every key has two buckets, one counting requests and one counting
+estimated model tokens. Both live in a single item of a shared table and
+are updated with an optimistic conditional write, so all containers see
+the same budget. Requests that would overdraw either bucket are rejected
+with 429 before any model work starts.
+"""
+import functools
+import math
+import os
+import time
+
+from content_transformer.notifications import is_background
+from content_transformer.responses import error_response
+from content_transformer.tokens import estimate_tokens
+from content_transformer.warmup import is_warmup
+
+MAX_UPDATE_ATTEMPTS = 3
+# Idle buckets are refilled anyway, so their items can expire
+IDLE_TTL_SECONDS = 24 * 60 * 60
+
+
+class RateLimitPolicy:
+    """Bucket sizes and refill rates for one API key"""
+
+    def __init__(self, requests_per_minute=60, request_burst=20,
+                 tokens_per_minute=200000, token_burst=100000):
+        self.request_rate = requests_per_minute / 60.0
+        self.request_capacity = request_burst
+        self.token_rate = tokens_per_minute / 60.0
+        self.token_capacity = token_burst
+
+    @classmethod
+    def from_environment(cls):
+        return cls(
+            requests_per_minute=float(os.environ.get('RATE_LIMIT_REQUESTS_PER_MINUTE', 60)),
+            request_burst=float(os.environ.get('RATE_LIMIT_REQUEST_BURST', 20)),
+            tokens_per_minute=float(os.environ.get('RATE_LIMIT_TOKENS_PER_MINUTE', 200000)),
+            token_burst=float(os.environ.get('RATE_LIMIT_TOKEN_BURST', 100000))
+        )
+
+
+def refill(level, capacity, rate, elapsed):
+    """Bucket level after elapsed seconds of refilling"""
+    return min(capacity, level + rate * max(elapsed, 0))
+
+
+def admit(state, policy, token_cost, now):
+    """
+    Try to take one request and token_cost tokens from the buckets
+
+    state is (request_level, token_level, updated_at), or None for a new key.
+    Returns (allowed, new_state, retry_after_seconds).
+    """
+    if state is None:
+        requests, tokens = policy.request_capacity, policy.token_capacity
+    else:
+        request_level, token_level, updated_at = state
+        elapsed = now - updated_at
+        requests = refill(request_level, policy.request_capacity, policy.request_rate, elapsed)
+        tokens = refill(token_level, policy.token_capacity, policy.token_rate, elapsed)
+
+    # A single request larger than the whole bucket is charged a full bucket
+    token_cost = min(token_cost, policy.token_capacity)
+
+    if requests >= 1 and tokens >= token_cost:
+        return True, (requests - 1, tokens - token_cost, now), 0
+
+    waits = []
+    if requests < 1:
+        waits.append((1 - requests) / policy.request_rate if policy.request_rate else math.inf)
+    if tokens < token_cost:
+        waits.append((token_cost - tokens) / policy.token_rate if policy.token_rate else math.inf)
+    return False, (requests, tokens, now), max(waits)
+
+
+class DynamoDBBucketStore:
+    """Bucket levels in a DynamoDB table keyed by bucketKey"""
+
+    def __init__(self, table):
+        self.table = table
+
+    def load(self, key):
+        item = self.table.get_item(Key={'bucketKey': key}, ConsistentRead=True).get('Item')
+        if not item:
+            return None, None
+        state = (float(item['requests']), float(item['tokens']), float(item['updatedAt']))
+        return state, item['version']
+
+    def save(self, key, state, version):
+        """Write new levels if nobody else did first; returns False on a lost race"""
+        from decimal import Decimal
+
+        requests, tokens, updated_at = state
+        condition = {'ConditionExpression': 'attribute_not_exists(bucketKey)'} if version is None else {
+            'ConditionExpression': 'version = :version',
+            'ExpressionAttributeValues': {':version': version}
+        }
+        try:
+            self.table.put_item(
+                Item={
+                    'bucketKey': key,
+                    'requests': Decimal(str(round(requests, 4))),
+                    'tokens': Decimal(str(round(tokens, 4))),
+                    'updatedAt': Decimal(str(round(updated_at, 3))),
+                    'version': (version or 0) + 1,
+                    'expiresAt': int(updated_at) + IDLE_TTL_SECONDS
+                },
+                **condition
+            )
+            return True
+        except Exception as e:
+            if getattr(e, 'response', {}).get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                return False
+            raise
+
+
+def check_rate_limit(store, key, policy, token_cost, now=None):
+    """
+    Charge a request against a key's buckets
+
+    Returns (allowed, retry_after_seconds). Lost races are retried with
+    fresh state; if every attempt loses, the request is admitted rather than
+    rejected on contention alone.
+    """
+    for _ in range(MAX_UPDATE_ATTEMPTS):
+        current = time.time() if now is None else now
+        state, version = store.load(key)
+        allowed, new_state, retry_after = admit(state, policy, token_cost, current)
+        if not allowed:
+            return False, retry_after
+        if store.save(key, new_state, version):
+            return True, 0
+    return True, 0
+
+
+def client_key(event):
+    """
+    API key of the caller, falling back to its source IP
+
+    Only keys API Gateway has validated (requestContext.identity.apiKey)
+    count. An X-Api-Key header is never trusted on its own, or each
+    request could name a fresh key to get a fresh bucket, usage scope and
+    dedupe scope.
+    """
+    identity = ((event or {}).get('requestContext') or {}).get('identity') or {}
+    api_key = identity.get('apiKey')
+    if api_key:
+        return f"key#{api_key}"
+    source_ip = identity.get('sourceIp')
+    return f"ip#{source_ip}" if source_ip else None
+
+
+def request_token_cost(event, max_output_tokens):
+    """
+    Estimated tokens a request will consume: its input plus the output cap
+
+    The input is the text fields of the decoded body. API Gateway delivers
+    bodies base64-encoded, and neither that nor JSON escaping is model
+    input. A body that does not decode is left for validation to reject.
+    """
+    from content_transformer.validation import ValidationError, validated_body
+
+    try:
+        body = validated_body(event)
+    except ValidationError:
+        body = {}
+    text = '\n'.join(value for value in body.values() if isinstance(value, str))
+    return estimate_tokens(text) + max_output_tokens
+
+
+def rate_limited(tool, max_output_tokens, store_factory=None, policy=None):
+    """
+    Reject requests over the caller's request or token budget with 429
+
+    Runs before the handler does any work. Without a configured table the
+    handler runs unchanged; if the table is unavailable, requests are let
+    through rather than failing.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            # Background jobs were charged when they were accepted
+            if is_warmup(event) or is_background(event):
+                return handler(event, context)
+            key = client_key(event)
+            store = store_factory() if store_factory else default_store()
+            if key is None or store is None:
+                return handler(event, context)
+
+            try:
+                allowed, retry_after = check_rate_limit(
+                    store, key, policy or RateLimitPolicy.from_environment(),
+                    request_token_cost(event, max_output_tokens)
+                )
+            except Exception as e:
+                print(f"Rate limiter unavailable for {tool}, admitting request: {e}")
+                allowed, retry_after = True, 0
+
+            if not allowed:
+                return error_response(
+                    429, 'Rate limit exceeded, retry later', event,
+                    {'Retry-After': str(max(1, math.ceil(min(retry_after, 3600))))}
+                )
+            return handler(event, context)
+
+        return wrapper
+    return decorator
+
+
+_default_store = []
+
+
+def default_store():
+    """Store backed by RATE_LIMIT_TABLE_NAME, or None when it is not set"""
+    if not _default_store:
+        table_name = os.environ.get('RATE_LIMIT_TABLE_NAME')
+        if not table_name:
+            return None
+        from content_transformer import runtime
+        _default_store.append(DynamoDBBucketStore(runtime.resource('dynamodb').Table(table_name)))
+    return _default_store[0]
@@ -0,0 +1,162 @@
+"""
+API Gateway proxy responses with content-negotiated compression
+"""
+import base64
+import json
+
+# Responses smaller than this are cheaper to send uncompressed
+COMPRESSION_THRESHOLD = 1024
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type',
+}
+
+
+_brotli = []
+
+
+def brotli_module():
+    """Import brotli on first use; None when it is not installed"""
+    if not _brotli:
+        try:
+            import brotli
+        except ImportError:
+            brotli = None
+        _brotli.append(brotli)
+    return _brotli[0]
+
+
+def header(event, name, default=''):
+    """Case-insensitive lookup of a request header"""
+    headers = (event or {}).get('headers') or {}
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return default
+
+
+def parse_body(event):
+    """Decode a proxy event body, which may arrive base64 encoded"""
+    body = (event or {}).get('body')
+    if not body:
+        return {}
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body)
+    return json.loads(body)
+
+
+def accepted_encodings(accept_encoding):
+    """Parse an Accept-Encoding header into {coding: q-value}"""
+    encodings = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        encodings[coding.strip().lower()] = quality
+    return encodings
+
+
+def choose_encoding(accept_encoding):
+    """Pick the best supported content coding, or None for identity"""
+    encodings = accepted_encodings(accept_encoding)
+    wildcard = encodings.get('*', 0.0)
+    candidates = ['br', 'gzip'] if brotli_module() else ['gzip']
+    best, best_quality = None, 0.0
+    for coding in candidates:
+        quality = encodings.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compress(data, encoding):
+    """Compress bytes with the given content coding"""
+    if encoding == 'br':
+        return brotli_module().compress(data, quality=5)
+    import gzip
+    return gzip.compress(data, compresslevel=6)
+
+
+def _json_default(value):
+    # DynamoDB returns every number as a Decimal
+    if type(value).__name__ == 'Decimal':
+        return int(value) if value == value.to_integral_value() else float(value)
+    return str(value)
+
+
+def etag_matches(event, etag):
+    """
+    True when If-None-Match names this entity tag in any content coding
+
+    Compressed representations carry the encoding as a suffix, e.g.
+    "abc-gzip", so the suffix is ignored when comparing.
+    """
+    if_none_match = header(event, 'If-None-Match')
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        candidate = candidate.strip('"')
+        if candidate == etag or candidate.rsplit('-', 1)[0] == etag:
+            return True
+    return False
+
+
+def not_modified_response(etag, headers=None):
+    """Build a bodiless 304 response"""
+    response_headers = dict(CORS_HEADERS)
+    response_headers['ETag'] = f'"{etag}"'
+    response_headers['Vary'] = 'Accept-Encoding'
+    response_headers.update(headers or {})
+    return {'statusCode': 304, 'headers': response_headers, 'body': ''}
+
+
+def json_response(status_code, payload, event=None, headers=None, etag=None):
+    """
+    Build a JSON proxy response, compressed when the client allows it
+
+    When etag is given it is sent as a strong ETag, suffixed with the
+    content coding so each representation has its own tag.
+    """
+    body = json.dumps(payload, separators=(',', ':'), ensure_ascii=False, default=_json_default)
+    response_headers = dict(CORS_HEADERS)
+    response_headers['Content-Type'] = 'application/json; charset=utf-8'
+    response_headers['Vary'] = 'Accept-Encoding'
+    response_headers.update(headers or {})
+
+    raw = body.encode('utf-8')
+    encoding = choose_encoding(header(event, 'Accept-Encoding')) if len(raw) >= COMPRESSION_THRESHOLD else None
+    if etag:
+        response_headers['ETag'] = f'"{etag}-{encoding}"' if encoding else f'"{etag}"'
+    if encoding:
+        response_headers['Content-Encoding'] = encoding
+        return {
+            'statusCode': status_code,
+            'headers': response_headers,
+            'body': base64.b64encode(compress(raw, encoding)).decode('ascii'),
+            'isBase64Encoded': True
+        }
+
+    return {
+        'statusCode': status_code,
+        'headers': response_headers,
+        'body': body
+    }
+
+
+def error_response(status_code, message, event=None, headers=None):
+    """Build the standard error payload"""
+    return json_response(status_code, {'status': 'error', 'message': message}, event, headers)
@@ -0,0 +1,85 @@
+"""
+Lazily created AWS clients and cheap per-request helpers
+
+boto3 is imported on first use instead of at module load, and clients are
+kept for the lifetime of the container so warm invocations reuse them.
+With tracing enabled, clients and resources are wrapped so every call is
+recorded as a span.
+"""
+import os
+import time
+
+# Connection settings per service. DynamoDB calls are small, so a stalled
+# one fails fast instead of eating the invocation deadline; a model call is
+# bounded by the deadline itself, so it is retried at most once.
+CLIENT_CONFIG = {
+    'dynamodb': {'connect_timeout': 2, 'read_timeout': 5, 'retries': {'mode': 'standard', 'max_attempts': 3}},
+    'bedrock-runtime': {'connect_timeout': 5, 'read_timeout': 120, 'retries': {'mode': 'standard', 'max_attempts': 2}},
+}
+
+_clients = {}
+_resources = {}
+
+
+def client_config(service_name):
+    """botocore Config for a service, or None to use the defaults"""
+    options = CLIENT_CONFIG.get(service_name)
+    if options is None:
+        return None
+    from botocore.config import Config
+    return Config(**options)
+
+
+def client(service_name, region_name=None, endpoint_url=None):
+    """Return a cached boto3 client, importing boto3 on first use"""
+    key = (service_name, region_name, endpoint_url)
+    if key not in _clients:
+        import boto3
+        from content_transformer import tracing
+        _clients[key] = tracing.instrument(
+            boto3.client(service_name, region_name=region_name, endpoint_url=endpoint_url,
+                         config=client_config(service_name)), service_name
+        )
+    return _clients[key]
+
+
+def resource(service_name):
+    """Return a cached boto3 resource, importing boto3 on first use"""
+    if service_name not in _resources:
+        import boto3
+        from content_transformer import tracing
+        _resources[service_name] = tracing.instrument(
+            boto3.resource(service_name, config=client_config(service_name)), service_name
+        )
+    return _resources[service_name]
+
+
+def register(service_name, client=None, resource=None, region_name=None, endpoint_url=None):
+    """Serve a service from a prebuilt client or resource (local emulators and tests)"""
+    from content_transformer import tracing
+    if client is not None:
+        _clients[(service_name, region_name, endpoint_url)] = tracing.instrument(client, service_name)
+    if resource is not None:
+        _resources[service_name] = tracing.instrument(resource, service_name)
+
+
+def reset_clients():
+    """Forget cached clients (used by tests that patch boto3)"""
+    _clients.clear()
+    _resources.clear()
+
+
+def new_transform_id():
+    """Return a random RFC 4122 version 4 UUID string without importing uuid"""
+    data = bytearray(os.urandom(16))
+    data[6] = data[6] & 0x0F | 0x40
+    data[8] = data[8] & 0x3F | 0x80
+    hex_id = data.hex()
+    return f"{hex_id[:8]}-{hex_id[8:12]}-{hex_id[12:16]}-{hex_id[16:20]}-{hex_id[20:]}"
+
+
+def utc_isoformat(timestamp=None):
+    """Format a UNIX timestamp like datetime.utcnow().isoformat()"""
+    timestamp = time.time() if timestamp is None else timestamp
+    microseconds = int(timestamp * 1_000_000) % 1_000_000
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(timestamp)) + f'.{microseconds:06d}'
@@ -0,0 +1,33 @@
+"""
+Streaming reads of S3 objects using ranged GETs
+"""
+import codecs
+
+RANGE_SIZE = 1024 * 1024
+
+
+def object_size(s3, bucket, key):
+    """Return the size of an S3 object in bytes"""
+    return s3.head_object(Bucket=bucket, Key=key)['ContentLength']
+
+
+def iter_object_bytes(s3, bucket, key, range_size=RANGE_SIZE, size=None, start=0):
+    """Yield an S3 object as consecutive byte ranges, from byte start"""
+    size = object_size(s3, bucket, key) if size is None else size
+    while start < size:
+        end = min(start + range_size, size) - 1
+        response = s3.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}")
+        yield response['Body'].read()
+        start = end + 1
+
+
+def iter_object_text(s3, bucket, key, range_size=RANGE_SIZE, size=None):
+    """Yield an S3 object as decoded UTF-8 text, one range at a time"""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    for block in iter_object_bytes(s3, bucket, key, range_size, size):
+        text = decoder.decode(block)
+        if text:
+            yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
@@ -0,0 +1,129 @@
+"""
+Sentence and paragraph segmentation for batched translation
+
+Splits text into sentences without losing any characters, so batches can
+be translated independently and stitched back with the original spacing.
+Latin sentences end at . ! ? followed by whitespace; CJK sentences end at
+full-width 。！？； and ellipses with no space after them. Closing quotes
+and brackets stay with the sentence they close.
+"""
+import re
+
+from content_transformer.tokens import estimate_tokens, is_wide
+
+SENTENCE_END = re.compile(
+    r'(?:'
+    r'[。！？；]+|…+|'                      # CJK terminators need no trailing space
+    r'[.!?]+(?=[\s"\'”’」』）)\]]|$)'       # Latin terminators only before a space or closer
+    r')'
+    r'[”’」』）)\]"\']*'                      # closing quotes and brackets
+    r'\s*'
+)
+PARAGRAPH_BREAK = re.compile(r'(\n\s*\n)')
+
+
+def split_sentences(text):
+    """
+    Split text into sentences, each keeping its trailing whitespace
+
+    ''.join(split_sentences(text)) == text always holds.
+    """
+    sentences = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        sentences.append(text[start:match.end()])
+        start = match.end()
+    if start < len(text):
+        sentences.append(text[start:])
+    return sentences
+
+
+def split_paragraphs(text):
+    """Split text into paragraphs, each keeping the blank lines that follow it"""
+    parts = PARAGRAPH_BREAK.split(text)
+    paragraphs = []
+    for i in range(0, len(parts), 2):
+        paragraph = parts[i] + (parts[i + 1] if i + 1 < len(parts) else '')
+        if paragraph:
+            paragraphs.append(paragraph)
+    return paragraphs
+
+
+def _hard_split(sentence, max_tokens):
+    """Cut a sentence too long for one batch at spaces, or at characters for CJK"""
+    pieces, current = [], ''
+    for token in re.findall(r'\S+\s*|\s+', sentence) if ' ' in sentence else sentence:
+        if current and estimate_tokens(current + token) > max_tokens:
+            pieces.append(current)
+            current = ''
+        current += token
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def segment_batches(text, max_tokens):
+    """
+    Group text into batches of whole sentences of at most max_tokens each
+
+    Batches prefer to end at paragraph breaks: a paragraph is only split
+    into sentences when it does not fit in a batch on its own. Joining the
+    batches gives back the original text exactly.
+    """
+    units = []
+    for paragraph in split_paragraphs(text):
+        if estimate_tokens(paragraph) <= max_tokens:
+            units.append((paragraph, True))
+            continue
+        for sentence in split_sentences(paragraph):
+            if estimate_tokens(sentence) <= max_tokens:
+                units.append((sentence, False))
+            else:
+                units.extend((piece, False) for piece in _hard_split(sentence, max_tokens))
+
+    batches, current = [], ''
+    for unit, is_paragraph in units:
+        if current and (estimate_tokens(current + unit) > max_tokens or (
+                is_paragraph and estimate_tokens(current) > max_tokens // 2)):
+            batches.append(current)
+            current = ''
+        current += unit
+    if current:
+        batches.append(current)
+    return batches
+
+
+def split_edges(text):
+    """(leading whitespace, content, trailing whitespace) so spacing survives translation"""
+    stripped = text.strip()
+    if not stripped:
+        return text, '', ''
+    start = text.find(stripped)
+    return text[:start], stripped, text[start + len(stripped):]
+
+
+def context_tail(text, max_tokens):
+    """The last whole sentences of text within max_tokens, as context for the next batch"""
+    tail = ''
+    for sentence in reversed(split_sentences(text.strip())):
+        if tail and estimate_tokens(sentence + tail) > max_tokens:
+            break
+        tail = sentence + tail
+    return tail.strip()
+
+
+def stitch(pieces):
+    """
+    Join translated pieces in order
+
+    Pieces cut mid-paragraph from CJK text carry no whitespace between
+    them, so a space is added where two non-CJK pieces would otherwise run
+    together.
+    """
+    text = ''
+    for piece in pieces:
+        if text and piece and not text[-1].isspace() and not piece[0].isspace() \
+                and not is_wide(text[-1]) and not is_wide(piece[0]):
+            text += ' '
+        text += piece
+    return text
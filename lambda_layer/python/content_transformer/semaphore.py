@@ -0,0 +1,297 @@
+"""
+Fleet-wide cap on in-flight Bedrock calls
+
+A distributed counting semaphore kept in one DynamoDB item: a map of
+lease IDs to expiry times plus a version number. Acquiring prunes expired
+leases (left behind by crashed or timed-out containers) and adds a new one
+with a version-conditioned write; releasing removes it the same way.
+Callers that find every slot taken back off and retry until their
+deadline, then give up with SemaphoreTimeout.
+
+Leases are taken for a priority class (interactive or bulk). Callers
+that had to queue are recorded in the item until their deadline, so the
+queue depth of each class is known fleet-wide: bulk callers are deferred
+while enough interactive ones are queued, and when both classes are
+queued, free slots go to each in proportion to its weight. A class with
+no competition may use every slot. Each model call takes its own lease,
+so running bulk work yields to interactive work at its next call.
+"""
+import collections
+import contextlib
+import json
+import os
+import random
+import threading
+import time
+
+from content_transformer.priority import BULK, CLASSES, INTERACTIVE, current_priority, policy_from_env
+
+MAX_BACKOFF_SECONDS = 0.5
+# Lease IDs are "<priority class>#<id>"
+LEASE_SEPARATOR = '#'
+
+
+class SemaphoreTimeout(Exception):
+    """No slot became free before the caller's deadline"""
+
+
+def lease_class(lease_id):
+    """Priority class of a lease or queued caller; leases without one are interactive"""
+    name, separator, _ = lease_id.partition(LEASE_SEPARATOR)
+    return name if separator and name in CLASSES else INTERACTIVE
+
+
+def deferred(policy, name, queued):
+    """True when a class must not take slots: bulk, while enough interactive callers are queued"""
+    return name == BULK and 0 < policy.bulk_defer_depth <= queued.get(INTERACTIVE, 0)
+
+
+def admits(policy, name, in_flight, queued, limit):
+    """
+    True when a free slot may go to a caller of class name
+
+    in_flight and queued count leases and other queued callers per class.
+    With no other class competing, the caller may take any free slot;
+    otherwise a class gets slots up to its weighted share among the
+    classes holding or waiting for them.
+    """
+    if sum(in_flight.values()) >= limit or deferred(policy, name, queued):
+        return False
+    waiting = {other for other in CLASSES if queued.get(other) and not deferred(policy, other, queued)}
+    if not waiting - {name}:
+        return True
+    active = [other for other in CLASSES if other == name or in_flight.get(other) or other in waiting]
+    share = limit * policy.weights[name] / sum(policy.weights[other] for other in active)
+    return in_flight.get(name, 0) < share
+
+
+class DistributedSemaphore:
+    """Lease-based counting semaphore on a table keyed by semaphoreKey"""
+
+    def __init__(self, table, name='bedrock', limit=10, lease_seconds=120, clock=time.time, policy=None):
+        self.table = table
+        self.name = name
+        self.limit = limit
+        self.lease_seconds = lease_seconds
+        self.clock = clock
+        self.policy = policy or policy_from_env()
+
+    def _load(self):
+        """(leases, queued callers, version); both maps are of IDs to expiry times"""
+        item = self.table.get_item(Key={'semaphoreKey': self.name}, ConsistentRead=True).get('Item')
+        if not item:
+            return {}, {}, None
+        decode = lambda entries: {key: float(expiry) for key, expiry in entries.items()}
+        return decode(item.get('leases', {})), decode(item.get('waiting', {})), item['version']
+
+    def _save(self, leases, waiting, version):
+        from decimal import Decimal
+
+        condition = {'ConditionExpression': 'attribute_not_exists(semaphoreKey)'} if version is None else {
+            'ConditionExpression': 'version = :version',
+            'ExpressionAttributeValues': {':version': version}
+        }
+        try:
+            self.table.put_item(
+                Item={
+                    'semaphoreKey': self.name,
+                    'leases': {lease: Decimal(str(round(expiry, 3))) for lease, expiry in leases.items()},
+                    'waiting': {caller: Decimal(str(round(expiry, 3))) for caller, expiry in waiting.items()},
+                    'version': (version or 0) + 1
+                },
+                **condition
+            )
+            return True
+        except Exception as e:
+            if getattr(e, 'response', {}).get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                return False
+            raise
+
+    def try_acquire(self, lease_id, queue_until=None):
+        """
+        Take a slot if this caller's class may have one; returns (acquired, in_flight, queued)
+
+        queued counts the other callers waiting, per class. A refused
+        caller with a queue_until time is recorded as waiting until then.
+        A lost write race counts as not acquired so the caller re-reads.
+        """
+        now = self.clock()
+        leases, waiting, version = self._load()
+        live = {lease: expiry for lease, expiry in leases.items() if expiry > now}
+        others = {caller: expiry for caller, expiry in waiting.items() if expiry > now and caller != lease_id}
+        in_flight = collections.Counter(lease_class(lease) for lease in live)
+        queued = collections.Counter(lease_class(caller) for caller in others)
+        if admits(self.policy, lease_class(lease_id), in_flight, queued, self.limit):
+            live[lease_id] = now + self.lease_seconds
+            if self._save(live, others, version):
+                return True, len(live), queued
+            return False, len(live) - 1, queued
+        if queue_until is not None and lease_id not in waiting:
+            # A lost race here is retried by the caller's next attempt
+            self._save(live, dict(others, **{lease_id: queue_until}), version)
+        return False, len(live), queued
+
+    def acquire(self, deadline, priority=INTERACTIVE):
+        """Block until a slot is held or the deadline passes; returns (lease_id, waited_seconds)"""
+        from content_transformer.runtime import new_transform_id
+
+        lease_id = f"{priority}{LEASE_SEPARATOR}{new_transform_id()}"
+        started = self.clock()
+        backoff = 0.02
+        while True:
+            acquired, in_flight, queued = self.try_acquire(lease_id, deadline)
+            if acquired:
+                waited = self.clock() - started
+                emit_metrics(self.name, in_flight, self.limit, waited, False, priority, queued)
+                return lease_id, waited
+            remaining = deadline - self.clock()
+            if remaining <= 0:
+                self.withdraw(lease_id)
+                emit_metrics(self.name, in_flight, self.limit, self.clock() - started, True, priority, queued)
+                raise SemaphoreTimeout(f"No {self.name} slot free within the deadline")
+            # Jittered exponential backoff, never sleeping past the deadline
+            time.sleep(min(remaining, random.uniform(0, backoff)))
+            backoff = min(backoff * 2, MAX_BACKOFF_SECONDS)
+
+    def release(self, lease_id):
+        """Remove a lease; retried on write races, and harmless if already expired"""
+        self._remove(lease_id, queued=False)
+
+    def withdraw(self, lease_id):
+        """Stop waiting for a slot; queued callers also drop out once their deadline passes"""
+        self._remove(lease_id, queued=True)
+
+    def _remove(self, lease_id, queued):
+        for _ in range(5):
+            leases, waiting, version = self._load()
+            entries = waiting if queued else leases
+            if lease_id not in entries:
+                return
+            entries.pop(lease_id)
+            now = self.clock()
+            unexpired = lambda entries: {key: expiry for key, expiry in entries.items() if expiry > now}
+            if self._save(unexpired(leases), unexpired(waiting), version):
+                return
+
+    @contextlib.contextmanager
+    def hold(self, deadline, priority=INTERACTIVE):
+        lease_id, _ = self.acquire(deadline, priority)
+        try:
+            yield
+        finally:
+            self.release(lease_id)
+
+    def occupancy(self):
+        """Number of unexpired leases"""
+        now = self.clock()
+        leases, _, _ = self._load()
+        return sum(1 for expiry in leases.values() if expiry > now)
+
+
+def emit_metrics(name, in_flight, limit, waited_seconds, throttled, priority=INTERACTIVE, queued=None):
+    """Publish occupancy and the caller's queue wait, per priority class, as an embedded-metric-format log line"""
+    queued = queued or {}
+    print(json.dumps({
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': 'ContentTransformer',
+                'Dimensions': [['Semaphore'], ['Semaphore', 'PriorityClass']],
+                'Metrics': [
+                    {'Name': 'InFlight', 'Unit': 'Count'},
+                    {'Name': 'Utilization', 'Unit': 'Percent'},
+                    {'Name': 'QueueWait', 'Unit': 'Milliseconds'},
+                    {'Name': 'QueueTimeouts', 'Unit': 'Count'},
+                    {'Name': 'InteractiveQueueDepth', 'Unit': 'Count'},
+                    {'Name': 'BulkQueueDepth', 'Unit': 'Count'}
+                ]
+            }]
+        },
+        'Semaphore': name,
+        'PriorityClass': priority,
+        'InFlight': in_flight,
+        'Utilization': round(100.0 * in_flight / limit, 1) if limit else 0,
+        'QueueWait': round(waited_seconds * 1000, 1),
+        'QueueTimeouts': 1 if throttled else 0,
+        'InteractiveQueueDepth': queued.get(INTERACTIVE, 0),
+        'BulkQueueDepth': queued.get(BULK, 0)
+    }))
+
+
+_default_semaphore = []
+
+
+def default_semaphore():
+    """Semaphore backed by SEMAPHORE_TABLE_NAME, or None when it is not set"""
+    if not _default_semaphore:
+        table_name = os.environ.get('SEMAPHORE_TABLE_NAME')
+        if not table_name:
+            return None
+        from content_transformer import runtime
+        _default_semaphore.append(DistributedSemaphore(
+            runtime.resource('dynamodb').Table(table_name),
+            limit=int(os.environ.get('BEDROCK_MAX_CONCURRENCY', 10)),
+            lease_seconds=int(os.environ.get('BEDROCK_LEASE_SECONDS', 120))
+        ))
+    return _default_semaphore[0]
+
+
+class SlotHold:
+    """
+    A held slot that calls outliving the block holding it can share
+
+    keep() adds a holder and returns the function it calls once finished;
+    the slot is released when the block and every holder are done.
+    """
+
+    def __init__(self, release):
+        self._release = release
+        self._holders = 1
+        self._lock = threading.Lock()
+
+    def keep(self):
+        with self._lock:
+            self._holders += 1
+        return self.done
+
+    def done(self):
+        with self._lock:
+            self._holders -= 1
+            last = self._holders == 0
+        if last:
+            self._release()
+
+
+@contextlib.contextmanager
+def bedrock_slot(queue_seconds=None):
+    """
+    Hold a fleet-wide Bedrock slot for the duration of a model call
+
+    Yields a SlotHold. The slot is taken for the current priority class;
+    bulk work may queue longer (BEDROCK_BULK_QUEUE_SECONDS) since nobody is
+    waiting on it. Queueing never outlasts the invocation deadline; running
+    out of time in the queue raises DeadlineExceeded rather than
+    SemaphoreTimeout.
+    """
+    from content_transformer.deadline import DeadlineExceeded, current_deadline
+
+    semaphore = default_semaphore()
+    if semaphore is None:
+        yield SlotHold(lambda: None)
+        return
+    priority = current_priority()
+    if queue_seconds is None:
+        queue_seconds = (semaphore.policy.bulk_queue_seconds if priority == BULK
+                         else float(os.environ.get('BEDROCK_QUEUE_SECONDS', 10)))
+    wait_seconds = current_deadline().cap(queue_seconds)
+    try:
+        lease_id, _ = semaphore.acquire(time.time() + wait_seconds, priority)
+    except SemaphoreTimeout:
+        if wait_seconds < queue_seconds:
+            raise DeadlineExceeded('Ran out of time waiting for a Bedrock slot')
+        raise
+    hold = SlotHold(lambda: semaphore.release(lease_id))
+    try:
+        yield hold
+    finally:
+        hold.done()
@@ -0,0 +1,28 @@
+"""
+Cheap model token estimates for text that has not been tokenized
+"""
+
+# Roughly four characters per token for Latin-script text
+CHARS_PER_TOKEN = 4
+
+
+def is_wide(char):
+    """True for CJK, kana and hangul characters, which cost about a token each"""
+    code = ord(char)
+    return (
+        0x3040 <= code <= 0x30FF      # Hiragana, Katakana
+        or 0x3400 <= code <= 0x4DBF   # CJK Extension A
+        or 0x4E00 <= code <= 0x9FFF   # CJK Unified Ideographs
+        or 0xAC00 <= code <= 0xD7AF   # Hangul syllables
+        or 0xF900 <= code <= 0xFAFF   # CJK Compatibility Ideographs
+    )
+
+
+def estimate_tokens(text):
+    """Estimate the number of model tokens in text"""
+    if not text:
+        return 0
+    if text.isascii():
+        return max(1, len(text) // CHARS_PER_TOKEN)
+    wide = sum(1 for char in text if is_wide(char))
+    return max(1, wide + (len(text) - wide) // CHARS_PER_TOKEN)
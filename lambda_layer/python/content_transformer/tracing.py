@@ -0,0 +1,247 @@
+"""
+Trace context propagation and spans across the app, API and handlers
+
+Follows the W3C Trace Context traceparent header, so a trace started by
+app.py (or any client sending the header) continues through API Gateway
+into the handler and every Bedrock, DynamoDB and S3 call it makes. Spans
+are exported as they end, one JSON line each, to the file named by
+TRACE_EXPORT; "stdout" writes them to the function log instead, where a
+log subscription can forward them to a collector. With TRACE_EXPORT unset
+spans are not exported and AWS clients are not wrapped.
+
+trace_viewer.py renders the critical path of a trace.
+"""
+import collections
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+
+from content_transformer.responses import header
+from content_transformer.warmup import is_warmup
+
+TRACE_EXPORT_ENV = 'TRACE_EXPORT'
+TRACEPARENT_HEADER = 'traceparent'
+# Request parameters worth recording on client spans
+CALL_ATTRIBUTES = ('modelId', 'TableName', 'IndexName', 'Bucket', 'Key')
+
+SpanContext = collections.namedtuple('SpanContext', ['trace_id', 'span_id'])
+
+_current = contextvars.ContextVar('content_transformer_span', default=None)
+_export_lock = threading.Lock()
+# Set until the first invocation of this container
+_cold = [True]
+_loaded_at = time.time()
+
+
+def enabled():
+    return bool(os.environ.get(TRACE_EXPORT_ENV))
+
+
+def parse_traceparent(value):
+    """SpanContext of a traceparent header value, or None when it is missing or malformed"""
+    parts = (value or '').strip().lower().split('-')
+    if len(parts) < 4 or [len(part) for part in parts[:4]] != [2, 32, 16, 2] or parts[0] == 'ff':
+        return None
+    try:
+        if not int(parts[1], 16) or not int(parts[2], 16):
+            return None
+        int(parts[0] + parts[3], 16)
+    except ValueError:
+        return None
+    return SpanContext(parts[1], parts[2])
+
+
+class Span:
+    """One timed operation; times are UNIX seconds"""
+
+    def __init__(self, name, trace_id, parent_id=None, kind='internal', attributes=None, start=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start = time.time() if start is None else start
+        self.end_time = None
+        self.status = 'ok'
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def end(self, error=None, end=None):
+        """Close the span and export it; later calls are ignored"""
+        if self.end_time is not None:
+            return
+        self.end_time = time.time() if end is None else end
+        if error is not None:
+            self.status = 'error'
+            self.attributes['error'] = f"{type(error).__name__}: {error}"
+        export(self)
+
+    def as_dict(self):
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentId': self.parent_id,
+            'name': self.name,
+            'kind': self.kind,
+            'start': self.start,
+            'end': self.end_time,
+            'durationMs': round((self.end_time - self.start) * 1000, 3),
+            'status': self.status,
+            'attributes': self.attributes
+        }
+
+
+def export(span):
+    """Append a finished span to the TRACE_EXPORT target; failures are logged, never raised"""
+    target = os.environ.get(TRACE_EXPORT_ENV)
+    if not target:
+        return
+    line = json.dumps(span.as_dict(), default=str)
+    try:
+        if target == 'stdout':
+            print(line)
+            return
+        with _export_lock, open(target, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+    except OSError as e:
+        print(f"Trace export failed: {e}")
+
+
+def current_span():
+    return _current.get()
+
+
+def start_span(name, parent=None, kind='internal', attributes=None, start=None):
+    """
+    Start a span without making it current
+
+    parent is a Span or SpanContext; without one the current span is the
+    parent, and with no current span a new trace begins.
+    """
+    parent = parent if parent is not None else _current.get()
+    if parent is None:
+        return Span(name, os.urandom(16).hex(), None, kind, attributes, start)
+    return Span(name, parent.trace_id, parent.span_id, kind, attributes, start)
+
+
+@contextlib.contextmanager
+def span(name, parent=None, kind='internal', **attributes):
+    """Run a block in a new current span, recording any exception it raises"""
+    current = start_span(name, parent, kind, attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.end(error=e)
+        raise
+    finally:
+        _current.reset(token)
+        current.end()
+
+
+def annotate(**attributes):
+    """Add attributes to the current span, if there is one"""
+    current = _current.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+def propagating(func):
+    """
+    func bound to a copy of the caller's context
+
+    Submit this to a thread pool so spans started on the worker thread
+    nest under the submitting span. Each call needs its own copy.
+    """
+    return functools.partial(contextvars.copy_context().run, func)
+
+
+class TracedClient:
+    """
+    A boto3 client, resource or Table whose calls each run in a client span
+
+    Table() returns a traced table, so item calls made through a resource
+    are recorded with the table name; other attributes pass through.
+    """
+
+    FACTORIES = ('Table',)
+
+    def __init__(self, target, service_name, table_name=None):
+        self._target = target
+        self._service_name = service_name
+        self._table_name = table_name
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if name.startswith('_') or not callable(attribute):
+            return attribute
+        if name in self.FACTORIES:
+            def factory(*args, **kwargs):
+                table_name = args[0] if args else kwargs.get('name')
+                return TracedClient(attribute(*args, **kwargs), self._service_name, table_name)
+            return factory
+
+        @functools.wraps(attribute)
+        def call(*args, **kwargs):
+            attributes = {'service': self._service_name, 'operation': name}
+            if self._table_name:
+                attributes['TableName'] = self._table_name
+            attributes.update((key, kwargs[key]) for key in CALL_ATTRIBUTES if isinstance(kwargs.get(key), str))
+            with span(f"{self._service_name}.{name}", kind='client', **attributes):
+                return attribute(*args, **kwargs)
+        return call
+
+
+def instrument(target, service_name):
+    """Wrap an AWS client or resource for tracing, or return it as is when tracing is off"""
+    if not enabled() or isinstance(target, TracedClient):
+        return target
+    return TracedClient(target, service_name)
+
+
+def traced(tool):
+    """
+    Run the handler in a server span that continues the caller's trace
+
+    Apply it outermost so validation, rate limiting and idempotency are
+    inside the span. The first invocation of a container is marked as a
+    cold start, with an init span covering the time from when the layer was
+    imported (provisioned containers are initialized ahead of time, so they
+    get the mark but no init span).
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            cold, _cold[0] = _cold[0], False
+            if not enabled() or is_warmup(event):
+                return handler(event, context)
+
+            parent = parse_traceparent(header(event, TRACEPARENT_HEADER))
+            attributes = {
+                'tool': tool,
+                'cold_start': cold,
+                'function': getattr(context, 'function_name', None) or os.environ.get('AWS_LAMBDA_FUNCTION_NAME'),
+                'request_id': getattr(context, 'aws_request_id', None)
+            }
+            with span(f"{tool} handler", parent, 'server', **attributes) as current:
+                if cold and os.environ.get('AWS_LAMBDA_INITIALIZATION_TYPE') != 'provisioned-concurrency':
+                    start_span('init', current, attributes={'cold_start': True}, start=_loaded_at).end(end=current.start)
+                response = handler(event, context)
+                status_code = response.get('statusCode') if isinstance(response, dict) else None
+                current.set(status_code=status_code)
+                if isinstance(status_code, int) and status_code >= 500:
+                    current.status = 'error'
+                return response
+
+        return wrapper
+    return decorator
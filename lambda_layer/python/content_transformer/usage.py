@@ -0,0 +1,209 @@
+"""
+Model token accounting
+
+Each invocation collects the input and output token counts Bedrock
+reports in its response headers (or an estimate when they are missing),
+stores them on the result item and adds them to daily counters in a
+usage table, one item per tool, model and API key. Reports over a date
+range are then a single key query per dimension instead of a scan of the
+results table.
+"""
+import json
+import os
+import threading
+import time
+
+from content_transformer.tokens import estimate_tokens
+
+INPUT_TOKEN_HEADER = 'x-amzn-bedrock-input-token-count'
+OUTPUT_TOKEN_HEADER = 'x-amzn-bedrock-output-token-count'
+DIMENSIONS = ('tool', 'model', 'key')
+# Daily counters are kept for a little over a year
+USAGE_TTL_SECONDS = 400 * 24 * 60 * 60
+
+
+class TokenUsage:
+    """Thread-safe token totals for one request, which may make several model calls"""
+
+    def __init__(self):
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.model_calls = 0
+        self.estimated_calls = 0
+        self.input_tokens_saved = 0
+        self._late_calls = None
+        self._lock = threading.Lock()
+
+    def add(self, input_tokens, output_tokens, estimated=False):
+        with self._lock:
+            late_calls = self._late_calls
+            if late_calls is None:
+                self.input_tokens += input_tokens
+                self.output_tokens += output_tokens
+                self.model_calls += 1
+                if estimated:
+                    self.estimated_calls += 1
+                return
+        # Already recorded: the call is recorded on its own instead
+        call = TokenUsage()
+        call.add(input_tokens, output_tokens, estimated)
+        late_calls(call)
+
+    def on_late_calls(self, callback):
+        """Pass calls added from now on to callback instead of the totals"""
+        with self._lock:
+            self._late_calls = callback
+
+    def add_saved(self, tokens):
+        """Record input tokens removed by prompt preprocessing"""
+        with self._lock:
+            self.input_tokens_saved += tokens
+
+    @property
+    def total_tokens(self):
+        return self.input_tokens + self.output_tokens
+
+    def as_dict(self):
+        return {
+            'input_tokens': self.input_tokens,
+            'output_tokens': self.output_tokens,
+            'total_tokens': self.total_tokens,
+            'model_calls': self.model_calls,
+            'input_tokens_saved': self.input_tokens_saved,
+            # True when any call's counts came from the estimator
+            'estimated': self.estimated_calls > 0
+        }
+
+
+def response_token_counts(response, prompt, completion):
+    """
+    (input_tokens, output_tokens, estimated) for one InvokeModel response
+
+    Falls back to estimating from the prompt and completion text when the
+    response does not carry Bedrock's token count headers.
+    """
+    headers = (response.get('ResponseMetadata') or {}).get('HTTPHeaders') or {}
+    input_tokens = headers.get(INPUT_TOKEN_HEADER)
+    output_tokens = headers.get(OUTPUT_TOKEN_HEADER)
+    if input_tokens is not None and output_tokens is not None:
+        try:
+            return int(input_tokens), int(output_tokens), False
+        except ValueError:
+            pass
+    return estimate_tokens(prompt), estimate_tokens(completion), True
+
+
+def usage_period(timestamp=None):
+    """UTC day a usage counter belongs to, e.g. 2024-05-01"""
+    return time.strftime('%Y-%m-%d', time.gmtime(time.time() if timestamp is None else timestamp))
+
+
+class DynamoDBUsageStore:
+    """Daily usage counters in a table keyed by usageKey and period"""
+
+    def __init__(self, table):
+        self.table = table
+
+    def add(self, dimension, value, usage, timestamp=None, requests=1):
+        timestamp = int(time.time() if timestamp is None else timestamp)
+        self.table.update_item(
+            Key={'usageKey': f"{dimension}#{value}", 'period': usage_period(timestamp)},
+            UpdateExpression=(
+                'ADD requests :one, modelCalls :calls, inputTokens :input, outputTokens :output, '
+                'estimatedCalls :estimated SET expiresAt = :expires'
+            ),
+            ExpressionAttributeValues={
+                ':one': requests,
+                ':calls': usage.model_calls,
+                ':input': usage.input_tokens,
+                ':output': usage.output_tokens,
+                ':estimated': usage.estimated_calls,
+                ':expires': timestamp + USAGE_TTL_SECONDS
+            }
+        )
+
+    def query(self, dimension, value, start_period, end_period):
+        """Daily counters for one tool, model or key, oldest first"""
+        response = self.table.query(
+            KeyConditionExpression='usageKey = :key AND #period BETWEEN :start AND :end',
+            ExpressionAttributeNames={'#period': 'period'},
+            ExpressionAttributeValues={
+                ':key': f"{dimension}#{value}", ':start': start_period, ':end': end_period
+            }
+        )
+        return response.get('Items', [])
+
+
+def usage_totals(items):
+    """Sum daily counter items into one total"""
+    totals = {'requests': 0, 'modelCalls': 0, 'inputTokens': 0, 'outputTokens': 0, 'estimatedCalls': 0}
+    for item in items:
+        for name in totals:
+            totals[name] += int(item.get(name, 0))
+    return totals
+
+
+def usage_cost(totals, input_price_per_1k, output_price_per_1k):
+    """Spend for a usage total at per-1K-token prices"""
+    return (totals['inputTokens'] * input_price_per_1k + totals['outputTokens'] * output_price_per_1k) / 1000.0
+
+
+def record_usage(tool, model_id, key, usage, timestamp=None, store=None, requests=1):
+    """
+    Add a request's usage to the tool, model and key counters
+
+    Model calls that finish afterwards, like an abandoned hedge, are
+    recorded as they finish, without counting the request again.
+    Accounting never fails the request: errors are logged and dropped.
+    """
+    usage.on_late_calls(lambda call: record_usage(tool, model_id, key, call, timestamp, store, requests=0))
+    emit_metrics(tool, model_id, usage)
+    store = store or default_store()
+    if store is None or usage.model_calls == 0:
+        return
+    for dimension, value in zip(DIMENSIONS, (tool, model_id, key)):
+        if not value:
+            continue
+        try:
+            store.add(dimension, value, usage, timestamp, requests)
+        except Exception as e:
+            print(f"Could not record {dimension} usage for {tool}: {e}")
+
+
+def emit_metrics(tool, model_id, usage):
+    """Publish token counts as a CloudWatch embedded-metric-format log line"""
+    print(json.dumps({
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': 'ContentTransformer',
+                'Dimensions': [['Tool'], ['Tool', 'Model']],
+                'Metrics': [
+                    {'Name': 'InputTokens', 'Unit': 'Count'},
+                    {'Name': 'OutputTokens', 'Unit': 'Count'},
+                    {'Name': 'ModelCalls', 'Unit': 'Count'},
+                    {'Name': 'InputTokensSaved', 'Unit': 'Count'}
+                ]
+            }]
+        },
+        'Tool': tool,
+        'Model': model_id,
+        'InputTokens': usage.input_tokens,
+        'OutputTokens': usage.output_tokens,
+        'ModelCalls': usage.model_calls,
+        'InputTokensSaved': usage.input_tokens_saved
+    }))
+
+
+_default_store = []
+
+
+def default_store():
+    """Store backed by USAGE_TABLE_NAME, or None when it is not set"""
+    if not _default_store:
+        table_name = os.environ.get('USAGE_TABLE_NAME')
+        if not table_name:
+            return None
+        from content_transformer import runtime
+        _default_store.append(DynamoDBUsageStore(runtime.resource('dynamodb').Table(table_name)))
+    return _default_store[0]
@@ -0,0 +1,189 @@
+"""
+Request validation that runs before any AWS client or model work
+
+Each endpoint declares a Schema once at import; its fields are compiled
+into a list of checks with the allowed options in lookup tables, so a
+request costs a size check, one JSON decode and a handful of dictionary
+lookups. Bodies over the size limit are rejected with 413 before they are
+decoded, and anything that is not a JSON object, misses a required field,
+has the wrong type, is out of range or is not one of the allowed options
+gets a 400. The handler receives the decoded body with defaults filled in.
+"""
+import base64
+import functools
+import json
+
+from content_transformer.responses import error_response
+from content_transformer.warmup import is_warmup
+
+# Lambda's synchronous invocation payload limit
+MAX_BODY_BYTES = 6 * 1024 * 1024
+# Where the decoded body is handed to the handler
+VALIDATED_BODY_KEY = 'validatedBody'
+
+_orjson = []
+
+
+class ValidationError(Exception):
+    """A request the endpoint will not process; carries the HTTP status to return"""
+
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+def orjson_module():
+    """Import orjson on first use; None when it is not installed"""
+    if not _orjson:
+        try:
+            import orjson
+        except ImportError:
+            orjson = None
+        _orjson.append(orjson)
+    return _orjson[0]
+
+
+def decode_json_object(event, max_bytes=MAX_BODY_BYTES):
+    """Decode a proxy event body that must be a JSON object, checking its size first"""
+    body = (event or {}).get('body')
+    if not body:
+        return {}
+    if event.get('isBase64Encoded'):
+        if len(body) // 4 * 3 > max_bytes:
+            raise ValidationError(413, f"Request body exceeds {max_bytes} bytes")
+        body = base64.b64decode(body)
+    elif len(body) > max_bytes or (len(body) * 4 > max_bytes and len(body.encode('utf-8')) > max_bytes):
+        raise ValidationError(413, f"Request body exceeds {max_bytes} bytes")
+    if body.lstrip()[:1] not in ('{', b'{'):
+        raise ValidationError(400, 'Request body must be a JSON object')
+    orjson = orjson_module()
+    try:
+        return orjson.loads(body) if orjson else json.loads(body)
+    except ValueError:
+        raise ValidationError(400, 'Request body is not valid JSON')
+
+
+class Field:
+    """
+    One body field: its type, default and limits
+
+    kind is str, int or bool. Integers are bounded by minimum and maximum,
+    strings by their length; a value above maximum is answered with
+    too_large_status. Strings may also be limited to max_chars (413 above
+    it), forbidden from being blank, required to start with prefix, or
+    restricted to choices, which match case-insensitively and are
+    normalized to their canonical spelling.
+    """
+
+    def __init__(self, name, kind=str, required=False, default=None, choices=None, minimum=None,
+                 maximum=None, max_chars=None, allow_blank=True, prefix=None, too_large_status=400):
+        self.name = name
+        self.kind = kind
+        self.required = required
+        self.default = default
+        self.choices = {choice.lower(): choice for choice in choices} if choices else None
+        self.minimum = minimum
+        self.maximum = maximum
+        self.max_chars = max_chars
+        self.allow_blank = allow_blank
+        self.prefix = prefix
+        self.too_large_status = too_large_status
+        self.choice_list = ', '.join(choices) if choices else ''
+
+    def check(self, value):
+        """Return the cleaned value or raise ValidationError"""
+        name = self.name
+        if self.kind is bool:
+            if not isinstance(value, bool):
+                raise ValidationError(400, f"{name} must be true or false")
+            return value
+        if self.kind is int:
+            if isinstance(value, bool) or not isinstance(value, int):
+                raise ValidationError(400, f"{name} must be an integer")
+            if self.maximum is not None and value > self.maximum:
+                raise ValidationError(self.too_large_status, f"{name} must be between {self.minimum} and {self.maximum}")
+            if self.minimum is not None and value < self.minimum:
+                raise ValidationError(400, f"{name} must be between {self.minimum} and {self.maximum}")
+            return value
+        if not isinstance(value, str):
+            raise ValidationError(400, f"{name} must be a string")
+        if self.max_chars is not None and len(value) > self.max_chars:
+            raise ValidationError(413, f"{name} exceeds {self.max_chars} characters")
+        if not self.allow_blank and not value.strip():
+            raise ValidationError(400, f"{name} must not be empty")
+        if self.prefix and not value.startswith(self.prefix):
+            raise ValidationError(400, f"{name} must start with {self.prefix}")
+        if self.choices is not None:
+            choice = self.choices.get(value.lower())
+            if choice is None:
+                raise ValidationError(400, f"{name} must be one of: {self.choice_list}")
+            return choice
+        if self.minimum is not None and len(value) < self.minimum:
+            raise ValidationError(400, f"{name} must be at least {self.minimum} characters")
+        if self.maximum is not None and len(value) > self.maximum:
+            raise ValidationError(self.too_large_status, f"{name} must be at most {self.maximum} characters")
+        return value
+
+
+class Schema:
+    """
+    Fields an endpoint accepts
+
+    one_of names fields of which at least one must be present. Unknown
+    fields are ignored so older clients keep working.
+    """
+
+    def __init__(self, fields, max_body_bytes=MAX_BODY_BYTES, one_of=()):
+        self.fields = tuple(fields)
+        self.max_body_bytes = max_body_bytes
+        self.one_of = tuple(one_of)
+        self.one_of_message = f"{' or '.join(self.one_of)} is required" if self.one_of else ''
+
+    def validate(self, body):
+        """Cleaned copy of a decoded body with defaults filled in"""
+        if not isinstance(body, dict):
+            raise ValidationError(400, 'Request body must be a JSON object')
+        cleaned = dict(body)
+        for field in self.fields:
+            value = body.get(field.name)
+            if value is None:
+                if field.required:
+                    raise ValidationError(400, f"{field.name} is required")
+                cleaned[field.name] = field.default
+            else:
+                cleaned[field.name] = field.check(value)
+        if self.one_of and all(body.get(name) is None for name in self.one_of):
+            raise ValidationError(400, self.one_of_message)
+        return cleaned
+
+    def validate_event(self, event):
+        return self.validate(decode_json_object(event, self.max_body_bytes))
+
+
+def validated(schema):
+    """
+    Reject invalid requests with 400 or 413 before the handler runs
+
+    Apply it outermost, so rate limiting and idempotency never see a bad
+    request. The handler reads the cleaned body with validated_body(event).
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            if is_warmup(event):
+                return handler(event, context)
+            try:
+                event[VALIDATED_BODY_KEY] = schema.validate_event(event)
+            except ValidationError as e:
+                return error_response(e.status_code, e.message, event)
+            return handler(event, context)
+
+        return wrapper
+    return decorator
+
+
+def validated_body(event):
+    """The body the validated decorator cleaned, decoding it if the handler was called directly"""
+    body = (event or {}).get(VALIDATED_BODY_KEY)
+    return body if body is not None else decode_json_object(event)
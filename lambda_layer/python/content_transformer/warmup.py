@@ -0,0 +1,25 @@
+"""
+Recognize scheduled warm-up pings before any real work happens
+"""
+import json
+
+from content_transformer import runtime
+
+
+def is_warmup(event):
+    """True for the {"warmup": true} payload sent by the warmer schedule"""
+    return isinstance(event, dict) and event.get('warmup') is True
+
+
+def warmup_response(clients=(), resources=()):
+    """
+    Answer a warm-up ping
+
+    Creating the clients loads boto3 and its endpoint data into the warm
+    container; no request is sent to Bedrock, DynamoDB or S3.
+    """
+    for service_name in clients:
+        runtime.client(service_name)
+    for service_name in resources:
+        runtime.resource(service_name)
+    return {'statusCode': 200, 'body': json.dumps({'status': 'warm'})}
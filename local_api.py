@@ -0,0 +1,1103 @@
+#!/usr/bin/env python3
+"""
+Local API Gateway emulator serving every handler of the stack
+
+Reads the REST API routes, Lambda functions and DynamoDB tables declared in
+cdk_stack.py (by walking its syntax tree, so aws_cdk is not needed) and
+serves them over HTTP with asyncio. Each request becomes an API Gateway
+proxy-integration event and runs on a pool of simulated containers per
+function: an idle warm container is reused, a new one pays a simulated
+cold start, and when the pool is full requests queue (or are throttled
+with 429, like Lambda at its concurrency limit). Handlers whose body is an
+iterator are streamed to the client with chunked transfer encoding.
+
+DynamoDB, S3 and by default Bedrock are in-memory stand-ins, so app.py and
+load generators run end-to-end on one machine. Presigned upload URLs point
+back at the emulator, and GET /_local/stats reports per-function
+invocations, cold starts, throttles and latency. With TRACE_EXPORT set,
+each request gets a gateway span (and a cold start span when a container
+starts) that the handler's spans nest under.
+
+The notifications WebSocket API is served at ws://<host>:<port>/_local/notifications.
+Writes to a table are delivered in order, in batches, to the functions the
+stack attaches to its stream (honoring their filters), asynchronous Lambda
+invocations run on the target function's pool, and messages the handlers
+post to connections are sent on the open WebSockets, so background jobs
+and their pushed notifications work offline.
+
+Usage:
+    python local_api.py [--port 3000] [--containers 4] [--cold-start-ms 800] [--bedrock local]
+"""
+import argparse
+import ast
+import asyncio
+import base64
+import collections
+import http
+import importlib.util
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+import urllib.parse
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(PROJECT_DIR, 'lambda_layer', 'python'))
+
+from local_dynamodb import LocalClientError, LocalDynamoDB, LocalTable
+from notification_channel import (
+    EXTENDED_LENGTH_BYTES, OP_CLOSE, OP_CONTINUATION, OP_PING, OP_PONG, OP_TEXT,
+    accept_key, apply_mask, encode_frame, frame_header
+)
+
+STACK_PATH = os.path.join(PROJECT_DIR, 'cdk_stack.py')
+CDK_JSON_PATH = os.path.join(PROJECT_DIR, 'cdk.json')
+STACK_CLASS = 'ContentTransformerStack'
+LOCAL_ACCOUNT = '000000000000'
+LOCAL_REGION = 'us-east-1'
+# API Gateway limits
+INTEGRATION_TIMEOUT_SECONDS = 29
+MAX_PAYLOAD_BYTES = 10 * 1024 * 1024
+MAX_HEADER_BYTES = 64 * 1024
+MAX_SOCKET_MESSAGE_BYTES = 128 * 1024
+STREAM_BATCH_SIZE = 100
+WEBSOCKET_PATH = '/_local/notifications'
+CONNECTIONS_PATH = '/_local/connections'
+
+Route = collections.namedtuple('Route', ['method', 'path', 'function', 'mock_body'])
+FunctionSpec = collections.namedtuple(
+    'FunctionSpec', ['name', 'handler', 'code', 'timeout', 'memory_size', 'environment']
+)
+StackDefinition = collections.namedtuple(
+    'StackDefinition',
+    ['routes', 'functions', 'tables', 'binary_media_types', 'cors_headers', 'socket_routes', 'stream_consumers'],
+    defaults=(None, None)
+)
+# A function attached to a table's stream, with its event filter patterns
+StreamConsumer = collections.namedtuple('StreamConsumer', ['table_name', 'function', 'filters'])
+
+
+class Unresolved(Exception):
+    """A stack expression whose value only exists in a real deployment"""
+
+
+class ApiResource:
+    """A REST API path while the stack is being read"""
+
+    def __init__(self, path):
+        self.path = path
+
+
+class StackReader:
+    """
+    Evaluates the subset of CDK calls the stack uses to declare its APIs
+
+    Constructs are reduced to plain records (tables, functions, integrations,
+    WebSocket routes and stream event sources) and anything that depends on a
+    deployment (ARNs, roles, tokens) is left unresolved. Context settings are
+    read from cdk.json, as cdk synth would.
+    """
+
+    def __init__(self, context):
+        self.context = context
+        self.names = {}
+        self.routes = []
+        self.functions = {}
+        self.tables = {}
+        self.socket_routes = {}
+        self.stream_consumers = []
+        self.api = None
+
+    def read(self, source):
+        tree = ast.parse(source)
+        stack = next(node for node in tree.body if isinstance(node, ast.ClassDef) and node.name == STACK_CLASS)
+        init = next(node for node in stack.body if isinstance(node, ast.FunctionDef) and node.name == '__init__')
+        for statement in init.body:
+            try:
+                if isinstance(statement, ast.Assign) and isinstance(statement.targets[0], ast.Name):
+                    self.names[statement.targets[0].id] = self.evaluate(statement.value)
+                elif isinstance(statement, ast.Expr) and isinstance(statement.value, ast.Call):
+                    self.evaluate(statement.value)
+            except Unresolved:
+                if isinstance(statement, ast.Assign) and isinstance(statement.targets[0], ast.Name):
+                    self.names.pop(statement.targets[0].id, None)
+        cors = (self.api or {}).get('default_cors_preflight_options') or {}
+        return StackDefinition(
+            self.routes, self.functions, self.tables,
+            (self.api or {}).get('binary_media_types', []),
+            cors.get('allow_headers', ['Content-Type', 'X-Api-Key']),
+            self.socket_routes, self.stream_consumers
+        )
+
+    def evaluate(self, node):
+        if isinstance(node, ast.Constant):
+            return node.value
+        if isinstance(node, ast.Name):
+            if node.id in self.names:
+                return self.names[node.id]
+            raise Unresolved(node.id)
+        if isinstance(node, ast.JoinedStr):
+            return ''.join(str(self.evaluate(part)) for part in node.values)
+        if isinstance(node, ast.FormattedValue):
+            return self.evaluate(node.value)
+        if isinstance(node, ast.Attribute):
+            if isinstance(node.value, ast.Name) and node.value.id == 'self':
+                if node.attr in ('account', 'region'):
+                    return LOCAL_ACCOUNT if node.attr == 'account' else LOCAL_REGION
+                raise Unresolved(f"self.{node.attr}")
+            owner = self.evaluate(node.value)
+            if isinstance(owner, dict) and node.attr in owner:
+                return owner[node.attr]
+            raise Unresolved(node.attr)
+        if isinstance(node, ast.IfExp):
+            return self.evaluate(node.body) if self.evaluate(node.test) else self.evaluate(node.orelse)
+        if isinstance(node, ast.BoolOp):
+            value = None
+            for operand in node.values:
+                value = self.evaluate(operand)
+                if isinstance(node.op, ast.Or) == bool(value):
+                    return value
+            return value
+        if isinstance(node, ast.Dict):
+            result = {}
+            for key, value in zip(node.keys, node.values):
+                try:
+                    if key is None:
+                        result.update(self.evaluate(value))
+                    else:
+                        result[self.evaluate(key)] = self.evaluate(value)
+                except Unresolved:
+                    continue
+            return result
+        if isinstance(node, (ast.List, ast.Tuple)):
+            return [self.evaluate(element) for element in node.elts]
+        if isinstance(node, ast.Call):
+            return self.call(node)
+        raise Unresolved(type(node).__name__)
+
+    def keywords(self, node):
+        """Keyword arguments that resolve; the rest (roles, layers) are dropped"""
+        result = {}
+        for keyword in node.keywords:
+            try:
+                result[keyword.arg] = self.evaluate(keyword.value)
+            except Unresolved:
+                continue
+        return result
+
+    def call(self, node):
+        func = node.func
+        name = func.attr if isinstance(func, ast.Attribute) else getattr(func, 'id', None)
+        args = lambda: [self.evaluate(arg) for arg in node.args]
+        if name in ('str', 'int', 'float'):
+            return {'str': str, 'int': int, 'float': float}[name](args()[0])
+        if name == 'try_get_context':
+            return self.context.get(args()[0])
+        if name == 'get':
+            owner = self.evaluate(func.value)
+            if not isinstance(owner, dict):
+                raise Unresolved('get')
+            return owner.get(*args())
+        if name in ('seconds', 'minutes'):
+            return args()[0] * (60 if name == 'minutes' else 1)
+        if name == 'from_asset':
+            return args()[0]
+        if name == 'Attribute':
+            return self.keywords(node)['name']
+        if name == 'Table':
+            options = self.keywords(node)
+            table = {
+                'table_name': options['table_name'],
+                'partition_key': options['partition_key'],
+                'sort_key': options.get('sort_key')
+            }
+            self.tables[table['table_name']] = table
+            return table
+        if name == 'Bucket':
+            return {'bucket_name': self.keywords(node).get('bucket_name', f"local-bucket-{LOCAL_ACCOUNT}")}
+        if name == 'Function':
+            options = self.keywords(node)
+            spec = FunctionSpec(
+                node.args[1].value, options['handler'], options['code'], options.get('timeout', 3),
+                options.get('memory_size', 128), options.get('environment', {})
+            )
+            self.functions[spec.name] = spec
+            return {'function': spec, 'function_name': spec.name}
+        if name == 'add_live_alias':
+            return self.evaluate(node.args[0])
+        if name == 'LambdaIntegration':
+            return {'function': self.evaluate(node.args[0])['function']}
+        if name == 'WebSocketLambdaIntegration':
+            return {'function': self.evaluate(node.args[1])['function']}
+        if name == 'WebSocketRouteOptions':
+            return self.keywords(node)
+        if name == 'WebSocketApi':
+            options = self.keywords(node)
+            for route_key in ('connect', 'disconnect', 'default'):
+                integration = (options.get(f"{route_key}_route_options") or {}).get('integration')
+                if integration:
+                    self.socket_routes[f"${route_key}"] = integration['function']
+            return {'socket_api': True}
+        if name == 'add_route':
+            owner = self.evaluate(func.value)
+            if not isinstance(owner, dict) or not owner.get('socket_api'):
+                raise Unresolved('add_route')
+            self.socket_routes[args()[0]] = self.keywords(node)['integration']['function']
+            return None
+        if name == 'DynamoEventSource':
+            return dict(self.keywords(node), table=self.evaluate(node.args[0]))
+        if name == 'add_event_source':
+            source = self.evaluate(node.args[0])
+            if 'table' not in source:
+                raise Unresolved('add_event_source')
+            self.stream_consumers.append(StreamConsumer(
+                source['table']['table_name'], self.evaluate(func.value)['function'], source.get('filters', [])
+            ))
+            return None
+        if name == 'filter':
+            return args()[0]
+        if name == 'is_equal':
+            return [args()[0]]
+        if name == 'or_':
+            return args()
+        if name == 'MockIntegration':
+            responses = self.keywords(node).get('integration_responses') or [{}]
+            templates = responses[0].get('response_templates') or {}
+            return {'mock_body': templates.get('application/json', '')}
+        if name in ('IntegrationResponse', 'CorsOptions'):
+            return self.keywords(node)
+        if name == 'RestApi':
+            self.api = dict(self.keywords(node), root=ApiResource(''))
+            return self.api
+        if name == 'add_resource':
+            return ApiResource(f"{self.evaluate(func.value).path}/{args()[0]}")
+        if name == 'add_method':
+            resource = self.evaluate(func.value)
+            method, integration = node.args[0].value, self.evaluate(node.args[1])
+            self.routes.append(Route(
+                method, resource.path, integration.get('function'), integration.get('mock_body')
+            ))
+            return None
+        raise Unresolved(name or 'call')
+
+
+def read_stack(stack_path=STACK_PATH, cdk_json_path=CDK_JSON_PATH):
+    """Routes, functions and tables declared by the stack"""
+    context = {}
+    if os.path.exists(cdk_json_path):
+        with open(cdk_json_path) as f:
+            context = json.load(f).get('context', {})
+    with open(stack_path) as f:
+        return StackReader(context).read(f.read())
+
+
+class LocalBedrock:
+    """
+    Stand-in for the bedrock-runtime client
+
+    Answers with the opening words of the prompt's input text after a delay
+    of first_token_ms plus ms_per_token for each generated token, and
+    reports token counts in the same headers Bedrock does.
+    """
+
+    INPUT_PATTERNS = (
+        re.compile(r'Text to translate: "(.*)"\s*\n', re.S),
+        re.compile(r'Document: (.*?)\n\nRequirements:', re.S)
+    )
+
+    def __init__(self, first_token_ms=300, ms_per_token=5, output_words=60):
+        self.first_token_ms = first_token_ms
+        self.ms_per_token = ms_per_token
+        self.output_words = output_words
+
+    def invoke_model(self, modelId, body, **kwargs):
+        request = json.loads(body)
+        prompt = request.get('prompt', '')
+        match = next(filter(None, (pattern.search(prompt) for pattern in self.INPUT_PATTERNS)), None)
+        text = match.group(1) if match else prompt
+        # Roughly 1.3 tokens per English word
+        max_words = int(request.get('max_tokens_to_sample', 1500) / 1.3)
+        words = text.split()[:min(self.output_words, max_words)]
+        output_tokens = max(1, round(len(words) * 1.3))
+        time.sleep((self.first_token_ms + output_tokens * self.ms_per_token) / 1000)
+        payload = {
+            'completion': f"[{modelId}] {' '.join(words)}",
+            'stop_reason': 'max_tokens' if len(words) == max_words else 'stop_sequence'
+        }
+        return {
+            'body': io.BytesIO(json.dumps(payload).encode('utf-8')),
+            'ResponseMetadata': {'HTTPHeaders': {
+                'x-amzn-bedrock-input-token-count': str(max(1, len(prompt) // 4)),
+                'x-amzn-bedrock-output-token-count': str(output_tokens)
+            }}
+        }
+
+
+class LocalS3:
+    """Stand-in for the s3 client: in-memory objects and presigned PUTs to the emulator"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.objects = {}
+        self.lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        with self.lock:
+            self.objects[(Bucket, Key)] = bytes(Body)
+        return {'ETag': f'"{len(Body):x}"'}
+
+    def _object(self, Bucket, Key):
+        with self.lock:
+            if (Bucket, Key) not in self.objects:
+                from local_dynamodb import LocalClientError
+                raise LocalClientError('NoSuchKey', f"{Key} does not exist")
+            return self.objects[(Bucket, Key)]
+
+    def head_object(self, Bucket, Key):
+        return {'ContentLength': len(self._object(Bucket, Key))}
+
+    def get_object(self, Bucket, Key, Range=None):
+        data = self._object(Bucket, Key)
+        if Range:
+            start, end = Range.split('=', 1)[1].split('-')
+            data = data[int(start):int(end) + 1]
+        return {'Body': io.BytesIO(data), 'ContentLength': len(data)}
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600):
+        key = urllib.parse.quote(Params['Key'])
+        return f"{self.base_url}/_local/s3/{Params['Bucket']}/{key}"
+
+
+class LocalLambda:
+    """Stand-in for the lambda client: invocations run on the gateway's function pools"""
+
+    def __init__(self, gateway):
+        self.gateway = gateway
+
+    def invoke(self, FunctionName, Payload=b'{}', InvocationType='RequestResponse', **kwargs):
+        # Accepts a name or a function, version or alias ARN
+        name = FunctionName.split(':')[6] if FunctionName.startswith('arn:') else FunctionName
+        pool = self.gateway.pools.get(name)
+        if pool is None or pool.handler is None:
+            raise LocalClientError('ResourceNotFoundException', f"Function not found: {FunctionName}")
+        future = asyncio.run_coroutine_threadsafe(
+            self.gateway.call(pool, json.loads(Payload)), self.gateway.loop
+        )
+        if InvocationType == 'Event':
+            return {'StatusCode': 202}
+        return {'StatusCode': 200, 'Payload': io.BytesIO(json.dumps(future.result()).encode('utf-8'))}
+
+
+class LocalConnections:
+    """Stand-in for the apigatewaymanagementapi client, posting to the gateway's open WebSockets"""
+
+    def __init__(self, gateway):
+        self.gateway = gateway
+
+    def post_to_connection(self, ConnectionId, Data):
+        writer = self.gateway.connections.get(ConnectionId)
+        if writer is None:
+            raise LocalClientError('GoneException', f"Connection {ConnectionId} is gone")
+        data = Data.encode('utf-8') if isinstance(Data, str) else bytes(Data)
+        self.gateway.loop.call_soon_threadsafe(writer.write, encode_frame(data))
+        return {}
+
+
+class LocalContext:
+    """The parts of the Lambda context object the handlers use"""
+
+    def __init__(self, spec, request_id, timeout):
+        self.function_name = spec.name
+        self.function_version = '$LATEST'
+        self.invoked_function_arn = f"arn:aws:lambda:{LOCAL_REGION}:{LOCAL_ACCOUNT}:function:{spec.name}"
+        self.memory_limit_in_mb = spec.memory_size
+        self.aws_request_id = request_id
+        self.log_group_name = f"/aws/lambda/{spec.name}"
+        self._deadline = time.monotonic() + timeout
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self._deadline - time.monotonic()) * 1000))
+
+
+class Throttled(Exception):
+    """Every container of a function is busy and throttling is on"""
+
+
+class Container:
+    def __init__(self, number):
+        self.number = number
+        self.invocations = 0
+        self.last_used = time.monotonic()
+
+
+def load_handler(spec):
+    """Import a function's handler module from its asset directory"""
+    module_name, function_name = spec.handler.rsplit('.', 1)
+    path = os.path.join(PROJECT_DIR, spec.code, f"{module_name}.py")
+    if not os.path.exists(path):
+        return None
+    module_spec = importlib.util.spec_from_file_location(f"local_api_{module_name}", path)
+    module = importlib.util.module_from_spec(module_spec)
+    module_spec.loader.exec_module(module)
+    return getattr(module, function_name)
+
+
+class FunctionPool:
+    """
+    Simulated execution environments for one function
+
+    At most max_containers invocations run at once, one per container. A
+    warm container idle longer than idle_seconds is reclaimed, so the next
+    request pays the cold start again.
+    """
+
+    def __init__(self, spec, handler, executor, max_containers=4, cold_start_seconds=0.8,
+                 idle_seconds=600, throttle=False):
+        self.spec = spec
+        self.handler = handler
+        self.executor = executor
+        self.max_containers = max_containers
+        self.cold_start_seconds = cold_start_seconds
+        self.idle_seconds = idle_seconds
+        self.throttle = throttle
+        self.idle = []
+        self.containers = 0
+        self.waiters = collections.deque()
+        self.stats = {'invocations': 0, 'cold_starts': 0, 'throttles': 0, 'errors': 0, 'timeouts': 0}
+        self.durations = collections.deque(maxlen=10000)
+
+    def prewarm(self, count):
+        while self.containers < min(count, self.max_containers):
+            self.containers += 1
+            self.idle.append(Container(self.containers))
+
+    async def acquire(self):
+        """(container, cold) for the next invocation, waiting if all are busy"""
+        now = time.monotonic()
+        expired = [c for c in self.idle if now - c.last_used > self.idle_seconds]
+        for container in expired:
+            self.idle.remove(container)
+            self.containers -= 1
+        if self.idle:
+            return self.idle.pop(), False
+        if self.containers < self.max_containers:
+            self.containers += 1
+            return Container(self.containers), True
+        if self.throttle:
+            self.stats['throttles'] += 1
+            raise Throttled()
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        return await waiter, False
+
+    def release(self, container):
+        container.last_used = time.monotonic()
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(container)
+                return
+        self.idle.append(container)
+
+    def run(self, event, container, cold, emit, trace=None):
+        """Runs on an executor thread; emit(kind, value) hands results to the event loop"""
+        from content_transformer import tracing
+
+        try:
+            if cold:
+                init = tracing.start_span('cold start', trace, attributes={
+                    'function': self.spec.name, 'container': container.number, 'cold_start': True
+                })
+                time.sleep(self.cold_start_seconds)
+                init.end()
+            request_id = (event.get('requestContext') or {}).get('requestId') or os.urandom(16).hex()
+            context = LocalContext(self.spec, request_id, self.spec.timeout)
+            result = self.handler(event, context)
+            body = result.get('body') if isinstance(result, dict) else None
+            if body is not None and not isinstance(body, (str, bytes)):
+                # A streaming handler: send headers now, then each piece as produced
+                emit('stream', result)
+                for piece in body:
+                    emit('chunk', piece.encode('utf-8') if isinstance(piece, str) else piece)
+            else:
+                emit('result', result)
+        except Exception as e:
+            traceback.print_exc()
+            emit('error', e)
+        finally:
+            container.invocations += 1
+            emit('end', None)
+
+    def percentile(self, fraction):
+        ordered = sorted(self.durations)
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000, 1) if ordered else None
+
+    def report(self):
+        return dict(
+            self.stats, containers=self.containers, idle=len(self.idle), queued=len(self.waiters),
+            p50_ms=self.percentile(0.5), p99_ms=self.percentile(0.99)
+        )
+
+
+def match_route(routes, method, path):
+    """(route, path_parameters), or (None, None) when no route matches"""
+    segments = path.rstrip('/').split('/') if path != '/' else ['']
+    for route in routes:
+        pattern = route.path.split('/') if route.path else ['']
+        if route.method != method or len(pattern) != len(segments):
+            continue
+        parameters = {}
+        for expected, actual in zip(pattern, segments):
+            if expected.startswith('{') and expected.endswith('}'):
+                parameters[expected[1:-1]] = urllib.parse.unquote(actual)
+            elif expected != actual:
+                break
+        else:
+            return route, parameters or None
+    return None, None
+
+
+def media_type_matches(content_type, patterns):
+    media_type = (content_type or '').split(';')[0].strip().lower()
+    for pattern in patterns:
+        kind, _, subtype = pattern.lower().partition('/')
+        if pattern == '*/*' or media_type == pattern.lower() or \
+                (subtype == '*' and media_type.startswith(kind + '/')):
+            return True
+    return False
+
+
+def build_event(route, method, path, query, headers, body, path_parameters, source_ip,
+                binary_media_types, stage='local'):
+    """API Gateway REST proxy-integration event for one request"""
+    single_headers, multi_headers = {}, collections.defaultdict(list)
+    for name, value in headers:
+        single_headers[name] = value
+        multi_headers[name].append(value)
+    query_pairs = urllib.parse.parse_qsl(query, keep_blank_values=True)
+    multi_query = collections.defaultdict(list)
+    for name, value in query_pairs:
+        multi_query[name].append(value)
+    content_type = next((value for name, value in headers if name.lower() == 'content-type'), '')
+    is_binary = bool(body) and media_type_matches(content_type, binary_media_types)
+    request_id = os.urandom(16).hex()
+    return {
+        'resource': route.path or '/',
+        'path': path,
+        'httpMethod': method,
+        'headers': single_headers or None,
+        'multiValueHeaders': dict(multi_headers) or None,
+        'queryStringParameters': dict(query_pairs) or None,
+        'multiValueQueryStringParameters': dict(multi_query) or None,
+        'pathParameters': path_parameters,
+        'stageVariables': None,
+        'requestContext': {
+            'resourcePath': route.path or '/',
+            'httpMethod': method,
+            'path': f"/{stage}{path}",
+            'stage': stage,
+            'requestId': request_id,
+            'requestTimeEpoch': int(time.time() * 1000),
+            'identity': {'sourceIp': source_ip}
+        },
+        'body': (base64.b64encode(body).decode('ascii') if is_binary else body.decode('utf-8'))
+        if body else None,
+        'isBase64Encoded': is_binary
+    }
+
+
+def matches_filter(pattern, record):
+    """True when a record matches a Lambda event filter pattern (lists of accepted values)"""
+    for key, expected in pattern.items():
+        value = record.get(key) if isinstance(record, dict) else None
+        if isinstance(expected, dict):
+            if not matches_filter(expected, value):
+                return False
+        elif value not in expected:
+            return False
+    return True
+
+
+def socket_event(route_key, event_type, connection_id, source_ip, body=None, stage='local'):
+    """API Gateway WebSocket event for a connection, disconnection or message"""
+    return {
+        'requestContext': {
+            'routeKey': route_key,
+            'eventType': event_type,
+            'connectionId': connection_id,
+            'requestId': os.urandom(16).hex(),
+            'stage': stage,
+            'domainName': '127.0.0.1',
+            'connectedAt': int(time.time() * 1000),
+            'identity': {'sourceIp': source_ip}
+        },
+        'body': body,
+        'isBase64Encoded': False
+    }
+
+
+def set_header(event, name, value):
+    """Replace a header in both header maps of a proxy event, whatever its case"""
+    for field, wrapped in (('headers', value), ('multiValueHeaders', [value])):
+        headers = {key: item for key, item in (event.get(field) or {}).items() if key.lower() != name}
+        headers[name] = wrapped
+        event[field] = headers
+
+
+class LocalApiGateway:
+    """HTTP and WebSocket front end dispatching requests to the function pools"""
+
+    def __init__(self, stack, pools, s3=None, integration_timeout=INTEGRATION_TIMEOUT_SECONDS, log=True):
+        self.stack = stack
+        self.pools = pools
+        self.s3 = s3
+        self.integration_timeout = integration_timeout
+        self.log = log
+        self.loop = None
+        self.connections = {}
+        self.streams = {}
+
+    def start(self):
+        """Bind to the running event loop and start delivering table streams"""
+        self.loop = asyncio.get_running_loop()
+        for table_name in {consumer.table_name for consumer in self.stack.stream_consumers or ()}:
+            self.streams[table_name] = asyncio.Queue()
+            self.loop.create_task(self.deliver_stream(table_name))
+
+    def publish(self, table_name, record):
+        """Queue a stream record for delivery; safe to call from handler threads"""
+        if self.loop is not None and table_name in self.streams:
+            self.loop.call_soon_threadsafe(self.streams[table_name].put_nowait, record)
+
+    async def deliver_stream(self, table_name):
+        """Invoke a table's stream consumers with batches of records, one batch at a time, in order"""
+        queue = self.streams[table_name]
+        consumers = [consumer for consumer in self.stack.stream_consumers if consumer.table_name == table_name]
+        while True:
+            records = [await queue.get()]
+            while not queue.empty() and len(records) < STREAM_BATCH_SIZE:
+                records.append(queue.get_nowait())
+            for consumer in consumers:
+                pool = self.pools.get(consumer.function.name)
+                matched = [record for record in records
+                           if not consumer.filters or any(matches_filter(f, record) for f in consumer.filters)]
+                if matched and pool is not None and pool.handler is not None:
+                    await self.call(pool, {'Records': matched})
+
+    async def call(self, pool, event):
+        """Invoke a function outside an HTTP request; returns its result, or None if it failed"""
+        try:
+            container, cold = await pool.acquire()
+        except Throttled:
+            return None
+        loop = asyncio.get_running_loop()
+        emitted = []
+        pool.stats['invocations'] += 1
+        pool.stats['cold_starts'] += cold
+        started = time.monotonic()
+        try:
+            await loop.run_in_executor(pool.executor, pool.run, event, container, cold,
+                                       lambda kind, value: emitted.append((kind, value)))
+        finally:
+            pool.release(container)
+        pool.durations.append(time.monotonic() - started)
+        kind, result = emitted[0]
+        if kind == 'error':
+            pool.stats['errors'] += 1
+            return None
+        return result if kind == 'result' else None
+
+    async def handle_connection(self, reader, writer):
+        source_ip = (writer.get_extra_info('peername') or ('127.0.0.1',))[0]
+        try:
+            while True:
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                method, target, version, headers, body = request
+                if urllib.parse.urlsplit(target).path == WEBSOCKET_PATH and any(
+                        name.lower() == 'upgrade' and value.lower() == 'websocket' for name, value in headers):
+                    await self.websocket_session(reader, writer, headers, source_ip)
+                    break
+                started = time.monotonic()
+                status = await self.dispatch(writer, method, target, headers, body, source_ip)
+                if self.log:
+                    print(f"{method} {target} {status} {(time.monotonic() - started) * 1000:.0f}ms")
+                keep_alive = version == 'HTTP/1.1' and not any(
+                    name.lower() == 'connection' and value.lower() == 'close' for name, value in headers
+                )
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def websocket_session(self, reader, writer, headers, source_ip):
+        """Serve one WebSocket connection, routing messages by their "action" like API Gateway"""
+        routes = self.stack.socket_routes or {}
+        key = next((value for name, value in headers if name.lower() == 'sec-websocket-key'), '')
+        if not routes or not key:
+            await self.send_json(writer, 404 if not routes else 400, {'message': 'No WebSocket API'})
+            return
+        connection_id = base64.urlsafe_b64encode(os.urandom(12)).decode('ascii')
+        connect = await self.route_socket_event(routes, '$connect', 'CONNECT', connection_id, source_ip)
+        if connect is not None and int(connect.get('statusCode', 200)) >= 400:
+            await self.send_json(writer, int(connect['statusCode']), {'message': 'Forbidden'})
+            return
+        writer.write(self.head(101, {
+            'Upgrade': 'websocket', 'Connection': 'Upgrade', 'Sec-WebSocket-Accept': accept_key(key)
+        }))
+        self.connections[connection_id] = writer
+        if self.log:
+            print(f"WebSocket {connection_id} connected")
+        try:
+            while True:
+                message = await self.read_message(reader, writer)
+                if message is None:
+                    break
+                try:
+                    action = json.loads(message).get('action')
+                except (ValueError, AttributeError):
+                    action = None
+                route_key = action if action in routes else '$default'
+                await self.route_socket_event(routes, route_key, 'MESSAGE', connection_id, source_ip,
+                                              message.decode('utf-8', 'replace'))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections.pop(connection_id, None)
+            await self.route_socket_event(routes, '$disconnect', 'DISCONNECT', connection_id, source_ip)
+
+    async def route_socket_event(self, routes, route_key, event_type, connection_id, source_ip, body=None):
+        function = routes.get(route_key)
+        pool = self.pools.get(function.name) if function else None
+        if pool is None or pool.handler is None:
+            return None
+        return await self.call(pool, socket_event(route_key, event_type, connection_id, source_ip, body))
+
+    async def read_message(self, reader, writer):
+        """The next text or binary message from a client, answering pings; None once it closes"""
+        fragments, size = [], 0
+        while True:
+            final, opcode, masked, length = frame_header(await reader.readexactly(2))
+            if length in EXTENDED_LENGTH_BYTES:
+                length = int.from_bytes(await reader.readexactly(EXTENDED_LENGTH_BYTES[length]), 'big')
+            mask = await reader.readexactly(4) if masked else None
+            size += length
+            if size > MAX_SOCKET_MESSAGE_BYTES:
+                writer.write(encode_frame((1009).to_bytes(2, 'big'), OP_CLOSE))
+                return None
+            payload = await reader.readexactly(length)
+            payload = apply_mask(payload, mask) if mask else payload
+            if opcode == OP_CLOSE:
+                writer.write(encode_frame(payload[:2], OP_CLOSE))
+                return None
+            if opcode == OP_PING:
+                writer.write(encode_frame(payload, OP_PONG))
+            elif opcode != OP_PONG:
+                fragments.append(payload)
+                if final:
+                    return b''.join(fragments)
+
+    async def read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        method, target, version = line.decode('latin-1').rstrip('\r\n').split(' ', 2)
+        headers, size = [], 0
+        while True:
+            line = await reader.readline()
+            size += len(line)
+            if line in (b'\r\n', b'\n', b'') or size > MAX_HEADER_BYTES:
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers.append((name.strip(), value.strip()))
+        length = int(next((value for name, value in headers if name.lower() == 'content-length'), 0) or 0)
+        if length > MAX_PAYLOAD_BYTES:
+            await reader.readexactly(length)
+            return method, target, version, headers, None
+        body = await reader.readexactly(length) if length else b''
+        return method, target, version, headers, body
+
+    async def dispatch(self, writer, method, target, headers, body, source_ip):
+        parsed = urllib.parse.urlsplit(target)
+        path = parsed.path
+        if body is None:
+            return await self.send_json(writer, 413, {'message': 'Request Too Long'})
+        if path == '/_local/stats' and method == 'GET':
+            return await self.send_json(writer, 200, {name: pool.report() for name, pool in self.pools.items()})
+        if path.startswith('/_local/s3/') and method == 'PUT' and self.s3 is not None:
+            bucket, _, key = path[len('/_local/s3/'):].partition('/')
+            response = self.s3.put_object(Bucket=bucket, Key=urllib.parse.unquote(key), Body=body)
+            return await self.send(writer, 200, {'ETag': response['ETag']}, b'')
+        if method == 'OPTIONS':
+            return await self.send(writer, 204, {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'OPTIONS,GET,PUT,POST,DELETE,PATCH,HEAD',
+                'Access-Control-Allow-Headers': ','.join(self.stack.cors_headers)
+            }, b'')
+
+        route, path_parameters = match_route(self.stack.routes, method, path)
+        if route is None:
+            return await self.send_json(writer, 403, {'message': 'Missing Authentication Token'})
+        if route.function is None:
+            return await self.send(writer, 200, {'Content-Type': 'application/json'},
+                                   (route.mock_body or '').encode('utf-8'))
+        pool = self.pools.get(route.function.name)
+        if pool is None or pool.handler is None:
+            print(f"No handler code for {route.function.name} at {route.function.code}")
+            return await self.send_json(writer, 502, {'message': 'Internal server error'})
+
+        event = build_event(route, method, path, parsed.query, headers, body, path_parameters,
+                            source_ip, self.stack.binary_media_types)
+        return await self.invoke(writer, pool, event)
+
+    async def invoke(self, writer, pool, event):
+        from content_transformer import tracing
+        from content_transformer.responses import header
+
+        trace = tracing.start_span(
+            f"{event['httpMethod']} {event['resource']}", tracing.parse_traceparent(header(event, 'traceparent')),
+            'server', {'component': 'api-gateway', 'function': pool.spec.name}
+        )
+        set_header(event, 'traceparent', trace.traceparent())
+        status = 502
+        try:
+            status = await self.integrate(writer, pool, event, trace)
+            return status
+        finally:
+            trace.set(status_code=status)
+            if status >= 500:
+                trace.status = 'error'
+            trace.end()
+
+    async def integrate(self, writer, pool, event, trace):
+        try:
+            container, cold = await pool.acquire()
+        except Throttled:
+            return await self.send_json(writer, 429, {'message': 'Rate Exceeded.'})
+        trace.set(cold_start=cold, container=container.number)
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        emit = lambda kind, value: loop.call_soon_threadsafe(queue.put_nowait, (kind, value))
+        started = time.monotonic()
+        pool.stats['invocations'] += 1
+        pool.stats['cold_starts'] += cold
+        task = loop.run_in_executor(pool.executor, pool.run, event, container, cold, emit, trace)
+        task.add_done_callback(lambda _: pool.release(container))
+
+        try:
+            kind, result = await asyncio.wait_for(
+                queue.get(), min(self.integration_timeout, pool.spec.timeout) + pool.cold_start_seconds * cold
+            )
+        except asyncio.TimeoutError:
+            pool.stats['timeouts'] += 1
+            return await self.send_json(writer, 504, {'message': 'Endpoint request timed out'})
+        if kind == 'error' or not isinstance(result, dict) or 'statusCode' not in result:
+            pool.stats['errors'] += 1
+            return await self.send_json(writer, 502, {'message': 'Internal server error'})
+
+        headers = dict(result.get('headers') or {})
+        for name, values in (result.get('multiValueHeaders') or {}).items():
+            headers[name] = ','.join(values)
+        status = int(result['statusCode'])
+        if kind == 'stream':
+            await self.stream(writer, status, headers, queue)
+        else:
+            body = result.get('body') or ''
+            body = base64.b64decode(body) if result.get('isBase64Encoded') else body.encode('utf-8')
+            await self.send(writer, status, headers, body)
+        pool.durations.append(time.monotonic() - started)
+        return status
+
+    async def stream(self, writer, status, headers, queue):
+        headers = {name: value for name, value in headers.items() if name.lower() != 'content-length'}
+        headers['Transfer-Encoding'] = 'chunked'
+        writer.write(self.head(status, headers))
+        while True:
+            kind, piece = await queue.get()
+            if kind != 'chunk':
+                break
+            if piece:
+                writer.write(f"{len(piece):x}\r\n".encode('ascii') + piece + b'\r\n')
+                await writer.drain()
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    @staticmethod
+    def head(status, headers):
+        try:
+            reason = http.HTTPStatus(status).phrase
+        except ValueError:
+            reason = ''
+        lines = [f"HTTP/1.1 {status} {reason}"] + [f"{name}: {value}" for name, value in headers.items()]
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    async def send(self, writer, status, headers, body):
+        headers = dict(headers, **{'Content-Length': str(len(body))})
+        writer.write(self.head(status, headers) + body)
+        await writer.drain()
+        return status
+
+    async def send_json(self, writer, status, payload):
+        return await self.send(writer, status, {'Content-Type': 'application/json'},
+                               json.dumps(payload).encode('utf-8'))
+
+
+def local_environment(stack):
+    """Environment for the handlers: every function's variables, table and bucket names included"""
+    environment = {}
+    for spec in stack.functions.values():
+        for name, value in spec.environment.items():
+            if environment.get(name, value) != value:
+                print(f"Warning: {name} differs between functions; using {value!r}")
+            environment[name] = str(value)
+    return environment
+
+
+def reset_local_services():
+    """Forget the clients and stores the shared layer cached, so a new gateway starts empty"""
+    from content_transformer import (
+        bulk, dedupe, hash_tree, idempotency, notifications, rate_limit, runtime, semaphore, usage
+    )
+
+    runtime.reset_clients()
+    for module in (bulk, dedupe, hash_tree, idempotency, notifications, rate_limit, usage):
+        module._default_store.clear()
+    semaphore._default_semaphore.clear()
+
+
+def create_gateway(stack=None, containers=4, cold_start_ms=800, idle_seconds=600, throttle=False,
+                   prewarm=0, bedrock=None, base_url='http://127.0.0.1:3000',
+                   integration_timeout=INTEGRATION_TIMEOUT_SECONDS, log=True):
+    """
+    Build the gateway with local DynamoDB and S3 registered for the handlers
+
+    Pass bedrock=None to call the real service through boto3.
+    """
+    import concurrent.futures
+    from content_transformer import runtime, tracing
+
+    stack = stack or read_stack()
+    environment = local_environment(stack)
+    if os.environ.get('TRACE_EXPORT'):
+        # A span file chosen for the local run wins over the stack's log export
+        environment.pop('TRACE_EXPORT', None)
+    os.environ.update(environment)
+    s3 = LocalS3(base_url)
+    reset_local_services()
+    tables = {
+        name: LocalTable(table['partition_key'], table['sort_key'], table['table_name'])
+        for name, table in stack.tables.items()
+    }
+    runtime.register('dynamodb', resource=LocalDynamoDB(list(tables.values())))
+    runtime.register('s3', client=s3)
+    if bedrock is not None:
+        runtime.register('bedrock-runtime', client=bedrock)
+
+    stream_consumers = stack.stream_consumers or []
+    used = {route.function.name for route in stack.routes if route.function is not None}
+    used.update(function.name for function in (stack.socket_routes or {}).values())
+    used.update(consumer.function.name for consumer in stream_consumers)
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, containers * len(used)))
+    pools = {}
+    for name in sorted(used):
+        spec = stack.functions[name]
+        pool = FunctionPool(spec, load_handler(spec), executor, containers, cold_start_ms / 1000,
+                            idle_seconds, throttle)
+        pool.prewarm(prewarm)
+        pools[name] = pool
+    # Every handler shares this process, so cold starts are traced per simulated container instead
+    tracing._cold[0] = False
+    gateway = LocalApiGateway(stack, pools, s3, integration_timeout, log)
+    for table_name in {consumer.table_name for consumer in stream_consumers}:
+        tables[table_name].stream_listeners.append(
+            lambda record, table_name=table_name: gateway.publish(table_name, record)
+        )
+    runtime.register('lambda', client=LocalLambda(gateway))
+    set_base_url(gateway, base_url)
+    return gateway
+
+
+def set_base_url(gateway, base_url):
+    """Point presigned URLs, the notifications endpoint and connection callbacks at the emulator"""
+    from content_transformer import runtime
+
+    if gateway.s3 is not None:
+        gateway.s3.base_url = base_url
+    callback_url = base_url + CONNECTIONS_PATH
+    if gateway.stack.socket_routes:
+        os.environ['NOTIFICATIONS_URL'] = 'ws' + base_url[len('http'):] + WEBSOCKET_PATH
+    os.environ['WEBSOCKET_CALLBACK_URL'] = callback_url
+    runtime.register('apigatewaymanagementapi', client=LocalConnections(gateway), endpoint_url=callback_url)
+
+
+async def serve(gateway, host, port):
+    server = await asyncio.start_server(gateway.handle_connection, host, port)
+    gateway.start()
+    for route in gateway.stack.routes:
+        pool = gateway.pools.get(route.function.name) if route.function else None
+        target = 'mock' if route.function is None else route.function.name
+        missing = '' if route.function is None or (pool and pool.handler) else ' (no handler code)'
+        print(f"  {route.method:<6} {route.path:<28} -> {target}{missing}")
+    print(f"Local API listening on http://{host}:{port}")
+    if gateway.stack.socket_routes:
+        print(f"Notifications WebSocket on ws://{host}:{port}{WEBSOCKET_PATH}")
+    async with server:
+        await server.serve_forever()
+
+
+def serve_in_background(gateway, host='127.0.0.1', port=0):
+    """Serve on a daemon thread (for tests and load generators); returns the bound port"""
+    started = threading.Event()
+    bound = []
+
+    async def run():
+        server = await asyncio.start_server(gateway.handle_connection, host, port)
+        bound.append(server.sockets[0].getsockname()[1])
+        gateway.start()
+        set_base_url(gateway, f"http://{host}:{bound[0]}")
+        started.set()
+        async with server:
+            await server.serve_forever()
+
+    threading.Thread(target=lambda: asyncio.run(run()), daemon=True).start()
+    started.wait()
+    return bound[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3000)
+    parser.add_argument('--containers', type=int, default=4, help='maximum concurrent containers per function')
+    parser.add_argument('--prewarm', type=int, default=0, help='warm containers per function at start')
+    parser.add_argument('--cold-start-ms', type=float, default=800, help='simulated init time of a new container')
+    parser.add_argument('--idle-seconds', type=float, default=600, help='idle time before a container is reclaimed')
+    parser.add_argument('--throttle', action='store_true', help='return 429 instead of queueing when all are busy')
+    parser.add_argument('--bedrock', choices=['local', 'aws'], default='local',
+                        help='simulated model, or the real service through boto3')
+    parser.add_argument('--model-first-token-ms', type=float, default=300)
+    parser.add_argument('--model-ms-per-token', type=float, default=5)
+    parser.add_argument('--quiet', action='store_true', help='do not log each request')
+    args = parser.parse_args()
+
+    bedrock = LocalBedrock(args.model_first_token_ms, args.model_ms_per_token) if args.bedrock == 'local' else None
+    gateway = create_gateway(
+        containers=args.containers, cold_start_ms=args.cold_start_ms, idle_seconds=args.idle_seconds,
+        throttle=args.throttle, prewarm=args.prewarm, bedrock=bedrock,
+        base_url=f"http://{args.host}:{args.port}", log=not args.quiet
+    )
+    try:
+        asyncio.run(serve(gateway, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
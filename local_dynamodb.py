@@ -0,0 +1,279 @@
+"""
+In-memory stand-in for a boto3 DynamoDB Table
+
+Supports the calls the handlers make: get_item, put_item, update_item
+(SET and ADD clauses), delete_item and query on the partition key, with
+condition expressions built from comparisons, BETWEEN, attribute_exists /
+attribute_not_exists, AND, OR, NOT and parentheses. Failed conditions
+raise an error shaped like botocore's ConditionalCheckFailedException.
+LocalDynamoDB groups tables behind the resource-level Table() and
+batch_get_item() calls. Functions added to a table's stream_listeners
+receive a DynamoDB Streams record (new and old images) for every write,
+in write order.
+"""
+import base64
+import copy
+import itertools
+import re
+import threading
+
+TOKEN_PATTERN = re.compile(r'\s*(<>|<=|>=|[=<>(),]|[#:]?[A-Za-z_][A-Za-z0-9_.\-]*)')
+COMPARATORS = {
+    '=': lambda a, b: a == b,
+    '<>': lambda a, b: a != b,
+    '<': lambda a, b: a is not None and a < b,
+    '<=': lambda a, b: a is not None and a <= b,
+    '>': lambda a, b: a is not None and a > b,
+    '>=': lambda a, b: a is not None and a >= b,
+}
+
+
+class LocalClientError(Exception):
+    """Mimics botocore.exceptions.ClientError"""
+
+    def __init__(self, code, message=''):
+        super().__init__(f"{code}: {message}")
+        self.response = {'Error': {'Code': code, 'Message': message}}
+
+
+def tokenize(expression):
+    tokens, position = [], 0
+    expression = expression.strip()
+    while position < len(expression):
+        match = TOKEN_PATTERN.match(expression, position)
+        if not match:
+            raise ValueError(f"Cannot parse expression near: {expression[position:]}")
+        tokens.append(match.group(1))
+        position = match.end()
+    return tokens
+
+
+class ConditionEvaluator:
+    """Recursive-descent evaluator for DynamoDB condition expressions"""
+
+    def __init__(self, item, names, values):
+        self.item = item or {}
+        self.names = names or {}
+        self.values = values or {}
+
+    def evaluate(self, expression):
+        self.tokens = tokenize(expression)
+        self.position = 0
+        result = self.parse_or()
+        if self.position != len(self.tokens):
+            raise ValueError(f"Unexpected token {self.tokens[self.position]!r}")
+        return result
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self, expected=None):
+        token = self.peek()
+        if expected is not None and (token is None or token.upper() != expected):
+            raise ValueError(f"Expected {expected}, got {token!r}")
+        self.position += 1
+        return token
+
+    def parse_or(self):
+        result = self.parse_and()
+        while (self.peek() or '').upper() == 'OR':
+            self.take()
+            right = self.parse_and()
+            result = result or right
+        return result
+
+    def parse_and(self):
+        result = self.parse_not()
+        while (self.peek() or '').upper() == 'AND':
+            self.take()
+            right = self.parse_not()
+            result = result and right
+        return result
+
+    def parse_not(self):
+        if (self.peek() or '').upper() == 'NOT':
+            self.take()
+            return not self.parse_not()
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        token = self.peek()
+        if token == '(':
+            self.take()
+            result = self.parse_or()
+            self.take(')')
+            return result
+        if token in ('attribute_exists', 'attribute_not_exists'):
+            self.take()
+            self.take('(')
+            exists = self.attribute_name(self.take()) in self.item
+            self.take(')')
+            return exists if token == 'attribute_exists' else not exists
+        left = self.operand(self.take())
+        comparator = self.take()
+        if (comparator or '').upper() == 'BETWEEN':
+            low = self.operand(self.take())
+            self.take('AND')
+            high = self.operand(self.take())
+            return left is not None and low <= left <= high
+        if comparator not in COMPARATORS:
+            raise ValueError(f"Unsupported comparator {comparator!r}")
+        right = self.operand(self.take())
+        return COMPARATORS[comparator](left, right)
+
+    def attribute_name(self, token):
+        return self.names.get(token, token)
+
+    def operand(self, token):
+        if token.startswith(':'):
+            return self.values[token]
+        return self.item.get(self.attribute_name(token))
+
+
+def evaluate_condition(item, expression, names=None, values=None):
+    return ConditionEvaluator(item, names, values).evaluate(expression)
+
+
+def to_attribute(value):
+    """DynamoDB-JSON attribute value of a plain Python value, as found in stream images"""
+    if isinstance(value, bool):
+        return {'BOOL': value}
+    if value is None:
+        return {'NULL': True}
+    if isinstance(value, str):
+        return {'S': value}
+    if isinstance(value, (bytes, bytearray)):
+        return {'B': base64.b64encode(value).decode('ascii')}
+    if isinstance(value, dict):
+        return {'M': {key: to_attribute(item) for key, item in value.items()}}
+    if isinstance(value, (list, tuple)):
+        return {'L': [to_attribute(item) for item in value]}
+    if isinstance(value, (set, frozenset)):
+        if all(isinstance(item, str) for item in value):
+            return {'SS': sorted(value)}
+        return {'NS': sorted(str(item) for item in value)}
+    return {'N': str(value)}
+
+
+class LocalTable:
+    """Thread-safe in-memory table with the boto3 Table call signatures"""
+
+    def __init__(self, partition_key, sort_key=None, name='local-table'):
+        self.name = name
+        self.partition_key = partition_key
+        self.sort_key = sort_key
+        self.items = {}
+        self.lock = threading.Lock()
+        self.stream_listeners = []
+        self._sequence = itertools.count(1)
+
+    def _key(self, item):
+        return (item[self.partition_key], item.get(self.sort_key) if self.sort_key else None)
+
+    def _publish(self, old, new):
+        """Hand a stream record of one write to the listeners; called with the lock held"""
+        if not self.stream_listeners or (old is None and new is None):
+            return
+        event_name = 'INSERT' if old is None else 'REMOVE' if new is None else 'MODIFY'
+        current = new if new is not None else old
+        keys = {self.partition_key: current[self.partition_key]}
+        if self.sort_key:
+            keys[self.sort_key] = current.get(self.sort_key)
+        change = {
+            'Keys': to_attribute(keys)['M'],
+            'SequenceNumber': str(next(self._sequence)),
+            'StreamViewType': 'NEW_AND_OLD_IMAGES'
+        }
+        if new is not None:
+            change['NewImage'] = to_attribute(new)['M']
+        if old is not None:
+            change['OldImage'] = to_attribute(old)['M']
+        record = {'eventName': event_name, 'eventSource': 'aws:dynamodb', 'dynamodb': change}
+        for listener in self.stream_listeners:
+            listener(record)
+
+    def _check(self, current, kwargs):
+        condition = kwargs.get('ConditionExpression')
+        if condition and not evaluate_condition(
+                current, condition,
+                kwargs.get('ExpressionAttributeNames'), kwargs.get('ExpressionAttributeValues')):
+            raise LocalClientError('ConditionalCheckFailedException', 'The conditional request failed')
+
+    def get_item(self, Key, ConsistentRead=False):
+        with self.lock:
+            item = self.items.get(self._key(Key))
+            return {'Item': copy.deepcopy(item)} if item is not None else {}
+
+    def put_item(self, Item, **kwargs):
+        with self.lock:
+            old = self.items.get(self._key(Item))
+            self._check(old, kwargs)
+            self.items[self._key(Item)] = copy.deepcopy(Item)
+            self._publish(old, Item)
+            return {}
+
+    def delete_item(self, Key, **kwargs):
+        with self.lock:
+            self._check(self.items.get(self._key(Key)), kwargs)
+            self._publish(self.items.pop(self._key(Key), None), None)
+            return {}
+
+    def update_item(self, Key, UpdateExpression, **kwargs):
+        names = kwargs.get('ExpressionAttributeNames') or {}
+        values = kwargs.get('ExpressionAttributeValues') or {}
+        with self.lock:
+            current = self.items.get(self._key(Key))
+            self._check(current, kwargs)
+            item = copy.deepcopy(current) if current is not None else dict(Key)
+            for action, clause in re.findall(r'(SET|ADD)\s+(.+?)(?=\s+(?:SET|ADD)\s+|$)', UpdateExpression.strip()):
+                for assignment in clause.split(','):
+                    if action == 'SET':
+                        name, value = [part.strip() for part in assignment.split('=', 1)]
+                        item[names.get(name, name)] = copy.deepcopy(values[value])
+                    else:
+                        name, value = assignment.split()
+                        name = names.get(name, name)
+                        if isinstance(values[value], set):
+                            item[name] = set(item.get(name, set())) | values[value]
+                        else:
+                            item[name] = item.get(name, 0) + values[value]
+            self.items[self._key(Key)] = item
+            self._publish(current, item)
+            return {'Attributes': copy.deepcopy(item)}
+
+    def query(self, KeyConditionExpression, ExpressionAttributeValues=None, ExpressionAttributeNames=None,
+              ScanIndexForward=True, Limit=None, **kwargs):
+        """Query by partition key; accepts a string expression 'pk = :value'"""
+        with self.lock:
+            matches = [
+                copy.deepcopy(item) for item in self.items.values()
+                if evaluate_condition(item, KeyConditionExpression, ExpressionAttributeNames,
+                                      ExpressionAttributeValues)
+            ]
+        if self.sort_key:
+            matches.sort(key=lambda item: item.get(self.sort_key), reverse=not ScanIndexForward)
+        return {'Items': matches[:Limit] if Limit else matches, 'Count': len(matches)}
+
+    def scan(self, **kwargs):
+        with self.lock:
+            return {'Items': [copy.deepcopy(item) for item in self.items.values()]}
+
+
+class LocalDynamoDB:
+    """Stand-in for boto3.resource('dynamodb') over a set of LocalTables"""
+
+    def __init__(self, tables):
+        self.tables = {table.name: table for table in tables}
+
+    def Table(self, name):
+        return self.tables[name]
+
+    def batch_get_item(self, RequestItems):
+        responses = {}
+        for name, request in RequestItems.items():
+            table = self.tables[name]
+            responses[name] = [
+                item for item in (table.get_item(Key=key).get('Item') for key in request['Keys'])
+                if item is not None
+            ]
+        return {'Responses': responses, 'UnprocessedKeys': {}}
@@ -0,0 +1,183 @@
+"""
+WebSocket client for job notifications, using only the standard library
+
+Connects to the notifications API (wss:// when deployed, ws:// for
+`python local_api.py`), subscribes to background jobs by transformId and
+waits for their pushed progress and completion messages, so the app never
+polls for results. The frame helpers implement the parts of RFC 6455 the
+notifications use (text, ping, pong and close frames, fragmented
+messages) and are shared with the local emulator's server side.
+
+Usage:
+    with NotificationChannel(accepted['notifications']) as channel:
+        channel.subscribe(accepted['transformId'])
+        message = channel.wait(accepted['transformId'], timeout=300, on_progress=print)
+"""
+import base64
+import hashlib
+import json
+import os
+import socket
+import ssl
+import time
+import urllib.parse
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+# Bytes of extended payload length that follow a 7-bit length of 126 or 127
+EXTENDED_LENGTH_BYTES = {126: 2, 127: 8}
+MAX_HANDSHAKE_BYTES = 16 * 1024
+
+
+def accept_key(key):
+    """Sec-WebSocket-Accept for a client's Sec-WebSocket-Key"""
+    return base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode('ascii')).digest()).decode('ascii')
+
+
+def apply_mask(payload, mask):
+    """XOR payload with the repeating 4-byte mask (masking and unmasking are the same)"""
+    if not payload:
+        return payload
+    length = len(payload)
+    repeated = (mask * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(repeated, 'big')).to_bytes(length, 'big')
+
+
+def encode_frame(payload, opcode=OP_TEXT, mask=False):
+    """One final frame; clients must mask what they send, servers must not"""
+    header = bytearray([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+    length = len(payload)
+    if length < 126:
+        header.append(mask_bit | length)
+    elif length < 1 << 16:
+        header.append(mask_bit | 126)
+        header += length.to_bytes(2, 'big')
+    else:
+        header.append(mask_bit | 127)
+        header += length.to_bytes(8, 'big')
+    if mask:
+        key = os.urandom(4)
+        header += key
+        payload = apply_mask(payload, key)
+    return bytes(header) + payload
+
+
+def frame_header(data):
+    """(final, opcode, masked, length) from a frame's first two bytes; length 126 or 127 is extended"""
+    return bool(data[0] & 0x80), data[0] & 0x0F, bool(data[1] & 0x80), data[1] & 0x7F
+
+
+class NotificationChannel:
+    """A WebSocket connection to the notifications API"""
+
+    def __init__(self, url, timeout=10):
+        parsed = urllib.parse.urlsplit(url)
+        secure = parsed.scheme == 'wss'
+        self.sock = socket.create_connection((parsed.hostname, parsed.port or (443 if secure else 80)), timeout)
+        if secure:
+            self.sock = ssl.create_default_context().wrap_socket(self.sock, server_hostname=parsed.hostname)
+        self.buffer = b''
+        self.handshake(parsed, timeout)
+
+    def handshake(self, parsed, timeout):
+        key = base64.b64encode(os.urandom(16)).decode('ascii')
+        target = (parsed.path or '/') + (f"?{parsed.query}" if parsed.query else '')
+        self.sock.sendall((
+            f"GET {target} HTTP/1.1\r\nHost: {parsed.netloc}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n"
+        ).encode('latin-1'))
+        deadline = time.monotonic() + timeout
+        while b'\r\n\r\n' not in self.buffer:
+            if len(self.buffer) > MAX_HANDSHAKE_BYTES:
+                raise ConnectionError('WebSocket handshake response too long')
+            self.buffer += self.recv(deadline)
+        head, self.buffer = self.buffer.split(b'\r\n\r\n', 1)
+        lines = head.decode('latin-1').split('\r\n')
+        headers = {name.strip().lower(): value.strip() for name, _, value in (line.partition(':') for line in lines[1:])}
+        if lines[0].split(' ')[1:2] != ['101'] or headers.get('sec-websocket-accept') != accept_key(key):
+            raise ConnectionError(f"WebSocket handshake failed: {lines[0]}")
+
+    def recv(self, deadline):
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            raise TimeoutError('Timed out waiting for a notification')
+        self.sock.settimeout(remaining)
+        try:
+            data = self.sock.recv(65536)
+        except socket.timeout:
+            raise TimeoutError('Timed out waiting for a notification')
+        if not data:
+            raise ConnectionError('Notification connection closed')
+        return data
+
+    def read_exactly(self, size, deadline):
+        while len(self.buffer) < size:
+            self.buffer += self.recv(deadline)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def read_frame(self, deadline):
+        final, opcode, masked, length = frame_header(self.read_exactly(2, deadline))
+        if length in EXTENDED_LENGTH_BYTES:
+            length = int.from_bytes(self.read_exactly(EXTENDED_LENGTH_BYTES[length], deadline), 'big')
+        mask = self.read_exactly(4, deadline) if masked else None
+        payload = self.read_exactly(length, deadline)
+        return final, opcode, apply_mask(payload, mask) if mask else payload
+
+    def send(self, message):
+        self.sock.sendall(encode_frame(json.dumps(message).encode('utf-8'), mask=True))
+
+    def subscribe(self, transform_id):
+        self.send({'action': 'subscribe', 'transformId': transform_id})
+
+    def receive(self, timeout=None):
+        """The next message, decoded from JSON; raises TimeoutError or ConnectionError"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        fragments = []
+        while True:
+            final, opcode, payload = self.read_frame(deadline)
+            if opcode == OP_PING:
+                self.sock.sendall(encode_frame(payload, OP_PONG, mask=True))
+            elif opcode == OP_CLOSE:
+                raise ConnectionError('Notification connection closed by the server')
+            elif opcode in (OP_TEXT, OP_BINARY, OP_CONTINUATION):
+                fragments.append(payload)
+                if final:
+                    return json.loads(b''.join(fragments).decode('utf-8'))
+
+    def wait(self, transform_id, timeout, on_progress=None):
+        """
+        The completed or failed message of a job
+
+        Progress messages are passed to on_progress as they arrive;
+        messages about other jobs are ignored.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            message = self.receive(max(0.0, deadline - time.monotonic()))
+            if message.get('transformId') != transform_id:
+                continue
+            if message.get('type') == 'progress':
+                if on_progress is not None:
+                    on_progress(message)
+                continue
+            return message
+
+    def close(self):
+        try:
+            self.sock.sendall(encode_frame(b'', OP_CLOSE, mask=True))
+        except OSError:
+            pass
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,105 @@
+"""
+Per-session history of transformation results for the Streamlit app
+
+Results are keyed by a hash of the tool, input text and options, so an
+unchanged resubmission is answered from the history without calling the
+API, and earlier results stay browsable and downloadable. Only whole
+results from the API are kept (see is_final), so a partial result or the
+app's sample output is never replayed. The history is bounded by entry
+count and by the bytes its outputs hold, evicting the least recently
+used results first; input text is kept only as a short preview.
+"""
+import collections
+import hashlib
+import json
+import time
+
+MAX_HISTORY_ENTRIES = 25
+MAX_HISTORY_BYTES = 4 * 1024 * 1024
+PREVIEW_CHARS = 60
+# A synchronous response says 'success'; a background job's stored result says 'completed'
+FINAL_STATUSES = ('success', 'completed')
+
+HistoryEntry = collections.namedtuple('HistoryEntry', [
+    'key', 'tool', 'options', 'preview', 'output', 'result', 'created', 'size'
+])
+
+
+def request_key(tool, text, options):
+    """Hash of a request; equal for the same tool, input text and options"""
+    payload = json.dumps([tool, text.strip(), options], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def is_final(result):
+    """Whether an API result is whole and may be kept; partial results and sample output are not"""
+    return result is not None and result.get('status') in FINAL_STATUSES
+
+
+def preview(text, limit=PREVIEW_CHARS):
+    """The start of text on one line, shortened with an ellipsis"""
+    line = ' '.join(text.split())
+    return line if len(line) <= limit else line[:limit - 1].rstrip() + '…'
+
+
+class ResultHistory:
+    """Least-recently-used results of one session, capped by count and bytes"""
+
+    def __init__(self, max_entries=MAX_HISTORY_ENTRIES, max_bytes=MAX_HISTORY_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        """Bytes held by stored outputs and API responses"""
+        return self._bytes
+
+    def get(self, tool, text, options):
+        """The stored entry for an identical request, or None; a hit becomes most recent"""
+        key = request_key(tool, text, options)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return entry
+
+    def add(self, tool, text, options, output, result=None):
+        """
+        Store a result and return its entry
+
+        output is the text shown and downloaded; result is the API
+        response, when there was one. A result larger than the whole
+        budget is returned but not kept.
+        """
+        key = request_key(tool, text, options)
+        size = len(output.encode('utf-8')) + (len(json.dumps(result, default=str)) if result is not None else 0)
+        entry = HistoryEntry(key, tool, dict(options), preview(text), output, result, time.time(), size)
+        if size > self.max_bytes:
+            return entry
+        self.remove(key)
+        self._entries[key] = entry
+        self._bytes += size
+        # Evict least recently used results until under both limits
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+        return entry
+
+    def remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def entries(self, tool=None):
+        """Stored entries, most recently used first"""
+        return [entry for entry in reversed(self._entries.values()) if tool is None or entry.tool == tool]
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Dashboard analytics over the archive of expired transformation results
+
+Reads the files the result archiver writes (archive/results/tool=.../
+date=.../part-*, see content_transformer/archive.py) from S3 or a local
+copy and computes volume per tool and day, language-pair popularity,
+processing-time percentiles and compression ratios with pandas and NumPy.
+
+Tools and dates outside a query are pruned by partition name before any
+file is listed, and only the columns the aggregates use are read from
+each file. Every partition is reduced to small mergeable aggregates
+(counts, sums and a latency histogram) cached against its file listing,
+so a repeat query reads only partitions that changed and merges the rest.
+
+Results are archived when they expire and filed by creation date, so the
+newest archived date is RESULT_RETENTION_DAYS ago; archived_window gives
+the dates a "last N days" view should cover.
+
+Usage:
+    python results_analytics.py s3://content-transformer-bucket-123456789012/archive/results [--days 30]
+    python results_analytics.py ./archive/results --tool translation --start 2024-05-01 --end 2024-05-31
+"""
+import argparse
+import collections
+import concurrent.futures
+import datetime
+import io
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(PROJECT_DIR, 'lambda_layer', 'python'))
+
+from content_transformer.archive import decode_columns, pyarrow_module, retention_days
+
+# The only columns any aggregate reads; the rest of each file (full texts included) is skipped
+COLUMNS = ('transformId', 'timestamp', 'source_language', 'target_language', 'processing_ms',
+           'original_words', 'summary_words', 'compression_ratio')
+# Few distinct values; read as categoricals so grouping compares codes instead of strings
+CATEGORY_COLUMNS = ('source_language', 'target_language')
+# Log-spaced latency buckets from 1 ms to 15 minutes; percentiles are within about 2%
+LATENCY_EDGES_MS = np.geomspace(1, 15 * 60 * 1000, 801)
+PERCENTILES = (50, 90, 99)
+# Partitions read at once when several are not cached
+READ_WORKERS = 8
+
+PartitionStats = collections.namedtuple('PartitionStats', [
+    'rows', 'language_pairs', 'latency_counts', 'original_words', 'summary_words', 'ratio_sum', 'ratio_count'
+])
+ArchiveSummary = collections.namedtuple('ArchiveSummary', [
+    'volume', 'language_pairs', 'latency', 'compression', 'rows', 'partitions_read', 'partitions_cached'
+])
+
+
+def partition_date(name):
+    """The date of a date=YYYY-MM-DD directory name, or None for anything else"""
+    if not name.startswith('date='):
+        return None
+    try:
+        return datetime.date.fromisoformat(name[len('date='):])
+    except ValueError:
+        return None
+
+
+def as_date(value):
+    if value is None or isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(value)
+
+
+def archived_window(days, retention=None, today=None):
+    """
+    (start, end) dates of the newest days creation dates the archive can hold
+
+    A result is archived once it expires, retention days (RESULT_RETENTION_DAYS
+    by default) after it was created, so nothing created since then is there yet.
+    """
+    retention = retention_days() if retention is None else retention
+    today = today or datetime.datetime.now(datetime.timezone.utc).date()
+    end = today - datetime.timedelta(days=max(0, int(retention)))
+    return end - datetime.timedelta(days=days - 1), end
+
+
+class LocalArchive:
+    """An archive prefix copied to a local directory"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def tools(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name[len('tool='):] for name in os.listdir(self.root) if name.startswith('tool='))
+
+    def partitions(self, tool, start=None, end=None):
+        """{date: [(key, fingerprint)]} of the tool's partitions within [start, end]"""
+        tool_dir = os.path.join(self.root, f"tool={tool}")
+        result = {}
+        for name in sorted(os.listdir(tool_dir)) if os.path.isdir(tool_dir) else []:
+            date = partition_date(name)
+            if date is None or (start and date < start) or (end and date > end):
+                continue
+            files = []
+            for filename in sorted(os.listdir(os.path.join(tool_dir, name))):
+                key = f"tool={tool}/{name}/{filename}"
+                stat = os.stat(os.path.join(self.root, key))
+                files.append((key, (stat.st_size, stat.st_mtime_ns)))
+            result[date] = files
+        return result
+
+    def read(self, key):
+        with open(os.path.join(self.root, key), 'rb') as f:
+            return f.read()
+
+
+class S3Archive:
+    """An archive prefix in S3; listings start at the first requested date and stop after the last"""
+
+    def __init__(self, bucket, prefix, s3=None):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        if s3 is None:
+            import boto3
+            s3 = boto3.client('s3')
+        self.s3 = s3
+
+    def tools(self):
+        response = self.s3.list_objects_v2(Bucket=self.bucket, Prefix=f"{self.prefix}/tool=", Delimiter='/')
+        return sorted(
+            common['Prefix'][len(self.prefix) + len('/tool='):].rstrip('/')
+            for common in response.get('CommonPrefixes', [])
+        )
+
+    def partitions(self, tool, start=None, end=None):
+        tool_prefix = f"{self.prefix}/tool={tool}/"
+        options = {'Bucket': self.bucket, 'Prefix': tool_prefix}
+        if start:
+            # Keys sort by date, so everything before the first wanted day is skipped server-side
+            options['StartAfter'] = f"{tool_prefix}date={start}"
+        result = {}
+        for page in self.s3.get_paginator('list_objects_v2').paginate(**options):
+            for entry in page.get('Contents', []):
+                key = entry['Key'][len(self.prefix) + 1:]
+                date = partition_date(key.split('/')[1]) if key.count('/') >= 2 else None
+                if date is None or (start and date < start):
+                    continue
+                if end and date > end:
+                    return result
+                result.setdefault(date, []).append((key, entry.get('ETag')))
+        return result
+
+    def read(self, key):
+        return self.s3.get_object(Bucket=self.bucket, Key=f"{self.prefix}/{key}")['Body'].read()
+
+
+def open_archive(location, s3=None):
+    """LocalArchive or S3Archive for a directory or s3://bucket/prefix location"""
+    if location.startswith('s3://'):
+        bucket, _, prefix = location[len('s3://'):].partition('/')
+        return S3Archive(bucket, prefix, s3)
+    return LocalArchive(location)
+
+
+def read_frame(data, key, columns=COLUMNS):
+    """The wanted columns of one archive file that it has, as a DataFrame"""
+    if key.endswith('.parquet'):
+        pyarrow = pyarrow_module()
+        if pyarrow is None:
+            raise RuntimeError('Reading Parquet archives requires pyarrow')
+        present = set(pyarrow.parquet.read_schema(io.BytesIO(data)).names)
+        return pyarrow.parquet.read_table(
+            io.BytesIO(data),
+            columns=[name for name in columns if name in present],
+            read_dictionary=[name for name in CATEGORY_COLUMNS if name in present]
+        ).to_pandas()
+    stored = decode_columns(data, key)
+    frame = pd.DataFrame({name: stored[name] for name in columns if name in stored})
+    return frame.astype({name: 'category' for name in CATEGORY_COLUMNS if name in frame})
+
+
+def numeric(frame, column):
+    """A column as floats with missing and malformed values dropped"""
+    if column not in frame:
+        return pd.Series([], dtype='float64')
+    return pd.to_numeric(frame[column], errors='coerce').dropna()
+
+
+def partition_stats(frame):
+    """Reduce one partition's rows to aggregates that merge by addition"""
+    if {'transformId', 'timestamp'} <= set(frame.columns) and frame['transformId'].duplicated().any():
+        # A retried archiver batch can write the same result twice, always to the same partition
+        frame = frame.drop_duplicates(['transformId', 'timestamp'])
+    if set(CATEGORY_COLUMNS) <= set(frame.columns):
+        sizes = frame.groupby(list(CATEGORY_COLUMNS), observed=True).size()
+        pairs = pd.Series(sizes.to_numpy(), [f"{source} → {target}" for source, target in sizes.index])
+    else:
+        pairs = pd.Series([], dtype='int64')
+    latency = numeric(frame, 'processing_ms').to_numpy()
+    latency_counts, _ = np.histogram(np.clip(latency, LATENCY_EDGES_MS[0], LATENCY_EDGES_MS[-1]), LATENCY_EDGES_MS)
+    ratios = numeric(frame, 'compression_ratio')
+    original_words = summary_words = 0.0
+    if {'original_words', 'summary_words'} <= set(frame.columns):
+        # Only rows with both counts, so the weighted ratio compares like with like
+        words = frame[['original_words', 'summary_words']].apply(pd.to_numeric, errors='coerce').dropna()
+        original_words, summary_words = float(words['original_words'].sum()), float(words['summary_words'].sum())
+    return PartitionStats(
+        len(frame), pairs, latency_counts, original_words, summary_words, float(ratios.sum()), int(ratios.count())
+    )
+
+
+def histogram_percentiles(counts, percentiles=PERCENTILES, edges=LATENCY_EDGES_MS):
+    """Percentiles of values binned by edges, interpolated geometrically within their bucket"""
+    total = counts.sum()
+    if not total:
+        return [float('nan')] * len(percentiles)
+    cumulative = np.cumsum(counts)
+    ranks = np.asarray(percentiles, dtype='float64') / 100 * total
+    buckets = np.minimum(np.searchsorted(cumulative, ranks), len(counts) - 1)
+    below = np.where(buckets > 0, cumulative[buckets - 1], 0)
+    fraction = np.clip((ranks - below) / np.maximum(counts[buckets], 1), 0, 1)
+    low, high = edges[buckets], edges[buckets + 1]
+    return list(low * (high / low) ** fraction)
+
+
+class ResultsAnalytics:
+    """Aggregates over an archive, cached per partition; safe to share between threads"""
+
+    def __init__(self, archive, read_workers=READ_WORKERS):
+        self.archive = archive
+        self.read_workers = read_workers
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _partition(self, tool, date, files):
+        frames = [read_frame(self.archive.read(key), key) for key, _ in files]
+        frame = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        return partition_stats(frame)
+
+    def partition_stats(self, tools=None, start=None, end=None):
+        """
+        ({(tool, date): PartitionStats}, partitions read, partitions served from cache)
+
+        A cached partition is reused while its file listing (names and
+        sizes or ETags) is unchanged.
+        """
+        start, end = as_date(start), as_date(end)
+        wanted = {}
+        for tool in tools or self.archive.tools():
+            for date, files in self.archive.partitions(tool, start, end).items():
+                if files:
+                    wanted[(tool, date)] = tuple(files)
+
+        stats, missing = {}, []
+        with self._lock:
+            for partition, files in wanted.items():
+                cached = self._cache.get(partition)
+                if cached is not None and cached[0] == files:
+                    stats[partition] = cached[1]
+                else:
+                    missing.append(partition)
+        if missing:
+            with concurrent.futures.ThreadPoolExecutor(min(self.read_workers, len(missing))) as executor:
+                futures = {
+                    partition: executor.submit(self._partition, partition[0], partition[1], wanted[partition])
+                    for partition in missing
+                }
+                for partition, future in futures.items():
+                    stats[partition] = future.result()
+            with self._lock:
+                self._cache.update((partition, (wanted[partition], stats[partition])) for partition in missing)
+        return stats, len(missing), len(wanted) - len(missing)
+
+    def summary(self, tools=None, start=None, end=None):
+        """ArchiveSummary of the results archived for tools between start and end (inclusive dates)"""
+        stats, read, cached = self.partition_stats(tools, start, end)
+        partitions = sorted(stats)
+        volume = pd.DataFrame(
+            [(date, tool, stats[(tool, date)].rows) for tool, date in partitions],
+            columns=['date', 'tool', 'results']
+        )
+
+        pair_counts = [stats[partition].language_pairs for partition in partitions
+                       if len(stats[partition].language_pairs)]
+        language_pairs = pd.concat(pair_counts).groupby(level=0).sum().sort_values(ascending=False) \
+            if pair_counts else pd.Series([], dtype='int64')
+        language_pairs.name = 'results'
+
+        latency_rows, compression_rows = [], []
+        for tool in sorted({tool for tool, _ in partitions}):
+            tool_stats = [stats[partition] for partition in partitions if partition[0] == tool]
+            counts = np.sum([partition.latency_counts for partition in tool_stats], axis=0)
+            latency_rows.append([tool, int(counts.sum())] + histogram_percentiles(counts))
+            ratio_count = sum(partition.ratio_count for partition in tool_stats)
+            if ratio_count:
+                original = sum(partition.original_words for partition in tool_stats)
+                summary = sum(partition.summary_words for partition in tool_stats)
+                compression_rows.append([
+                    tool, ratio_count,
+                    sum(partition.ratio_sum for partition in tool_stats) / ratio_count,
+                    round((1 - summary / original) * 100, 1) if original else float('nan')
+                ])
+        latency = pd.DataFrame(
+            latency_rows, columns=['tool', 'results'] + [f"p{percentile}_ms" for percentile in PERCENTILES]
+        ).set_index('tool')
+        compression = pd.DataFrame(
+            compression_rows, columns=['tool', 'documents', 'mean_ratio', 'overall_ratio']
+        ).set_index('tool')
+        return ArchiveSummary(volume, language_pairs, latency, compression, int(volume['results'].sum()),
+                              read, cached)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('archive', nargs='?', default=os.environ.get('RESULTS_ARCHIVE'),
+                        help='s3://bucket/archive/results or a local copy (default: $RESULTS_ARCHIVE)')
+    parser.add_argument('--tool', action='append', help='transformationType to include (repeatable)')
+    parser.add_argument('--start', help='first date, YYYY-MM-DD')
+    parser.add_argument('--end', help='last date, YYYY-MM-DD')
+    parser.add_argument('--days', type=int,
+                        help='days to include, ending at the newest archived date; overrides --start and --end')
+    parser.add_argument('--json', action='store_true', help='print the aggregates as JSON')
+    args = parser.parse_args()
+    if not args.archive:
+        parser.error('pass the archive location or set RESULTS_ARCHIVE')
+    start, end = args.start, args.end
+    if args.days:
+        start, end = archived_window(args.days)
+
+    analytics = ResultsAnalytics(open_archive(args.archive))
+    started = time.perf_counter()
+    summary = analytics.summary(args.tool, start, end)
+    elapsed = time.perf_counter() - started
+
+    if args.json:
+        print(json.dumps({
+            'rows': summary.rows,
+            'volume': summary.volume.groupby('tool')['results'].sum().to_dict(),
+            'language_pairs': summary.language_pairs.head(20).to_dict(),
+            'latency': summary.latency.to_dict(orient='index'),
+            'compression': summary.compression.to_dict(orient='index')
+        }, default=str, indent=2))
+        return
+
+    print(f"📦 {summary.rows:,} archived results in {summary.partitions_read + summary.partitions_cached} "
+          f"partitions ({elapsed * 1000:.0f} ms)")
+    print("\nVolume by tool")
+    print(summary.volume.groupby('tool')['results'].sum().to_string())
+    if len(summary.language_pairs):
+        print("\nTop language pairs")
+        print(summary.language_pairs.head(10).to_string())
+    print("\nProcessing time")
+    print(summary.latency.round(0).to_string())
+    if len(summary.compression):
+        print("\nCompression (%)")
+        print(summary.compression.round(1).to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Synth-time assertions on the ContentTransformerStack template
+"""
+import contextlib
+import os
+import sys
+import tempfile
+
+import pytest
+
+cdk = pytest.importorskip("aws_cdk")
+from aws_cdk.assertions import Match, Template
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(PROJECT_DIR)
+
+from build_layer import source_digest
+from cdk_stack import ContentTransformerStack, layer_asset_dir
+
+ASSET_DIRS = [
+    'lambda/document-summarizer', 'lambda/language-translator', 'lambda/format-converter',
+    'lambda/style-rewriter', 'lambda/content-repurposer', 'lambda/upload-url',
+    'lambda/result-reader', 'lambda/result-archiver', 'lambda/result-notifier', 'lambda/notification-socket',
+    'lambda/bulk-jobs', 'lambda_layer'
+]
+
+@contextlib.contextmanager
+def scratch_project():
+    """Work in a scratch directory holding empty asset folders"""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        for asset_dir in ASSET_DIRS:
+            os.makedirs(os.path.join(workdir, asset_dir))
+        os.chdir(workdir)
+        try:
+            yield workdir
+        finally:
+            os.chdir(cwd)
+
+def synth(settings):
+    """Synthesize the stack from a scratch project"""
+    with scratch_project():
+        app = cdk.App(context={'contentTransformer': settings})
+        stack = ContentTransformerStack(app, "TestStack")
+        return Template.from_stack(stack)
+
+def test_provisioned_concurrency():
+    """Only configured tools get provisioned concurrency on their live alias"""
+    template = synth({'provisionedConcurrency': {'summarize': 2, 'translate': 1}})
+    template.resource_count_is("AWS::Lambda::Alias", 5)
+    template.has_resource_properties("AWS::Lambda::Alias", {
+        "Name": "live",
+        "ProvisionedConcurrencyConfig": {"ProvisionedConcurrentExecutions": 2}
+    })
+    template.has_resource_properties("AWS::Lambda::Alias", {
+        "Name": "live",
+        "ProvisionedConcurrencyConfig": {"ProvisionedConcurrentExecutions": 1}
+    })
+
+def test_scheduled_scaling():
+    """Scaling schedules become scheduled actions on each provisioned alias"""
+    template = synth({
+        'provisionedConcurrency': {'summarize': 1},
+        'scheduledScaling': [
+            {'name': 'Up', 'schedule': 'cron(0 8 ? * MON-FRI *)', 'minCapacity': 5, 'maxCapacity': 10},
+            {'name': 'Down', 'schedule': 'cron(0 19 ? * MON-FRI *)', 'minCapacity': 1, 'maxCapacity': 10}
+        ]
+    })
+    template.resource_count_is("AWS::ApplicationAutoScaling::ScalableTarget", 1)
+    template.has_resource_properties("AWS::ApplicationAutoScaling::ScalableTarget", {
+        "MinCapacity": 1,
+        "MaxCapacity": 10,
+        "ScalableDimension": "lambda:function:ProvisionedConcurrency",
+        "ScheduledActions": Match.array_with([
+            Match.object_like({
+                "Schedule": "cron(0 8 ? * MON-FRI *)",
+                "ScalableTargetAction": {"MinCapacity": 5, "MaxCapacity": 10}
+            })
+        ])
+    })
+
+def test_warmer_schedule():
+    """The warmer sends the warm-up payload to every live alias"""
+    template = synth({'warmer': {'enabled': True, 'rateMinutes': 4}})
+    template.resource_count_is("AWS::Events::Rule", 5)
+    template.has_resource_properties("AWS::Events::Rule", {
+        "ScheduleExpression": "rate(4 minutes)",
+        "Targets": [Match.object_like({"Input": '{"warmup":true}'})]
+    })
+
+def test_defaults_are_off():
+    """Without context nothing is provisioned or scheduled"""
+    template = synth({})
+    template.resource_count_is("AWS::Events::Rule", 0)
+    template.resource_count_is("AWS::ApplicationAutoScaling::ScalableTarget", 0)
+    template.has_resource_properties("AWS::Lambda::Alias", {
+        "ProvisionedConcurrencyConfig": Match.absent()
+    })
+
+def test_results_not_stage_cached():
+    """The stage cache ignores Cache-Control, so stored results are never cached by it"""
+    template = synth({})
+    template.has_resource_properties("AWS::ApiGateway::Stage", {
+        "CacheClusterEnabled": Match.absent(),
+        "MethodSettings": Match.absent()
+    })
+
+def test_result_archive():
+    """Results expire by TTL and only TTL deletions from the stream reach the archiver"""
+    template = synth({'archive': {'retentionDays': 7, 'batchSize': 500, 'glacierAfterDays': 90}})
+    template.has_resource_properties("AWS::DynamoDB::Table", {
+        "TableName": "content-transformation-results",
+        "TimeToLiveSpecification": {"AttributeName": "expiresAt", "Enabled": True},
+        "StreamSpecification": {"StreamViewType": "NEW_AND_OLD_IMAGES"}
+    })
+    template.has_resource_properties("AWS::Lambda::EventSourceMapping", {
+        "BatchSize": 500,
+        "FunctionResponseTypes": ["ReportBatchItemFailures"],
+        "FilterCriteria": {"Filters": [Match.object_like({"Pattern": Match.string_like_regexp("dynamodb.amazonaws.com")})]}
+    })
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "document_summarizer.handler",
+        "Environment": {"Variables": Match.object_like({"RESULT_RETENTION_DAYS": "7"})}
+    })
+    template.has_resource_properties("AWS::S3::Bucket", {
+        "LifecycleConfiguration": {"Rules": [Match.object_like({
+            "Prefix": "archive/",
+            "Transitions": Match.array_with([
+                Match.object_like({"StorageClass": "GLACIER_IR", "TransitionInDays": 90})
+            ])
+        })]}
+    })
+
+def test_notifications():
+    """Result writes reach the notifier, which pushes them over the WebSocket API"""
+    template = synth({})
+    template.has_resource_properties("AWS::ApiGatewayV2::Api", {"ProtocolType": "WEBSOCKET"})
+    template.has_resource_properties("AWS::ApiGatewayV2::Route", {"RouteKey": "subscribe"})
+    template.has_resource_properties("AWS::DynamoDB::Table", {
+        "TableName": "content-transformation-subscriptions",
+        "TimeToLiveSpecification": {"AttributeName": "expiresAt", "Enabled": True}
+    })
+    template.has_resource_properties("AWS::Lambda::EventSourceMapping", {
+        "StartingPosition": "LATEST",
+        "FilterCriteria": {"Filters": [{"Pattern": '{"eventName":["INSERT","MODIFY"]}'}]}
+    })
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "language_translator.handler",
+        "Environment": {"Variables": Match.object_like({"NOTIFICATIONS_URL": Match.any_value()})}
+    })
+    template.has_resource_properties("AWS::IAM::Policy", {
+        "PolicyDocument": {"Statement": Match.array_with([Match.object_like({
+            "Action": "lambda:InvokeFunction", "Effect": "Allow"
+        })])}
+    })
+
+def test_stale_layer_build():
+    """A layer build made from other shared sources stops synth instead of deploying"""
+    with scratch_project():
+        os.makedirs('build/lambda_layer')
+        with open('build/lambda_layer.sources', 'w') as f:
+            f.write(source_digest('lambda_layer'))
+        assert layer_asset_dir() == 'build/lambda_layer'
+        with open('lambda_layer/requirements.txt', 'w') as f:
+            f.write('brotli\n')
+        with pytest.raises(RuntimeError, match='out of date'):
+            layer_asset_dir()
+
+def test_mock_integrations_stay_text():
+    """With every media type binary, MOCK health and CORS responses are still converted to text"""
+    template = synth({})
+    methods = template.find_resources("AWS::ApiGateway::Method")
+    mocks = [m["Properties"] for m in methods.values() if m["Properties"]["Integration"]["Type"] == "MOCK"]
+    assert {m["HttpMethod"] for m in mocks} == {"GET", "OPTIONS"}
+    for method in mocks:
+        assert method["Integration"]["ContentHandling"] == "CONVERT_TO_TEXT"
+        assert method["Integration"]["IntegrationResponses"][0]["ContentHandling"] == "CONVERT_TO_TEXT"
+
+def test_bulk_jobs():
+    """Bulk jobs run for up to 15 minutes per invocation with shard settings from context"""
+    template = synth({"bulkJobs": {"concurrency": 4, "shardRecords": 50}})
+    template.has_resource_properties("AWS::DynamoDB::Table", {
+        "TableName": "content-transformation-bulk-jobs",
+        "TimeToLiveSpecification": {"AttributeName": "expiresAt", "Enabled": True}
+    })
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "bulk_jobs.handler",
+        "Timeout": 900,
+        "Environment": {"Variables": Match.object_like({
+            "BULK_CONCURRENCY": "4",
+            "BULK_SHARD_RECORDS": "50",
+            "SUMMARIZER_FUNCTION_NAME": Match.any_value(),
+            "TRANSLATOR_FUNCTION_NAME": Match.any_value()
+        })}
+    })
+    template.has_resource_properties("AWS::ApiGateway::Resource", {"PathPart": "resume"})
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Test script for streaming document extraction
+"""
+import io
+import json
+import os
+import sys
+import zipfile
+
+from document_extraction import (
+    DocumentExtractor,
+    ExtractionError,
+    MAX_EXTRACTED_CHARS,
+    MAX_UPLOAD_BYTES,
+    check_upload,
+    extract_text,
+)
+
+def create_docx(paragraphs):
+    """Build a minimal .docx file in memory"""
+    body = ''.join(
+        f'<w:p><w:r><w:t>{text}</w:t></w:r></w:p>' for text in paragraphs
+    )
+    document = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f'<w:body>{body}</w:body></w:document>'
+    )
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('word/document.xml', document)
+    buffer.seek(0)
+    return buffer
+
+def test_txt_extraction():
+    """Paragraphs survive block boundaries and multi-byte characters"""
+    text = '\n\n'.join(f'段落 {i} ' + 'x' * 5000 for i in range(50))
+    result = extract_text(io.BytesIO(text.encode('utf-8')), 'notes.txt')
+    assert result == text
+
+def test_docx_extraction():
+    """Paragraph text is pulled out of word/document.xml"""
+    result = extract_text(create_docx(['First paragraph', 'Second paragraph']), 'report.docx')
+    assert result == 'First paragraph\n\nSecond paragraph'
+
+def test_truncation():
+    """Extraction stops once the character budget is used"""
+    text = '\n\n'.join('y' * 100 for _ in range(100))
+    result = extract_text(io.BytesIO(text.encode()), 'long.txt', max_chars=250)
+    assert len(result) <= 252
+    # Separators count against the budget; a spent budget adds nothing more
+    result = extract_text(io.BytesIO(b'aaaaaaaa\n\nbbbbbbbbbbbbbbbbbbbb'), 'short.txt', max_chars=9)
+    assert result == 'aaaaaaaa'
+
+def test_limits():
+    """Oversized and unsupported files are rejected before parsing"""
+    for filename, size in [('big.pdf', MAX_UPLOAD_BYTES + 1), ('image.png', 10)]:
+        try:
+            check_upload(filename, size)
+        except ExtractionError:
+            continue
+        raise AssertionError(f"{filename} should have been rejected")
+
+def test_extraction_fits_summarizer():
+    """The longest extraction the app can post inline is accepted by the summarizer"""
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lambda', 'document-summarizer'))
+    from document_summarizer import REQUEST_SCHEMA
+
+    body = REQUEST_SCHEMA.validate_event({'body': json.dumps({'document_text': 'a' * MAX_EXTRACTED_CHARS})})
+    assert len(body['document_text']) == MAX_EXTRACTED_CHARS
+
+def test_cache_by_hash():
+    """Identical uploads are served from the hash cache"""
+    extractor = DocumentExtractor()
+    digest, _, future = extractor.submit(io.BytesIO(b'hello\n\nworld'), 'a.txt')
+    assert future.result() == 'hello\n\nworld'
+    assert extractor.cached(digest) == 'hello\n\nworld'
+
+    same_digest, _, _ = extractor.submit(io.BytesIO(b'hello\n\nworld'), 'b.txt')
+    assert same_digest == digest
+
+    # A cache hit still reports truncation
+    long_text = b'z' * (MAX_EXTRACTED_CHARS + 10)
+    _, first, future = extractor.submit(io.BytesIO(long_text), 'long.txt')
+    future.result()
+    _, second, future = extractor.submit(io.BytesIO(long_text), 'again.txt')
+    assert len(future.result()) == MAX_EXTRACTED_CHARS
+    assert second.truncated and second.characters == first.characters == MAX_EXTRACTED_CHARS
+
+def run_test():
+    """Run the extraction tests"""
+    print("🚀 Testing Document Extraction")
+    print("=" * 50)
+    tests = [test_txt_extraction, test_docx_extraction, test_truncation, test_limits,
+             test_extraction_fits_summarizer, test_cache_by_hash]
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e}")
+            return False
+    print("\n🎉 Test completed successfully!")
+    return True
+
+if __name__ == "__main__":
+    success = run_test()
+    sys.exit(0 if success else 1)
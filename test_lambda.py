@@ -7,8 +7,10 @@ import os
 import sys
 from unittest.mock import Mock, patch
 
-# Add lambda directory to path
-sys.path.append('/workspace/content-transformer-ai/lambda/document-summarizer')
+# Add lambda directory and shared layer to path
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(PROJECT_DIR, 'lambda', 'document-summarizer'))
+sys.path.append(os.path.join(PROJECT_DIR, 'lambda_layer', 'python'))
 
 # Set environment variables
 os.environ['TABLE_NAME'] = 'content-transformer-table'
@@ -43,7 +45,7 @@ def create_mock_context():
     context.function_version = '$LATEST'
     context.invoked_function_arn = 'arn:aws:lambda:us-east-1:123456789012:function:document-summarizer'
     context.memory_limit_in_mb = 128
-    context.remaining_time_in_millis = lambda: 30000
+    context.get_remaining_time_in_millis = lambda: 30000
     return context
 
 def mock_bedrock_response():
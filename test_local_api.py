@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Test script for the local API Gateway emulator
+"""
+import concurrent.futures
+import contextlib
+import http.client
+import json
+import os
+import sys
+import time
+import urllib.parse
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(PROJECT_DIR)
+sys.path.append(os.path.join(PROJECT_DIR, 'lambda_layer', 'python'))
+
+import local_api
+import trace_viewer
+from notification_channel import NotificationChannel
+
+
+@contextlib.contextmanager
+def local_gateway(**options):
+    """Serve the stack locally, then undo the environment and clients it registered"""
+    environment = dict(os.environ)
+    try:
+        gateway = local_api.create_gateway(bedrock=local_api.LocalBedrock(0, 0), log=False, **options)
+        yield gateway, local_api.serve_in_background(gateway)
+    finally:
+        os.environ.clear()
+        os.environ.update(environment)
+        local_api.reset_local_services()
+
+
+def request(port, method, path, body=None, headers=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    connection.request(method, path, body=body, headers=headers or {})
+    response = connection.getresponse()
+    data = response.read()
+    connection.close()
+    return response.status, dict(response.getheaders()), data
+
+
+def test_stack_routes():
+    """Routes, handlers and tables are read from cdk_stack.py without aws_cdk"""
+    stack = local_api.read_stack()
+    routes = {(route.method, route.path): route for route in stack.routes}
+    for path in ('/summarize', '/translate', '/convert', '/rewrite', '/repurpose'):
+        assert ('POST', path) in routes
+    assert routes[('POST', '/summarize')].function.handler == 'document_summarizer.handler'
+    assert routes[('POST', '/summarize')].function.timeout == 120
+    assert json.loads(routes[('GET', '/health')].mock_body)['status'] == 'healthy'
+    assert stack.tables['content-transformation-results']['sort_key'] == 'timestamp'
+    environment = routes[('POST', '/translate')].function.environment
+    assert environment['TABLE_NAME'] == 'content-transformation-results'
+    assert environment['HEDGE_ENABLED'] == 'false' and environment['RATE_LIMIT_REQUESTS_PER_MINUTE']
+
+def test_proxy_events():
+    """Requests become REST proxy events, with path parameters and base64 binary bodies"""
+    stack = local_api.read_stack()
+    route, parameters = local_api.match_route(stack.routes, 'GET', '/transform/abc%20d')
+    assert route.path == '/transform/{transformId}' and parameters == {'transformId': 'abc d'}
+    assert local_api.match_route(stack.routes, 'GET', '/summarize') == (None, None)
+
+    event = local_api.build_event(route, 'GET', '/transform/abc', 'include_original_text=false&a=1&a=2',
+                                  [('Accept-Encoding', 'gzip')], b'', parameters, '10.0.0.1', ['*/*'])
+    assert event['queryStringParameters']['include_original_text'] == 'false'
+    assert event['multiValueQueryStringParameters']['a'] == ['1', '2']
+    assert event['requestContext']['identity']['sourceIp'] == '10.0.0.1' and event['body'] is None
+    event = local_api.build_event(route, 'POST', '/x', '', [('Content-Type', 'application/json')],
+                                  b'{"a": 1}', None, '10.0.0.1', ['*/*'])
+    assert event['isBase64Encoded'] and json.loads(local_api.base64.b64decode(event['body'])) == {'a': 1}
+
+def test_end_to_end():
+    """Summarize, read back, upload to local S3 and translate through the HTTP server"""
+    with local_gateway(cold_start_ms=0) as (gateway, port):
+        status, _, body = request(port, 'POST', '/summarize', json.dumps({
+            'document_text': 'Serverless functions scale with demand. ' * 40, 'summary_type': 'Key Highlights'
+        }), {'Content-Type': 'application/json'})
+        assert status == 200, body
+        transform_id = json.loads(body)['transformId']
+        status, headers, body = request(port, 'GET', f'/transform/{transform_id}')
+        assert status == 200 and json.loads(body)['summary_type'] == 'Key Highlights'
+        assert 'ETag' in headers
+        assert request(port, 'GET', f'/transform/{transform_id}', headers={'If-None-Match': headers['ETag']})[0] == 304
+        # Only a stored, completed result can be unmodified
+        assert request(port, 'GET', '/transform/nonexistent', headers={'If-None-Match': '*'})[0] == 404
+        assert request(port, 'GET', '/transform/nonexistent', headers={'If-None-Match': '"nonexistent.v1"'})[0] == 404
+
+        status, _, body = request(port, 'POST', '/upload-url', json.dumps({
+            'filename': 'a.pdf', 'content_type': 'application/pdf', 'content_length': 30
+        }))
+        assert status == 400
+        status, _, body = request(port, 'POST', '/upload-url', json.dumps({'filename': 'a.txt', 'content_length': 30}))
+        upload = json.loads(body)
+        assert request(port, 'PUT', urllib.parse.urlsplit(upload['upload_url']).path, b'Uploaded text to summarize.')[0] == 200
+        status, _, body = request(port, 'POST', '/summarize', json.dumps({'s3_key': upload['s3_key']}))
+        assert status == 200 and 'Uploaded text' in json.loads(body)['summary']
+        # A blank revision of a living document summarizes to nothing rather than failing
+        status, _, body = request(port, 'POST', '/upload-url', json.dumps({'filename': 'b.txt', 'content_length': 3}))
+        blank = json.loads(body)
+        assert request(port, 'PUT', urllib.parse.urlsplit(blank['upload_url']).path, b' \n ')[0] == 200
+        status, _, body = request(port, 'POST', '/summarize', json.dumps({'s3_key': blank['s3_key'], 'document_id': 'doc-1'}))
+        assert status == 200 and json.loads(body)['revision']['chunks'] == 0, body
+
+        status, _, body = request(port, 'POST', '/translate', json.dumps({'text_to_translate': 'Hola mundo'}))
+        assert status == 200 and 'Hola mundo' in json.loads(body)['translated_text']
+
+        assert request(port, 'GET', '/health')[0] == 200
+        assert request(port, 'GET', '/unknown')[0] == 403
+        assert request(port, 'POST', '/convert', '{}')[0] == 502  # no handler code in this tree
+        assert request(port, 'OPTIONS', '/summarize')[1]['Access-Control-Allow-Origin'] == '*'
+        stats = json.loads(request(port, 'GET', '/_local/stats')[2])
+        assert stats['DocumentSummarizerFunction']['invocations'] == 3
+        assert stats['DocumentSummarizerFunction']['cold_starts'] == 1
+
+def test_section_reuse():
+    """A near-duplicate edited near its start reuses the summaries of its later sections"""
+    import random
+
+    rng = random.Random(7)
+    words = 'serverless pipeline document summary latency cost region model quota bucket'.split()
+    lines = [' '.join(f"{rng.choice(words)}{rng.randrange(100)}" for _ in range(rng.randrange(20, 60)))
+             for _ in range(300)]
+    with local_gateway(cold_start_ms=0) as (gateway, port):
+        # Force section reuse even for a small edit
+        os.environ['DEDUPE_REUSE_THRESHOLD'] = '1.1'
+        status, _, body = request(port, 'POST', '/summarize', json.dumps({'document_text': '\n'.join(lines)}))
+        assert status == 200, body
+        edited = lines[:5] + ['an inserted paragraph near the start of the document'] + lines[5:]
+        status, _, body = request(port, 'POST', '/summarize', json.dumps({'document_text': '\n'.join(edited)}))
+        assert status == 200, body
+        reused = json.loads(body)['near_duplicate']
+        assert reused['reused'] == 'sections' and reused['sections_reused'] >= 3, reused
+
+def test_container_pool():
+    """A full pool queues requests, or throttles them with 429 when asked to"""
+    with local_gateway(containers=1, cold_start_ms=300, throttle=True) as (gateway, port):
+        with concurrent.futures.ThreadPoolExecutor(4) as pool:
+            statuses = list(pool.map(lambda _: request(port, 'GET', '/transform/missing')[0], range(4)))
+        assert statuses.count(429) >= 1 and statuses.count(404) >= 1
+
+    with local_gateway(containers=2, cold_start_ms=200) as (gateway, port):
+        started = time.monotonic()
+        with concurrent.futures.ThreadPoolExecutor(6) as pool:
+            statuses = list(pool.map(lambda _: request(port, 'GET', '/transform/missing')[0], range(6)))
+        assert statuses == [404] * 6 and time.monotonic() - started < 1.5
+        stats = gateway.pools['ResultReaderFunction'].report()
+        assert stats['cold_starts'] == 2 and stats['containers'] == 2 and stats['invocations'] == 6
+
+def test_streaming_response():
+    """A handler returning an iterator body is sent as chunks while it runs"""
+    def handler(event, context):
+        def pieces():
+            for i in range(3):
+                time.sleep(0.05)
+                yield f"part {i}\n"
+        return {'statusCode': 200, 'headers': {'Content-Type': 'text/plain'}, 'body': pieces()}
+
+    spec = local_api.FunctionSpec('Streamer', 'streamer.handler', '', 10, 128, {})
+    stack = local_api.StackDefinition([local_api.Route('GET', '/stream', spec, None)], {'Streamer': spec}, {}, [], [])
+    pool = local_api.FunctionPool(spec, handler, concurrent.futures.ThreadPoolExecutor(2), cold_start_seconds=0)
+    port = local_api.serve_in_background(local_api.LocalApiGateway(stack, {'Streamer': pool}, log=False))
+    status, headers, body = request(port, 'GET', '/stream')
+    assert status == 200 and headers['Transfer-Encoding'] == 'chunked'
+    assert body == b'part 0\npart 1\npart 2\n'
+
+def test_trace_propagation():
+    """A traceparent sent to the gateway reaches the handler and every client call beneath it"""
+    path = os.path.join(PROJECT_DIR, f".test-traces-{os.getpid()}.jsonl")
+    os.environ['TRACE_EXPORT'] = path
+    try:
+        with local_gateway(cold_start_ms=20) as (gateway, port):
+            status, _, body = request(port, 'POST', '/summarize', json.dumps({
+                'document_text': 'Traces follow requests across services. ' * 20
+            }), {'traceparent': '00-' + 'c' * 32 + '-' + 'd' * 16 + '-01'})
+            assert status == 200, body
+            transform_id = json.loads(body)['transformId']
+            # The gateway span ends just after the response is written
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                traces = trace_viewer.find_traces(trace_viewer.load_spans(path), transform_id)
+                if any(span['parentId'] == 'd' * 16 for span in traces[0]):
+                    break
+                time.sleep(0.01)
+    finally:
+        os.environ.pop('TRACE_EXPORT', None)
+        if os.path.exists(path):
+            os.remove(path)
+
+    assert len(traces) == 1 and traces[0][0]['traceId'] == 'c' * 32
+    roots, children = trace_viewer.span_tree(traces[0])
+    assert [root['name'] for root in roots] == ['POST /summarize'] and roots[0]['parentId'] == 'd' * 16
+    assert roots[0]['attributes']['cold_start'] and roots[0]['attributes']['status_code'] == 200
+    names = [span['name'] for span, _ in trace_viewer.critical_path(roots[0], children)]
+    assert names[:3] == ['POST /summarize', 'cold start', 'summarize handler']
+    assert 'bedrock-runtime.invoke_model' in names and 'dynamodb.put_item' in names
+
+def test_background_notifications():
+    """A job accepted with Prefer: respond-async pushes its progress and result over the WebSocket"""
+    stack = local_api.read_stack()
+    assert stack.socket_routes['subscribe'].name == 'NotificationSocketFunction'
+    assert stack.socket_routes['$connect'].name == 'NotificationSocketFunction'
+    consumers = {consumer.function.name: consumer for consumer in stack.stream_consumers}
+    assert consumers['ResultNotifierFunction'].table_name == 'content-transformation-results'
+    assert consumers['ResultNotifierFunction'].filters == [{'eventName': ['INSERT', 'MODIFY']}]
+    assert not local_api.matches_filter(consumers['ResultArchiverFunction'].filters[0], {'eventName': 'REMOVE'})
+
+    with local_gateway(cold_start_ms=0) as (gateway, port):
+        status, headers, body = request(port, 'POST', '/summarize', json.dumps({
+            'document_text': 'Background jobs report their progress. ' * 40
+        }), {'Content-Type': 'application/json', 'Prefer': 'respond-async'})
+        assert status == 202, body
+        accepted = json.loads(body)
+        assert accepted['status'] == 'processing' and headers['Location'] == accepted['resultPath']
+        assert accepted['notifications'] == f"ws://127.0.0.1:{port}{local_api.WEBSOCKET_PATH}"
+
+        progress = []
+        with NotificationChannel(accepted['notifications']) as channel:
+            channel.subscribe(accepted['transformId'])
+            message = channel.wait(accepted['transformId'], timeout=10, on_progress=progress.append)
+        assert message['type'] == 'completed', message
+        assert message['result']['transformId'] == accepted['transformId'] and message['result']['summary']
+        assert all(update['type'] == 'progress' for update in progress)
+
+        status, _, body = request(port, 'GET', accepted['resultPath'])
+        assert status == 200 and json.loads(body)['summary'] == message['result']['summary']
+
+def test_bulk_jobs():
+    """A bulk job runs each record through the summarizer and writes sharded JSONL results"""
+    stack = local_api.read_stack()
+    bulk_function = stack.functions['BulkJobsFunction']
+    assert bulk_function.environment['SUMMARIZER_FUNCTION_NAME'] == 'DocumentSummarizerFunction'
+
+    with local_gateway(cold_start_ms=0) as (gateway, port):
+        records = [{'id': i, 'text': f"Bulk document {i} describes a long report. " * 20} for i in range(5)]
+        gateway.s3.put_object(Bucket=bulk_function.environment['BUCKET_NAME'], Key='uploads/batch/docs.jsonl',
+                              Body=''.join(json.dumps(record) + '\n' for record in records).encode('utf-8'))
+        status, headers, body = request(port, 'POST', '/bulk-jobs', json.dumps({
+            'input_key': 'uploads/batch/docs.jsonl', 'tool': 'summarize', 'id_field': 'id', 'summary_type': 'Key Highlights'
+        }), {'Content-Type': 'application/json'})
+        assert status == 202, body
+        job = json.loads(body)
+        status_path = job['statusPath']
+        assert headers['Location'] == status_path and job['status'] == 'running'
+
+        deadline = time.monotonic() + 20
+        while job['status'] == 'running' and time.monotonic() < deadline:
+            time.sleep(0.1)
+            status, _, body = request(port, 'GET', status_path)
+            job = json.loads(body)
+        assert job['status'] == 'completed', job
+        assert job['records'] == 5 and job['failed'] == 0 and job['progress'] == 100.0
+
+        output = gateway.s3._object(bulk_function.environment['BUCKET_NAME'], job['outputPrefix'] + 'part-00000.jsonl')
+        lines = [json.loads(line) for line in output.decode('utf-8').splitlines()]
+        assert [line['id'] for line in lines] == list(range(5))
+        assert all(line['statusCode'] == 200 and line['result']['summary'] for line in lines)
+
+        status, _, _ = request(port, 'POST', status_path + '/resume')
+        assert status == 409
+        status, _, _ = request(port, 'POST', '/bulk-jobs', json.dumps({
+            'input_key': 'uploads/batch/missing.jsonl', 'tool': 'summarize'
+        }), {'Content-Type': 'application/json'})
+        assert status == 400
+
+def run_test():
+    """Run the local API tests"""
+    print("🚀 Testing Local API Gateway Emulator")
+    print("=" * 50)
+    tests = [value for name, value in sorted(globals().items()) if name.startswith('test_')]
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e}")
+            return False
+    print("\n🎉 Test completed successfully!")
+    return True
+
+if __name__ == "__main__":
+    success = run_test()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Test script for the per-session result history
+"""
+import sys
+
+from result_history import ResultHistory, is_final, preview, request_key
+
+OPTIONS = {'summary_type': 'Bullet Points', 'length': 5}
+
+def test_resubmission_hits():
+    """The same text and options are served from history; other options are not"""
+    history = ResultHistory()
+    assert history.get('summarizer', 'Some document', OPTIONS) is None
+    history.add('summarizer', 'Some document', OPTIONS, '• Summary', {'summary': '• Summary'})
+
+    entry = history.get('summarizer', 'Some document\n', dict(reversed(list(OPTIONS.items()))))
+    assert entry is not None and entry.output == '• Summary' and history.hits == 1
+    assert history.get('summarizer', 'Some document', {**OPTIONS, 'length': 6}) is None
+    assert history.get('translator', 'Some document', OPTIONS) is None
+    assert request_key('summarizer', 'a', OPTIONS) != request_key('summarizer', 'b', OPTIONS)
+
+def test_bounded_by_count_and_bytes():
+    """Least recently used results are evicted first, by entry count and by bytes"""
+    history = ResultHistory(max_entries=3, max_bytes=1000)
+    for text in ('one', 'two', 'three'):
+        history.add('translator', text, {}, text.upper())
+    history.get('translator', 'one', {})
+    history.add('translator', 'four', {}, 'FOUR')
+    assert [entry.preview for entry in history.entries()] == ['four', 'one', 'three']
+
+    history.add('translator', 'big', {}, 'x' * 995)
+    assert [entry.preview for entry in history.entries()] == ['big', 'four']
+    assert history.size <= 1000
+
+    # A result larger than the whole budget is not kept
+    entry = history.add('translator', 'huge', {}, 'x' * 2000)
+    assert entry.output == 'x' * 2000 and history.get('translator', 'huge', {}) is None
+    assert len(history) == 2
+
+def test_entries_by_tool():
+    """Entries are listed newest first, per tool, with a one-line preview"""
+    history = ResultHistory()
+    history.add('summarizer', 'first\n\ndocument', OPTIONS, 'a')
+    history.add('translator', 'text', {'target_language': 'Spanish'}, 'b')
+    history.add('summarizer', 'second document', OPTIONS, 'c')
+    assert [entry.output for entry in history.entries('summarizer')] == ['c', 'a']
+    assert history.entries('summarizer')[1].preview == 'first document'
+    assert preview('word ' * 40, limit=20) == 'word word word word…'
+
+def test_only_final_results_kept():
+    """Whole API results qualify for the history; partial results and sample output do not"""
+    assert is_final({'status': 'success', 'summary': 'a'})
+    assert is_final({'status': 'completed', 'summary': 'a'})
+    assert not is_final({'status': 'partial', 'summary': 'a', 'partial': True})
+    assert not is_final({'status': 'processing'})
+    assert not is_final(None)
+
+def run_test():
+    """Run the result history tests"""
+    print("🚀 Testing Result History")
+    print("=" * 50)
+    tests = [test_resubmission_hits, test_bounded_by_count_and_bytes, test_entries_by_tool,
+             test_only_final_results_kept]
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e}")
+            return False
+    print("\n🎉 Test completed successfully!")
+    return True
+
+if __name__ == "__main__":
+    success = run_test()
+    sys.exit(0 if success else 1)
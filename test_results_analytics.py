@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Tests for the dashboard analytics over archived results
+"""
+import datetime
+import io
+import os
+import sys
+import tempfile
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(PROJECT_DIR, 'lambda_layer', 'python'))
+
+from content_transformer.archive import archive_records
+from results_analytics import ResultsAnalytics, S3Archive, archived_window, histogram_percentiles, open_archive
+
+DAY = 1_714_521_600  # 2024-05-01 00:00 UTC
+
+
+class DirectoryS3:
+    """s3 client writing objects under a local directory, listing them the way S3 does"""
+
+    def __init__(self, root):
+        self.root = root
+        self.listed = []
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        path = os.path.join(self.root, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(Body)
+
+    def keys(self):
+        return sorted(
+            os.path.relpath(os.path.join(dirpath, filename), self.root).replace(os.sep, '/')
+            for dirpath, _, filenames in os.walk(self.root) for filename in filenames
+        )
+
+    def list_objects_v2(self, Bucket, Prefix, Delimiter=None, StartAfter=''):
+        keys = [key for key in self.keys() if key.startswith(Prefix) and key > StartAfter]
+        self.listed.extend(keys)
+        if Delimiter:
+            prefixes = sorted({Prefix + key[len(Prefix):].split(Delimiter, 1)[0] + Delimiter for key in keys})
+            return {'CommonPrefixes': [{'Prefix': prefix} for prefix in prefixes]}
+        return {'Contents': [{'Key': key, 'ETag': str(os.path.getsize(os.path.join(self.root, key)))}
+                             for key in keys]}
+
+    def get_paginator(self, operation):
+        client = self
+
+        class Paginator:
+            def paginate(self, **kwargs):
+                yield client.list_objects_v2(**kwargs)
+        return Paginator()
+
+    def get_object(self, Bucket, Key):
+        with open(os.path.join(self.root, Key), 'rb') as f:
+            return {'Body': io.BytesIO(f.read())}
+
+
+def expired(sequence, item):
+    image = {}
+    for key, value in item.items():
+        if isinstance(value, str):
+            image[key] = {'S': value}
+        elif isinstance(value, dict):
+            image[key] = {'M': {inner: {'N': str(number)} for inner, number in value.items()}}
+        else:
+            image[key] = {'N': str(value)}
+    return {
+        'eventName': 'REMOVE', 'userIdentity': {'type': 'Service', 'principalId': 'dynamodb.amazonaws.com'},
+        'dynamodb': {'SequenceNumber': str(sequence), 'OldImage': image}
+    }
+
+
+def archived_results(root):
+    """Archive a few days of results with the archiver itself; returns the fake S3 client"""
+    s3 = DirectoryS3(root)
+    records = []
+    for day in range(3):
+        for i in range(10):
+            records.append(expired(len(records), {
+                'transformId': f"t-{day}-{i}", 'timestamp': DAY + day * 86_400 + i,
+                'transformationType': 'translation', 'processing_ms': 1000 * (i + 1),
+                'source_language': 'English', 'target_language': 'Spanish' if i < 7 else 'French',
+                'translated_text': 'Hola ' * 50
+            }))
+        records.append(expired(len(records), {
+            'transformId': f"s-{day}", 'timestamp': DAY + day * 86_400, 'transformationType': 'summarization',
+            'processing_ms': 5000, 'original_words': 1000, 'summary_words': 100 * (day + 1),
+            'compression_ratio': 100 - 10 * (day + 1), 'usage': {'input_tokens': 1300}
+        }))
+    archive_records(records, s3, 'bucket', 'archive/results')
+    # A retried batch writes the first day's translations again
+    archive_records(records[:10], s3, 'bucket', 'archive/results')
+    return s3
+
+
+def test_summary_and_pruning():
+    """Aggregates match the archived rows, duplicates are dropped and pruned partitions are not read"""
+    with tempfile.TemporaryDirectory() as root:
+        archived_results(root)
+        analytics = ResultsAnalytics(open_archive(os.path.join(root, 'archive', 'results')))
+        summary = analytics.summary()
+
+        assert summary.rows == 33 and summary.partitions_read == 6
+        assert summary.volume.groupby('tool')['results'].sum().to_dict() == {'summarization': 3, 'translation': 30}
+        assert summary.language_pairs.to_dict() == {'English → Spanish': 21, 'English → French': 9}
+        p50, p90, p99 = summary.latency.loc['translation', ['p50_ms', 'p90_ms', 'p99_ms']]
+        assert 4900 < p50 <= 5100 and 8900 < p90 <= 9300 and p99 <= 10_100
+        compression = summary.compression.loc['summarization']
+        assert compression['documents'] == 3 and compression['mean_ratio'] == 80 and compression['overall_ratio'] == 80
+
+        # Cached partitions are merged without reading them again
+        assert analytics.summary().partitions_cached == 6
+        week = analytics.summary(['translation'], '2024-05-02', '2024-05-03')
+        assert week.rows == 20 and week.partitions_read == 0 and 'summarization' not in week.latency.index
+
+
+def test_archived_window():
+    """A "last 30 days" query ends at the newest date the archive can hold, so it finds expired results"""
+    today = datetime.date(2024, 6, 2)
+    assert archived_window(30, retention=30, today=today) == (datetime.date(2024, 4, 4), datetime.date(2024, 5, 3))
+    assert archived_window(7, retention=0, today=today) == (datetime.date(2024, 5, 27), today)
+    with tempfile.TemporaryDirectory() as root:
+        archived_results(root)
+        analytics = ResultsAnalytics(open_archive(os.path.join(root, 'archive', 'results')))
+        # Every row was created at least 30 days before today, as expired results are
+        assert analytics.summary(None, *archived_window(30, retention=30, today=today)).rows == 33
+        assert analytics.summary(None, today - datetime.timedelta(days=29), today).rows == 0
+
+
+def test_s3_listing_starts_at_first_date():
+    """S3 listings skip keys before the first wanted date and stop after the last"""
+    with tempfile.TemporaryDirectory() as root:
+        s3 = archived_results(root)
+        archive = S3Archive('bucket', 'archive/results', s3)
+        assert archive.tools() == ['summarization', 'translation']
+        s3.listed.clear()
+        analytics = ResultsAnalytics(archive)
+        summary = analytics.summary(['translation'], '2024-05-02', '2024-05-02')
+        assert summary.rows == 10 and summary.partitions_read == 1
+        assert not any('date=2024-05-01' in key for key in s3.listed)
+
+
+def test_histogram_percentiles():
+    """Percentiles from the latency histogram are close to exact ones"""
+    import numpy as np
+    from results_analytics import LATENCY_EDGES_MS
+
+    values = np.random.default_rng(3).lognormal(7, 1, 50_000)
+    counts, _ = np.histogram(values, LATENCY_EDGES_MS)
+    for estimate, exact in zip(histogram_percentiles(counts), np.percentile(values, [50, 90, 99])):
+        assert abs(estimate - exact) / exact < 0.02
+    assert all(np.isnan(value) for value in histogram_percentiles(np.zeros(len(LATENCY_EDGES_MS) - 1)))
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
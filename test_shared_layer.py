@@ -0,0 +1,1136 @@
+#!/usr/bin/env python3
+"""
+Test script for the shared Lambda layer helpers
+"""
+import base64
+import contextlib
+import gzip
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from unittest.mock import Mock
+
+# Add shared layer to path
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(PROJECT_DIR, 'lambda_layer', 'python'))
+
+from local_dynamodb import LocalClientError, LocalDynamoDB, LocalTable, evaluate_condition
+from content_transformer import runtime
+from content_transformer import archive
+from content_transformer import semaphore as semaphore_module
+from content_transformer import bulk
+from content_transformer import notifications
+from content_transformer.chunking import iter_chunks, map_chunks, map_writes
+from content_transformer.deadline import (
+    RESERVE_SECONDS, UNLIMITED, Deadline, DeadlineExceeded, current_deadline, deadline_aware
+)
+from content_transformer import dedupe as dedupe_module
+from content_transformer.dedupe import DynamoDBDedupeStore, find_near_duplicate, index_document
+from content_transformer.hash_tree import (
+    DynamoDBRevisionStore, build_summary_tree, iter_content_chunks, previous_hashes
+)
+from content_transformer.hedging import HedgePolicy, LatencyTracker, hedged_call
+from content_transformer.minhash import LSHIndex, MinHasher, minhash, pack_signature, similarity
+from content_transformer.preprocess import preprocess, remove_repeated_lines, strip_markup, template
+from content_transformer.idempotency import COMPLETED, IN_PROGRESS, DynamoDBIdempotencyStore, idempotent
+from content_transformer.rate_limit import (
+    DynamoDBBucketStore, RateLimitPolicy, admit, check_rate_limit, client_key, rate_limited,
+    request_token_cost
+)
+from content_transformer.responses import choose_encoding, etag_matches, json_response, parse_body
+from content_transformer.s3_stream import iter_object_text
+from content_transformer.priority import BULK, INTERACTIVE, PriorityPolicy, current_priority, prioritized
+from content_transformer.semaphore import DistributedSemaphore, SemaphoreTimeout, admits
+from content_transformer.tokens import estimate_tokens
+from content_transformer.usage import (
+    DynamoDBUsageStore, TokenUsage, record_usage, response_token_counts, usage_cost, usage_totals
+)
+from content_transformer import tracing
+from content_transformer.validation import Field, Schema, ValidationError, validated, validated_body
+from content_transformer.warmup import is_warmup, warmup_response
+
+def create_mock_s3(data):
+    """Create a mock S3 client serving ranged GETs of one object"""
+    def get_object(Bucket, Key, Range):
+        start, end = Range.replace('bytes=', '').split('-')
+        return {'Body': Mock(read=lambda: data[int(start):int(end) + 1])}
+
+    s3 = Mock()
+    s3.head_object.return_value = {'ContentLength': len(data)}
+    s3.get_object.side_effect = get_object
+    return s3
+
+def test_ranged_reads():
+    """Ranged GETs reassemble the object, even across multi-byte characters"""
+    text = '文档内容 document content ' * 1000
+    s3 = create_mock_s3(text.encode('utf-8'))
+    blocks = list(iter_object_text(s3, 'bucket', 'uploads/doc.txt', range_size=1001))
+    assert ''.join(blocks) == text
+    assert s3.get_object.call_count > 1
+
+def test_chunking():
+    """Chunks respect the size limit and keep every word"""
+    paragraphs = [f"Paragraph {i} " + 'word ' * 50 for i in range(200)]
+    text = '\n\n'.join(paragraphs)
+    chunks = list(iter_chunks([text[i:i + 777] for i in range(0, len(text), 777)], chunk_chars=2000))
+    assert all(len(chunk) <= 2000 for chunk in chunks)
+    assert ' '.join(chunks).split() == text.split()
+
+def test_map_chunks_order():
+    """Mapped results come back in chunk order"""
+    assert map_chunks(iter(range(20)), lambda n: n * n, max_workers=3) == [n * n for n in range(20)]
+
+def test_progress_only_for_model_work():
+    """Only opted-in chunk work advances a job's progress; store writes run even past the deadline"""
+    class CountingProgress(notifications.Progress):
+        def __init__(self):
+            self.calls = 0
+
+        def advance(self, total=None):
+            self.calls += 1
+
+    @deadline_aware
+    def expired(event, context):
+        return map_writes(['a', 'b'], str.upper)
+
+    progress = CountingProgress()
+    store = DynamoDBDedupeStore(LocalDynamoDB([LocalTable('dedupeKey', name='dedupe')]), 'dedupe')
+    token = notifications._progress.set(progress)
+    try:
+        assert map_chunks(['a', 'b', 'c'], str.upper, report_progress=True) == ['A', 'B', 'C']
+        assert map_chunks(['a'], str.upper) == ['A'] and map_writes(['a', 'b'], str.upper) == ['A', 'B']
+        index_document(store, 't-1', minhash(sample_document(200, 4)), 'key#a', 'Bullet Points#5', 'summary', {})
+        assert expired({}, Mock(get_remaining_time_in_millis=lambda: 0)) == ['A', 'B']
+    finally:
+        notifications._progress.reset(token)
+    assert progress.calls == 3 and len(store.table.items) > 1
+
+def test_response_compression():
+    """Large responses are gzipped only when the client accepts it"""
+    payload = {'translated_text': 'Serverless translation output. ' * 200}
+    event = {'headers': {'accept-encoding': 'gzip, deflate'}}
+
+    response = json_response(200, payload, event)
+    assert response['isBase64Encoded']
+    assert response['headers']['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(base64.b64decode(response['body']))) == payload
+
+    plain = json_response(200, payload, {'headers': {}})
+    assert 'Content-Encoding' not in plain['headers']
+    assert json.loads(plain['body']) == payload
+
+    small = json_response(200, {'status': 'ok'}, event)
+    assert 'Content-Encoding' not in small['headers']
+
+def test_encoding_negotiation():
+    """q-values and wildcards are honored"""
+    assert choose_encoding('gzip;q=0') is None
+    assert choose_encoding('identity') is None
+    assert choose_encoding('*') in ('gzip', 'br')
+
+def test_parse_base64_body():
+    """Binary-typed request bodies arrive base64 encoded"""
+    event = {'body': base64.b64encode(b'{"text_to_translate": "hola"}').decode(), 'isBase64Encoded': True}
+    assert parse_body(event) == {'text_to_translate': 'hola'}
+
+def test_runtime_ids():
+    """Transform IDs are valid version 4 UUIDs and timestamps match isoformat"""
+    transform_id = runtime.new_transform_id()
+    assert str(uuid.UUID(transform_id)) == transform_id
+    assert uuid.UUID(transform_id).version == 4
+    assert runtime.utc_isoformat(1700000000.25) == datetime.utcfromtimestamp(1700000000.25).isoformat()
+
+def test_warmup_detection():
+    """Only the scheduled warm-up payload short-circuits a handler"""
+    assert is_warmup({'warmup': True})
+    assert not is_warmup({'body': '{"warmup": true}'})
+    assert not is_warmup({'warmup': 'yes'})
+    assert warmup_response()['statusCode'] == 200
+
+def test_etags():
+    """ETags carry the content coding and match in any coding"""
+    payload = {'summary': 'Immutable result. ' * 100}
+    gzipped = json_response(200, payload, {'headers': {'Accept-Encoding': 'gzip'}}, etag='abc-123.v1')
+    plain = json_response(200, payload, {'headers': {}}, etag='abc-123.v1')
+    assert gzipped['headers']['ETag'] == '"abc-123.v1-gzip"'
+    assert plain['headers']['ETag'] == '"abc-123.v1"'
+
+    for if_none_match in ('"abc-123.v1"', '"abc-123.v1-gzip"', 'W/"abc-123.v1", "other"', '*'):
+        assert etag_matches({'headers': {'If-None-Match': if_none_match}}, 'abc-123.v1')
+    assert not etag_matches({'headers': {'If-None-Match': '"abc-123.v1.brief"'}}, 'abc-123.v1')
+    assert not etag_matches({'headers': {}}, 'abc-123.v1')
+
+class FakeIdempotencyStore:
+    """In-memory stand-in for the idempotency table"""
+
+    def __init__(self):
+        self.records = {}
+
+    def acquire(self, key, fingerprint, lease_seconds):
+        if key in self.records:
+            return self.records[key]
+        self.records[key] = {'status': IN_PROGRESS, 'fingerprint': fingerprint}
+        return None
+
+    def get(self, key):
+        return self.records.get(key)
+
+    def complete(self, key, status_code, body):
+        self.records[key].update(status=COMPLETED, statusCode=status_code,
+                                 responseBody=gzip.compress(body.encode('utf-8')))
+
+    def release(self, key):
+        self.records.pop(key, None)
+
+def test_idempotency_replay():
+    """Retries with the same key replay the stored response without rerunning"""
+    store = FakeIdempotencyStore()
+    calls = []
+
+    @idempotent('summarize', store_factory=lambda: store)
+    def handler(event, context):
+        calls.append(event)
+        return json_response(200, {'transformId': f"id-{len(calls)}"}, event)
+
+    event = {'body': '{"document_text": "abc"}', 'headers': {'Idempotency-Key': 'retry-1'}}
+    first = handler(event, None)
+    second = handler(event, None)
+    assert len(calls) == 1
+    assert json.loads(first['body']) == json.loads(second['body']) == {'transformId': 'id-1'}
+    assert second['headers']['Idempotent-Replayed'] == 'true'
+
+    reused = handler(dict(event, body='{"document_text": "xyz"}'), None)
+    assert reused['statusCode'] == 422
+
+    handler({'body': '{}', 'headers': {}}, None)
+    assert len(calls) == 2
+
+def test_idempotency_errors_not_stored():
+    """Server errors release the key so a retry runs again"""
+    store = FakeIdempotencyStore()
+    results = [500, 200]
+
+    @idempotent('translate', store_factory=lambda: store)
+    def handler(event, context):
+        return json_response(results.pop(0), {'status': 'done'}, event)
+
+    event = {'body': '{}', 'headers': {'idempotency-key': 'k'}}
+    assert handler(event, None)['statusCode'] == 500
+    assert handler(event, None)['statusCode'] == 200
+    assert store.records['translate#k']['status'] == COMPLETED
+
+def test_token_estimates():
+    """CJK characters count about one token each, Latin text about four characters"""
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('a' * 400) == 100
+    assert estimate_tokens('我的流水线挂了') == 7
+
+class FakeBucketStore:
+    """In-memory stand-in for the rate limit table with versioned writes"""
+
+    def __init__(self):
+        self.items = {}
+
+    def load(self, key):
+        return self.items.get(key, (None, None))
+
+    def save(self, key, state, version):
+        if self.items.get(key, (None, None))[1] != version:
+            return False
+        self.items[key] = (state, (version or 0) + 1)
+        return True
+
+def test_token_bucket():
+    """Buckets drain, reject with a retry delay, then refill over time"""
+    policy = RateLimitPolicy(requests_per_minute=60, request_burst=2, tokens_per_minute=6000, token_burst=1000)
+    store = FakeBucketStore()
+    assert check_rate_limit(store, 'key#a', policy, 100, now=0) == (True, 0)
+    assert check_rate_limit(store, 'key#a', policy, 100, now=0) == (True, 0)
+    allowed, retry_after = check_rate_limit(store, 'key#a', policy, 100, now=0)
+    assert not allowed and retry_after == 1
+    assert check_rate_limit(store, 'key#a', policy, 100, now=1)[0]
+
+    allowed, _, retry_after = admit((5, 100, 0), policy, 600, now=0)
+    assert not allowed and retry_after == 5
+
+def test_rate_limited_handler():
+    """Over-budget callers get 429 with Retry-After before the handler runs"""
+    policy = RateLimitPolicy(requests_per_minute=1, request_burst=1)
+    store = FakeBucketStore()
+    calls = []
+
+    @rate_limited('summarize', max_output_tokens=1500, store_factory=lambda: store, policy=policy)
+    def handler(event, context):
+        calls.append(event)
+        return json_response(200, {'status': 'success'}, event)
+
+    event = {'body': '{}', 'requestContext': {'identity': {'apiKey': 'abc', 'sourceIp': '10.0.0.1'}}}
+    assert handler(event, None)['statusCode'] == 200
+    limited = handler(event, None)
+    assert limited['statusCode'] == 429
+    assert int(limited['headers']['Retry-After']) >= 1
+    assert len(calls) == 1
+    # A client-chosen X-Api-Key header does not buy a fresh bucket
+    spoofed = {'body': '{}', 'headers': {'X-Api-Key': 'new-key'}, 'requestContext': {'identity': {'sourceIp': '10.0.0.2'}}}
+    assert client_key(spoofed) == 'ip#10.0.0.2'
+    assert handler(spoofed, None)['statusCode'] == 200
+    spoofed['headers']['X-Api-Key'] = 'another-key'
+    assert handler(spoofed, None)['statusCode'] == 429
+
+def test_request_token_cost():
+    """Token costs count the decoded text, not its base64 or JSON encoding"""
+    body = json.dumps({'text_to_translate': '我的流水线挂了' * 100, 'target_language': 'English'})
+    plain = request_token_cost({'body': body}, 1500)
+    encoded = {'body': base64.b64encode(body.encode('utf-8')).decode('ascii'), 'isBase64Encoded': True}
+    assert plain == request_token_cost(encoded, 1500) == estimate_tokens('我的流水线挂了' * 100 + '\nEnglish') + 1500
+    assert request_token_cost({'body': 'not json'}, 1500) == 1500
+
+def test_local_table_conditions():
+    """The table stand-in evaluates the condition expressions the stores use"""
+    item = {'idempotencyKey': 'k', 'status': 'IN_PROGRESS', 'leaseExpiresAt': 5, 'expiresAt': 100}
+    expression = ('attribute_not_exists(idempotencyKey) OR expiresAt < :now '
+                  'OR (#status = :in_progress AND leaseExpiresAt < :now)')
+    names = {'#status': 'status'}
+    assert evaluate_condition(item, expression, names, {':now': 10, ':in_progress': 'IN_PROGRESS'})
+    assert not evaluate_condition(item, expression, names, {':now': 1, ':in_progress': 'IN_PROGRESS'})
+    assert evaluate_condition({}, 'attribute_not_exists(bucketKey)')
+    assert evaluate_condition({'version': 2}, 'NOT version = :v', values={':v': 3})
+
+def test_stores_on_local_table():
+    """Idempotency and rate limit stores work against the table stand-in"""
+    idempotency = DynamoDBIdempotencyStore(LocalTable('idempotencyKey'))
+    assert idempotency.acquire('summarize#k', 'fp', 60) is None
+    assert idempotency.acquire('summarize#k', 'fp', 60)['status'] == IN_PROGRESS
+    idempotency.complete('summarize#k', 200, '{"ok": true}')
+    assert idempotency.get('summarize#k')['status'] == COMPLETED
+
+    class VanishingTable(LocalTable):
+        """Another request releases the key between each refused write and the read"""
+
+        def get_item(self, Key, ConsistentRead=False):
+            return {}
+
+    calls = []
+    vanishing = DynamoDBIdempotencyStore(VanishingTable('idempotencyKey'))
+    vanishing.table.put_item(Item={'idempotencyKey': 'summarize#k', 'status': IN_PROGRESS, 'expiresAt': 2 ** 40,
+                                   'leaseExpiresAt': 2 ** 40, 'fingerprint': 'fp'})
+    handler = idempotent('summarize', store_factory=lambda: vanishing)(lambda event, context: calls.append(event))
+    response = handler({'body': '', 'headers': {'Idempotency-Key': 'k'}}, None)
+    assert response['statusCode'] == 409 and not calls
+
+    buckets = DynamoDBBucketStore(LocalTable('bucketKey'))
+    policy = RateLimitPolicy(requests_per_minute=60, request_burst=1)
+    assert check_rate_limit(buckets, 'key#a', policy, 10, now=100.0)[0]
+    assert not check_rate_limit(buckets, 'key#a', policy, 10, now=100.0)[0]
+
+def test_semaphore_caps_concurrency():
+    """No more than the limit hold a slot at once across competing threads"""
+    semaphore = DistributedSemaphore(LocalTable('semaphoreKey'), limit=3, lease_seconds=30)
+    active, peak, lock = [0], [0], threading.Lock()
+
+    def worker():
+        with semaphore.hold(time.time() + 10):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+
+    threads = [threading.Thread(target=worker) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 3
+    assert semaphore.occupancy() == 0
+
+def test_semaphore_deadline_and_expiry():
+    """Full semaphores time out, and expired leases free their slot"""
+    now = [1000.0]
+    semaphore = DistributedSemaphore(LocalTable('semaphoreKey'), limit=1, lease_seconds=30, clock=lambda: now[0])
+    semaphore.acquire(deadline=now[0])
+    try:
+        semaphore.acquire(deadline=now[0])
+        raise AssertionError("second acquire should time out")
+    except SemaphoreTimeout:
+        pass
+    now[0] += 31
+    assert semaphore.try_acquire('next')[0]
+
+def test_priority_admission():
+    """Free slots are shared by weight, bulk is deferred behind queued interactive callers"""
+    policy = PriorityPolicy({INTERACTIVE: 3, BULK: 1}, bulk_defer_depth=2, bulk_queue_seconds=60)
+    # Alone, a class may use every slot
+    assert admits(policy, BULK, {BULK: 9}, {}, 10)
+    assert not admits(policy, BULK, {BULK: 10}, {}, 10)
+    # With both queued, bulk stops at its quarter and interactive at three quarters
+    assert admits(policy, BULK, {INTERACTIVE: 7, BULK: 2}, {INTERACTIVE: 1}, 10)
+    assert not admits(policy, BULK, {INTERACTIVE: 6, BULK: 3}, {INTERACTIVE: 1}, 10)
+    assert admits(policy, INTERACTIVE, {INTERACTIVE: 7, BULK: 2}, {BULK: 5}, 10)
+    assert not admits(policy, INTERACTIVE, {INTERACTIVE: 8, BULK: 1}, {BULK: 5}, 10)
+    # A deep interactive queue defers bulk entirely, and deferred bulk does not hold interactive back
+    assert not admits(policy, BULK, {INTERACTIVE: 1}, {INTERACTIVE: 2}, 10)
+    assert admits(policy, INTERACTIVE, {INTERACTIVE: 9}, {INTERACTIVE: 2, BULK: 4}, 10)
+
+    now = [1000.0]
+    semaphore = DistributedSemaphore(LocalTable('semaphoreKey'), limit=4, lease_seconds=30,
+                                     clock=lambda: now[0], policy=policy)
+    for i in range(4):
+        assert semaphore.try_acquire(f"bulk#{i}")[0]
+    # Interactive callers queue until their deadline; a released slot goes to them, not to bulk
+    for i in range(2):
+        assert not semaphore.try_acquire(f"interactive#{i}", queue_until=now[0] + 10)[0]
+    semaphore.release('bulk#0')
+    acquired, in_flight, queued = semaphore.try_acquire('bulk#9', queue_until=now[0] + 60)
+    assert not acquired and queued[INTERACTIVE] == 2
+    assert semaphore.try_acquire('interactive#0')[0]
+    semaphore.withdraw('interactive#1')
+    semaphore.release('bulk#1')
+    assert semaphore.try_acquire('bulk#9')[0]
+    # Leases from before priority classes count as interactive
+    assert semaphore.occupancy() == 4 and not semaphore.try_acquire('legacy')[0]
+
+    @prioritized('summarize')
+    def handler(event, context):
+        return {'statusCode': 200, 'body': current_priority()}
+
+    assert handler({'headers': {'x-priority': 'Bulk'}}, None)['body'] == BULK
+    assert handler({'headers': {'X-Priority': 'urgent'}}, None)['body'] == INTERACTIVE
+    assert current_priority() == INTERACTIVE
+
+def test_usage_accounting():
+    """Token counts come from Bedrock headers, fall back to estimates and roll up per dimension"""
+    headers = {'ResponseMetadata': {'HTTPHeaders': {
+        'x-amzn-bedrock-input-token-count': '120', 'x-amzn-bedrock-output-token-count': '30'
+    }}}
+    assert response_token_counts(headers, 'prompt', 'done') == (120, 30, False)
+    assert response_token_counts({}, 'x' * 400, 'y' * 40) == (100, 10, True)
+
+    usage = TokenUsage()
+    usage.add(120, 30)
+    usage.add(100, 10, estimated=True)
+    assert usage.as_dict()['total_tokens'] == 260 and usage.as_dict()['estimated']
+
+    store = DynamoDBUsageStore(LocalTable('usageKey', 'period'))
+    day = 1714521600  # 2024-05-01
+    record_usage('summarize', 'model-a', 'key#abc', usage, day, store=store)
+    record_usage('summarize', 'model-a', None, usage, day + 86400, store=store)
+    totals = usage_totals(store.query('tool', 'summarize', '2024-05-01', '2024-05-02'))
+    assert totals['requests'] == 2 and totals['inputTokens'] == 440 and totals['modelCalls'] == 4
+    assert usage_totals(store.query('key', 'key#abc', '2024-05-01', '2024-05-31'))['requests'] == 1
+    assert usage_cost(totals, 8.0, 24.0) == (440 * 8.0 + 80 * 24.0) / 1000
+
+    # A call finishing after the request was recorded (an abandoned hedge) adds its tokens, not a request
+    usage.add(50, 5)
+    totals = usage_totals(store.query('tool', 'summarize', '2024-05-01', '2024-05-02'))
+    assert totals['requests'] == 2 and totals['inputTokens'] == 490 and totals['modelCalls'] == 5
+    assert usage.as_dict()['input_tokens'] == 220
+
+def test_hedge_threshold():
+    """The hedge delay follows the latency percentile once enough samples exist"""
+    tracker = LatencyTracker()
+    policy = HedgePolicy(enabled=True, percentile=90, initial_delay=8, min_delay=1, max_delay=30)
+    assert policy.delay(tracker) == 8
+    for seconds in range(1, 101):
+        tracker.record(seconds / 10)
+    assert tracker.percentile(90) == 9.0
+    assert policy.delay(tracker) == 9.0
+    tracker.record(0.01)
+    assert HedgePolicy(percentile=1, min_delay=0.5).delay(tracker) == 0.5
+
+def test_hedged_call():
+    """Slow primaries are hedged, the first answer wins and failures fall over"""
+    def slow():
+        time.sleep(0.3)
+        return 'primary'
+
+    assert hedged_call(lambda: 'primary', lambda: 'secondary', 0.05) == ('primary', False, False)
+    assert hedged_call(slow, lambda: 'secondary', 0.02) == ('secondary', True, True)
+    # The abandoned primary still reports its result when it finishes
+    abandoned = threading.Event()
+    results = []
+    assert hedged_call(slow, lambda: 'secondary', 0.02,
+                       on_abandoned=lambda result: (results.append(result), abandoned.set())) == ('secondary', True, True)
+    assert abandoned.wait(2) and results == ['primary']
+
+    def failing():
+        raise RuntimeError('throttled')
+
+    assert hedged_call(failing, lambda: 'secondary', 1) == ('secondary', True, True)
+    try:
+        hedged_call(failing, lambda: 'secondary', 1, should_failover=lambda error: False)
+        raise AssertionError("failover should have been skipped")
+    except RuntimeError:
+        pass
+
+def test_hedged_model_call():
+    """Both attempts of a hedged call share one slot until both finish, and the loser's tokens still count"""
+    from content_transformer.bedrock import invoke_completion
+
+    semaphore = DistributedSemaphore(LocalTable('semaphoreKey'), limit=2, lease_seconds=30)
+    occupancy = []
+    loser_done = threading.Event()
+
+    class Bedrock:
+        def __init__(self, seconds, text):
+            self.seconds, self.text = seconds, text
+
+        def invoke_model(self, modelId, body):
+            occupancy.append(semaphore.occupancy())
+            time.sleep(self.seconds)
+            if self.seconds > 0.1:
+                loser_done.set()
+            return {'body': io.BytesIO(json.dumps({'completion': self.text}).encode())}
+
+    runtime.register('bedrock-runtime', client=Bedrock(0, 'fast'), region_name='eu-west-1')
+    semaphore_module._default_semaphore.append(semaphore)
+    policy = HedgePolicy(enabled=True, secondary_region='eu-west-1', initial_delay=0.02)
+    usage = TokenUsage()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            completion = invoke_completion(Bedrock(0.3, 'slow ' * 40), 'model-a', 'prompt ' * 40,
+                                           usage=usage, policy=policy)
+        # The loser is still calling Bedrock, so the shared slot stays taken until it finishes
+        assert completion.text == 'fast' and semaphore.occupancy() == 1
+        assert occupancy == [1, 1]
+        assert loser_done.wait(2)
+        time.sleep(0.05)
+        assert usage.model_calls == 2 and semaphore.occupancy() == 0
+
+        # A call abandoned at the deadline gives its slot up with it
+        @deadline_aware
+        def call_slowly(event, context):
+            return invoke_completion(Bedrock(3, 'late'), 'model-a', 'prompt', policy=HedgePolicy())
+
+        loser_done.clear()
+        try:
+            call_slowly({}, Mock(get_remaining_time_in_millis=lambda: (RESERVE_SECONDS + 1.5) * 1000))
+            assert False, 'expected DeadlineExceeded'
+        except DeadlineExceeded:
+            assert semaphore.occupancy() == 0 and not loser_done.is_set()
+    finally:
+        semaphore_module._default_semaphore.clear()
+        runtime.reset_clients()
+
+SAMPLE_WORDS = ("serverless pipelines move documents through upload extraction summarization "
+                "translation and storage while the dashboard reports latency cost and usage ").split()
+
+def sample_document(count, seed):
+    rng = random.Random(seed)
+    return ' '.join(f"{rng.choice(SAMPLE_WORDS)}{rng.randrange(50)}" for _ in range(count))
+
+def test_minhash_similarity():
+    """Signatures ignore formatting, track edits and stream identically"""
+    document = sample_document(2000, 1)
+    signature = minhash(document)
+    assert similarity(signature, minhash(document.upper().replace(' ', '\n  '))) == 1.0
+
+    words = document.split()
+    edited = ' '.join(words[:1000] + ['inserted', 'sentence', 'here'] + words[1000:])
+    rewritten = ' '.join(words[:1000] + sample_document(1000, 5).split())
+    assert similarity(signature, minhash(edited)) > 0.9
+    assert 0.2 < similarity(signature, minhash(rewritten)) < 0.8
+    assert similarity(signature, minhash(sample_document(2000, 3))) < 0.2
+
+    hasher = MinHasher()
+    for start in range(0, len(document), 333):
+        hasher.update(document[start:start + 333])
+    assert hasher.signature() == signature
+
+    zh = "舞台上的 DevOps 常被描绘成技术乌托邦。自动化流水线顺畅运行，开发与运维无缝协作。" * 4
+    assert similarity(minhash(zh), minhash(zh.replace("技术", "科技", 1))) > 0.7
+
+def test_lsh_index():
+    """LSH finds near-duplicates and skips unrelated documents"""
+    index = LSHIndex()
+    for seed in range(20):
+        index.add(f"doc-{seed}", minhash(sample_document(500, seed)))
+    words = sample_document(500, 4).split()
+    found, score = index.query(minhash(' '.join(words[:250] + ['changed'] + words[251:])), 0.8)
+    assert found == 'doc-4' and score >= 0.8
+    assert index.query(minhash(sample_document(500, 99)), 0.8) == (None, 0.0)
+
+def test_dedupe_store():
+    """Indexed documents are found again only for the same scope and options"""
+    store = DynamoDBDedupeStore(LocalDynamoDB([LocalTable('dedupeKey', name='dedupe')]), 'dedupe')
+    document = sample_document(800, 2)
+    index_document(store, 't-1', minhash(document), 'key#a', 'Bullet Points#5', 'stored summary', {'abc': 'part'})
+
+    record, score = find_near_duplicate(store, minhash(document + ' appendix'), 'key#a', 'Bullet Points#5', 0.5)
+    assert record['summary'] == 'stored summary' and record['sections'] == {'abc': 'part'} and score > 0.9
+    assert find_near_duplicate(store, minhash(document), 'key#b', 'Bullet Points#5', 0.5) == (None, 0.0)
+    assert find_near_duplicate(store, minhash(document), 'key#a', 'Executive Summary#5', 0.5) == (None, 0.0)
+
+def test_dedupe_band_limits():
+    """Band items keep only their newest documents and lookups try the most-shared candidates first"""
+    table = LocalTable('dedupeKey', name='dedupe')
+    store = DynamoDBDedupeStore(LocalDynamoDB([table]), 'dedupe')
+    table.put_item(Item={'dedupeKey': 'band#x', 'documentIds': {'legacy'}})
+    original_cap, original_candidates = dedupe_module.MAX_BAND_DOCUMENTS, dedupe_module.MAX_CANDIDATES
+    dedupe_module.MAX_BAND_DOCUMENTS, dedupe_module.MAX_CANDIDATES = 2, 1
+    try:
+        for number in range(1, 4):
+            store.add(f"t-{number}", ['band#x'], {'transformId': f"t-{number}"}, now=1000 + number)
+        band = table.get_item(Key={'dedupeKey': 'band#x'})['Item']
+        assert band['documents'] == {'t-2': 1002, 't-3': 1003} and 'documentIds' not in band
+        assert store.candidates(['band#x', 'band#y']) == {'t-2': (1, 1002), 't-3': (1, 1003)}
+
+        document = sample_document(800, 3)
+        keys = dedupe_module.band_keys(minhash(document), 'key#a', 'Bullet Points#5')
+        store.add('match', keys, {'transformId': 'match', 'signature': pack_signature(minhash(document))}, now=1)
+        for number in range(5):
+            store.add(f"other-{number}", keys[:1], {'transformId': f"other-{number}"}, now=2000 + number)
+        record, score = find_near_duplicate(store, minhash(document), 'key#a', 'Bullet Points#5', 0.9)
+        assert record['transformId'] == 'match' and score == 1.0
+    finally:
+        dedupe_module.MAX_BAND_DOCUMENTS, dedupe_module.MAX_CANDIDATES = original_cap, original_candidates
+
+def revised_document(seed, paragraphs=300):
+    rng = random.Random(seed)
+    return [
+        ' '.join(f"{rng.choice(SAMPLE_WORDS)}{rng.randrange(50)}" for _ in range(rng.randrange(20, 80)))
+        for _ in range(paragraphs)
+    ]
+
+def test_content_defined_chunks():
+    """Chunks keep all text, stay within bounds and only change near an edit"""
+    lines = revised_document(1)
+    text = '\n'.join(lines)
+    chunks = list(iter_content_chunks([text[i:i + 1000] for i in range(0, len(text), 1000)],
+                                      target_chars=3000, min_chars=1000, max_chars=6000))
+    assert ''.join(chunks) == text
+    assert all(len(chunk) <= 6000 for chunk in chunks) and len(chunks) > 5
+
+    edited = lines[:150] + ['a brand new paragraph inserted mid document'] + lines[150:]
+    edited_chunks = list(iter_content_chunks(['\n'.join(edited)], 3000, 1000, 6000))
+    assert len(set(chunks) - set(edited_chunks)) <= 2
+
+def test_summary_tree_reuse():
+    """A revision re-summarizes only changed chunks and the path to the root"""
+    calls = {'chunks': 0, 'merges': 0}
+
+    def summarize_chunk(text):
+        calls['chunks'] += 1
+        return f"summary of {len(text)} chars"
+
+    def merge(summaries):
+        calls['merges'] += 1
+        return ' + '.join(summaries)[:200]
+
+    store = DynamoDBRevisionStore(LocalDynamoDB([LocalTable('treeKey', name='revisions')]), 'revisions')
+    lines = revised_document(2, paragraphs=600)
+    tree = build_summary_tree(iter_content_chunks(['\n'.join(lines)], 3000, 1000, 6000),
+                              summarize_chunk, merge, {}, salt='Bullet Points#5')
+    store.save('key#a#spec', tree, 1)
+    first = dict(calls)
+    assert first['chunks'] == len(tree.levels[0]) and len(tree.levels[-1]) == 1
+
+    calls.update(chunks=0, merges=0)
+    lines[300] += ' with an edited sentence'
+    manifest = store.load_manifest('key#a#spec')
+    cached = store.load_summaries('key#a#spec', previous_hashes(manifest))
+    revised = build_summary_tree(iter_content_chunks(['\n'.join(lines)], 3000, 1000, 6000),
+                                 summarize_chunk, merge, cached, salt='Bullet Points#5')
+    assert 1 <= calls['chunks'] <= 2
+    assert 1 <= calls['merges'] <= len(revised.levels) + 1
+    assert revised.root != tree.root
+
+    calls.update(chunks=0, merges=0)
+    build_summary_tree(iter_content_chunks(['\n'.join(lines)], 3000, 1000, 6000),
+                       summarize_chunk, merge, cached, salt='Executive Summary#5')
+    assert calls['chunks'] == first['chunks']
+
+    # A blank document has no chunks and an empty summary
+    empty = build_summary_tree(iter_content_chunks(['  \n\n ']), summarize_chunk, merge, {})
+    assert empty.levels == [[]] and empty.root is None and empty.summary == ''
+    store.save('key#a#blank', empty, 1)
+
+def test_summary_tree_deadline():
+    """Chunks summarized before the deadline are saved and reused by the next attempt"""
+    calls = {'chunks': 0}
+
+    def summarize_chunk(text):
+        calls['chunks'] += 1
+        if 'SLOW' in text and calls.get('slow'):
+            time.sleep(1.5)
+        return f"summary of {len(text)} chars"
+
+    @deadline_aware
+    def summarize(event, context):
+        return build_summary_tree(iter_content_chunks(['\n'.join(lines)], 3000, 1000, 6000),
+                                  summarize_chunk, lambda summaries: ' + '.join(summaries)[:200], cached)
+
+    store = DynamoDBRevisionStore(LocalDynamoDB([LocalTable('treeKey', name='revisions')]), 'revisions')
+    lines = revised_document(3, paragraphs=600)
+    lines[300] = 'SLOW ' + lines[300]
+    cached, calls['slow'] = {}, True
+    try:
+        summarize({}, Mock(get_remaining_time_in_millis=lambda: (RESERVE_SECONDS + 0.5) * 1000))
+        assert False, 'expected DeadlineExceeded'
+    except DeadlineExceeded as e:
+        tree = e.partial
+        assert 0 < e.completed == len(tree.levels[0]) and len(tree.levels) == 1
+        assert all(digest in tree.summaries for digest in tree.computed)
+        store.save_partial('key#a#spec', tree, None)
+    manifest = store.load_manifest('key#a#spec')
+    assert manifest['revision'] == 0 and manifest['levels'] == [] and set(manifest['pending']) == tree.computed
+
+    cached, calls['chunks'], calls['slow'] = store.load_summaries('key#a#spec', previous_hashes(manifest)), 0, False
+    finished = summarize({}, None)
+    assert len(finished.levels[-1]) == 1 and calls['chunks'] == len(finished.levels[0]) - len(tree.computed)
+    assert calls['chunks'] < len(finished.levels[0])
+
+def test_preprocess():
+    """Preprocessing drops running headers, page numbers, boilerplate and markup but keeps content"""
+    assert template("""
+        Line one
+          indented
+        """) == 'Line one\n  indented'
+    pages = []
+    for page in range(1, 5):
+        pages.append(f"ACME Corp Quarterly Report\n\nRevenue grew   {page}0% in region {page}.\n"
+                     f"\u00a0Costs were flat.\n\nPage {page} of 4\n\u00a9 2024 ACME Corp")
+    text = '\n\n\n'.join(pages)
+    clean, saved = preprocess(text)
+    assert clean.count('ACME Corp Quarterly Report') == 1
+    assert 'Revenue grew 30% in region 3.' in clean and clean.count('Costs were flat.') == 1
+    assert 'Page' not in clean and '\u00a9' not in clean and '\n\n\n' not in clean
+    assert saved > 0 and saved == estimate_tokens(text) - estimate_tokens(clean)
+
+    # Translations keep every line; bare numbers are data, not page numbers
+    kept, _ = preprocess('Total\n42\nTotal\n42\nTotal\n42', remove_repeats=False)
+    assert kept == 'Total\n42\nTotal\n42\nTotal\n42'
+    assert remove_repeated_lines('2024\nPage views\n- 3 -') == '2024\nPage views'
+
+    html = '<html><style>p {color: red}</style><h1>Title</h1><p>A &amp; B<br>next <b>line</b></p><!-- x --></html>'
+    assert strip_markup(html).split() == ['Title', 'A', '&', 'B', 'next', 'line']
+    markdown = '## Heading\n- item with [a link](https://example.com) and **bold** text'
+    assert strip_markup(markdown) == 'Heading\nitem with a link and bold text'
+    assert preprocess('', markup=True) == ('', 0)
+
+    usage = TokenUsage()
+    usage.add_saved(saved)
+    assert usage.as_dict()['input_tokens_saved'] == saved
+
+def test_request_validation():
+    """Invalid requests get 400 or 413 before the handler runs; valid ones arrive cleaned"""
+    schema = Schema([
+        Field('text', max_chars=20, allow_blank=False),
+        Field('key', prefix='uploads/'),
+        Field('style', default='Standard', choices=('Standard', 'Formal')),
+        Field('length', kind=int, default=5, minimum=1, maximum=10),
+        Field('bytes', kind=int, maximum=100, too_large_status=413),
+        Field('flag', kind=bool, default=False),
+    ], max_body_bytes=200, one_of=('text', 'key'))
+    calls = []
+
+    @validated(schema)
+    def handler(event, context):
+        calls.append(validated_body(event))
+        return {'statusCode': 200}
+
+    def status(body, **event):
+        return handler(dict(event, body=body), None)['statusCode']
+
+    assert status(json.dumps({'text': 'hi', 'style': 'formal', 'extra': 1})) == 200
+    assert calls[-1] == {'text': 'hi', 'key': None, 'style': 'Formal', 'length': 5, 'bytes': None,
+                         'flag': False, 'extra': 1}
+    encoded = base64.b64encode(b'{"key": "uploads/a.txt", "length": 10}').decode()
+    assert status(encoded, isBase64Encoded=True) == 200 and calls[-1]['key'] == 'uploads/a.txt'
+    for body in ('[1]', 'not json', '{"text": ', '{}', '{"text": "  "}', '{"key": "secret/a"}',
+                 '{"text": "a", "style": "Loud"}', '{"text": "a", "length": 0}', '{"text": "a", "length": true}',
+                 '{"text": "a", "length": "5"}', '{"text": "a", "flag": "yes"}', '{"text": 5}'):
+        assert status(body) == 400, body
+    assert status(json.dumps({'text': 'x' * 21})) == 413
+    assert status(json.dumps({'text': 'a', 'bytes': 101})) == 413
+    assert status('{"text": "' + 'a' * 300 + '"}') == 413
+    assert status(base64.b64encode(b' ' * 300).decode(), isBase64Encoded=True) == 413
+    assert len(calls) == 2
+
+    # Warm-up pings skip validation
+    assert handler({'warmup': True}, None)['statusCode'] == 200
+    try:
+        schema.validate([])
+        assert False, 'a list is not a request'
+    except ValidationError as e:
+        assert e.status_code == 400
+
+def test_tracing():
+    """Spans continue the caller's trace through threads, clients and the handler decorator"""
+    valid = '00-' + 'a' * 32 + '-' + 'b' * 16 + '-01'
+    assert tracing.parse_traceparent(valid) == ('a' * 32, 'b' * 16)
+    for value in ('', 'garbage', '00-' + '0' * 32 + '-' + 'b' * 16 + '-01', 'ff' + valid[2:], valid.replace('b', 'x')):
+        assert tracing.parse_traceparent(value) is None, value
+
+    path = os.path.join(PROJECT_DIR, f".test-traces-{uuid.uuid4().hex}.jsonl")
+    previous = os.environ.get(tracing.TRACE_EXPORT_ENV)
+    os.environ[tracing.TRACE_EXPORT_ENV] = path
+    try:
+        table = tracing.instrument(LocalDynamoDB([LocalTable('transformId', 'timestamp', 'results')]), 'dynamodb')
+        assert tracing.instrument(table, 'dynamodb') is table
+
+        @tracing.traced('summarize')
+        def handler(event, context):
+            tracing.annotate(transformId='t-1')
+            map_chunks(['a', 'b'], lambda chunk: table.Table('results').put_item(
+                Item={'transformId': chunk, 'timestamp': 1}))
+            return {'statusCode': 200}
+
+        assert handler({'headers': {'Traceparent': valid}}, Mock(function_name='fn', aws_request_id='r-1')) == \
+            {'statusCode': 200}
+        with open(path) as f:
+            spans = [json.loads(line) for line in f]
+    finally:
+        if previous is None:
+            os.environ.pop(tracing.TRACE_EXPORT_ENV)
+        else:
+            os.environ[tracing.TRACE_EXPORT_ENV] = previous
+        if os.path.exists(path):
+            os.remove(path)
+
+    by_name = {}
+    for span in spans:
+        by_name.setdefault(span['name'], []).append(span)
+    server = by_name['summarize handler'][0]
+    assert server['traceId'] == 'a' * 32 and server['parentId'] == 'b' * 16 and server['kind'] == 'server'
+    assert server['attributes']['transformId'] == 't-1' and server['attributes']['status_code'] == 200
+    assert server['attributes']['function'] == 'fn' and server['attributes']['request_id'] == 'r-1'
+    # Calls made on worker threads still nest under the handler
+    writes = by_name['dynamodb.put_item']
+    assert len(writes) == 2 and all(span['parentId'] == server['spanId'] for span in writes)
+    assert writes[0]['attributes']['TableName'] == 'results' and writes[0]['kind'] == 'client'
+
+    with tracing.span('outer') as outer:
+        try:
+            with tracing.span('inner'):
+                raise ValueError('boom')
+        except ValueError:
+            pass
+        assert tracing.current_span() is outer
+    assert tracing.current_span() is None and outer.end_time is not None
+
+def test_deadline():
+    """Deadlines come from the remaining invocation time and stop chunked work with its finished prefix"""
+    context = Mock(get_remaining_time_in_millis=lambda: 10_000)
+    assert 6.9 < Deadline.from_invocation({}, context, reserve=3).remaining() <= 7
+    # A stale request time from a replayed event is ignored; a live one caps at API Gateway's limit
+    stale = {'requestContext': {'requestTimeEpoch': 1_600_000_000_000}}
+    assert Deadline.from_invocation(stale, None).remaining() == float('inf')
+    live = {'requestContext': {'requestTimeEpoch': (time.time() - 5) * 1000}}
+    assert 20.9 < Deadline.from_invocation(live, Mock(get_remaining_time_in_millis=lambda: 60_000), 3).remaining() <= 21
+    assert current_deadline() is UNLIMITED and UNLIMITED.cap(5) == 5
+
+    @deadline_aware
+    def handler(event, context):
+        assert current_deadline().remaining() <= 7
+        return current_deadline().call(lambda: time.sleep(1) or 'late')
+
+    try:
+        handler({}, Mock(get_remaining_time_in_millis=lambda: 3_200))
+        assert False, 'expected DeadlineExceeded'
+    except DeadlineExceeded:
+        pass
+    assert current_deadline() is UNLIMITED
+
+    def work(chunk):
+        time.sleep(1 if chunk == 'c' else 0.01)
+        current_deadline().check()
+        return chunk.upper()
+
+    @deadline_aware
+    def chunked(event, context):
+        return map_chunks(iter('abcdef'), work, max_workers=2)
+
+    try:
+        chunked({}, Mock(get_remaining_time_in_millis=lambda: 3_300))
+        assert False, 'expected DeadlineExceeded'
+    except DeadlineExceeded as e:
+        assert e.partial == ['A', 'B'] and e.completed == 2
+
+def test_result_archive():
+    """TTL deletions from the stream are written as one columnar file per tool and day"""
+    class FlakyS3:
+        def __init__(self):
+            self.objects = {}
+
+        def put_object(self, Bucket, Key, Body, ContentType):
+            if 'tool=translation' in Key:
+                raise RuntimeError('slow down')
+            self.objects[Key] = Body
+
+    def expired(sequence, transform_id, timestamp, kind, usage, removed_by='dynamodb.amazonaws.com'):
+        image = {
+            'transformId': {'S': transform_id}, 'timestamp': {'N': str(timestamp)},
+            'transformationType': {'S': kind}, 'status': {'S': 'completed'},
+            'confidence_score': {'N': '94.5'}, 'truncated': {'BOOL': False},
+            'usage': {'M': {'input_tokens': {'N': str(usage)}, 'estimated': {'BOOL': True}}},
+            'sections': {'L': [{'S': 'a'}]}
+        }
+        return {
+            'eventName': 'REMOVE', 'userIdentity': {'type': 'Service', 'principalId': removed_by},
+            'dynamodb': {'SequenceNumber': str(sequence), 'OldImage': image}
+        }
+
+    day = 1_714_521_600  # 2024-05-01 00:00 UTC
+    records = [
+        expired(100, 's-2', day + 60, 'summarization', 20),
+        expired(101, 's-1', day + 30, 'summarization', 10),
+        expired(102, 't-1', day + 30, 'translation', 5),
+        expired(103, 's-3', day + 86_400, 'summarization', 30),
+        # Deleted by hand, not expired: not archived
+        expired(104, 's-4', day, 'summarization', 40, removed_by='someone'),
+    ]
+    s3 = FlakyS3()
+    archived, written, retry_from = archive.archive_records(records, s3, 'bucket', 'archive/results')
+    assert archived == 3 and written == sum(len(body) for body in s3.objects.values())
+    # The translation file failed, so the batch resumes from its record
+    assert retry_from == '102'
+    assert sorted(key.rsplit('/', 1)[0] for key in s3.objects) == [
+        'archive/results/tool=summarization/date=2024-05-01',
+        'archive/results/tool=summarization/date=2024-05-02'
+    ]
+    key = next(key for key in s3.objects if 'date=2024-05-01' in key)
+    columns = archive.decode_columns(s3.objects[key], key)
+    assert list(columns)[:5] == ['transformId', 'timestamp', 'transformationType', 'status', 'confidence_score']
+    assert columns['transformId'] == ['s-1', 's-2'] and columns['usage_input_tokens'] == [10, 20]
+    assert columns['usage_estimated'] == [True, True] and columns['sections'] == ['["a"]', '["a"]']
+    assert columns['confidence_score'] == [94.5, 94.5]
+
+    # Retention comes from the environment; zero keeps results forever
+    previous = os.environ.get('RESULT_RETENTION_DAYS')
+    try:
+        os.environ['RESULT_RETENTION_DAYS'] = '2'
+        assert archive.result_expiry(1000) == 1000 + 2 * 86_400
+        os.environ['RESULT_RETENTION_DAYS'] = '0'
+        assert archive.result_expiry(1000) is None
+    finally:
+        if previous is None:
+            os.environ.pop('RESULT_RETENTION_DAYS')
+        else:
+            os.environ['RESULT_RETENTION_DAYS'] = previous
+
+def test_stream_notifications():
+    """Result writes become progress and completion messages pushed to subscribed connections"""
+    results = LocalTable('transformId', 'timestamp', 'results')
+    records = []
+    results.stream_listeners.append(records.append)
+    key = {'transformId': 't-1', 'timestamp': 100}
+    results.put_item(Item=dict(key, status=notifications.PROCESSING))
+    recorder = notifications.ProgressRecorder(results, 't-1', 100, interval=0)
+    recorder.advance(3)
+    results.put_item(Item=dict(key, status='completed', summary='Short', original_text='Long ' * 100))
+    # A finished result is not touched by late progress
+    recorder.advance(3)
+
+    messages = [message for _, message in notifications.stream_notifications(records)]
+    assert [message['type'] for message in messages] == ['progress', 'progress', 'completed']
+    assert messages[1]['completed'] == 1 and messages[1]['total'] == 3
+    assert messages[2]['result'] == dict(key, status='completed', summary='Short')
+    large = notifications.notification_for(dict(key, status='completed', summary='x' * 100_000))
+    assert 'result' not in large and large['resultPath'] == '/transform/t-1'
+    assert notifications.notification_for(dict(key, status='failed', error='boom'))['message'] == 'boom'
+
+    class Connections:
+        def __init__(self):
+            self.posted = []
+
+        def post_to_connection(self, ConnectionId, Data):
+            if ConnectionId == 'gone':
+                error = LocalClientError('GoneException')
+                error.response = {'Error': {'Code': 'GoneException'}}
+                raise error
+            self.posted.append((ConnectionId, json.loads(Data)))
+
+    store = notifications.DynamoDBSubscriptionStore(LocalTable('transformId', 'connectionId'))
+    for connection_id in ('a', 'gone'):
+        store.subscribe('t-1', connection_id)
+    client = Connections()
+    assert notifications.notify(store, client, [('t-1', messages[0])]) == (1, 1)
+    assert store.subscribers('t-1') == ['a']
+    assert notifications.notify(store, client, [('t-1', messages[2])]) == (1, 0)
+    assert store.subscribers('t-1') == [] and [c for c, _ in client.posted] == ['a', 'a']
+
+def test_bulk_job_resumes():
+    """A bulk job checkpoints each shard, resumes where it stopped and fences off stale runs"""
+    lines = [json.dumps({'id': f"doc-{i}", 'text': f"Document {i} " * 20}) for i in range(7)]
+    lines.insert(3, 'not json')
+    data = ('\n'.join(lines) + '\n').encode('utf-8')
+    s3 = create_mock_s3(data)
+    attempts = {}
+
+    def invoke(FunctionName, InvocationType, Payload):
+        event = json.loads(Payload)
+        key = event['headers']['Idempotency-Key']
+        attempts[key] = attempts.get(key, 0) + 1
+        assert event['headers']['X-Priority'] == 'bulk'
+        # The first attempt at each record is throttled, and retried
+        status, body = (429, {'message': 'Slow down'}) if attempts[key] == 1 else (200, {'summary': 'Short'})
+        return {'StatusCode': 200, 'Payload': io.BytesIO(json.dumps({'statusCode': status, 'body': json.dumps(body)}).encode())}
+
+    class OneShard:
+        """A deadline with time for a single shard"""
+        def __init__(self):
+            self.checks = 0
+
+        def remaining(self):
+            self.checks += 1
+            return 600 if self.checks == 1 else 10
+
+    store = bulk.DynamoDBJobStore(LocalTable('jobId'))
+    job = store.create(bulk.new_job('job-1', 'summarize', 'uploads/docs.jsonl', 'jsonl', len(data), 'text', 'id',
+                                    {'summary_type': 'Key Highlights', 'length': None}))
+    previous = {name: os.environ.get(name) for name in ('BUCKET_NAME', 'SUMMARIZER_FUNCTION_NAME')}
+    os.environ.update(BUCKET_NAME='bucket', SUMMARIZER_FUNCTION_NAME='summarizer')
+    retry_seconds, bulk.MAX_RETRY_SECONDS = bulk.MAX_RETRY_SECONDS, 0
+    try:
+        stale = job
+        job = bulk.run_job(job, store, s3, Mock(invoke=invoke), OneShard(), concurrency=2, shard_records=5)
+        assert job['status'] == bulk.RUNNING and job['shard'] == 1 and job['records'] == 5 and job['failed'] == 1
+        assert job['offset'] == sum(len(line) + 1 for line in lines[:5])
+        assert bulk.job_status(job)['progress'] < 100
+        # A run still holding the job as it was before the checkpoint is fenced off
+        assert bulk.run_job(stale, store, s3, Mock(invoke=invoke), OneShard(), shard_records=5) is None
+
+        job = bulk.run_job(store.get('job-1'), store, s3, Mock(invoke=invoke), UNLIMITED, shard_records=5)
+        assert job['status'] == bulk.COMPLETED and job['records'] == 8 and job['failed'] == 1
+        assert bulk.job_status(job)['progress'] == 100.0
+    finally:
+        bulk.MAX_RETRY_SECONDS = retry_seconds
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+    shards = {}
+    for call in s3.put_object.call_args_list:
+        shards[call.kwargs['Key']] = [json.loads(line) for line in call.kwargs['Body'].decode().splitlines()]
+    assert sorted(shards) == ['bulk/job-1/part-00000.jsonl', 'bulk/job-1/part-00001.jsonl']
+    output = shards['bulk/job-1/part-00000.jsonl'] + shards['bulk/job-1/part-00001.jsonl']
+    assert [line['index'] for line in output] == list(range(8))
+    assert output[3]['statusCode'] == 400 and output[3]['error'].startswith('Invalid JSON')
+    assert output[0] == {'index': 0, 'id': 'doc-0', 'statusCode': 200, 'result': {'summary': 'Short'}}
+    sent = json.loads(bulk.record_event(job, 0, {'text': 'Hello'})['body'])
+    assert sent == {'summary_type': 'Key Highlights', 'document_text': 'Hello'}
+
+    # A shard the deadline cuts short is checkpointed as far as it got and resumed from there
+    class ThreeRecords:
+        """A deadline with time for the shard check and three records"""
+        def __init__(self):
+            self.checks = 0
+
+        def remaining(self):
+            self.checks += 1
+            return 600 if self.checks <= 4 else 1
+
+    def answer(FunctionName, InvocationType, Payload):
+        return {'StatusCode': 200, 'Payload': io.BytesIO(json.dumps({'statusCode': 200, 'body': '{}'}).encode())}
+
+    s3 = create_mock_s3(data)
+    os.environ.update(BUCKET_NAME='bucket', SUMMARIZER_FUNCTION_NAME='summarizer')
+    try:
+        job = store.create(bulk.new_job('job-2', 'summarize', 'uploads/docs.jsonl', 'jsonl', len(data), 'text'))
+        job = bulk.run_job(job, store, s3, Mock(invoke=answer), ThreeRecords(), concurrency=1, shard_records=5)
+        assert job['status'] == bulk.RUNNING and job['shard'] == 1 and job['records'] == 3
+        assert job['offset'] == sum(len(line) + 1 for line in lines[:3])
+        job = bulk.run_job(store.get('job-2'), store, s3, Mock(invoke=answer), UNLIMITED, shard_records=5)
+        assert job['status'] == bulk.COMPLETED and job['records'] == 8
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    written = [[json.loads(line)['index'] for line in call.kwargs['Body'].decode().splitlines()]
+               for call in s3.put_object.call_args_list]
+    assert written == [[0, 1, 2], [3, 4, 5, 6, 7]]
+
+    # CSV rows may span lines; resumed reads reuse the header's columns
+    csv_data = b'id,text\r\n1,"Hello, world"\r\n2,"Two\nlines"\r\n3,Last'
+    reader = bulk.RecordReader(create_mock_s3(csv_data), 'bucket', 'uploads/docs.csv', 'csv')
+    records = list(reader)
+    assert [record.data for record in records] == [
+        {'id': '1', 'text': 'Hello, world'}, {'id': '2', 'text': 'Two\nlines'}, {'id': '3', 'text': 'Last'}
+    ]
+    resumed = bulk.RecordReader(create_mock_s3(csv_data), 'bucket', 'uploads/docs.csv', 'csv',
+                                records[0].offset, reader.columns)
+    assert [record.data['id'] for record in resumed] == ['2', '3']
+    assert records[-1].offset == len(csv_data)
+
+def test_background_jobs():
+    """Prefer: respond-async returns 202 and hands the request to an asynchronous invocation"""
+    results = LocalTable('transformId', 'timestamp', 'results')
+    invoked = []
+    runtime.register('dynamodb', resource=LocalDynamoDB([results]))
+    runtime.register('lambda', client=Mock(invoke=lambda **kwargs: invoked.append(kwargs)))
+    previous = {name: os.environ.get(name) for name in ('TABLE_NAME', 'NOTIFICATIONS_URL')}
+    os.environ.update(TABLE_NAME='results', NOTIFICATIONS_URL='wss://example/live')
+
+    @notifications.background('summarization')
+    def handler(event, context):
+        transform_id, timestamp = notifications.job_identity(event)
+        notifications.current_progress().advance(2)
+        if json.loads(event['body']).get('fail'):
+            return json_response(500, {'message': 'Model unavailable'})
+        results.put_item(Item={'transformId': transform_id, 'timestamp': timestamp, 'status': 'completed'})
+        return json_response(200, {'transformId': transform_id})
+
+    try:
+        context = Mock(invoked_function_arn='arn:aws:lambda:us-east-1:1:function:summarizer')
+        assert handler({'body': '{}', 'headers': {}}, context)['statusCode'] == 200 and not invoked
+
+        event = {'body': '{}', 'headers': {'Prefer': 'respond-async', 'Accept-Encoding': 'gzip'},
+                 'requestContext': {'requestTimeEpoch': 1}}
+        accepted = handler(event, context)
+        body = json.loads(accepted['body'])
+        assert accepted['statusCode'] == 202 and accepted['headers']['Location'] == body['resultPath']
+        assert invoked[0]['InvocationType'] == 'Event' and invoked[0]['FunctionName'] == context.invoked_function_arn
+        continuation = json.loads(invoked[0]['Payload'])
+        assert notifications.is_background(continuation) and 'Accept-Encoding' not in continuation['headers']
+        assert 'requestTimeEpoch' not in continuation['requestContext']
+        key = {'transformId': body['transformId'], 'timestamp': continuation['backgroundJob']['timestamp']}
+        assert results.get_item(Key=key)['Item']['status'] == notifications.PROCESSING
+
+        assert json.loads(handler(continuation, context)['body'])['transformId'] == body['transformId']
+        assert results.get_item(Key=key)['Item']['status'] == 'completed'
+
+        # A job that fails is marked failed for its subscribers
+        handler(dict(event, body='{"fail": true}'), context)
+        failed = json.loads(invoked[1]['Payload'])
+        handler(failed, context)
+        item = results.get_item(Key=dict(failed['backgroundJob']))['Item']
+        assert item['status'] == notifications.FAILED and item['error'] == 'Model unavailable'
+        assert item['progress'] == {'completed': 1, 'total': 2}
+    finally:
+        runtime.reset_clients()
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+def run_test():
+    """Run the shared layer tests"""
+    print("🚀 Testing Shared Layer Helpers")
+    print("=" * 50)
+    tests = [value for name, value in sorted(globals().items()) if name.startswith('test_')]
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e}")
+            return False
+    print("\n🎉 Test completed successfully!")
+    return True
+
+if __name__ == "__main__":
+    success = run_test()
+    sys.exit(0 if success else 1)
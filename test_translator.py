@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Test script for language translator batching
+"""
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+from unittest.mock import Mock
+
+# Add lambda directory and shared layer to path
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(PROJECT_DIR, 'lambda', 'language-translator'))
+sys.path.append(os.path.join(PROJECT_DIR, 'lambda_layer', 'python'))
+
+from local_dynamodb import LocalDynamoDB, LocalTable
+from language_translator import handler, translate_text
+from content_transformer import runtime
+from content_transformer.deadline import RESERVE_SECONDS
+from content_transformer.segmentation import segment_batches, split_sentences, stitch
+from content_transformer.tokens import estimate_tokens
+from content_transformer.usage import TokenUsage
+
+SOURCE_PARAGRAPH = "舞台上的 DevOps 常被描绘成技术乌托邦。自动化流水线顺畅运行！开发与运维无缝协作？"
+TEXT_PATTERN = re.compile(r'Text to translate: "(.*)"\s*\n\s*Provide only', re.S)
+
+
+class FakeBedrock:
+    """
+    Translates by tagging each sentence, keeping paragraphs; reports truncation for long inputs
+
+    Texts containing slow_marker take slow_seconds to translate.
+    """
+
+    def __init__(self, truncate_over_tokens=None, slow_marker=None, slow_seconds=0):
+        self.truncate_over_tokens = truncate_over_tokens
+        self.slow_marker = slow_marker
+        self.slow_seconds = slow_seconds
+        self.prompts = []
+        self.lock = threading.Lock()
+
+    def invoke_model(self, modelId, body):
+        prompt = json.loads(body)['prompt']
+        with self.lock:
+            self.prompts.append(prompt)
+        text = TEXT_PATTERN.search(prompt).group(1)
+        if self.slow_marker and self.slow_marker in text:
+            time.sleep(self.slow_seconds)
+        translated = '\n\n'.join(
+            ' '.join(f"<{sentence.strip()}>" for sentence in split_sentences(paragraph) if sentence.strip())
+            for paragraph in text.split('\n\n')
+        )
+        truncated = self.truncate_over_tokens and estimate_tokens(text) > self.truncate_over_tokens
+        payload = {'completion': translated, 'stop_reason': 'max_tokens' if truncated else 'stop_sequence'}
+        return {'body': io.BytesIO(json.dumps(payload).encode('utf-8'))}
+
+
+def test_sentence_segmentation():
+    """Sentences split on CJK and Latin terminators without losing characters"""
+    text = "第一句。第二句！“引用。”Third one. Fourth? 3.14 stays whole"
+    sentences = split_sentences(text)
+    assert ''.join(sentences) == text
+    assert sentences == ["第一句。", "第二句！", "“引用。”", "Third one. ", "Fourth? ", "3.14 stays whole"]
+
+def test_batches_round_trip():
+    """Batches respect the token budget and join back into the original text"""
+    text = "\n\n".join([SOURCE_PARAGRAPH * 20] * 6)
+    batches = segment_batches(text, 200)
+    assert ''.join(batches) == text
+    assert all(estimate_tokens(batch) <= 200 for batch in batches)
+    assert stitch(["One.", "Two."]) == "One. Two." and stitch(["一。", "二。"]) == "一。二。"
+
+def test_short_text_single_pass():
+    """Short texts keep the single-call behavior"""
+    bedrock = FakeBedrock()
+    translated, truncated, segments = translate_text(
+        bedrock, 'model', SOURCE_PARAGRAPH, 'Chinese', 'English', 'Standard', TokenUsage()
+    )
+    assert segments == 1 and not truncated and len(bedrock.prompts) == 1
+    assert translated.startswith("<舞台上的")
+
+def test_long_text_batched_in_order():
+    """Long texts are batched with context and stitched back in order"""
+    paragraphs = [f"第{i}段。" + SOURCE_PARAGRAPH * 15 for i in range(8)]
+    bedrock = FakeBedrock()
+    usage = TokenUsage()
+    translated, truncated, segments = translate_text(
+        bedrock, 'model', "\n\n".join(paragraphs), 'Chinese', 'English', 'Standard', usage
+    )
+    assert segments > 1 and not truncated and usage.model_calls == segments
+    positions = [translated.index(f"<第{i}段。>") for i in range(8)]
+    assert positions == sorted(positions)
+    assert translated.count("\n\n") == 7
+    assert sum('for context only' in prompt for prompt in bedrock.prompts) == segments - 1
+
+def test_truncation_detection():
+    """Batches cut off by the output cap are split; unsplittable ones are flagged"""
+    bedrock = FakeBedrock(truncate_over_tokens=100)
+    text = SOURCE_PARAGRAPH * 10
+    translated, truncated, _ = translate_text(bedrock, 'model', text, 'Chinese', 'English', 'Standard', TokenUsage())
+    assert not truncated and translated.count('<') == 30
+
+    bedrock = FakeBedrock(truncate_over_tokens=5)
+    _, truncated, _ = translate_text(bedrock, 'model', text, 'Chinese', 'English', 'Standard', TokenUsage())
+    assert truncated
+
+def test_deadline_keeps_finished_batches():
+    """Batches finished before the deadline are saved and returned as a partial translation"""
+    paragraphs = [f"{i}{SOURCE_PARAGRAPH * 12}" for i in range(6)]
+    paragraphs[3] = 'SLOW' + paragraphs[3]
+    table = LocalTable('transformId', 'timestamp', 'results')
+    environment = dict(os.environ)
+    os.environ.update(TABLE_NAME='results', BEDROCK_MODEL_ID='model')
+    runtime.register('dynamodb', resource=LocalDynamoDB([table]))
+    runtime.register('bedrock-runtime', client=FakeBedrock(slow_marker='SLOW', slow_seconds=5))
+    try:
+        started = time.monotonic()
+        response = handler({'body': json.dumps({'text_to_translate': '\n\n'.join(paragraphs)})},
+                           Mock(get_remaining_time_in_millis=lambda: (RESERVE_SECONDS + 1.5) * 1000))
+        elapsed = time.monotonic() - started
+    finally:
+        os.environ.clear()
+        os.environ.update(environment)
+        runtime.reset_clients()
+
+    assert response['statusCode'] == 200 and elapsed < 3
+    body = json.loads(response['body'])
+    assert body['status'] == 'partial' and body['partial'] and body['segments'] > body['segments_completed'] > 0
+    assert '<0' in body['translated_text'] and 'SLOW' not in body['translated_text']
+    [item] = table.scan()['Items']
+    assert item['status'] == 'partial' and item['translated_text'] == body['translated_text']
+
+def run_test():
+    """Run the translator tests"""
+    print("🚀 Testing Language Translator Batching")
+    print("=" * 50)
+    tests = [value for name, value in sorted(globals().items()) if name.startswith('test_')]
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e}")
+            return False
+    print("\n🎉 Test completed successfully!")
+    return True
+
+if __name__ == "__main__":
+    success = run_test()
+    sys.exit(0 if success else 1)
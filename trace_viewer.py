@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Render the critical path of a traced request
+
+Reads the spans exported with TRACE_EXPORT (a span file, or a function log
+with spans mixed into other lines), finds every trace that produced or
+read the given transformId (or has the given trace ID), and prints each as
+a waterfall. Spans on the critical path, the chain of work the request
+actually waited on, are marked with *, and their exclusive time is totalled
+per component: app, gateway, cold start, handler, Bedrock, DynamoDB, S3.
+Back-to-back calls of the same operation are shown as one line.
+
+Usage:
+    python trace_viewer.py <transformId or traceId> [--file traces.jsonl] [--width 40]
+"""
+import argparse
+import collections
+import json
+import os
+import sys
+
+DEFAULT_FILE = 'traces.jsonl'
+
+
+def load_spans(path):
+    """Every span object in a JSON-lines file, skipping lines that are not spans"""
+    spans = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line.startswith('{'):
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and record.get('traceId') and record.get('spanId') and record.get('end'):
+                spans.append(record)
+    return spans
+
+
+def find_traces(spans, identifier):
+    """Spans grouped by trace, for traces that mention identifier, oldest first"""
+    traces = collections.defaultdict(list)
+    for span in spans:
+        traces[span['traceId']].append(span)
+    matching = [
+        trace for trace_id, trace in traces.items()
+        if trace_id == identifier or any(span['attributes'].get('transformId') == identifier for span in trace)
+    ]
+    return sorted(matching, key=lambda trace: min(span['start'] for span in trace))
+
+
+def span_tree(trace):
+    """(roots, children by parent span ID), each list in start order"""
+    ids = {span['spanId'] for span in trace}
+    children = collections.defaultdict(list)
+    roots = []
+    for span in sorted(trace, key=lambda span: span['start']):
+        if span.get('parentId') in ids:
+            children[span['parentId']].append(span)
+        else:
+            roots.append(span)
+    return roots, children
+
+
+def critical_path(span, children, until=None):
+    """
+    [(span, exclusive seconds)] for the chain of work span waited on
+
+    Walking back from the end of span, the child still running latest is
+    on the path; the time before it started is searched the same way, and
+    any stretch no child covers is span's own.
+    """
+    cursor = span['end'] if until is None else min(until, span['end'])
+    exclusive, path = 0.0, []
+    remaining = list(children.get(span['spanId'], []))
+    while True:
+        candidates = [child for child in remaining if child['start'] < cursor]
+        if not candidates:
+            break
+        child = max(candidates, key=lambda child: min(child['end'], cursor))
+        remaining.remove(child)
+        end = min(child['end'], cursor)
+        exclusive += cursor - end
+        path = critical_path(child, children, end) + path
+        cursor = child['start']
+    exclusive += max(0.0, cursor - span['start'])
+    return [(span, exclusive)] + path
+
+
+def component(span):
+    """Which part of the system a span's time belongs to"""
+    attributes = span['attributes']
+    if span['name'] in ('cold start', 'init'):
+        return 'cold start'
+    if attributes.get('service'):
+        return attributes['service']
+    if attributes.get('component'):
+        return attributes['component']
+    if span['kind'] == 'server':
+        return 'handler'
+    return span['name']
+
+
+def leaf_runs(spans, children):
+    """Group back-to-back childless spans of the same operation, so repeated writes print as one line"""
+    groups = []
+    for span in spans:
+        key = (span['name'], span['attributes'].get('TableName'))
+        previous = groups[-1][-1] if groups else None
+        if previous is not None and span['spanId'] not in children and previous['spanId'] not in children \
+                and (previous['name'], previous['attributes'].get('TableName')) == key:
+            groups[-1].append(span)
+        else:
+            groups.append([span])
+    return groups
+
+
+def render(trace, width):
+    roots, children = span_tree(trace)
+    started = min(span['start'] for span in trace)
+    finished = max(span['end'] for span in trace)
+    total = max(finished - started, 1e-9)
+    on_path = {}
+    for root in roots:
+        on_path.update((span['spanId'], exclusive) for span, exclusive in critical_path(root, children))
+
+    print(f"\n🔎 trace {trace[0]['traceId']}  {total * 1000:.1f} ms, {len(trace)} spans")
+    print(f"  {'start':>9} {'ms':>9}  {'timeline':<{width}}  span")
+
+    def show(group, depth):
+        span, last = group[0], group[-1]
+        offset = span['start'] - started
+        duration = sum(member['end'] - member['start'] for member in group)
+        left = int(offset / total * width)
+        length = max(1, int((last['end'] - span['start']) / total * width))
+        bar = (' ' * left + '█' * length)[:width]
+        marker = '*' if any(member['spanId'] in on_path for member in group) else ' '
+        notes = [f"{key}={span['attributes'][key]}" for key in ('status_code', 'modelId', 'TableName', 'container')
+                 if span['attributes'].get(key) is not None]
+        if len(group) > 1:
+            notes.append(f"×{len(group)}")
+        if span['attributes'].get('cold_start'):
+            notes.append('cold')
+        errors = [member for member in group if member['status'] == 'error']
+        if errors:
+            notes.append(f"error: {errors[0]['attributes'].get('error', '')}".strip())
+        print(f"{marker} {offset * 1000:>9.1f} {duration * 1000:>9.1f}  {bar:<{width}}  "
+              f"{'  ' * depth}{span['name']}{'  ' + ', '.join(notes) if notes else ''}")
+        for child_group in leaf_runs(children.get(span['spanId'], []), children):
+            show(child_group, depth + 1)
+
+    for root in roots:
+        show([root], 0)
+
+    totals = collections.Counter()
+    spans_by_id = {span['spanId']: span for span in trace}
+    for span_id, exclusive in on_path.items():
+        totals[component(spans_by_id[span_id])] += exclusive
+    print(f"\n  critical path by component ({sum(totals.values()) * 1000:.1f} ms)")
+    for name, seconds in totals.most_common():
+        print(f"  {name:<20} {seconds * 1000:>9.1f} ms {seconds / total * 100:>5.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('identifier', help='transformId returned by the API, or a trace ID')
+    parser.add_argument('--file', default=os.environ.get('TRACE_EXPORT') or DEFAULT_FILE,
+                        help='span file written through TRACE_EXPORT')
+    parser.add_argument('--width', type=int, default=40, help='timeline width in characters')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.file):
+        print(f"No span file at {args.file}; set TRACE_EXPORT when running the API and app")
+        sys.exit(1)
+    traces = find_traces(load_spans(args.file), args.identifier)
+    if not traces:
+        print(f"No trace mentions {args.identifier} in {args.file}")
+        sys.exit(1)
+    for trace in traces:
+        render(trace, args.width)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Report Bedrock token usage and spend from the usage table
+
+Reads the daily counters the handlers keep per tool, model and API key,
+one key query per name, and prints totals with an estimated cost.
+
+Usage:
+    python usage_report.py --dimension tool summarize translate [--days 30]
+    python usage_report.py --dimension model anthropic.claude-v2 --input-price 0.008 --output-price 0.024
+"""
+import argparse
+import os
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(PROJECT_DIR, 'lambda_layer', 'python'))
+
+from content_transformer.usage import DIMENSIONS, DynamoDBUsageStore, usage_cost, usage_period, usage_totals
+
+DEFAULT_TABLE = 'content-transformation-usage'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--dimension', choices=DIMENSIONS, default='tool', help='counter family to report')
+    parser.add_argument('names', nargs='+', help='tools, model IDs or API-key counters (key#... or ip#...)')
+    parser.add_argument('--days', type=int, default=30, help='days to include, ending today (UTC)')
+    parser.add_argument('--table', default=os.environ.get('USAGE_TABLE_NAME', DEFAULT_TABLE))
+    parser.add_argument('--input-price', type=float, default=0.0, help='USD per 1K input tokens')
+    parser.add_argument('--output-price', type=float, default=0.0, help='USD per 1K output tokens')
+    args = parser.parse_args()
+
+    import boto3
+
+    store = DynamoDBUsageStore(boto3.resource('dynamodb').Table(args.table))
+    end = usage_period()
+    start = usage_period(time.time() - (args.days - 1) * 24 * 60 * 60)
+
+    print(f"📊 {args.dimension} usage {start} → {end}")
+    print(f"{'name':<40} {'requests':>9} {'calls':>7} {'input':>12} {'output':>12} {'cost':>10}")
+    any_estimated = False
+    for name in args.names:
+        totals = usage_totals(store.query(args.dimension, name, start, end))
+        cost = usage_cost(totals, args.input_price, args.output_price)
+        estimated = ' *' if totals['estimatedCalls'] else ''
+        any_estimated = any_estimated or bool(estimated)
+        print(f"{name:<40} {totals['requests']:>9} {totals['modelCalls']:>7} "
+              f"{totals['inputTokens']:>12,} {totals['outputTokens']:>12,} {cost:>10.4f}{estimated}")
+    if any_estimated:
+        print("* includes estimated token counts")
+
+
+if __name__ == '__main__':
+    main()